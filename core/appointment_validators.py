@@ -4,12 +4,12 @@ from django.db.models import Q, F, ExpressionWrapper, DurationField, DateTimeFie
 from django.utils.timezone import make_aware, is_naive
 from datetime import timezone
 
-def validate_appointment_conflicts(series):
+def validate_series_conflicts(series):
     """Validates conflicts for a series of appointments."""
-    from core.models import Appointment, Practice
-    conflicts = []
+    from core.services.conflict_service import ConflictChecker
     treatment_duration = series.treatment.duration_minutes
 
+    proposals = []
     for i in range(series.total_sessions):
         appointment_start_time = series.start_date + timedelta(days=i * series.interval_days)
 
@@ -17,80 +17,47 @@ def validate_appointment_conflicts(series):
         if is_naive(appointment_start_time):
             appointment_start_time = make_aware(appointment_start_time, timezone=timezone.utc)
 
-        appointment_end_time = appointment_start_time + timedelta(minutes=treatment_duration)
+        proposals.append({
+            'start': appointment_start_time,
+            'end': appointment_start_time + timedelta(minutes=treatment_duration),
+            'practitioner_id': getattr(series.practitioner, 'pk', None),
+            'room_id': getattr(series.room, 'pk', None),
+        })
 
-        # Überprüfe Behandler-Konflikte
-        practitioner_conflicts = Appointment.objects.filter(
-            practitioner=series.practitioner,
-            appointment_date__lt=appointment_end_time,
-            appointment_date__gt=appointment_start_time - timedelta(minutes=treatment_duration)
-        )
-
-        if practitioner_conflicts.exists():
-            conflicts.append({
-                'session': i + 1,
-                'date': appointment_start_time,
-                'conflicting_appointments': list(practitioner_conflicts),
-                'reason': 'Der Behandler hat bereits einen Termin in diesem Zeitraum'
-            })
-            continue
-
-        # Überprüfe Raum-Konflikte
-        room_conflicts = Appointment.objects.filter(
-            room=series.room,
-            appointment_date__lt=appointment_end_time,
-            appointment_date__gt=appointment_start_time - timedelta(minutes=treatment_duration)
-        )
-
-        if room_conflicts.exists():
-            conflicts.append({
-                'session': i + 1,
-                'date': appointment_start_time,
-                'conflicting_appointments': list(room_conflicts),
-                'reason': 'Der Raum ist in diesem Zeitraum bereits belegt'
-            })
+    # Eine Abfrage für die ganze Serie; Sitzungen werden auch gegeneinander geprüft
+    conflicts = ConflictChecker.for_proposals(proposals).check_batch(proposals)
 
     if conflicts:
         conflict_info = '\n'.join([
-            f"Session {c['session']} am {c['date']}: {c['reason']}" 
+            f"Session {c['index'] + 1} am {c['start']}: {c['reason']}"
             for c in conflicts
         ])
         raise ValidationError(f"Terminkonflikte gefunden:\n{conflict_info}")
 
 def validate_conflict_for_appointment(appointment_date, duration_minutes, practitioner, room, exclude_id=None):
     """Validates that there are no conflicting appointments."""
-    from core.models import Appointment, Practice
-    practice = Practice.objects.first()
-    
+    from core.services.conflict_service import ConflictChecker
+
     end_time = appointment_date + timedelta(minutes=duration_minutes)
-    
-    # Prüfe auf Überschneidungen für den Behandler
-    practitioner_conflicts = Appointment.objects.filter(
-        practitioner=practitioner,
-        appointment_date__lt=end_time,
-        appointment_date__gt=appointment_date - timedelta(minutes=duration_minutes)
-    ).exclude(id=exclude_id)
-    
-    # Prüfe auf Überschneidungen für den Raum
-    room_conflicts = Appointment.objects.filter(
-        room=room,
-        appointment_date__lt=end_time,
-        appointment_date__gt=appointment_date - timedelta(minutes=duration_minutes)
-    ).exclude(id=exclude_id)
-    
-    if practitioner_conflicts.exists():
-        raise ValidationError('Der Behandler hat bereits einen Termin in diesem Zeitraum')
-    
-    if room_conflicts.exists():
-        raise ValidationError('Der Raum ist in diesem Zeitraum bereits belegt')
+    practitioner_id = getattr(practitioner, 'pk', practitioner)
+    room_id = getattr(room, 'pk', room)
+
+    # Lädt die Termine von Behandler und Raum mit einer Abfrage (stornierte ausgenommen)
+    ConflictChecker(
+        appointment_date,
+        end_time,
+        practitioner_ids=[practitioner_id],
+        room_ids=[room_id],
+        exclude_ids=[exclude_id],
+    ).validate(appointment_date, end_time, practitioner_id, room_id)
 
 def validate_appointment_conflicts(appointment):
     """Validates appointment conflicts."""
     validate_conflict_for_appointment(
         appointment.appointment_date,
-        appointment.duration_minutes,
-        appointment.practitioner,
-        appointment.room,
+        appointment.duration_minutes or 0,
+        appointment.practitioner_id,
+        appointment.room_id,
         appointment.id
     )
 
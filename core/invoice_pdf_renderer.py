@@ -0,0 +1,156 @@
+"""
+Rechnungs-PDFs mit reportlab (siehe InvoicePdfService).
+
+Das Modul greift weder auf Django noch auf die Datenbank zu: Es erhält ein fertig
+aufbereitetes, JSON-kompatibles Rechnungsdokument und schreibt das PDF. Dadurch kann
+es ohne Django-Setup in den Prozessen des Render-Pools laufen (Start per 'spawn').
+
+RENDERER_VERSION geht in den Cache-Schlüssel ein und muss bei jeder Änderung am
+Layout erhöht werden, damit zwischengespeicherte PDFs neu erzeugt werden.
+"""
+
+import os
+import tempfile
+from io import BytesIO
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+RENDERER_VERSION = '1'
+
+
+def _euro(value: str) -> str:
+    """'1234.5' -> '1.234,50 €'"""
+    formatted = f'{float(value):,.2f}'
+    return formatted.replace(',', 'X').replace('.', ',').replace('X', '.') + ' €'
+
+
+def _german_date(value: str) -> str:
+    """ISO-Datum -> TT.MM.JJJJ"""
+    if not value:
+        return ''
+    year, month, day = value[:10].split('-')
+    return f'{day}.{month}.{year}'
+
+
+def render_invoice_pdf(document: Dict) -> bytes:
+    """Erzeugt das PDF zu einem Rechnungsdokument (siehe InvoicePdfService.build_documents)"""
+    styles = getSampleStyleSheet()
+    small = styles['Normal'].clone('InvoiceSmall', fontSize=8, leading=10)
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        leftMargin=20 * mm, rightMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm,
+        title=f"Rechnung {document['invoice_number']}",
+        # Ohne festes Erstellungsdatum unterscheiden sich sonst zwei Läufe byteweise
+        invariant=1,
+    )
+    practice = document.get('practice') or {}
+    patient = document['patient']
+    elements = []
+
+    if practice:
+        elements.append(Paragraph(escape(practice.get('name', '')), styles['Heading2']))
+        elements.append(Paragraph(
+            escape(' · '.join(filter(None, [
+                practice.get('street_address'),
+                f"{practice.get('postal_code', '')} {practice.get('city', '')}".strip(),
+                practice.get('phone'),
+                practice.get('email'),
+            ]))),
+            small
+        ))
+        elements.append(Spacer(1, 10 * mm))
+
+    elements.append(Paragraph('<br/>'.join(escape(part) for part in filter(None, [
+        patient['name'],
+        patient.get('street_address'),
+        f"{patient.get('postal_code', '')} {patient.get('city', '')}".strip(),
+    ])), styles['Normal']))
+    elements.append(Spacer(1, 10 * mm))
+
+    elements.append(Paragraph(document['title'], styles['Heading1']))
+    header = [
+        ['Rechnungsnummer:', document['invoice_number']],
+        ['Rechnungsdatum:', _german_date(document['invoice_date'])],
+    ]
+    if document.get('due_date'):
+        header.append(['Zahlungsziel:', _german_date(document['due_date'])])
+    elements.append(Table(header, colWidths=[45 * mm, 80 * mm], hAlign='LEFT'))
+    elements.append(Spacer(1, 8 * mm))
+
+    rows = [['Datum', 'Leistung', 'Betrag']]
+    for line in document['lines']:
+        rows.append([
+            _german_date(line.get('date')),
+            Paragraph(escape(line['description']), styles['Normal']),
+            _euro(line['amount']),
+        ])
+    rows.append(['', 'Gesamtbetrag', _euro(document['total'])])
+    if document.get('paid') and float(document['paid']):
+        rows.append(['', 'Bereits bezahlt', _euro(document['paid'])])
+        rows.append(['', 'Offener Betrag', _euro(document['open'])])
+
+    table = Table(rows, colWidths=[28 * mm, 107 * mm, 35 * mm], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ('FONTNAME', (1, len(document['lines']) + 1), (-1, -1), 'Helvetica-Bold'),
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 10 * mm))
+
+    bank = practice.get('bank_details') or {}
+    if document.get('due_date'):
+        elements.append(Paragraph(
+            f"Bitte überweisen Sie den Betrag bis zum {_german_date(document['due_date'])} "
+            f"unter Angabe der Rechnungsnummer {escape(document['invoice_number'])}.",
+            styles['Normal']
+        ))
+    if bank.get('iban'):
+        elements.append(Paragraph(
+            escape(' · '.join(filter(None, [
+                bank.get('account_holder'), bank.get('bank_name'),
+                f"IBAN {bank['iban']}", f"BIC {bank['bic']}" if bank.get('bic') else None,
+            ]))),
+            small
+        ))
+    if practice.get('tax_id'):
+        elements.append(Paragraph(escape(f"Steuernummer: {practice['tax_id']}"), small))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_invoice_to_file(document: Dict, path: str) -> Tuple[str, int]:
+    """
+    Schreibt das PDF atomar (temporäre Datei + os.replace) nach path – Einstiegspunkt
+    für den Render-Pool; zurück geht nur der Pfad, nicht der Dateiinhalt.
+    """
+    data = render_invoice_pdf(document)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return path, len(data)
+
+
+def render_invoices_to_files(jobs: List[Tuple[Dict, str]]) -> List[Tuple[str, int]]:
+    """Mehrere Rechnungen in einem Aufruf (ein Pool-Auftrag je Portion statt je Rechnung)"""
+    return [render_invoice_to_file(document, path) for document, path in jobs]
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.services.email_outbox_service import EmailOutboxService
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Stellt E-Mails aus dem Ausgangspostfach gebündelt zu (eine SMTP-Verbindung je Stapel)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Stellt die aktuell fälligen E-Mails zu und beendet sich danach',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Nachrichten je Stapel (Standard: EMAIL_OUTBOX["BATCH_SIZE"])',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=10.0,
+            help='Sekunden zwischen zwei Abfragen des Ausgangspostfachs (Standard: 10)',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Stellt endgültig fehlgeschlagene E-Mails vor der Zustellung erneut ein',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Löscht nur gesendete E-Mails älter als RETENTION_DAYS und beendet sich',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted = EmailOutboxService.purge_sent()
+            self.stdout.write(self.style.SUCCESS(f'✅ {deleted} gesendete E-Mails gelöscht'))
+            return
+
+        if options['retry_failed']:
+            count = EmailOutboxService.retry_failed()
+            self.stdout.write(f'🔁 {count} fehlgeschlagene E-Mails erneut eingestellt')
+
+        try:
+            while True:
+                result = EmailOutboxService.deliver_pending(batch_size=options['batch_size'])
+                if result['batches']:
+                    self.stdout.write(
+                        f"📧 {result['sent']} gesendet, {result['retried']} erneut eingestellt, "
+                        f"{result['failed']} fehlgeschlagen ({result['batches']} Stapel, "
+                        f"{result['messages_per_second']} Nachrichten/s)"
+                    )
+                close_old_connections()
+
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('⏹ E-Mail-Zustellung wird beendet...')
+
+        statistics = EmailOutboxService.get_statistics()['by_status']
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Ausgangspostfach: {statistics['pending']} wartend, {statistics['failed']} fehlgeschlagen"
+        ))
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.synthetic_data_service import SCALES, SyntheticPracticeGenerator
+
+
+class Command(BaseCommand):
+    help = 'Erzeugt reproduzierbare synthetische Praxisdaten (Patienten, Verordnungsketten, Termine, Abrechnung) für Entwicklung und Benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            choices=sorted(SCALES),
+            default='small',
+            help='Vordefinierte Größe: ' + ', '.join(
+                f"{name} ({values['patients']} Patienten, {values['appointments']} Termine)"
+                for name, values in SCALES.items()
+            )
+        )
+        parser.add_argument('--patients', type=int, help='Anzahl Patienten (überschreibt --scale)')
+        parser.add_argument('--appointments', type=int, help='Ungefähre Anzahl Termine (überschreibt --scale)')
+        parser.add_argument('--seed', type=int, default=42, help='Startwert des Zufallsgenerators')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Patienten pro Block (eine Transaktion) und Zeilen pro bulk_create'
+        )
+        parser.add_argument('--history-days', type=int, default=730, help='Zeitraum in der Vergangenheit')
+        parser.add_argument('--future-days', type=int, default=60, help='Zeitraum geplanter Termine')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Auch bei DEBUG=False ausführen (niemals auf Produktivdatenbanken)'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Nur für Entwicklungsdatenbanken – bei DEBUG=False mit --force bestätigen')
+
+        scale = SCALES[options['scale']]
+        patients = options['patients'] or scale['patients']
+        appointments = options['appointments'] or scale['appointments']
+        self.stdout.write(f'Erzeuge {patients} Patienten mit ca. {appointments} Terminen (Seed {options["seed"]})...')
+
+        generator = SyntheticPracticeGenerator(
+            patients=patients,
+            appointments=appointments,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            history_days=options['history_days'],
+            future_days=options['future_days'],
+            progress_callback=self.stdout.write,
+        )
+        counts = generator.generate()
+
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS('Synthetische Praxisdaten erzeugt'))
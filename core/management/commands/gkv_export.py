@@ -78,6 +78,11 @@ class Command(BaseCommand):
                 start_date = end_date - timedelta(days=30)
                 self.stdout.write(f"Export für letzten Monat: {start_date} bis {end_date}")
         
+        # Export in Datei: Validierung und Export laufen als Streams, ohne alle Daten im Speicher zu halten
+        if options['output_file'] and not options['validate_only'] and not options['dry_run']:
+            self._stream_to_file(export_service, options, billing_cycle, start_date, end_date)
+            return
+
         # Generiere Export-Daten
         export_data = export_service.generate_gkv_export_data(
             billing_cycle=billing_cycle,
@@ -166,6 +171,51 @@ class Command(BaseCommand):
                 self.style.ERROR(f"Export-Fehler: {str(e)}")
             )
     
+    def _stream_to_file(self, export_service, options, billing_cycle, start_date, end_date):
+        """Validiert und schreibt den Export blockweise in die Ausgabedatei"""
+        validation_result = export_service.validate_gkv_compliance(
+            export_service.iter_gkv_export_items(billing_cycle, start_date, end_date)
+        )
+
+        if not validation_result['total_items']:
+            self.stdout.write(self.style.WARNING("Keine GKV-Export-Daten gefunden"))
+            return
+
+        self.stdout.write(f"Gefunden: {validation_result['total_items']} Termine für GKV-Export")
+
+        if validation_result['errors']:
+            self.stdout.write(self.style.ERROR("Validierungsfehler gefunden:"))
+            for error in validation_result['errors']:
+                self.stdout.write(f"  - {error}")
+
+        if validation_result['warnings']:
+            self.stdout.write(self.style.WARNING("Warnungen:"))
+            for warning in validation_result['warnings']:
+                self.stdout.write(f"  - {warning}")
+
+        try:
+            stats = export_service.write_export_file(
+                options['output_file'],
+                export_format=options['format'],
+                billing_cycle=billing_cycle,
+                start_date=start_date,
+                end_date=end_date
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"Export gespeichert: {options['output_file']}")
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Export erfolgreich: {stats['total_items']} Termine, "
+                    f"Gesamtbetrag: {stats['total_amount']:.2f}€, "
+                    f"Zuzahlungen: {stats['total_copayment']:.2f}€"
+                )
+            )
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f"Export-Fehler: {str(e)}")
+            )
+
     def show_gkv_price_info(self):
         """Zeigt Informationen zu GKV-Preisen an"""
         self.stdout.write("GKV-Preise 2023 (gültig ab 01.03.2023):")
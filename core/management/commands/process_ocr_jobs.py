@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.models import OCRJob
+from core.services.ocr_job_service import OCRJobService
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Verarbeitet wartende OCR-Aufträge im Prozesspool (Worker für OCR_JOBS DISPATCH="worker")'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Arbeitet die aktuelle Warteschlange ab und beendet sich danach',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Sekunden zwischen zwei Abfragen der Warteschlange (Standard: 2)',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Löscht nur abgelaufene Aufträge (RESULT_TTL_HOURS) und beendet sich',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted = OCRJobService.purge_expired()
+            self.stdout.write(self.style.SUCCESS(f'✅ {deleted} abgelaufene OCR-Aufträge gelöscht'))
+            return
+
+        config = OCRJobService.get_settings()
+        self.stdout.write(
+            f"🔍 OCR-Worker gestartet ({config['MAX_WORKERS']} Prozesse, "
+            f"{config['CONFIG_WORKERS']} Konfigurationen parallel)"
+        )
+
+        try:
+            while True:
+                OCRJobService.dispatch_pending()
+                close_old_connections()
+
+                if options['once'] and OCRJobService.in_flight() == 0 \
+                        and not OCRJob.objects.filter(status='queued').exists():
+                    break
+
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('⏹ OCR-Worker wird beendet...')
+        finally:
+            OCRJobService.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS('✅ OCR-Worker beendet'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core.services.prescription_chain_service import PrescriptionChainService
+
+
+class Command(BaseCommand):
+    help = 'Baut die denormalisierten Verordnungsketten (Erstverordnung, Position, Sitzungssummen) neu auf'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Anzahl Verordnungen pro Schreibvorgang'
+        )
+
+    def handle(self, *args, **options):
+        updated = PrescriptionChainService.rebuild(batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Verordnungsketten neu aufgebaut: {updated} Verordnungen aktualisiert')
+        )
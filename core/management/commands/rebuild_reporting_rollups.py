@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.services.reporting_rollup_service import ReportingRollupService
+
+
+class Command(BaseCommand):
+    help = 'Baut die Tages-Rollups für Berichte und Finanzauswertungen aus den Rohdaten neu auf (z.B. nächtlich per Cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            choices=list(ReportingRollupService.ROLLUPS),
+            help='Nur diese Rollups neu aufbauen'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Nur die letzten N Tage (und geplante Termine der nächsten N Tage) neu verdichten'
+        )
+        parser.add_argument('--start', help='Erster Tag (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Letzter Tag (YYYY-MM-DD)')
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Anzahl Tage pro Transaktion'
+        )
+
+    @staticmethod
+    def _parse_day(value):
+        if value is None:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Ungültiges Datum: {value} (erwartet YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start_day = self._parse_day(options['start'])
+        end_day = self._parse_day(options['end'])
+        if options['days']:
+            today = timezone.localdate()
+            start_day = start_day or today - timedelta(days=options['days'])
+            end_day = end_day or today + timedelta(days=options['days'])
+        if start_day and end_day and start_day > end_day:
+            raise CommandError('--start liegt nach --end')
+
+        results = ReportingRollupService.rebuild(
+            kinds=options['only'],
+            start_day=start_day,
+            end_day=end_day,
+            chunk_days=max(1, options['chunk_days'])
+        )
+
+        for kind, rows in results.items():
+            self.stdout.write(f'  {kind}: {rows} Zeilen')
+        self.stdout.write(self.style.SUCCESS('Tages-Rollups neu aufgebaut'))
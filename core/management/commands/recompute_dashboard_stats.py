@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.services.dashboard_stats_service import DashboardStatsService
+
+
+class Command(BaseCommand):
+    help = 'Berechnet die materialisierten Dashboard-Statistiken vollständig neu (z.B. alle 15 Minuten per Cron)'
+
+    def handle(self, *args, **options):
+        counter_count = DashboardStatsService.recompute()
+        stats = DashboardStatsService.get_stats()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Dashboard-Statistiken neu berechnet: {counter_count} Zähler, '
+                f'{stats["patients"]["total"]} Patienten, {stats["appointments"]["total"]} Termine'
+            )
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from core.services.prescription_finance_service import PrescriptionFinanceService
+
+
+class Command(BaseCommand):
+    help = 'Gleicht die materialisierten Finanzübersichten der Verordnungen mit einer Neuberechnung ab (z.B. nächtlich per Cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Abweichungen und fehlende Übersichten korrigieren'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Anzahl Verordnungsketten pro Berechnungsschritt'
+        )
+
+    def handle(self, *args, **options):
+        differences = PrescriptionFinanceService.reconcile(fix=options['fix'], batch_size=options['batch_size'])
+
+        for difference in differences[:50]:
+            if difference['field'] == 'missing':
+                self.stdout.write(f"Verordnung {difference['prescription_id']}: Übersicht fehlt")
+            else:
+                self.stdout.write(
+                    f"Verordnung {difference['prescription_id']}: {difference['field']} "
+                    f"gespeichert {difference['stored']}, berechnet {difference['expected']}"
+                )
+        if len(differences) > 50:
+            self.stdout.write(f"... und {len(differences) - 50} weitere Abweichungen")
+
+        prescription_count = len({d['prescription_id'] for d in differences})
+        if not differences:
+            self.stdout.write(self.style.SUCCESS('Finanzübersichten sind konsistent'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'{prescription_count} Finanzübersichten korrigiert'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{prescription_count} Finanzübersichten weichen ab (mit --fix korrigieren)'
+            ))
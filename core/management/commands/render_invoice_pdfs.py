@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from core.services.invoice_pdf_service import INVOICE_TYPES, InvoicePdfService
+from time import perf_counter
+
+class Command(BaseCommand):
+    help = 'Erzeugt die Rechnungs-PDFs eines Abrechnungslaufs im Voraus (z.B. nach dem monatlichen Zuzahlungslauf)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--billing-cycle',
+            type=int,
+            help='Zuzahlungs- und Privatrechnungen dieses Abrechnungszyklus',
+        )
+        parser.add_argument(
+            '--start',
+            help='Rechnungsdatum ab (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--end',
+            help='Rechnungsdatum bis (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--types',
+            default='',
+            help=f"Rechnungsarten, kommagetrennt ({', '.join(INVOICE_TYPES)}; Standard: alle)",
+        )
+
+    def handle(self, *args, **options):
+        start_date = parse_date(options['start']) if options['start'] else None
+        end_date = parse_date(options['end']) if options['end'] else None
+        if options['billing_cycle'] is None and not (start_date and end_date):
+            raise CommandError('Bitte --billing-cycle oder --start und --end angeben')
+
+        types = [name for name in options['types'].split(',') if name]
+        unknown = [name for name in types if name not in INVOICE_TYPES]
+        if unknown:
+            raise CommandError(f"Unbekannte Rechnungsarten: {', '.join(unknown)}")
+
+        invoices = InvoicePdfService.invoices_for_run(
+            billing_cycle_id=options['billing_cycle'],
+            start_date=start_date,
+            end_date=end_date,
+            types=types or None
+        )
+        self.stdout.write(f'🧾 {len(invoices)} Rechnungen gefunden')
+
+        started = perf_counter()
+        try:
+            InvoicePdfService.render(invoices)
+        finally:
+            InvoicePdfService.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(invoices)} Rechnungs-PDFs bereit ({perf_counter() - started:.1f}s)'
+        ))
@@ -0,0 +1,84 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.services.benchmark_service import BenchmarkError, BenchmarkService
+
+
+class Command(BaseCommand):
+    help = 'Misst Laufzeit, Datenbankabfragen und Speicherbedarf der zeitkritischen Pfade und schreibt die Ergebnisse als JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            choices=list(BenchmarkService.benchmarks()),
+            help='Nur diese Benchmarks ausführen'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Durchläufe je Benchmark')
+        parser.add_argument(
+            '--output',
+            help='Pfad der JSON-Datei (Standard: benchmarks/benchmark_<Zeitstempel>.json)'
+        )
+        parser.add_argument('--compare', help='Früheres Ergebnis (JSON) zum Vergleich')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Auch bei DEBUG=False ausführen (niemals auf Produktivdatenbanken)'
+        )
+
+    def _print_result(self, result):
+        if result['status'] != 'ok':
+            self.stdout.write(self.style.ERROR(f"  {result['name']}: {result['error']}"))
+            return
+        self.stdout.write(
+            f"  {result['name']:<18} median {result['median_ms']:>10.1f} ms  "
+            f"{result['queries']:>6} Abfragen ({result['db_ms']:.1f} ms)  "
+            f"Spitze {result['peak_memory_kb']:>10.1f} KiB"
+        )
+        for repeated in result['repeated_queries']:
+            self.stdout.write(self.style.WARNING(f"      {repeated['count']}x {repeated['sql'][:120]}"))
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Nur für Entwicklungsdatenbanken – bei DEBUG=False mit --force bestätigen')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Vergleichsdatei nicht lesbar: {e}')
+
+        try:
+            report = BenchmarkService.run(
+                names=options['only'], repeat=options['repeat'], progress_callback=self._print_result
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        output = options['output'] or os.path.join(
+            'benchmarks', f"benchmark_{timezone.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, default=str)
+
+        if baseline is not None:
+            self.stdout.write('Vergleich (Median):')
+            for row in BenchmarkService.compare(report, baseline):
+                change = f"{row['change_percent']:+.1f} %" if row['change_percent'] is not None else 'n/a'
+                self.stdout.write(
+                    f"  {row['name']:<18} {row['baseline_median_ms']:>10.1f} -> {row['median_ms']:>10.1f} ms "
+                    f"({change}), Abfragen {row['baseline_queries']} -> {row['queries']}"
+                )
+
+        failed = [result['name'] for result in report['results'] if result['status'] != 'ok']
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Fehlgeschlagen: {', '.join(failed)}"))
+        self.stdout.write(self.style.SUCCESS(f'Ergebnisse geschrieben: {output}'))
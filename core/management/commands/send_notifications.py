@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from core.services.email_outbox_service import EmailOutboxService
 from core.services.notification_service import NotificationService
 import logging
 
@@ -27,15 +28,27 @@ class Command(BaseCommand):
             
             # Termin-Erinnerungen
             self.stdout.write('📅 Prüfe Termin-Erinnerungen...')
-            NotificationService.send_appointment_reminders()
+            count = NotificationService.send_appointment_reminders(dry_run=dry_run)
+            self.stdout.write(f'   {count} neue Erinnerungen')
             
             # Verordnungsablauf
             self.stdout.write('📋 Prüfe ablaufende Verordnungen...')
-            NotificationService.check_prescription_expiry()
+            count = NotificationService.check_prescription_expiry(dry_run=dry_run)
+            self.stdout.write(f'   {count} neue Benachrichtigungen')
             
             # No-Show Nachverfolgung
             self.stdout.write('❓ Prüfe No-Show Nachverfolgungen...')
-            NotificationService.check_no_show_followup()
+            count = NotificationService.check_no_show_followup(dry_run=dry_run)
+            self.stdout.write(f'   {count} neue Nachverfolgungen')
+            
+            # Zustellung über das Ausgangspostfach
+            if not dry_run:
+                self.stdout.write('📧 Stelle E-Mails zu...')
+                result = EmailOutboxService.deliver_pending()
+                self.stdout.write(
+                    f"   {result['sent']} gesendet, {result['retried']} erneut eingestellt, "
+                    f"{result['failed']} fehlgeschlagen ({result['messages_per_second']} Nachrichten/s)"
+                )
             
             self.stdout.write(
                 self.style.SUCCESS('✅ Automatische Benachrichtigungen erfolgreich abgeschlossen!')
@@ -1,56 +1,54 @@
 from django.core.management.base import BaseCommand
+from django.db.models import Count
 from django.utils import timezone
 from core.models import Appointment
-from datetime import timedelta
+from core.services.appointment_workflow_service import AppointmentWorkflowService
 
 
 class Command(BaseCommand):
     help = 'Aktualisiert den Status von Terminen basierend auf ihrer Endzeit'
 
+    DRY_RUN_PREVIEW_LIMIT = 50
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Zeigt an, welche Termine geändert würden, ohne sie tatsächlich zu ändern',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=AppointmentWorkflowService.TRANSITION_CHUNK_SIZE,
+            help='Anzahl Termine pro UPDATE-Block',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        chunk_size = options['chunk_size']
         now = timezone.now()
         
-        # Finde alle geplanten Termine, deren Endzeit in der Vergangenheit liegt
-        planned_appointments = Appointment.objects.filter(status='planned')
-        
-        appointments_to_update = []
-        
-        for appointment in planned_appointments:
-            if appointment.appointment_date and appointment.duration_minutes:
-                # Berechne die Endzeit des Termins
-                end_time = appointment.appointment_date + timedelta(minutes=appointment.duration_minutes)
-                
-                # Wenn die Endzeit in der Vergangenheit liegt
-                if end_time < now:
-                    appointments_to_update.append(appointment)
+        # Geplante Termine, deren Endzeit (appointment_date + Dauer) in der Vergangenheit liegt
+        overdue_appointments = AppointmentWorkflowService.get_overdue_planned_appointments(now)
         
         if dry_run:
+            overdue_count = overdue_appointments.count()
             self.stdout.write(
                 self.style.WARNING(
-                    f'DRY RUN: {len(appointments_to_update)} Termine würden auf "completed" gesetzt werden:'
+                    f'DRY RUN: {overdue_count} Termine würden auf "completed" gesetzt werden:'
                 )
             )
-            for appointment in appointments_to_update:
-                end_time = appointment.appointment_date + timedelta(minutes=appointment.duration_minutes)
+            for appointment in overdue_appointments.select_related('patient')[:self.DRY_RUN_PREVIEW_LIMIT]:
                 self.stdout.write(
                     f'  - Termin {appointment.id}: {appointment.patient} am {appointment.appointment_date.strftime("%d.%m.%Y %H:%M")} '
-                    f'(Ende: {end_time.strftime("%d.%m.%Y %H:%M")})'
+                    f'(Ende: {appointment.end_time.strftime("%d.%m.%Y %H:%M")})'
                 )
+            if overdue_count > self.DRY_RUN_PREVIEW_LIMIT:
+                self.stdout.write(f'  ... und {overdue_count - self.DRY_RUN_PREVIEW_LIMIT} weitere')
         else:
-            # Aktualisiere die Termine
-            updated_count = 0
-            for appointment in appointments_to_update:
-                appointment.status = 'completed'
-                appointment.save()
-                updated_count += 1
+            updated_count = AppointmentWorkflowService.bulk_transition(
+                overdue_appointments, 'completed', chunk_size=chunk_size
+            )
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -59,31 +57,20 @@ class Command(BaseCommand):
             )
         
         # Abgeschlossene Termine auf "ready_to_bill" setzen (falls möglich)
-        completed_appointments = Appointment.objects.filter(
-            status='completed'
-        )
-        
-        ready_to_bill_count = 0
-        for appointment in completed_appointments:
-            if appointment.can_be_billed():
-                if dry_run:
-                    self.stdout.write(f"  - Termin {appointment.id} würde auf 'ready_to_bill' gesetzt")
-                else:
-                    appointment.status = 'ready_to_bill'
-                    appointment.save()
-                    ready_to_bill_count += 1
+        billable_appointments = AppointmentWorkflowService.get_billable_completed_appointments(now.date())
         
-        if not dry_run:
+        if dry_run:
+            self.stdout.write(f"  - {billable_appointments.count()} Termine würden auf 'ready_to_bill' gesetzt")
+        else:
+            ready_to_bill_count = AppointmentWorkflowService.bulk_transition(
+                billable_appointments, 'ready_to_bill', chunk_size=chunk_size
+            )
             self.stdout.write(f"✅ {ready_to_bill_count} Termine auf 'ready_to_bill' gesetzt")
         
         # Statistiken
-        stats = {
-            'planned': Appointment.objects.filter(status='planned').count(),
-            'confirmed': Appointment.objects.filter(status='confirmed').count(),
-            'completed': Appointment.objects.filter(status='completed').count(),
-            'ready_to_bill': Appointment.objects.filter(status='ready_to_bill').count(),
-            'billed': Appointment.objects.filter(status='billed').count(),
-        }
+        stats = {status: 0 for status in ['planned', 'confirmed', 'completed', 'ready_to_bill', 'billed']}
+        for row in Appointment.objects.filter(status__in=stats.keys()).values('status').annotate(count=Count('id')):
+            stats[row['status']] = row['count']
         
         self.stdout.write("\n📊 Aktuelle Termin-Statistiken:")
         for status, count in stats.items():
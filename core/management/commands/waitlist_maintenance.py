@@ -60,6 +60,8 @@ class Command(BaseCommand):
                 )
             else:
                 self.stdout.write('DRY RUN: Wartung würde durchgeführt werden...')
+                offered_count = WaitlistService.offer_appointments_to_waitlist(dry_run=True)
+                self.stdout.write(f"  • {offered_count} Termine würden angeboten")
             
         except Exception as e:
             self.stdout.write(
@@ -0,0 +1,146 @@
+"""
+Performance-Middleware für Requests.
+
+Misst jede Anfrage mit perf_counter und meldet langsame Anfragen über
+PerformanceMonitor.log_slow_request. Ein Anteil der Anfragen (PERFORMANCE_MONITORING
+['SAMPLE_RATE']) wird zusätzlich detailliert erfasst: Über connection.execute_wrapper
+werden Anzahl und Dauer der Datenbankabfragen gemessen (funktioniert auch ohne DEBUG,
+anders als connection.queries), die SQL-Texte auf einen Fingerabdruck normalisiert, um
+N+1-Muster zu erkennen, und die Latenz je Route in ein Histogramm einsortiert.
+
+Ohne Sampling bleibt pro Anfrage nur die Zeitmessung; der Server-Timing-Header
+(app bzw. db) ist per SERVER_TIMING abschaltbar.
+"""
+
+import logging
+import random
+import re
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core.services.error_service import PerformanceMonitor
+from core.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.0,  # Anteil der detailliert erfassten Anfragen (0.0 - 1.0)
+    'SERVER_TIMING': False,
+    'N_PLUS_ONE_THRESHOLD': 10,  # gleiche Abfrage so oft pro Anfrage -> Warnung
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_sql(sql: str) -> str:
+    """
+    Normalisiert SQL auf seine Struktur: Literale und Platzhalter werden zu ?, IN-Listen
+    beliebiger Länge zu IN (...). Abfragen, die sich nur in den Parametern unterscheiden,
+    erhalten denselben Fingerabdruck.
+    """
+    normalized = _STRING_LITERAL.sub('?', sql)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _IN_LIST.sub('IN (...)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+class QueryCollector:
+    """execute_wrapper: zählt und misst Abfragen und sammelt deren Fingerabdrücke"""
+
+    __slots__ = ('count', 'duration', 'fingerprints')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint_sql(sql)] += 1
+
+    def repeated(self, threshold: int):
+        """Fingerabdrücke, die mindestens threshold-mal ausgeführt wurden"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+class RequestPerformanceMiddleware:
+    """Zeitmessung, Abfrage-Profiling (gesampelt) und Server-Timing-Header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = {**DEFAULT_SETTINGS, **getattr(settings, 'PERFORMANCE_MONITORING', {})}
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.sample_rate = float(self.config['SAMPLE_RATE'])
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def __call__(self, request):
+        start = perf_counter()
+        collector = None
+
+        if self._sampled():
+            collector = QueryCollector()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(collector))
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        duration = perf_counter() - start
+        PerformanceMonitor.log_slow_request(request, duration)
+        if collector is not None:
+            self._record(request, duration, collector)
+        if self.config['SERVER_TIMING']:
+            self._add_server_timing(response, duration, collector)
+        return response
+
+    @staticmethod
+    def endpoint(request) -> str:
+        """URL-Name statt Pfad, damit IDs die Anzahl der Histogramme nicht aufblähen"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            name = 'unresolved'
+        else:
+            name = match.view_name or f'/{match.route}'
+        return f'{request.method} {name}'
+
+    def _record(self, request, duration: float, collector: QueryCollector) -> None:
+        endpoint = self.endpoint(request)
+        metrics.observe(f'request:{endpoint}', duration * 1000)
+        metrics.observe(f'request_db:{endpoint}', collector.duration * 1000)
+
+        PerformanceMonitor.log_database_query_count(request, collector.count)
+        for sql, count in collector.repeated(self.config['N_PLUS_ONE_THRESHOLD']):
+            logger.warning(
+                f"Mögliches N+1-Muster: {endpoint} führte dieselbe Abfrage {count}x aus: {sql[:300]}",
+                extra={'request_path': request.path, 'query_count': count, 'fingerprint': sql}
+            )
+
+    @staticmethod
+    def _add_server_timing(response, duration: float, collector) -> None:
+        entries = [f'app;dur={duration * 1000:.1f}']
+        if collector is not None:
+            entries.append(f'db;dur={collector.duration * 1000:.1f};desc="{collector.count} queries"')
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join([existing, *entries] if existing else entries)
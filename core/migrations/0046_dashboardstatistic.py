@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_user_initials_alter_patient_email_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('computed_at', models.DateTimeField(blank=True, help_text='Zeitpunkt der letzten vollständigen Neuberechnung', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dashboard-Kennzahl',
+                'verbose_name_plural': 'Dashboard-Kennzahlen',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_ocrjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'id'], name='core_appoin_appoint_7f504a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='core_auditl_timesta_3238cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billingcycle',
+            index=models.Index(fields=['start_date', 'id'], name='core_billin_start_d_ae8635_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at', 'id'], name='core_patien_created_866197_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'id'], name='core_paymen_payment_9fd906_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['created_at', 'id'], name='core_prescr_created_d069fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlist',
+            index=models.Index(fields=['created_at', 'id'], name='core_waitli_created_d18d46_idx'),
+        ),
+    ]
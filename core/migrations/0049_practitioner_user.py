@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-17 14:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_therapists_to_practitioners(apps, schema_editor):
+    """Verknüpft Therapeuten mit dem Behandler gleichen Namens (bisherige Zuordnung)"""
+    User = apps.get_model('core', 'User')
+    Practitioner = apps.get_model('core', 'Practitioner')
+
+    linked = 0
+    for user in User.objects.filter(is_therapist=True).order_by('id'):
+        practitioner = Practitioner.objects.filter(
+            first_name=user.first_name,
+            last_name=user.last_name,
+            user__isnull=True
+        ).order_by('id').first()
+        if practitioner:
+            practitioner.user = user
+            practitioner.save(update_fields=['user'])
+            linked += 1
+
+    print(f"✅ {linked} Therapeuten mit Behandlern verknüpft")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='practitioner',
+            name='user',
+            field=models.OneToOneField(blank=True, help_text='Benutzerkonto des Behandlers; bestimmt, welche Termine und Patienten ein Therapeut sieht', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='practitioner_profile', to=settings.AUTH_USER_MODEL, verbose_name='Benutzerkonto'),
+        ),
+        migrations.RunPython(link_therapists_to_practitioners, migrations.RunPython.noop),
+    ]
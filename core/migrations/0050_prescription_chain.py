@@ -0,0 +1,39 @@
+# Generated by Django 5.1.5 on 2026-10-17 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0049_practitioner_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='chain_completed_sessions',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Abgeschlossene Sitzungen der Kette'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='chain_last_position',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Letzte Position der Kette'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='chain_position',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='0 für die Erstverordnung, sonst Nummer der Folgeverordnung', verbose_name='Position in der Kette'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='chain_root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chain_prescriptions', to='core.prescription', verbose_name='Erstverordnung der Kette'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='chain_total_sessions',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Sitzungen der Kette'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-17 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0050_prescription_chain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionFinancialSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billed_amount', models.DecimalField(decimal_places=2, default=0, help_text='Summe der BillingItems dieser Verordnung', max_digits=12)),
+                ('expected_amount', models.DecimalField(decimal_places=2, default=0, help_text='Abrechnungsbereite, noch nicht abgerechnete Termine der Verordnungskette', max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, help_text='Summe der Zahlungszuordnungen dieser Verordnung', max_digits=12)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, help_text='Offener Betrag (erwartet abzüglich bezahlt)', max_digits=12)),
+                ('computed_at', models.DateTimeField(blank=True, help_text='Zeitpunkt der letzten Berechnung', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('prescription', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='financial_summary', to='core.prescription')),
+            ],
+            options={
+                'verbose_name': 'Finanzübersicht Verordnung',
+                'verbose_name_plural': 'Finanzübersichten Verordnungen',
+                'indexes': [models.Index(fields=['outstanding_amount'], name='core_prescr_outstan_41f31a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-17 17:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0051_prescriptionfinancialsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('appointment_count', models.PositiveIntegerField(default=0)),
+                ('duration_minutes', models.PositiveIntegerField(default=0, help_text='Summe der Termindauern')),
+                ('insurance_group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.insuranceprovidergroup')),
+                ('practitioner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.practitioner')),
+                ('treatment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.treatment')),
+            ],
+            options={
+                'verbose_name': 'Tagesstatistik Termine',
+                'verbose_name_plural': 'Tagesstatistiken Termine',
+                'indexes': [models.Index(fields=['day', 'status'], name='core_dailya_day_c6bf2b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBillingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('billing_type', models.CharField(choices=[('gkv', 'GKV'), ('private', 'Privat'), ('self_pay', 'Selbstzahler'), ('other', 'Sonstige')], max_length=10)),
+                ('is_billed', models.BooleanField(default=False)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('insurance_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('patient_copay', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('insurance_group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.insuranceprovidergroup')),
+                ('practitioner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.practitioner')),
+                ('treatment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.treatment')),
+            ],
+            options={
+                'verbose_name': 'Tagesstatistik Abrechnung',
+                'verbose_name_plural': 'Tagesstatistiken Abrechnung',
+                'indexes': [models.Index(fields=['day', 'billing_type'], name='core_dailyb_day_c6f835_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyInvoiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Tagesstatistik Rechnungen',
+                'verbose_name_plural': 'Tagesstatistiken Rechnungen',
+                'indexes': [models.Index(fields=['day', 'status'], name='core_dailyi_day_81c844_idx')],
+            },
+        ),
+    ]
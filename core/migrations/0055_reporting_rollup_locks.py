@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-17 21:00
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+ROLLUP_DIMENSIONS = {
+    'DailyAppointmentRollup': ['day', 'practitioner_id', 'treatment_id', 'insurance_group_id', 'status'],
+    'DailyBillingRollup': [
+        'day', 'practitioner_id', 'treatment_id', 'insurance_group_id', 'billing_type', 'is_billed'
+    ],
+    'DailyInvoiceRollup': ['day', 'status'],
+}
+
+
+def remove_duplicate_rollup_rows(apps, schema_editor):
+    """
+    Doppelte Zeilen (gleichzeitige Aktualisierungen desselben Tages) vor dem Unique-Constraint
+    entfernen; jede Zeile enthält die vollständige Verdichtung, daher bleibt die jüngste stehen.
+    """
+    for model_name, dimensions in ROLLUP_DIMENSIONS.items():
+        model = apps.get_model('core', model_name)
+        duplicates = model.objects.values(*dimensions).annotate(
+            rows=Count('id'), keep_id=Max('id')
+        ).filter(rows__gt=1).order_by()
+        for group in duplicates:
+            keep_id = group.pop('keep_id')
+            group.pop('rows')
+            model.objects.filter(**group).exclude(id=keep_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0054_ocrjob_claim_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportingRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tages-Rollup Aktualisierung',
+                'verbose_name_plural': 'Tages-Rollup Aktualisierungen',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'day'), name='unique_reporting_rollup_day')],
+            },
+        ),
+        migrations.RunPython(remove_duplicate_rollup_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyappointmentrollup',
+            constraint=models.UniqueConstraint(models.F('day'), django.db.models.functions.comparison.Coalesce('practitioner', 0), django.db.models.functions.comparison.Coalesce('treatment', 0), django.db.models.functions.comparison.Coalesce('insurance_group', 0), models.F('status'), name='unique_daily_appointment_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailybillingrollup',
+            constraint=models.UniqueConstraint(models.F('day'), django.db.models.functions.comparison.Coalesce('practitioner', 0), django.db.models.functions.comparison.Coalesce('treatment', 0), django.db.models.functions.comparison.Coalesce('insurance_group', 0), models.F('billing_type'), models.F('is_billed'), name='unique_daily_billing_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyinvoicerollup',
+            constraint=models.UniqueConstraint(fields=('day', 'status'), name='unique_daily_invoice_rollup'),
+        ),
+    ]
@@ -1,13 +1,15 @@
-from django.db import models
+import uuid
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.timezone import now, make_aware
 from datetime import datetime, date, timedelta
+from decimal import Decimal
 from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from core.appointment_validators import (
-    validate_conflict_for_appointment,
     validate_appointment_conflicts,
     validate_working_hours
 )
@@ -20,7 +22,6 @@ from .validators import (
     validate_patient_age, validate_insurance_validity,
     validate_prescription_dates, validate_billing_amount,
     validate_working_hours as validate_working_hours_custom,
-    validate_room_availability, validate_practitioner_availability,
     validate_patient_insurance_overlap, validate_treatment_legs_codes,
     validate_icd_code, PhoneNumberField, EmailField, PostalCodeField,
     InsuranceNumberField, TaxNumberField, InstitutionCodeField, HexColorField
@@ -256,72 +257,33 @@ class User(AbstractUser):
         if self.is_superuser:
             self.is_admin = True
         super().save(*args, **kwargs)
+        # Rolle oder Admin-Status können sich geändert haben: Matrix und Sichtbarkeit neu auflösen
+        self.__dict__.pop('_permission_matrix', None)
+        self.__dict__.pop('_therapist_scope', None)
 
     def has_module_permission(self, module_name, required_permission='read'):
         """Prüft ob Benutzer die erforderliche Berechtigung für ein Modul hat"""
         # Admin-Override: Admins haben alle Rechte
         if self.is_superuser or self.is_admin:
             return True
-            
-        # Prüfe individuelle Modul-Berechtigungen
-        try:
-            module_perm = self.module_permissions.get(module=module_name, is_active=True)
-            if module_perm and module_perm.is_valid():
-                return module_perm.has_permission(required_permission)
-        except ModulePermission.DoesNotExist:
-            pass
-            
-        # Fallback: Prüfe alte Berechtigungsfelder
-        if hasattr(self, f'can_access_{module_name}'):
-            return getattr(self, f'can_access_{module_name}', False)
-            
-        # Fallback: Prüfe Rollen-Berechtigungen
-        if self.role and self.role.permissions:
-            return self.role.permissions.get(module_name, False)
-            
-        return False
+        
+        # Individuelle Modul-Berechtigungen, alte Berechtigungsfelder und Rolle
+        # werden aus der gecachten Berechtigungsmatrix ausgewertet
+        from core.services.permission_service import PermissionMatrixService
+        return PermissionMatrixService.get(self).has_permission(self, module_name, required_permission)
 
     def get_effective_permissions(self):
         """Gibt alle effektiven Berechtigungen zurück"""
-        permissions = {}
-        
-        # Alle verfügbaren Module
-        module_choices = ModulePermission.MODULE_CHOICES
-        
-        for module_code, module_name in module_choices:
-            # Bestimme das höchste Berechtigungslevel
-            permission_level = 'none'
-            if self.has_module_permission(module_code, 'full'):
-                permission_level = 'full'
-            elif self.has_module_permission(module_code, 'delete'):
-                permission_level = 'delete'
-            elif self.has_module_permission(module_code, 'update'):
-                permission_level = 'update'
-            elif self.has_module_permission(module_code, 'create'):
-                permission_level = 'create'
-            elif self.has_module_permission(module_code, 'read'):
-                permission_level = 'read'
-            
-            permissions[module_code] = {
-                'permission': permission_level,
-                'name': module_name
-            }
-            
-        return permissions
+        from core.services.permission_service import PermissionMatrixService
+        return PermissionMatrixService.effective_permissions(self, ModulePermission.MODULE_CHOICES)
     
     def get_module_permission_level(self, module_name):
         """Gibt das Berechtigungslevel für ein Modul zurück"""
         if self.is_superuser or self.is_admin:
             return 'full'
-            
-        try:
-            module_perm = self.module_permissions.get(module=module_name, is_active=True)
-            if module_perm and module_perm.is_valid():
-                return module_perm.permission
-        except ModulePermission.DoesNotExist:
-            pass
-            
-        return 'none'
+        
+        from core.services.permission_service import PermissionMatrixService
+        return PermissionMatrixService.get(self).permission_level(module_name)
     
     def grant_module_permission(self, module_name, permission_level, granted_by=None, expires_at=None):
         """Erteilt eine Modul-Berechtigung"""
@@ -343,14 +305,20 @@ class User(AbstractUser):
             module_perm.is_active = True
             module_perm.save()
         
+        # Versionsmarke der Berechtigungsmatrix erhöhen
+        from core.services.permission_service import PermissionMatrixService
+        PermissionMatrixService.invalidate(self.pk, self)
+        
         return module_perm
     
     def revoke_module_permission(self, module_name):
         """Entzieht eine Modul-Berechtigung"""
+        from core.services.permission_service import PermissionMatrixService
         try:
             module_perm = self.module_permissions.get(module=module_name)
             module_perm.is_active = False
             module_perm.save()
+            PermissionMatrixService.invalidate(self.pk, self)
             return True
         except ModulePermission.DoesNotExist:
             return False
@@ -431,6 +399,11 @@ class Patient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
@@ -743,6 +716,15 @@ class Practitioner(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     email = models.EmailField(unique=True, null=True, blank=True)  # Optional gemacht
+    user = models.OneToOneField(
+        'User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='practitioner_profile',
+        verbose_name="Benutzerkonto",
+        help_text="Benutzerkonto des Behandlers; bestimmt, welche Termine und Patienten ein Therapeut sieht"
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -914,19 +896,15 @@ class Treatment(models.Model):
 
     def get_price_for_insurance_group(self, insurance_group):
         """Gibt den Preis für eine bestimmte Versicherungsgruppe zurück"""
-        try:
-            surcharge = Surcharge.objects.get(
-                treatment=self,
-                insurance_provider_group=insurance_group,
-                valid_from__lte=timezone.now().date(),
-                valid_until__gte=timezone.now().date()
-            )
-            return {
-                'insurance_amount': surcharge.insurance_payment,
-                'patient_copay': surcharge.patient_payment
-            }
-        except Surcharge.DoesNotExist:
+        from core.services.price_resolver import PriceResolver
+
+        surcharge = PriceResolver.get_surcharge(self, insurance_group, timezone.now().date())
+        if surcharge is None:
             return None
+        return {
+            'insurance_amount': surcharge.insurance_payment,
+            'patient_copay': surcharge.patient_payment
+        }
 
     def get_self_pay_price(self):
         """Gibt den Selbstzahler-Preis zurück"""
@@ -1124,6 +1102,9 @@ class BillingCycle(models.Model):
     class Meta:
         verbose_name = "Abrechnungszyklus"
         verbose_name_plural = "Abrechnungszyklen"
+        indexes = [
+            models.Index(fields=['start_date', 'id']),
+        ]
 
 # DiagnosisGroup Model
 class DiagnosisGroup(models.Model):
@@ -1192,6 +1173,38 @@ class Prescription(models.Model):
         verbose_name="Folgeverordnungsnummer",
         help_text="Nummer der Folgeverordnung (1, 2, 3, ...)"
     )
+
+    # Denormalisierte Verordnungskette (gepflegt vom PrescriptionChainService)
+    chain_root = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='chain_prescriptions',
+        verbose_name="Erstverordnung der Kette"
+    )
+    chain_position = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Position in der Kette",
+        help_text="0 für die Erstverordnung, sonst Nummer der Folgeverordnung"
+    )
+    chain_total_sessions = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Sitzungen der Kette"
+    )
+    chain_completed_sessions = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Abgeschlossene Sitzungen der Kette"
+    )
+    chain_last_position = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Letzte Position der Kette"
+    )
     
     # ICD-10 Diagnose
     diagnosis_code = models.ForeignKey(
@@ -1291,36 +1304,52 @@ class Prescription(models.Model):
             )['max_num'] or 0
             self.follow_up_number = max_follow_up + 1
 
-    def get_root_prescription(self, depth=0):
+    # Felder, deren Änderung die Kettensummen betrifft
+    CHAIN_FIELDS = ('original_prescription_id', 'number_of_sessions', 'sessions_completed')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._chain_state = instance._get_chain_state()
+        instance._stored_status = instance.__dict__.get('status')
+        return instance
+
+    def _get_chain_state(self):
+        return tuple(self.__dict__.get(field) for field in self.CHAIN_FIELDS)
+
+    def _chain_is_stale(self):
+        return self.chain_root_id is None or getattr(self, '_chain_state', None) != self._get_chain_state()
+
+    def get_root_prescription(self):
         """Gibt die ursprüngliche Verordnung zurück (auch bei Folgeverordnungen)"""
-        # Verhindere unendliche Rekursion
-        if depth > 10:
-            raise ValidationError("Maximale Rekursionstiefe für Folgeverordnungen erreicht. Möglicherweise gibt es zirkuläre Referenzen.")
-        
-        if self.original_prescription:
-            return self.original_prescription.get_root_prescription(depth + 1)
-        return self
+        if self.pk and self.chain_root_id is None:
+            self._sync_chain()
+        if self.chain_root_id is None or self.chain_root_id == self.pk:
+            return self
+        return self.chain_root
 
     def get_all_follow_ups(self):
-        """Gibt alle Folgeverordnungen zurück (inklusive dieser Verordnung)"""
+        """Gibt alle Verordnungen der Kette zurück (Erstverordnung zuerst, inklusive dieser Verordnung)"""
         root = self.get_root_prescription()
-        follow_ups = [root]
-        follow_ups.extend(root.follow_up_prescriptions.order_by('follow_up_number'))
-        return follow_ups
+        if not root.pk:
+            return [root]
+        return list(Prescription.objects.filter(chain_root_id=root.pk).order_by('chain_position', 'id'))
 
     def get_total_sessions_across_all_prescriptions(self):
         """Gibt die Gesamtanzahl der Sitzungen über alle Verordnungen hinweg zurück"""
-        total = 0
-        for prescription in self.get_all_follow_ups():
-            total += prescription.number_of_sessions
-        return total
+        if not self.pk:
+            return self.number_of_sessions
+        if self.chain_root_id is None:
+            self._sync_chain()
+        return self.chain_total_sessions
 
     def get_total_completed_sessions_across_all_prescriptions(self):
         """Gibt die Gesamtanzahl der abgeschlossenen Sitzungen über alle Verordnungen hinweg zurück"""
-        total = 0
-        for prescription in self.get_all_follow_ups():
-            total += prescription.sessions_completed
-        return total
+        if not self.pk:
+            return self.sessions_completed
+        if self.chain_root_id is None:
+            self._sync_chain()
+        return self.chain_completed_sessions
 
     def get_remaining_sessions(self):
         """Gibt die verbleibenden Sitzungen über alle Verordnungen hinweg zurück"""
@@ -1328,17 +1357,21 @@ class Prescription(models.Model):
 
     def can_create_follow_up(self):
         """Prüft ob eine Folgeverordnung erstellt werden kann"""
-        # Nur ursprüngliche Verordnungen oder letzte Folgeverordnung können verlängert werden
-        if self.is_follow_up:
-            # Prüfe ob dies die letzte Folgeverordnung ist
-            root = self.get_root_prescription()
-            max_follow_up = root.follow_up_prescriptions.aggregate(
-                max_num=models.Max('follow_up_number')
-            )['max_num'] or 0
-            return self.follow_up_number == max_follow_up
-        else:
-            # Ursprüngliche Verordnung kann verlängert werden
+        # Ursprüngliche Verordnung kann immer verlängert werden
+        if not self.is_follow_up:
             return True
+        # Sonst nur die letzte Folgeverordnung der Kette
+        if self.chain_root_id is None:
+            self._sync_chain()
+        return self.chain_position == self.chain_last_position
+
+    def _sync_chain(self):
+        """Kette nachträglich zuordnen (noch nicht per rebuild_prescription_chains befüllt)"""
+        from core.services.prescription_chain_service import PrescriptionChainService
+
+        with transaction.atomic():
+            PrescriptionChainService.sync(self)
+        self._chain_state = self._get_chain_state()
 
     def create_follow_up_prescription(self, **kwargs):
         """Erstellt eine neue Folgeverordnung"""
@@ -1369,38 +1402,37 @@ class Prescription(models.Model):
         # Überschreibe mit übergebenen Werten
         follow_up_data.update(kwargs)
         
-        # Folgeverordnungsnummer automatisch setzen
-        root = self.get_root_prescription()
-        max_follow_up = root.follow_up_prescriptions.aggregate(
-            max_num=models.Max('follow_up_number')
-        )['max_num'] or 0
-        follow_up_data['follow_up_number'] = max_follow_up + 1
+        # Folgeverordnungsnummer und Kettensummen setzt save()
+        follow_up_data['follow_up_number'] = 0
         
         return Prescription.objects.create(**follow_up_data)
 
     def get_all_appointments(self):
         """Gibt alle Termine über alle Verordnungen hinweg zurück"""
-        appointments = []
-        for prescription in self.get_all_follow_ups():
-            appointments.extend(prescription.appointments.all())
-        return appointments
+        prescription_ids = [prescription.id for prescription in self.get_all_follow_ups()]
+        return list(
+            Appointment.objects.filter(prescription_id__in=prescription_ids)
+            .select_related('treatment', 'prescription__patient_insurance__insurance_provider')
+            .order_by('appointment_date')
+        )
+
+    def get_financial_summary(self):
+        """Materialisierte Finanzübersicht (wird bei Bedarf berechnet)"""
+        from core.services.prescription_finance_service import PrescriptionFinanceService
+
+        return PrescriptionFinanceService.get_summary(self)
 
     def get_total_amount(self):
         """Gibt den Gesamtbetrag der Verordnung zurück"""
-        total = Decimal('0.00')
-        for appointment in self.get_all_appointments():
-            billing_amount = appointment.get_billing_amount()
-            if billing_amount:
-                total += billing_amount['insurance_amount'] + billing_amount['patient_copay']
-        return total
+        return self.get_financial_summary().expected_amount
 
     def get_paid_amount(self):
         """Gibt den bereits bezahlten Betrag zurück"""
-        return self.payment_allocations.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        return self.get_financial_summary().paid_amount
 
     def get_remaining_amount(self):
         """Gibt den verbleibenden Betrag zurück"""
-        return self.get_total_amount() - self.get_paid_amount()
+        return self.get_financial_summary().outstanding_amount
 
     def is_fully_paid(self):
         """Prüft ob die Verordnung vollständig bezahlt ist"""
@@ -1410,15 +1442,33 @@ class Prescription(models.Model):
         if self.diagnosis_code and not self.diagnosis_text:
             self.diagnosis_text = f"{self.diagnosis_code.code} - {self.diagnosis_code.title}"
         
-        # Folgeverordnungsnummer automatisch setzen
-        if self.is_follow_up and self.original_prescription and self.follow_up_number == 0:
-            root = self.get_root_prescription()
-            max_follow_up = root.follow_up_prescriptions.aggregate(
-                max_num=models.Max('follow_up_number')
-            )['max_num'] or 0
-            self.follow_up_number = max_follow_up + 1
-        
-        super().save(*args, **kwargs)
+        from core.services.prescription_chain_service import PrescriptionChainService
+
+        is_new = self._state.adding or self.pk is None
+
+        with transaction.atomic():
+            # Folgeverordnungsnummer automatisch setzen
+            # (unter Sperre der Kette, damit gleichzeitige Folgeverordnungen verschiedene Nummern erhalten)
+            if self.is_follow_up and self.original_prescription_id and self.follow_up_number == 0:
+                root_id = PrescriptionChainService.resolve_root_id(self)
+                PrescriptionChainService.lock_chains(root_id)
+                self.follow_up_number = PrescriptionChainService.next_follow_up_number(root_id)
+
+            super().save(*args, **kwargs)
+
+            # Kette zuordnen und Summen aktualisieren (neu angelegt, Ursprung oder Sitzungen geändert)
+            moved_from = None
+            if is_new or self._chain_is_stale():
+                moved_from = PrescriptionChainService.sync(self)
+
+            # Neue Folgeverordnungen übernehmen den erwarteten Betrag ihrer Kette; beim
+            # Kettenwechsel ändern sich neue und bisherige Kette
+            if moved_from is not None or (is_new and self.is_follow_up):
+                from core.services.prescription_finance_service import PrescriptionFinanceService
+                PrescriptionFinanceService.guarded(
+                    PrescriptionFinanceService.refresh, f"Verordnung {self.pk}", [self.pk, moved_from]
+                )
+        self._chain_state = self._get_chain_state()
 
     def __str__(self):
         if self.is_follow_up:
@@ -1427,6 +1477,9 @@ class Prescription(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
 
     def get_all_treatments(self):
         """Gibt alle Behandlungen der Verordnung zurück"""
@@ -1568,6 +1621,7 @@ class Appointment(models.Model):
             models.Index(fields=['series_identifier']),
             models.Index(fields=['created_at']),
             models.Index(fields=['prescription_id']),
+            models.Index(fields=['appointment_date', 'id']),
         ]
         ordering = ['appointment_date']
         verbose_name = "Termin"
@@ -1582,34 +1636,14 @@ class Appointment(models.Model):
         if self.duration_minutes:
             validate_appointment_duration(self.duration_minutes)
         
-        # Prüfe ob der Behandler verfügbar ist
-        if self.practitioner and self.appointment_date:
-            conflicts = validate_conflict_for_appointment(self)
-            if conflicts:
-                raise ValidationError(f"Terminkonflikt mit Behandler: {conflicts}")
-            
-            # Zusätzliche Verfügbarkeitsprüfung
-            end_time = self.appointment_date + timedelta(minutes=self.duration_minutes)
-            validate_practitioner_availability(
-                self.practitioner, 
-                self.appointment_date, 
-                end_time, 
-                self.id
-            )
+        # Prüfe Überschneidungen bei Behandler und Raum (eine Abfrage für beide)
+        if self.appointment_date and (self.practitioner_id or self.room_id):
+            validate_appointment_conflicts(self)
         
-        # Prüfe ob der Raum verfügbar ist (falls angegeben)
+        # Prüfe ob der Raum geöffnet ist (falls angegeben)
         if self.room and self.appointment_date:
             if not self.room.is_available_at(self.appointment_date):
                 raise ValidationError(f"Raum {self.room.name} ist zum gewählten Zeitpunkt nicht verfügbar.")
-            
-            # Zusätzliche Raumverfügbarkeitsprüfung
-            end_time = self.appointment_date + timedelta(minutes=self.duration_minutes)
-            validate_room_availability(
-                self.room, 
-                self.appointment_date, 
-                end_time, 
-                self.id
-            )
         
         # Prüfe Terminserien-Logik: Eine Verordnung pro Serie
         if self.series_identifier and self.prescription:
@@ -1654,10 +1688,14 @@ class Appointment(models.Model):
             not self.billing_items.exists()):
             self.status = 'ready_to_bill'
 
+        # Gespeicherter Stand für die Finanzübersicht (siehe remember_appointment_billing_state)
+        self._stored_billing_state = None
+
         # Automatische Wartelisten-Eintragung bei Terminabsagen
         if self.pk:  # Nur bei bestehenden Terminen
             try:
                 old_instance = Appointment.objects.get(pk=self.pk)
+                self._stored_billing_state = (old_instance.status, old_instance.prescription_id)
                 if (old_instance.status != 'cancelled' and 
                     self.status == 'cancelled' and
                     self.prescription):  # Nur bei Terminen mit Verordnung
@@ -1705,70 +1743,29 @@ class Appointment(models.Model):
         """Gibt den Abrechnungsbetrag für den Termin zurück"""
         if not self.can_be_billed():
             return None
-        
-        appointment_date = self.appointment_date.date()
-        
-        # Wenn Verordnung vorhanden, verwende Surcharge (kassengruppenspezifisch) oder TreatmentPrice als Fallback
-        if self.prescription and self.prescription.patient_insurance:
-            # 1. Versuche Surcharge (kassengruppenspezifische Preise)
-            try:
-                surcharge = Surcharge.objects.get(
-                    treatment=self.treatment,
-                    insurance_provider_group=self.prescription.patient_insurance.insurance_provider.group,
-                    valid_from__lte=appointment_date,
-                    valid_until__gte=appointment_date
-                )
-                return {
-                    'insurance_amount': surcharge.insurance_payment,
-                    'patient_copay': surcharge.patient_payment
-                }
-            except Surcharge.DoesNotExist:
-                pass
-            
-            # 2. Fallback: TreatmentPrice (Basispreise)
-            try:
-                from .models import TreatmentPrice, PriceList
-                treatment_price = TreatmentPrice.objects.filter(
-                    treatment=self.treatment,
-                    price_list__valid_from__lte=appointment_date,
-                    is_active=True
-                ).filter(
-                    models.Q(price_list__valid_until__isnull=True) | models.Q(price_list__valid_until__gte=appointment_date)
-                ).first()
-                
-                if treatment_price:
-                    return {
-                        'insurance_amount': treatment_price.gkv_price or Decimal('0.00'),
-                        'patient_copay': treatment_price.copayment_amount or Decimal('0.00')
-                    }
-            except Exception:
-                pass
-        
-        # Ohne Verordnung: Selbstzahler-Preis
-        # 1. Versuche TreatmentPrice
-        try:
-            from .models import TreatmentPrice, PriceList
-            treatment_price = TreatmentPrice.objects.filter(
-                treatment=self.treatment,
-                price_list__valid_from__lte=appointment_date,
-                is_active=True
-            ).filter(
-                models.Q(price_list__valid_until__isnull=True) | models.Q(price_list__valid_until__gte=appointment_date)
-            ).first()
-            
-            if treatment_price and treatment_price.self_pay_price:
-                return {
-                    'insurance_amount': Decimal('0.00'),
-                    'patient_copay': treatment_price.self_pay_price
-                }
-        except Exception:
-            pass
-        
-        # 2. Fallback: Treatment.self_pay_price (deprecated)
-        return {
-            'insurance_amount': Decimal('0.00'),
-            'patient_copay': self.treatment.self_pay_price if hasattr(self.treatment, 'self_pay_price') else Decimal('0.00')
-        }
+        return self.calculate_billing_amount()
+
+    def calculate_billing_amount(self):
+        """
+        Berechnet den Abrechnungsbetrag ohne Abrechenbarkeitsprüfung.
+
+        Mit Verordnung: Surcharge der Kassengruppe, Fallback TreatmentPrice (GKV-Preis/Zuzahlung).
+        Ohne Verordnung: Selbstzahler-Preis aus TreatmentPrice bzw. Treatment.self_pay_price.
+        Die Preise werden über den PriceResolver ohne weitere Datenbankabfragen ermittelt.
+        """
+        from core.services.price_resolver import PriceResolver
+
+        insurance_group = None
+        with_prescription = bool(self.prescription and self.prescription.patient_insurance)
+        if with_prescription:
+            insurance_group = self.prescription.patient_insurance.insurance_provider.group_id
+
+        return PriceResolver.resolve_billing_amount(
+            self.treatment,
+            self.appointment_date.date(),
+            insurance_provider_group=insurance_group,
+            with_prescription=with_prescription
+        )
 
     def mark_as_ready_to_bill(self):
         """Markiert den Termin als abrechnungsbereit"""
@@ -1858,6 +1855,7 @@ class AuditLog(models.Model):
             models.Index(fields=['model_name', 'object_id']),
             models.Index(fields=['user', 'timestamp']),
             models.Index(fields=['timestamp']),
+            models.Index(fields=['timestamp', 'id']),
         ]
 
     def __str__(self):
@@ -2274,17 +2272,18 @@ class BillingItem(models.Model):
         """Berechnet die Beträge basierend auf der Surcharge oder dem Selbstzahler-Preis"""
         if self.prescription and self.prescription.patient_insurance:
             # Mit Verordnung: Verwende Surcharge
-            try:
-                surcharge = Surcharge.objects.get(
-                    treatment=self.treatment,
-                    insurance_provider_group=self.prescription.patient_insurance.insurance_provider.group,
-                    valid_from__lte=self.appointment.appointment_date.date(),
-                    valid_until__gte=self.appointment.appointment_date.date()
-                )
-                self.insurance_amount = surcharge.insurance_payment
-                self.patient_copay = surcharge.patient_payment
-            except Surcharge.DoesNotExist:
-                raise ValidationError(f"Keine Preiskonfiguration gefunden für {self.treatment} und {self.prescription.patient_insurance.insurance_provider.group}")
+            from core.services.price_resolver import PriceResolver
+
+            insurance_provider = self.prescription.patient_insurance.insurance_provider
+            surcharge = PriceResolver.get_surcharge(
+                self.treatment,
+                insurance_provider.group_id,
+                self.appointment.appointment_date.date()
+            )
+            if surcharge is None:
+                raise ValidationError(f"Keine Preiskonfiguration gefunden für {self.treatment} und {insurance_provider.group}")
+            self.insurance_amount = surcharge.insurance_payment
+            self.patient_copay = surcharge.patient_payment
         else:
             # Ohne Verordnung: Selbstzahler-Preis
             if not self.treatment.is_self_pay or not self.treatment.self_pay_price:
@@ -2739,6 +2738,9 @@ class Waitlist(models.Model):
         verbose_name = "Warteliste"
         verbose_name_plural = "Wartelisten"
         ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
         
     def __str__(self):
         return f"{self.patient} - {self.treatment} (Priorität: {self.get_priority_display()})"
@@ -3057,9 +3059,10 @@ class PatientCopayInvoice(models.Model):
         return f"Zuzahlungsrechnung {self.invoice_number} - {self.patient.full_name} ({self.total_copay}€)"
 
     def get_billing_items(self):
-        """Gibt alle BillingItems für diesen Patienten zurück"""
-        return self.gkv_claim.billing_items.filter(
-            appointment__patient=self.patient
+        """Gibt alle BillingItems mit Zuzahlung für diesen Patienten zurück"""
+        return self.gkv_claim.billing_cycle.billing_items.filter(
+            appointment__patient=self.patient,
+            patient_copay__gt=0
         )
 
     def get_treatments_summary(self):
@@ -3380,6 +3383,9 @@ class Payment(models.Model):
         verbose_name = "Zahlung"
         verbose_name_plural = "Zahlungen"
         ordering = ['-payment_date', '-created_at']
+        indexes = [
+            models.Index(fields=['payment_date', 'id']),
+        ]
 
     def __str__(self):
         invoice_ref = self.get_invoice_reference()
@@ -3599,4 +3605,300 @@ class PaymentAllocation(models.Model):
         
         # Betrag darf nicht größer als verbleibender Zahlungsbetrag sein
         if self.amount > self.payment.remaining_amount:
-            raise ValidationError("Betrag übersteigt verbleibenden Zahlungsbetrag.")
\ No newline at end of file
+            raise ValidationError("Betrag übersteigt verbleibenden Zahlungsbetrag.")
+
+class PrescriptionFinancialSummary(models.Model):
+    """
+    Materialisierte Finanzübersicht einer Verordnung.
+
+    Wird per Signal bei Änderungen an Terminen, BillingItems und Zahlungszuordnungen
+    fortgeschrieben (siehe PrescriptionFinanceService) und vom Management-Command
+    reconcile_prescription_finances gegen die Neuberechnung geprüft.
+    """
+    prescription = models.OneToOneField(
+        'Prescription',
+        on_delete=models.CASCADE,
+        related_name='financial_summary'
+    )
+    billed_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        help_text="Summe der BillingItems dieser Verordnung"
+    )
+    expected_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        help_text="Abrechnungsbereite, noch nicht abgerechnete Termine der Verordnungskette"
+    )
+    paid_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        help_text="Summe der Zahlungszuordnungen dieser Verordnung"
+    )
+    outstanding_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        help_text="Offener Betrag (erwartet abzüglich bezahlt)"
+    )
+    computed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Zeitpunkt der letzten Berechnung"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Finanzübersicht Verordnung"
+        verbose_name_plural = "Finanzübersichten Verordnungen"
+        indexes = [
+            models.Index(fields=['outstanding_amount']),
+        ]
+
+    def __str__(self):
+        return f"Verordnung {self.prescription_id}: offen {self.outstanding_amount}€"
+
+
+class DashboardStatistic(models.Model):
+    """
+    Materialisierter Kennzahlen-Zähler für das Dashboard.
+
+    Wird per Signal inkrementell fortgeschrieben (siehe DashboardStatsService)
+    und regelmäßig vom Management-Command recompute_dashboard_stats neu berechnet.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    computed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Zeitpunkt der letzten vollständigen Neuberechnung"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Dashboard-Kennzahl"
+        verbose_name_plural = "Dashboard-Kennzahlen"
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class OCRJob(models.Model):
+    """
+    Asynchroner OCR-Auftrag für ein hochgeladenes Rezept.
+
+    Dient zugleich als datenbankgestützte Warteschlange (siehe OCRJobService)
+    und als Ablage der Ergebnisse, die das Frontend per Polling abruft.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Wartend'),
+        ('processing', 'In Bearbeitung'),
+        ('completed', 'Abgeschlossen'),
+        ('failed', 'Fehlgeschlagen'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    file = models.CharField(max_length=500, help_text="Pfad der Datei im Default-Storage")
+    original_name = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    file_size = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ocr_jobs'
+    )
+    result = models.JSONField(null=True, blank=True)
+    validation = models.JSONField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "OCR-Auftrag"
+        verbose_name_plural = "OCR-Aufträge"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_by', 'status']),
+            models.Index(fields=['status', 'heartbeat_at']),
+        ]
+
+    def __str__(self):
+        return f"OCR-Auftrag {self.id} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+
+class DailyAppointmentRollup(models.Model):
+    """
+    Termine je Tag × Behandler × Behandlung × Versicherungsgruppe × Status.
+
+    Wird per Signal tageweise fortgeschrieben (siehe ReportingRollupService) und vom
+    Management-Command rebuild_reporting_rollups nächtlich neu aufgebaut.
+    """
+    day = models.DateField()
+    practitioner = models.ForeignKey('Practitioner', on_delete=models.CASCADE, null=True, related_name='+')
+    treatment = models.ForeignKey('Treatment', on_delete=models.CASCADE, null=True, related_name='+')
+    insurance_group = models.ForeignKey(
+        'InsuranceProviderGroup', on_delete=models.SET_NULL, null=True, related_name='+'
+    )
+    status = models.CharField(max_length=20)
+    appointment_count = models.PositiveIntegerField(default=0)
+    duration_minutes = models.PositiveIntegerField(default=0, help_text="Summe der Termindauern")
+
+    class Meta:
+        verbose_name = "Tagesstatistik Termine"
+        verbose_name_plural = "Tagesstatistiken Termine"
+        indexes = [
+            models.Index(fields=['day', 'status']),
+        ]
+        constraints = [
+            # Je Dimension nur eine Zeile; NULL über Coalesce, da NULL sonst als verschieden gilt
+            models.UniqueConstraint(
+                'day', Coalesce('practitioner', 0), Coalesce('treatment', 0), Coalesce('insurance_group', 0),
+                'status', name='unique_daily_appointment_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.appointment_count}"
+
+
+class DailyBillingRollup(models.Model):
+    """
+    Abrechnungspositionen je Tag × Behandler × Behandlung × Versicherungsgruppe ×
+    Abrechnungsart × abgerechnet (siehe DailyAppointmentRollup).
+    """
+    BILLING_TYPE_CHOICES = [
+        ('gkv', 'GKV'),
+        ('private', 'Privat'),
+        ('self_pay', 'Selbstzahler'),
+        ('other', 'Sonstige'),
+    ]
+
+    day = models.DateField()
+    practitioner = models.ForeignKey('Practitioner', on_delete=models.CASCADE, null=True, related_name='+')
+    treatment = models.ForeignKey('Treatment', on_delete=models.CASCADE, null=True, related_name='+')
+    insurance_group = models.ForeignKey(
+        'InsuranceProviderGroup', on_delete=models.SET_NULL, null=True, related_name='+'
+    )
+    billing_type = models.CharField(max_length=10, choices=BILLING_TYPE_CHOICES)
+    is_billed = models.BooleanField(default=False)
+    item_count = models.PositiveIntegerField(default=0)
+    insurance_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    patient_copay = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Tagesstatistik Abrechnung"
+        verbose_name_plural = "Tagesstatistiken Abrechnung"
+        indexes = [
+            models.Index(fields=['day', 'billing_type']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                'day', Coalesce('practitioner', 0), Coalesce('treatment', 0), Coalesce('insurance_group', 0),
+                'billing_type', 'is_billed', name='unique_daily_billing_rollup'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.billing_type}: {self.insurance_amount}€"
+
+
+class DailyInvoiceRollup(models.Model):
+    """Patientenrechnungen je Tag (Erstellung) × Status (siehe DailyAppointmentRollup)"""
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    invoice_count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Tagesstatistik Rechnungen"
+        verbose_name_plural = "Tagesstatistiken Rechnungen"
+        indexes = [
+            models.Index(fields=['day', 'status']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_daily_invoice_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.amount}€"
+
+
+class ReportingRollupDay(models.Model):
+    """
+    Sperrzeile je Rollup und Tag: ReportingRollupService.refresh_range sperrt die Zeilen
+    seines Zeitraums, bevor es die Tage neu verdichtet, damit gleichzeitige Aktualisierungen
+    desselben Tages nacheinander laufen.
+    """
+    kind = models.CharField(max_length=20)
+    day = models.DateField()
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tages-Rollup Aktualisierung"
+        verbose_name_plural = "Tages-Rollup Aktualisierungen"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'day'], name='unique_reporting_rollup_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.day}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Ausgangspostfach für E-Mails (Transactional Outbox).
+
+    Benachrichtigungen werden in derselben Transaktion wie die auslösende Änderung
+    gesammelt angelegt und vom Zustell-Worker (EmailOutboxService, Management-Command
+    deliver_emails) in Stapeln über eine gemeinsame SMTP-Verbindung versendet.
+    dedup_key verhindert, dass dieselbe Benachrichtigung mehrfach angelegt wird.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Wartend'),
+        ('sending', 'Wird gesendet'),
+        ('sent', 'Gesendet'),
+        ('failed', 'Fehlgeschlagen'),
+    ]
+
+    dedup_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    category = models.CharField(max_length=50, blank=True)
+    recipient = models.EmailField(max_length=255)
+    from_email = models.CharField(max_length=255, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.UUIDField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Ausgehende E-Mail"
+        verbose_name_plural = "Ausgehende E-Mails"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient}: {self.subject} ({self.get_status_display()})"
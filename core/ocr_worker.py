@@ -0,0 +1,52 @@
+"""
+Einstiegspunkte für die Prozesse des OCR-Prozesspools (siehe OCRJobService).
+
+Die Worker werden per 'spawn' gestartet und importieren nur dieses Modul;
+Django wird im Initializer eingerichtet, bevor core.services geladen wird.
+"""
+
+import os
+import sys
+from multiprocessing.util import Finalize
+
+
+def _shutdown_page_executor():
+    ocr_service = sys.modules.get('core.services.ocr_service')
+    if ocr_service is not None:
+        ocr_service.shutdown_page_executor()
+
+
+def init_ocr_worker():
+    """
+    Richtet Django im Worker-Prozess ein und begrenzt die OpenMP-Threads von Tesseract,
+    da bereits mehrere Aufträge und Konfigurationen parallel laufen.
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical.settings')
+
+    import django
+    django.setup()
+
+    # Ein eigener Seiten-Prozesspool (OCRService) muss beendet sein, bevor multiprocessing
+    # beim Prozessende auf alle Kindprozesse wartet und seine Queues schließt (Priorität 10)
+    # - sonst blockiert das Beenden.
+    Finalize(None, _shutdown_page_executor, exitpriority=100)
+
+
+def run_ocr_job(file_path, config_workers=None):
+    """Führt OCR und Validierung für eine Datei aus und liefert ein JSON-serialisierbares Ergebnis"""
+    from core.services.ocr_service import OCRService
+
+    service = OCRService(config_workers=config_workers)
+    extracted_data = service.process_prescription_file(file_path)
+    return {
+        'extracted_data': extracted_data,
+        'validation': service.validate_extracted_data(extracted_data),
+    }
+
+
+def run_pdf_page_ocr(pdf_path, page_number, digest, config_workers=None):
+    """OCR einer einzelnen gerasterten PDF-Seite (Seiten-Prozesspool des OCRService)"""
+    from core.services.ocr_service import OCRService
+
+    return OCRService(config_workers=config_workers).ocr_pdf_page(pdf_path, page_number, digest)
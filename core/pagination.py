@@ -0,0 +1,144 @@
+"""
+Keyset-(Cursor-)Paginierung für die REST-API.
+
+Statt OFFSET wird die Position als Schlüsselwerte des letzten Datensatzes kodiert
+(z.B. (timestamp, id)). Die nächste Seite filtert per zusammengesetztem Vergleich
+"(timestamp, id) < (T, I)" und liest nur page_size + 1 Zeilen über den passenden
+Index – die Kosten pro Seite bleiben auch nach Millionen Zeilen konstant.
+
+Die Paginierung ist opt-in: Ohne ?cursor= oder ?page_size= liefern die Endpunkte
+weiterhin die vollständige Liste, damit bestehende Clients unverändert funktionieren.
+Die Sortierschlüssel legt jeder ViewSet über das Attribut keyset_ordering fest; der
+letzte Schlüssel muss eindeutig sein (in der Regel id).
+"""
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Vorwärts-Paginierung über zusammengesetzte, indizierte Schlüssel"""
+
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_ordering = ('-id',)
+    invalid_cursor_message = 'Ungültiger Cursor'
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', None) or self.default_ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id',) if ordering[-1].startswith('-') else ('id',)
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def is_requested(self, request) -> bool:
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    # ------------------------------------------------------------------
+    # Cursor
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def encode_cursor(values) -> str:
+        payload = json.dumps(values, separators=(',', ':'), default=str)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor, model, ordering):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _key_values(instance, ordering):
+        return [getattr(instance, field.lstrip('-')) for field in ordering]
+
+    @staticmethod
+    def _after(ordering, values) -> Q:
+        """
+        Bedingung "liegt hinter values" in Sortierreihenfolge, ausgeschrieben als
+        (a > A) OR (a = A AND b > B) OR ... Die zusätzliche Schranke a >= A (bzw. a <= A) auf dem
+        ersten Schlüssel erlaubt der Datenbank den Einstieg per Index-Range-Scan.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    # ------------------------------------------------------------------
+    # BasePagination
+    # ------------------------------------------------------------------
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, queryset.model, self.ordering)
+            queryset = queryset.filter(self._after(self.ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = self.encode_cursor(self._key_values(self.page[-1], self.ordering))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('page_size', self.page_size),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
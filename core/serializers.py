@@ -49,6 +49,45 @@ from .models import (
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+
+class SparseFieldsetMixin:
+    """
+    Erlaubt Clients über ?fields=id,first_name,... nur ausgewählte Felder abzufragen.
+
+    Nicht angeforderte Felder werden vor der Serialisierung entfernt, sodass auch ihre
+    SerializerMethodFields und verschachtelten Serializer nicht ausgewertet werden.
+    Wirkt nur bei lesenden Anfragen und nur auf den obersten Serializer (bzw. die
+    Elemente einer Liste); unbekannte Feldnamen werden ignoriert.
+    """
+
+    fields_query_param = 'fields'
+
+    def _requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return None
+
+        value = getattr(request, 'query_params', request.GET).get(self.fields_query_param)
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._requested_fields()
+        if requested:
+            selected = {name: field for name, field in fields.items() if name in requested}
+            if selected:
+                return selected
+        return fields
+
+
 class BundeslandSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bundesland
@@ -189,35 +228,62 @@ class PatientInsuranceSerializer(serializers.ModelSerializer):
             'insurance_number', 'valid_from', 'valid_to', 'is_private'
         ]
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     insurances = PatientInsuranceSerializer(many=True, read_only=True)
     insurance_provider_name = serializers.SerializerMethodField()
     consent_active = serializers.SerializerMethodField()
     latest_consent = serializers.SerializerMethodField()
     
-    def get_insurance_provider_name(self, obj):
-        """Gibt den Namen der aktuellen Versicherung zurück"""
-        current_insurance = obj.insurances.filter(
-            valid_from__lte=timezone.now().date(),
-            valid_to__gte=timezone.now().date()
-        ).first()
-        
+    @staticmethod
+    def _current_insurance(obj):
+        """
+        Aktuelle Versicherung: zuerst eine am Stichtag laufende mit Enddatum, sonst die zuletzt
+        begonnene. Ausgewertet über obj.insurances.all(), damit ein Prefetch (siehe
+        QueryOptimizer.optimize_patient_queryset) ohne weitere Abfragen genutzt wird.
+        """
+        today = timezone.now().date()
+        insurances = sorted(obj.insurances.all(), key=lambda insurance: insurance.pk)
+
+        current_insurance = next((
+            insurance for insurance in insurances
+            if insurance.valid_from <= today and insurance.valid_to is not None and insurance.valid_to >= today
+        ), None)
         if not current_insurance:
             # Fallback: neueste gültige Versicherung
-            current_insurance = obj.insurances.filter(
-                valid_from__lte=timezone.now().date()
-            ).order_by('-valid_from').first()
-        
+            current_insurance = max(
+                (insurance for insurance in insurances if insurance.valid_from <= today),
+                key=lambda insurance: insurance.valid_from,
+                default=None
+            )
+        return current_insurance
+
+    @staticmethod
+    def _latest_consent(obj):
+        """Neueste Datenschutzeinwilligung (aus dem Prefetch, sonst eine Abfrage; je Patient gemerkt)"""
+        if not hasattr(obj, '_latest_consent'):
+            if 'data_consents' in getattr(obj, '_prefetched_objects_cache', {}):
+                obj._latest_consent = max(
+                    obj.data_consents.all(),
+                    key=lambda consent: (consent.consent_date, consent.pk),
+                    default=None
+                )
+            else:
+                obj._latest_consent = obj.data_consents.order_by('-consent_date', '-id').first()
+        return obj._latest_consent
+
+    def get_insurance_provider_name(self, obj):
+        """Gibt den Namen der aktuellen Versicherung zurück"""
+        current_insurance = self._current_insurance(obj)
         if current_insurance and current_insurance.insurance_provider:
             return current_insurance.insurance_provider.name
         return None
 
     def get_consent_active(self, obj):
-        latest = obj.data_consents.order_by('-consent_date').first()
+        latest = self._latest_consent(obj)
         return latest.is_active() if latest else False
 
     def get_latest_consent(self, obj):
-        latest = obj.data_consents.order_by('-consent_date').first()
+        latest = self._latest_consent(obj)
         if not latest:
             return None
         return {
@@ -304,7 +370,7 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class AuditLogSerializer(serializers.ModelSerializer):
+class AuditLogSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     action_display = serializers.CharField(source='get_action_display', read_only=True)
     
@@ -354,7 +420,10 @@ class PractitionerSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Practitioner
-        fields = ['id', 'first_name', 'last_name', 'is_active', 'working_hours']
+        fields = ['id', 'first_name', 'last_name', 'user', 'is_active', 'working_hours']
+        # Die Verknüpfung bestimmt die Sichtbarkeit für Therapeuten; Änderung nur über
+        # PractitionerViewSet.link_user (Admin)
+        read_only_fields = ['user']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -387,7 +456,7 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     treatment_name = serializers.CharField(source='treatment.treatment_name', read_only=True)
     practitioner_name = serializers.SerializerMethodField()
@@ -516,7 +585,7 @@ class AppointmentSeriesSerializer(serializers.Serializer):
             logger.exception("Fehler bei der Validierung der Terminserie")
             raise serializers.ValidationError(f"Validierungsfehler: {str(e)}")
 
-class BillingCycleSerializer(serializers.ModelSerializer):
+class BillingCycleSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     insurance_provider_name = serializers.CharField(source='insurance_provider.name', read_only=True)
     total_insurance_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     total_patient_copay = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -559,7 +628,7 @@ class BillingCycleSerializer(serializers.ModelSerializer):
         
         return data
 
-class PrescriptionSerializer(serializers.ModelSerializer):
+class PrescriptionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     treatment_1 = serializers.PrimaryKeyRelatedField(queryset=Treatment.objects.all())
     treatment_name = serializers.CharField(source='treatment_1.treatment_name', read_only=True)
     treatment = serializers.PrimaryKeyRelatedField(source='treatment_1', read_only=True)
@@ -601,6 +670,10 @@ class PrescriptionSerializer(serializers.ModelSerializer):
             'updated_at',
             'number_of_sessions',
             'sessions_completed',
+            'chain_root',
+            'chain_position',
+            'chain_total_sessions',
+            'chain_completed_sessions',
             'therapy_goals',
             'is_urgent',
             'requires_home_visit',
@@ -803,7 +876,7 @@ class LocalHolidaySerializer(serializers.ModelSerializer):
         model = LocalHoliday
         fields = '__all__'
 
-class WaitlistSerializer(serializers.ModelSerializer):
+class WaitlistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.get_full_name', read_only=True)
     treatment_name = serializers.CharField(source='treatment.treatment_name', read_only=True)
     practitioner_name = serializers.CharField(source='practitioner.get_full_name', read_only=True)
@@ -832,7 +905,7 @@ class WaitlistSerializer(serializers.ModelSerializer):
         
         return data
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     invoice_reference = serializers.SerializerMethodField()
     payment_method_display = serializers.CharField(source='get_payment_method_display', read_only=True)
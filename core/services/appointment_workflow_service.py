@@ -1,9 +1,13 @@
+import logging
 from datetime import datetime, timedelta
 from django.db import transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Q, Subquery, Value
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
-from core.models import Appointment, BillingCycle, BillingItem
+from core.models import Appointment, AuditLog, BillingCycle, BillingItem
+
+logger = logging.getLogger(__name__)
 
 
 class AppointmentWorkflowService:
@@ -11,6 +15,139 @@ class AppointmentWorkflowService:
     Service für automatische Workflow-Status-Änderungen bei Terminen
     """
     
+    TRANSITION_CHUNK_SIZE = 1000
+
+    @staticmethod
+    def annotate_end_time(queryset):
+        """Annotiert das Terminende (appointment_date + duration_minutes) als Datenbank-Ausdruck"""
+        duration = ExpressionWrapper(
+            F('duration_minutes') * Value(timedelta(minutes=1)),
+            output_field=DurationField()
+        )
+        return queryset.annotate(
+            end_time=ExpressionWrapper(F('appointment_date') + duration, output_field=DateTimeField())
+        )
+
+    @staticmethod
+    def get_overdue_planned_appointments(now=None):
+        """Geplante Termine, deren Endzeit in der Vergangenheit liegt"""
+        return AppointmentWorkflowService.annotate_end_time(
+            Appointment.objects.filter(status='planned', duration_minutes__gt=0)
+        ).filter(end_time__lt=now or timezone.now())
+
+    @staticmethod
+    def get_billable_completed_appointments(today=None):
+        """
+        Abgeschlossene Termine, die abrechnungsbereit gesetzt werden können.
+
+        Entspricht Prescription.can_be_billed() als Datenbank-Filter: Verordnung in
+        Bearbeitung/verlängert, gültige Krankenkasse, Erstbehandlung ohne Selbstzahler,
+        und noch keine Abrechnungsposition.
+        """
+        today = today or timezone.now().date()
+        return Appointment.objects.filter(
+            status='completed',
+            billing_items__isnull=True,
+            prescription__status__in=['In_Progress', 'Extended'],
+            prescription__treatment_1__isnull=False,
+            prescription__treatment_1__is_self_pay=False,
+            prescription__patient_insurance__valid_from__lte=today
+        ).filter(
+            Q(prescription__patient_insurance__valid_to__isnull=True) |
+            Q(prescription__patient_insurance__valid_to__gte=today)
+        )
+
+    @staticmethod
+    def lock_chunk(queryset, new_status, chunk_size):
+        """
+        Nächster Block (id, status, appointment_date, treatment_name) mit Zeilensperre.
+
+        Die IDs kommen als Unterabfrage aus dem QuerySet, gesperrt werden nur die Termin-Zeilen:
+        Filter wie billing_items__isnull=True erzeugen einen LEFT OUTER JOIN, auf dessen
+        nullbare Seite PostgreSQL kein FOR UPDATE erlaubt; Verordnung, Versicherung und
+        Behandlung sollen ohnehin nicht mitgesperrt werden.
+        """
+        return Appointment.objects.filter(
+            id__in=Subquery(queryset.order_by('id').values('id')[:chunk_size])
+        ).exclude(status=new_status).order_by('id').select_for_update(of=('self',)).values_list(
+            'id', 'status', 'appointment_date', 'treatment__treatment_name'
+        )
+
+    @staticmethod
+    def bulk_transition(queryset, new_status, chunk_size=None, notes=None):
+        """
+        Setzt alle Termine eines QuerySets blockweise per UPDATE auf new_status.
+
+        Statt Appointment.save() pro Termin werden je Block die IDs gesperrt gelesen
+        (siehe lock_chunk),
+        mit einem UPDATE umgestellt und die Nebeneffekte gesammelt ausgeführt:
+        AuditLog-Einträge per bulk_create, Wartelisten-Eintragung bei Absagen mit
+        Verordnung, Dashboard-Zähler, Tages-Rollups und Cache-Invalidierung.
+
+        Returns:
+            Anzahl der umgestellten Termine
+        """
+        from core.services.cache_service import CacheService
+        from core.services.dashboard_stats_service import DashboardStatsService
+        from core.services.prescription_finance_service import PrescriptionFinanceService
+        from core.services.reporting_rollup_service import ReportingRollupService
+        from core.services.waitlist_service import WaitlistService
+
+        chunk_size = chunk_size or AppointmentWorkflowService.TRANSITION_CHUNK_SIZE
+        queryset = queryset.exclude(status=new_status).order_by('id')
+        notes = notes or f"Automatische Statusänderung auf '{new_status}'"
+        total = 0
+
+        while True:
+            with transaction.atomic():
+                rows = list(AppointmentWorkflowService.lock_chunk(queryset, new_status, chunk_size))
+                if not rows:
+                    break
+
+                ids = [row[0] for row in rows]
+                Appointment.objects.filter(id__in=ids).update(status=new_status)
+
+                AuditLog.objects.bulk_create([
+                    AuditLog(
+                        model_name='Appointment',
+                        object_id=appointment_id,
+                        action='update',
+                        field_name='status',
+                        old_value=old_status,
+                        new_value=new_status,
+                        notes=notes
+                    )
+                    for appointment_id, old_status, _, _ in rows
+                ])
+
+                if new_status == 'cancelled':
+                    WaitlistService.add_to_waitlist_bulk(
+                        Appointment.objects.filter(id__in=ids, prescription__isnull=False)
+                        .select_related('prescription', 'treatment'),
+                        notes="Automatische Wartelisten-Eintragung bei Terminabsage"
+                    )
+
+                fields = ['status', 'appointment_date', 'treatment__treatment_name']
+                DashboardStatsService.record_bulk_updates(Appointment, [
+                    (dict(zip(fields, row[1:])), dict(zip(fields, (new_status,) + row[2:])))
+                    for row in rows
+                ])
+                ReportingRollupService.refresh_days('appointments', {row[2] for row in rows})
+
+                # Abrechnungsbereite Termine bestimmen den erwarteten Betrag der Verordnung
+                if new_status == 'ready_to_bill' or any(row[1] == 'ready_to_bill' for row in rows):
+                    PrescriptionFinanceService.refresh(
+                        Appointment.objects.filter(id__in=ids, prescription__isnull=False)
+                        .values_list('prescription_id', flat=True).distinct()
+                    )
+
+            total += len(rows)
+            logger.info(f"{total} Termine auf '{new_status}' gesetzt")
+
+        if total:
+            CacheService.invalidate_model_cache('appointment')
+        return total
+
     @staticmethod
     def process_completed_appointments():
         """
@@ -0,0 +1,382 @@
+"""
+Verfügbarkeits-Engine für Terminvorschläge.
+
+Lädt belegte Zeiten von Behandlern und Räumen, Abwesenheiten, Feiertage und
+Öffnungszeiten für ein Suchfenster mit wenigen Sammelabfragen und beantwortet
+anschließend alle Slot-Anfragen aus sortierten Intervall-Listen im Speicher.
+"""
+
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta, time
+from typing import Dict, List, Optional, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Absence, Appointment, LocalHoliday, Practice
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def parse_opening_hours(opening_hours) -> Dict[int, Optional[Tuple[time, time]]]:
+    """
+    Wandelt Öffnungszeiten im JSON-Format ({'monday': {'open': True, 'hours': '08:00-18:00'}, ...})
+    in ein Dict Wochentag (0=Montag) -> (Beginn, Ende) bzw. None bei geschlossenem Tag um.
+    """
+    parsed = {}
+    for weekday, day_name in enumerate(WEEKDAYS):
+        day_settings = (opening_hours or {}).get(day_name, {})
+        hours = day_settings.get('hours', '')
+        if not day_settings.get('open') or not hours:
+            parsed[weekday] = None
+            continue
+        try:
+            start_str, end_str = hours.split('-')
+            parsed[weekday] = (
+                datetime.strptime(start_str.strip(), '%H:%M').time(),
+                datetime.strptime(end_str.strip(), '%H:%M').time(),
+            )
+        except (ValueError, AttributeError):
+            # Fehlerhaftes Format: Tag gilt als geschlossen
+            parsed[weekday] = None
+    return parsed
+
+
+class IntervalIndex:
+    """
+    Sortierte Liste halboffener Intervalle [start, end) mit Präfix-Maximum der Endzeiten.
+
+    Eine Überlappungsprüfung kostet O(log n): Alle Intervalle, die vor dem Ende des
+    angefragten Zeitraums beginnen, liegen links vom Bisektionspunkt; es gibt genau dann
+    eine Überschneidung, wenn das größte Ende unter ihnen nach dem angefragten Beginn liegt.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._payloads = []
+        self._max_ends = []
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, start, end, payload=None):
+        """
+        Fügt ein Intervall ein und hält die Liste sortiert. Optional wird ein Payload
+        (z.B. die Termin-ID) gespeichert, den find() für das überlappende Intervall liefert.
+        """
+        index = bisect_left(self._starts, start)
+        if index == len(self._starts) and not self._dirty:
+            # Einfügen in Startreihenfolge: Präfix-Maximum direkt fortschreiben
+            self._max_ends.append(end if not self._max_ends or end > self._max_ends[-1] else self._max_ends[-1])
+        else:
+            self._dirty = True
+        self._starts.insert(index, start)
+        self._ends.insert(index, end)
+        self._payloads.insert(index, payload)
+
+    def _rebuild(self):
+        self._max_ends = []
+        current_max = None
+        for end in self._ends:
+            if current_max is None or end > current_max:
+                current_max = end
+            self._max_ends.append(current_max)
+        self._dirty = False
+
+    def overlaps(self, start, end) -> bool:
+        """Prüft ob [start, end) mit einem gespeicherten Intervall überlappt"""
+        if not self._starts:
+            return False
+        if self._dirty:
+            self._rebuild()
+        index = bisect_left(self._starts, end)
+        return index > 0 and self._max_ends[index - 1] > start
+
+    def find(self, start, end):
+        """
+        Liefert (Beginn, Ende, Payload) eines mit [start, end) überlappenden Intervalls oder None.
+
+        Von der Bisektionsposition wird rückwärts gesucht, solange das Präfix-Maximum
+        noch eine Überschneidung zulässt; ohne Konflikt bleibt es bei O(log n).
+        """
+        if not self._starts:
+            return None
+        if self._dirty:
+            self._rebuild()
+        index = bisect_left(self._starts, end) - 1
+        while index >= 0 and self._max_ends[index] > start:
+            if self._ends[index] > start:
+                return self._starts[index], self._ends[index], self._payloads[index]
+            index -= 1
+        return None
+
+
+class AvailabilityEngine:
+    """
+    Beantwortet Verfügbarkeitsfragen für eine Menge von Behandlern und Räumen.
+
+    Die Daten werden blockweise (LOAD_CHUNK_DAYS) nachgeladen, sobald eine Anfrage über
+    das bereits geladene Fenster hinausgeht. Pro Block fallen damit zwei Abfragen an
+    (Termine und Abwesenheiten), unabhängig davon, wie viele Slots geprüft werden.
+    """
+
+    SLOT_STEP_MINUTES = 15
+    LOAD_CHUNK_DAYS = 31
+    MAX_DAYS_TO_CHECK = 30
+
+    def __init__(self, start, practitioners=(), rooms=(), practice=None):
+        self.practitioner_order = list(dict.fromkeys(self._pk(p) for p in practitioners if p is not None))
+        self.practitioner_ids = set(self.practitioner_order)
+        self.rooms = {room.id: room for room in rooms if room is not None}
+        self.practice = practice if practice is not None else Practice.objects.first()
+
+        self.practice_hours = parse_opening_hours(self.practice.opening_hours) if self.practice else None
+        self.room_hours = {
+            room_id: parse_opening_hours(room.opening_hours)
+            for room_id, room in self.rooms.items()
+            if not room.is_home_visit
+        }
+
+        self.practitioner_bookings: Dict[int, IntervalIndex] = {pid: IntervalIndex() for pid in self.practitioner_ids}
+        self.room_bookings: Dict[int, IntervalIndex] = {rid: IntervalIndex() for rid in self.rooms}
+        self.practitioner_absences: Dict[int, IntervalIndex] = {pid: IntervalIndex() for pid in self.practitioner_ids}
+        self._loaded_absence_ids = set()
+
+        self._load_holidays()
+
+        # Einen Tag Vorlauf, damit lange Termine vom Vortag erfasst werden
+        window_start = timezone.localtime(start).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._loaded_from = window_start - timedelta(days=1)
+        self._loaded_until = self._loaded_from
+        self._ensure_loaded(window_start + timedelta(days=self.LOAD_CHUNK_DAYS))
+
+    @staticmethod
+    def _pk(obj):
+        return obj if isinstance(obj, int) else obj.pk
+
+    # ------------------------------------------------------------------
+    # Laden
+    # ------------------------------------------------------------------
+
+    def _load_holidays(self):
+        """Lädt alle Feiertage des Bundeslands der Praxis (kleine Tabelle, einmalig)"""
+        self.holiday_dates = set()
+        self.recurring_holidays = set()
+        if not self.practice:
+            return
+        holidays = LocalHoliday.objects.filter(
+            bundesland_id=self.practice.bundesland_id
+        ).values_list('date', 'is_recurring')
+        for holiday_date, is_recurring in holidays:
+            if is_recurring:
+                self.recurring_holidays.add((holiday_date.month, holiday_date.day))
+            else:
+                self.holiday_dates.add(holiday_date)
+
+    def _ensure_loaded(self, until):
+        """Lädt Termine und Abwesenheiten bis mindestens zum angegebenen Zeitpunkt"""
+        while self._loaded_until < until:
+            chunk_start = self._loaded_until
+            chunk_end = chunk_start + timedelta(days=self.LOAD_CHUNK_DAYS)
+            self._load_chunk(chunk_start, chunk_end)
+            self._loaded_until = chunk_end
+
+    def _load_chunk(self, chunk_start, chunk_end):
+        if not self.practitioner_ids and not self.rooms:
+            return
+
+        appointments = Appointment.objects.filter(
+            appointment_date__gte=chunk_start,
+            appointment_date__lt=chunk_end,
+        ).filter(
+            Q(practitioner_id__in=self.practitioner_ids) | Q(room_id__in=list(self.rooms))
+        ).exclude(
+            status='cancelled'
+        ).values_list('practitioner_id', 'room_id', 'appointment_date', 'duration_minutes')
+
+        count = 0
+        for practitioner_id, room_id, appointment_date, duration_minutes in appointments:
+            end = appointment_date + timedelta(minutes=duration_minutes or 0)
+            if practitioner_id in self.practitioner_bookings:
+                self.practitioner_bookings[practitioner_id].add(appointment_date, end)
+            if room_id in self.room_bookings:
+                self.room_bookings[room_id].add(appointment_date, end)
+            count += 1
+
+        absences = Absence.objects.filter(
+            practitioner_id__in=self.practitioner_ids,
+            start_date__lte=chunk_end.date(),
+            end_date__gte=chunk_start.date(),
+        ).exclude(
+            id__in=self._loaded_absence_ids
+        ).values_list('id', 'practitioner_id', 'start_date', 'end_date', 'is_full_day', 'start_time', 'end_time')
+
+        for absence_id, practitioner_id, start_date, end_date, is_full_day, start_time, end_time in absences:
+            self._loaded_absence_ids.add(absence_id)
+            index = self.practitioner_absences[practitioner_id]
+            if is_full_day or not (start_time and end_time):
+                index.add(self._local(start_date, time.min), self._local(end_date + timedelta(days=1), time.min))
+                continue
+            # Stundenweise Abwesenheit gilt an jedem Tag des Zeitraums
+            current = start_date
+            while current <= end_date:
+                index.add(self._local(current, start_time), self._local(current, end_time))
+                current += timedelta(days=1)
+
+        logger.debug(
+            f"Verfügbarkeitsdaten geladen: {chunk_start.date()} bis {chunk_end.date()} ({count} Termine)"
+        )
+
+    @staticmethod
+    def _local(day, clock_time):
+        return timezone.make_aware(datetime.combine(day, clock_time))
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    def is_holiday(self, day) -> bool:
+        return day in self.holiday_dates or (day.month, day.day) in self.recurring_holidays
+
+    def get_practice_hours(self, day) -> Optional[Tuple[time, time]]:
+        """Öffnungszeiten der Praxis für einen Tag (None = geschlossen)"""
+        if self.is_holiday(day):
+            return None
+        if self.practice_hours is None:
+            return (time.min, time.max)
+        return self.practice_hours[day.weekday()]
+
+    def is_practice_open(self, start, end) -> bool:
+        """Entspricht Practice.is_open_at für Beginn und Ende des Slots"""
+        local_start = timezone.localtime(start)
+        local_end = timezone.localtime(end)
+        for moment in (local_start, local_end):
+            hours = self.get_practice_hours(moment.date())
+            if not hours or not (hours[0] <= moment.time() <= hours[1]):
+                return False
+        return True
+
+    def is_room_open(self, room_id, start, end) -> bool:
+        """Prüft die Raumöffnungszeiten (Hausbesuche sind immer möglich)"""
+        if room_id is None or room_id not in self.room_hours:
+            return True
+        local_start = timezone.localtime(start)
+        local_end = timezone.localtime(end)
+        hours = self.room_hours[room_id][local_start.weekday()]
+        if not hours:
+            return False
+        return (local_start.time().replace(second=0, microsecond=0) >= hours[0] and
+                local_end.time().replace(second=0, microsecond=0) <= hours[1])
+
+    def is_practitioner_free(self, practitioner_id, start, end) -> bool:
+        """Prüft Abwesenheiten und bestehende Termine des Behandlers"""
+        self._ensure_loaded(end)
+        if practitioner_id not in self.practitioner_bookings:
+            return True
+        if self.practitioner_absences[practitioner_id].overlaps(start, end):
+            return False
+        return not self.practitioner_bookings[practitioner_id].overlaps(start, end)
+
+    def is_room_free(self, room_id, start, end) -> bool:
+        """Prüft bestehende Termine im Raum"""
+        self._ensure_loaded(end)
+        if room_id is None or room_id not in self.room_bookings:
+            return True
+        if room_id not in self.room_hours:
+            # Hausbesuch: keine Raumbelegung
+            return True
+        return not self.room_bookings[room_id].overlaps(start, end)
+
+    def is_slot_available(self, start, practitioner, room, duration_minutes) -> bool:
+        """Prüft ob ein Zeitslot für Behandler und Raum verfügbar ist"""
+        end = start + timedelta(minutes=duration_minutes)
+        practitioner_id = self._pk(practitioner)
+        room_id = self._pk(room) if room is not None else None
+
+        return (self.is_practice_open(start, end) and
+                self.is_room_open(room_id, start, end) and
+                self.is_practitioner_free(practitioner_id, start, end) and
+                self.is_room_free(room_id, start, end))
+
+    def add_booking(self, practitioner, room, start, duration_minutes):
+        """Merkt einen (vorgeschlagenen) Termin als belegt vor"""
+        end = start + timedelta(minutes=duration_minutes)
+        practitioner_id = self._pk(practitioner)
+        if practitioner_id in self.practitioner_bookings:
+            self.practitioner_bookings[practitioner_id].add(start, end)
+        if room is not None and self._pk(room) in self.room_bookings:
+            self.room_bookings[self._pk(room)].add(start, end)
+
+    def find_next_available_slot(self, start, practitioner, room, duration_minutes, max_days=None):
+        """Findet den nächsten verfügbaren Zeitslot ab dem angegebenen Zeitpunkt"""
+        max_days = max_days or self.MAX_DAYS_TO_CHECK
+        step = timedelta(minutes=self.SLOT_STEP_MINUTES)
+        current = timezone.localtime(start)
+
+        for _ in range(max_days):
+            hours = self.get_practice_hours(current.date())
+            if hours:
+                day_start = current.replace(hour=hours[0].hour, minute=hours[0].minute, second=0, microsecond=0)
+                if current < day_start:
+                    current = day_start
+                while current.time() <= hours[1]:
+                    if self.is_slot_available(current, practitioner, room, duration_minutes):
+                        return current
+                    next_slot = current + step
+                    if next_slot.date() != current.date():
+                        break
+                    current = next_slot
+
+            # Nächster Tag, Beginn wird über die Öffnungszeiten gesetzt
+            current = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        return None
+
+    def find_alternative_slots(self, day, duration_minutes, limit=5, from_hour=7, until_hour=19):
+        """
+        Sucht freie Kombinationen aus Zeit, Raum und Behandler an einem Tag.
+
+        Gibt Tupel (Zeitpunkt, Behandler-ID, Raum-ID) in der Reihenfolge Zeit, Raum,
+        Behandler zurück und bricht ab, sobald `limit` Treffer gefunden sind.
+        """
+        step = timedelta(minutes=self.SLOT_STEP_MINUTES)
+        local_day = timezone.localtime(day)
+        current = local_day.replace(hour=from_hour, minute=0, second=0, microsecond=0)
+        day_end = local_day.replace(hour=until_hour, minute=0, second=0, microsecond=0)
+        slots: List[Tuple[datetime, int, int]] = []
+        while current <= day_end:
+            end = current + timedelta(minutes=duration_minutes)
+            if self.is_practice_open(current, end):
+                for room_id in self.rooms:
+                    if not (self.is_room_open(room_id, current, end) and self.is_room_free(room_id, current, end)):
+                        continue
+                    for practitioner_id in self.practitioner_order:
+                        if self.is_practitioner_free(practitioner_id, current, end):
+                            slots.append((current, practitioner_id, room_id))
+                            if len(slots) >= limit:
+                                return slots
+            current += step
+        return slots
+
+    def get_conflicts(self, start, room, duration_minutes=30) -> List[str]:
+        """Gibt lesbare Konflikte (Öffnungszeiten Praxis/Raum) für einen Zeitslot zurück"""
+        conflicts = []
+        end = start + timedelta(minutes=duration_minutes)
+        local_start = timezone.localtime(start)
+
+        hours = self.get_practice_hours(local_start.date())
+        if not hours or not (hours[0] <= local_start.time() <= hours[1]):
+            conflicts.append("Außerhalb der Praxisöffnungszeiten")
+
+        if room is not None and room.id in self.room_hours:
+            if not self.room_hours[room.id][local_start.weekday()]:
+                conflicts.append(f"Raum {room.name} ist an diesem Tag nicht verfügbar")
+            elif not self.is_room_open(room.id, start, end):
+                conflicts.append(f"Außerhalb der Raumöffnungszeiten ({room.name})")
+
+        return conflicts
@@ -0,0 +1,315 @@
+"""
+Benchmark-Suite für die zeitkritischen Pfade der Anwendung.
+
+Jeder Benchmark ruft einen Pfad so auf, wie er im Betrieb genutzt wird (API-Views mit
+Serialisierung, bzw. den Service bei Massenabrechnung und GKV-Export), und misst:
+- Laufzeit (perf_counter, mehrere Durchläufe; der erste ist in der Regel "kalt")
+- Anzahl und Dauer der Datenbankabfragen (execute_wrapper) sowie wiederholte Abfragen
+  nach SQL-Fingerabdruck (Hinweis auf N+1-Muster)
+- Spitzen-Speicherverbrauch (tracemalloc, in einem eigenen Durchlauf, da tracemalloc
+  die Laufzeit verfälscht)
+
+Der gesamte Lauf (einschließlich des Benchmark-Benutzers) liegt in einer Transaktion, die
+zurückgerollt wird, jeder Durchlauf zusätzlich in einem eigenen Savepoint; schreibende Pfade
+(Massenabrechnung) verändern die Datenbank also nicht. Die Ergebnisse werden als JSON
+abgelegt, damit Läufe verglichen werden können (siehe run_benchmarks --compare).
+"""
+
+import logging
+import os
+import secrets
+import statistics
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.middleware import QueryCollector
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_USERNAME = 'benchmark'
+REPEATED_QUERY_THRESHOLD = 10
+
+
+class BenchmarkError(Exception):
+    """Benchmark konnte nicht ausgeführt werden (fehlende Daten, Fehlerantwort)"""
+
+
+class BenchmarkService:
+    """Führt die Benchmarks aus und vergleicht Ergebnisse"""
+
+    # ------------------------------------------------------------------
+    # Kontext
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def build_context() -> Dict:
+        """
+        Benutzer, Beispieldatensätze und Zeiträume, die alle Benchmarks gemeinsam nutzen.
+        Nur innerhalb der zurückgerollten Transaktion von run() aufrufen: Der Superuser
+        für die API-Aufrufe wird hier angelegt und darf nicht bestehen bleiben.
+        """
+        from core.models import BillingCycle, Practitioner, Prescription, Room, User
+
+        user = User.objects.create_superuser(
+            f'{BENCHMARK_USERNAME}-{secrets.token_hex(4)}', 'benchmark@example.com', secrets.token_urlsafe(24)
+        )
+
+        today = timezone.localdate()
+        return {
+            'user': user,
+            'today': today,
+            'prescription': Prescription.objects.filter(
+                treatment_1__isnull=False, status__in=['Open', 'In_Progress']
+            ).order_by('-id').first(),
+            'practitioner': Practitioner.objects.filter(is_active=True).order_by('id').first(),
+            'room': Room.objects.filter(is_active=True).order_by('id').first(),
+            'billing_cycle': BillingCycle.objects.annotate(
+                item_count=Count('billing_items')
+            ).order_by('-item_count', '-id').first(),
+        }
+
+    @staticmethod
+    def _require(context: Dict, key: str):
+        value = context.get(key)
+        if value is None:
+            raise BenchmarkError(
+                f"Keine Daten für '{key}' – zuerst 'manage.py generate_practice_data' ausführen"
+            )
+        return value
+
+    @staticmethod
+    def _call_view(context: Dict, method: str, path: str, data: Optional[Dict] = None, view=None):
+        """Ruft eine API-View wie ein Client auf (inkl. Rendern bzw. Lesen des Streams)"""
+        factory = APIRequestFactory()
+        if method == 'post':
+            request = factory.post(path, data or {}, format='json')
+        else:
+            request = factory.get(path, data or {})
+        force_authenticate(request, user=context['user'])
+
+        if view is None:
+            match = resolve(path)
+            response = match.func(request, *match.args, **match.kwargs)
+        else:
+            response = view(request)
+
+        if getattr(response, 'streaming', False):
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            if hasattr(response, 'render'):
+                response.render()
+            size = len(response.content)
+        if response.status_code >= 400:
+            content = b'' if getattr(response, 'streaming', False) else response.content[:300]
+            raise BenchmarkError(f"HTTP {response.status_code} für {path}: {content.decode('utf-8', 'replace')}")
+        return size
+
+    # ------------------------------------------------------------------
+    # Benchmarks
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def bench_series_preview(context: Dict):
+        """Terminvorschlag für eine Serie von 10 Terminen"""
+        from core.views.views import AppointmentSeriesViewSet
+
+        prescription = BenchmarkService._require(context, 'prescription')
+        practitioner = BenchmarkService._require(context, 'practitioner')
+        room = context.get('room')
+        start = context['today'] + timedelta(days=7 - context['today'].weekday())
+        return BenchmarkService._call_view(context, 'post', '/api/appointments/series/preview/', {
+            'prescription_id': prescription.id,
+            'start_date': start.isoformat(),
+            'appointment_time': '09:00',
+            'interval_days': 7,
+            'number_of_appointments': 10,
+            'practitioner_id': practitioner.id,
+            'room_id': room.id if room else None,
+        }, view=AppointmentSeriesViewSet.as_view({'post': 'preview'}))
+
+    @staticmethod
+    def bench_bulk_billing(context: Dict):
+        """Massenabrechnung aller abrechnungsbereiten Termine der letzten 60 Tage"""
+        from core.services.bulk_billing_service import BulkBillingService
+
+        today = context['today']
+        results = BulkBillingService.create_bulk_billing_cycles(today - timedelta(days=60), today)
+        return sum(result.get('appointments_count', 0) or 0 for result in results)
+
+    @staticmethod
+    def bench_gkv_export(context: Dict):
+        """CSV-Export des größten Abrechnungszyklus in eine Datei"""
+        from core.services.gkv_export_service import GKVExportService
+
+        billing_cycle = BenchmarkService._require(context, 'billing_cycle')
+        with tempfile.TemporaryDirectory() as directory:
+            summary = GKVExportService().write_export_file(
+                os.path.join(directory, 'export.csv'), 'csv', billing_cycle=billing_cycle
+            )
+        return summary.get('total_items')
+
+    @staticmethod
+    def bench_dashboard(context: Dict):
+        return BenchmarkService._call_view(context, 'get', '/api/dashboard-stats/')
+
+    @staticmethod
+    def bench_finance_overview(context: Dict):
+        return BenchmarkService._call_view(context, 'get', '/api/finance/overview/', {
+            'period': 'year', 'year': context['today'].year,
+        })
+
+    @staticmethod
+    def bench_invoice_overview(context: Dict):
+        return BenchmarkService._call_view(context, 'get', '/api/invoices/overview/')
+
+    @staticmethod
+    def bench_patient_list(context: Dict):
+        return BenchmarkService._call_view(context, 'get', '/api/patients/')
+
+    @classmethod
+    def benchmarks(cls) -> Dict[str, Callable]:
+        return {
+            'series_preview': cls.bench_series_preview,
+            'bulk_billing': cls.bench_bulk_billing,
+            'gkv_export': cls.bench_gkv_export,
+            'dashboard': cls.bench_dashboard,
+            'finance_overview': cls.bench_finance_overview,
+            'invoice_overview': cls.bench_invoice_overview,
+            'patient_list': cls.bench_patient_list,
+        }
+
+    # ------------------------------------------------------------------
+    # Messung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _measure(func: Callable, context: Dict, trace_memory: bool = False) -> Dict:
+        collector = QueryCollector()
+        with transaction.atomic():
+            with connection.execute_wrapper(collector):
+                if trace_memory:
+                    tracemalloc.start()
+                start = perf_counter()
+                try:
+                    output = func(context)
+                finally:
+                    elapsed = perf_counter() - start
+                    peak = None
+                    if trace_memory:
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+            transaction.set_rollback(True)
+
+        return {
+            'wall_ms': elapsed * 1000,
+            'queries': collector.count,
+            'db_ms': collector.duration * 1000,
+            'peak_bytes': peak,
+            'output': output,
+            'repeated': collector.repeated(REPEATED_QUERY_THRESHOLD),
+        }
+
+    @classmethod
+    def run_one(cls, name: str, func: Callable, context: Dict, repeat: int = 3) -> Dict:
+        """Führt einen Benchmark repeat-mal aus und einmal zusätzlich mit Speichermessung"""
+        try:
+            runs = [cls._measure(func, context) for _ in range(max(1, repeat))]
+            memory = cls._measure(func, context, trace_memory=True)
+        except Exception as e:
+            logger.warning(f"Benchmark {name} fehlgeschlagen: {e}")
+            return {'name': name, 'status': 'error', 'error': str(e)}
+
+        timings = [run['wall_ms'] for run in runs]
+        last = runs[-1]
+        return {
+            'name': name,
+            'status': 'ok',
+            'runs_ms': [round(value, 2) for value in timings],
+            'min_ms': round(min(timings), 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries': last['queries'],
+            'db_ms': round(last['db_ms'], 2),
+            'peak_memory_kb': round(memory['peak_bytes'] / 1024, 1),
+            'output': last['output'],
+            'repeated_queries': [
+                {'count': count, 'sql': sql[:500]} for sql, count in last['repeated'][:5]
+            ],
+        }
+
+    @staticmethod
+    def dataset_summary() -> Dict[str, int]:
+        from core.models import Appointment, BillingItem, Patient, PatientInvoice, Prescription
+
+        return {
+            'patients': Patient.objects.count(),
+            'prescriptions': Prescription.objects.count(),
+            'appointments': Appointment.objects.count(),
+            'billing_items': BillingItem.objects.count(),
+            'patient_invoices': PatientInvoice.objects.count(),
+        }
+
+    @classmethod
+    def run(cls, names: Optional[List[str]] = None, repeat: int = 3,
+            progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Führt die gewählten (Standard: alle) Benchmarks aus.
+
+        Returns:
+            {'created_at', 'database', 'dataset', 'repeat', 'results': [...]}
+        """
+        available = cls.benchmarks()
+        unknown = set(names or []) - set(available)
+        if unknown:
+            raise BenchmarkError(f"Unbekannte Benchmarks: {', '.join(sorted(unknown))}")
+
+        results = []
+        with transaction.atomic():
+            context = cls.build_context()
+            for name, func in available.items():
+                if names and name not in names:
+                    continue
+                result = cls.run_one(name, func, context, repeat)
+                results.append(result)
+                if progress_callback:
+                    progress_callback(result)
+            transaction.set_rollback(True)
+
+        return {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': cls.dataset_summary(),
+            'repeat': repeat,
+            'results': results,
+        }
+
+    @staticmethod
+    def compare(report: Dict, baseline: Dict) -> List[Dict]:
+        """Median-Laufzeit und Abfragen je Benchmark im Vergleich zu einem früheren Lauf"""
+        previous = {result['name']: result for result in baseline.get('results', []) if result.get('status') == 'ok'}
+        comparison = []
+        for result in report['results']:
+            before = previous.get(result['name'])
+            if result.get('status') != 'ok' or before is None:
+                continue
+            change = None
+            if before['median_ms']:
+                change = round((result['median_ms'] - before['median_ms']) / before['median_ms'] * 100, 1)
+            comparison.append({
+                'name': result['name'],
+                'median_ms': result['median_ms'],
+                'baseline_median_ms': before['median_ms'],
+                'change_percent': change,
+                'queries': result['queries'],
+                'baseline_queries': before['queries'],
+            })
+        return comparison
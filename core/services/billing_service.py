@@ -1,10 +1,12 @@
+import logging
 from datetime import datetime, date
 from decimal import Decimal
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from django.db import transaction, models
-from django.db.models import Sum
+from django.db.models import Q, Sum
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 from core.models import (
     BillingCycle,
@@ -15,8 +17,16 @@ from core.models import (
     PatientInsurance,
     Surcharge
 )
+from core.services.price_resolver import PriceResolver
+from core.services.dashboard_stats_service import DashboardStatsService
+from core.services.prescription_finance_service import PrescriptionFinanceService
+from core.services.reporting_rollup_service import ReportingRollupService
+
+logger = logging.getLogger(__name__)
 
 class BillingService:
+    BULK_BATCH_SIZE = 500
+
     @staticmethod
     def create_billing_cycle(
         insurance_provider: InsuranceProvider,
@@ -141,6 +151,121 @@ class BillingService:
         
         return billing_items
 
+    @staticmethod
+    def can_appointment_be_billed_in_memory(appointment: Appointment, billed_ids=(), today: date = None) -> bool:
+        """
+        Entspricht Appointment.can_be_billed(), arbeitet aber ausschließlich auf
+        vorab geladenen Daten (select_related) und einer Menge bereits abgerechneter Termin-IDs.
+        """
+        if appointment.status != 'ready_to_bill' or appointment.id in billed_ids:
+            return False
+
+        prescription = appointment.prescription
+        if prescription:
+            if prescription.status not in ['In_Progress', 'Extended']:
+                return False
+            if not prescription.patient_insurance.is_valid(today or timezone.now().date()):
+                return False
+            if not prescription.treatment_1:
+                return False
+            return not prescription.treatment_1.is_self_pay
+
+        if not appointment.treatment.is_self_pay:
+            return False
+        if appointment.patient_insurance and not appointment.patient_insurance.is_private:
+            return False
+        return True
+
+    @staticmethod
+    def get_billing_amount_in_memory(appointment: Appointment) -> Dict:
+        """Entspricht Appointment.get_billing_amount() für bereits geprüfte Termine, ohne Datenbankzugriff"""
+        prescription = appointment.prescription
+        with_prescription = bool(prescription and prescription.patient_insurance)
+        group_id = None
+        if with_prescription:
+            provider = prescription.patient_insurance.insurance_provider
+            group_id = provider.group_id if provider else None
+
+        return PriceResolver.resolve_billing_amount(
+            appointment.treatment,
+            timezone.localtime(appointment.appointment_date).date(),
+            insurance_provider_group=group_id,
+            with_prescription=with_prescription
+        )
+
+    @staticmethod
+    def build_billing_item(billing_cycle: BillingCycle, appointment: Appointment, billing_amount: Dict) -> BillingItem:
+        """Baut ein BillingItem inkl. Billing-Typ und GKV-Feldern auf, ohne es zu speichern"""
+        item = BillingItem(
+            billing_cycle=billing_cycle,
+            prescription=appointment.prescription,
+            appointment=appointment,
+            treatment=appointment.treatment,
+            insurance_amount=billing_amount['insurance_amount'],
+            patient_copay=billing_amount['patient_copay']
+        )
+        item._set_billing_type()
+        if item.is_gkv_billing:
+            item._set_gkv_fields()
+        return item
+
+    @staticmethod
+    def create_billing_items_batched(
+        billing_cycle: BillingCycle,
+        appointments,
+        batch_size: Optional[int] = None
+    ) -> Dict:
+        """
+        Mengenbasierte Variante von create_billing_items für große Abrechnungsläufe.
+
+        Prüft und bepreist alle Termine im Speicher (vorab geladene Verordnungen, Versicherungen
+        und die Preistabellen des PriceResolver), schreibt die Positionen per bulk_create in Blöcken und aktualisiert
+        die Summen des Abrechnungszyklus mit einem einzigen Aggregat.
+
+        Returns:
+            Dict mit 'created' (Anzahl), 'skipped' (Liste von (Termin-ID, Grund)) und 'items'
+        """
+        batch_size = batch_size or BillingService.BULK_BATCH_SIZE
+        if hasattr(appointments, 'select_related'):
+            appointments = appointments.select_related(
+                'treatment',
+                'patient_insurance',
+                'prescription__patient_insurance__insurance_provider',
+                'prescription__treatment_1'
+            )
+        appointments = list(appointments)
+
+        billed_ids = set(BillingItem.objects.filter(
+            appointment_id__in=[a.id for a in appointments]
+        ).values_list('appointment_id', flat=True))
+
+        today = timezone.now().date()
+        items = []
+        skipped = []
+        for appointment in appointments:
+            if not BillingService.can_appointment_be_billed_in_memory(appointment, billed_ids, today):
+                skipped.append((appointment.id, 'Termin kann nicht abgerechnet werden'))
+                continue
+
+            billing_amount = BillingService.get_billing_amount_in_memory(appointment)
+            if billing_amount['insurance_amount'] <= 0 and billing_amount['patient_copay'] <= 0:
+                skipped.append((appointment.id, 'Keine Abrechnungsbeträge gefunden'))
+                continue
+
+            items.append(BillingService.build_billing_item(billing_cycle, appointment, billing_amount))
+            billed_ids.add(appointment.id)
+
+        with transaction.atomic():
+            for start in range(0, len(items), batch_size):
+                BillingItem.objects.bulk_create(items[start:start + batch_size])
+            billing_cycle.update_totals()
+            # bulk_create löst keine Signals aus
+            DashboardStatsService.record_bulk_created(items)
+            PrescriptionFinanceService.refresh({item.appointment.prescription_id for item in items})
+            ReportingRollupService.refresh_days('billing', {item.created_at for item in items})
+
+        return {'created': len(items), 'skipped': skipped, 'items': items}
+
     @staticmethod
     @transaction.atomic
     def create_self_pay_billing_items(appointments: List[Appointment]) -> List[BillingItem]:
@@ -1,19 +1,27 @@
+import logging
 from datetime import date
 from typing import List, Dict
 from django.db import transaction
+from django.db.models import Count
 from django.core.exceptions import ValidationError
 
 from core.models import InsuranceProvider, BillingCycle, Appointment, Surcharge, BillingItem
+from core.services.price_resolver import PriceResolver
 from core.services.billing_service import BillingService
 from core.services.invoice_service import InvoiceService
 
+logger = logging.getLogger(__name__)
+
 
 class BulkBillingService:
     @staticmethod
-    @transaction.atomic
-    def create_bulk_billing_cycles(start_date: date, end_date: date) -> List[Dict]:
+    def create_bulk_billing_cycles(start_date: date, end_date: date, batch_size: int = None, progress_callback=None) -> List[Dict]:
         """
         Erstellt Abrechnungszyklen für alle Krankenkassen mit Terminen im angegebenen Zeitraum.
+
+        Die Preistabellen werden einmal für den gesamten Zeitraum geladen, die Positionen je
+        Krankenkasse in einer eigenen Transaktion per bulk_create geschrieben. Über
+        progress_callback(index, total, result) kann der Fortschritt pro Krankenkasse verfolgt werden.
         
         Returns:
             List[Dict]: Liste mit Ergebnissen pro Krankenkasse
@@ -31,82 +39,86 @@ class BulkBillingService:
         results = []
         
         try:
-            # Finde alle Krankenkassen mit abrechnungsbereiten Terminen
-            insurance_providers = InsuranceProvider.objects.filter(
-                patientinsurance__patient__appointment__appointment_date__date__range=[start_date, end_date],
-                patientinsurance__patient__appointment__status='ready_to_bill',
-                patientinsurance__patient__appointment__prescription__isnull=False,  # Nur Termine mit Verordnung
-                patientinsurance__patient__appointment__billing_items__isnull=True  # Noch nicht abgerechnete Termine
-            ).distinct()
+            billable = Appointment.objects.filter(
+                appointment_date__date__gte=start_date,
+                appointment_date__date__lte=end_date,
+                status='ready_to_bill',
+                prescription__treatment_1__is_self_pay=False,
+                billing_items__isnull=True  # Noch nicht abgerechnete Termine
+            )
 
-            if not insurance_providers.exists():
+            # Finde alle Krankenkassen mit abrechnungsbereiten Terminen (eine gruppierte Abfrage)
+            provider_counts = dict(
+                billable.values('prescription__patient_insurance__insurance_provider_id').annotate(
+                    count=Count('id')
+                ).values_list('prescription__patient_insurance__insurance_provider_id', 'count')
+            )
+            provider_counts.pop(None, None)
+            insurance_providers = list(InsuranceProvider.objects.filter(id__in=provider_counts.keys()).order_by('name'))
+
+            if not insurance_providers:
                 return [{
                     'insurance_provider': 'System',
                     'status': 'skipped',
                     'message': 'Keine abrechnungsbereiten Termine im angegebenen Zeitraum gefunden'
                 }]
 
-            for provider in insurance_providers:
+            # Bestehende Zyklen einmalig für alle Krankenkassen laden
+            existing_cycles = {}
+            for cycle in BillingCycle.objects.filter(
+                insurance_provider__in=insurance_providers,
+                start_date__lte=end_date,
+                end_date__gte=start_date
+            ).order_by('id'):
+                existing_cycles.setdefault(cycle.insurance_provider_id, cycle)
+
+            total = len(insurance_providers)
+            for index, provider in enumerate(insurance_providers, start=1):
                 try:
-                    # Prüfe ob bereits ein Abrechnungszyklus existiert
-                    existing_cycle = BillingCycle.objects.filter(
-                        insurance_provider=provider,
-                        start_date__lte=end_date,
-                        end_date__gte=start_date
-                    ).first()
-
+                    existing_cycle = existing_cycles.get(provider.id)
                     if existing_cycle:
-                        results.append({
+                        result = {
                             'insurance_provider': provider.name,
                             'status': 'skipped',
                             'message': f'Bereits existierender Zyklus: {existing_cycle.id}'
-                        })
-                        continue
-
-                    # Finde alle abrechenbaren Termine für diese Krankenkasse
-                    appointments = BillingService.get_billable_appointments(
-                        start_date=start_date,
-                        end_date=end_date,
-                        insurance_provider=provider
-                    )
-
-                    if not appointments:
-                        results.append({
+                        }
+                    else:
+                        with transaction.atomic():
+                            cycle = BillingService.create_billing_cycle(
+                                insurance_provider=provider,
+                                start_date=start_date,
+                                end_date=end_date
+                            )
+                            billing_result = BillingService.create_billing_items_batched(
+                                cycle,
+                                billable.filter(prescription__patient_insurance__insurance_provider=provider),
+                                batch_size=batch_size
+                            )
+
+                        result = {
                             'insurance_provider': provider.name,
-                            'status': 'skipped',
-                            'message': 'Keine abrechenbaren Termine gefunden'
-                        })
-                        continue
-
-                    # Erstelle neuen Abrechnungszyklus
-                    cycle = BillingService.create_billing_cycle(
-                        insurance_provider=provider,
-                        start_date=start_date,
-                        end_date=end_date
-                    )
-
-                    # Erstelle Abrechnungspositionen
-                    billing_items = BillingService.create_billing_items(cycle, appointments)
-
-                    # Aktualisiere die Gesamtbeträge
-                    cycle.update_totals()
-
-                    results.append({
-                        'insurance_provider': provider.name,
-                        'status': 'success',
-                        'cycle_id': cycle.id,
-                        'appointments_count': len(billing_items),
-                        'total_insurance_amount': str(cycle.total_insurance_amount),
-                        'total_patient_copay': str(cycle.total_patient_copay)
-                    })
+                            'status': 'success',
+                            'cycle_id': cycle.id,
+                            'appointments_count': billing_result['created'],
+                            'skipped_appointments': len(billing_result['skipped']),
+                            'total_insurance_amount': str(cycle.total_insurance_amount),
+                            'total_patient_copay': str(cycle.total_patient_copay)
+                        }
 
                 except Exception as e:
-                    results.append({
+                    result = {
                         'insurance_provider': provider.name,
                         'status': 'error',
                         'message': str(e)
-                    })
-                    continue
+                    }
+
+                results.append(result)
+                logger.info(
+                    f"Massenabrechnung {index}/{total}: {provider.name} - {result['status']} "
+                    f"({result.get('appointments_count', 0)} Positionen)"
+                )
+                if progress_callback:
+                    progress_callback(index, total, result)
 
         except Exception as e:
             # Bei einem allgemeinen Fehler
@@ -239,12 +251,7 @@ class BulkBillingService:
                 print(f"- Insurance Group: {insurance_group}")
                 print(f"- Datum: {appointment_date}")
 
-                surcharge = Surcharge.objects.filter(
-                    treatment=treatment,
-                    insurance_provider_group=insurance_group,
-                    valid_from__lte=appointment_date,
-                    valid_until__gte=appointment_date
-                ).first()
+                surcharge = PriceResolver.get_surcharge(treatment, insurance_group, appointment_date)
 
                 if surcharge:
                     print(f"Surcharge gefunden: {surcharge.insurance_payment} / {surcharge.patient_payment}")
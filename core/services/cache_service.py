@@ -1,7 +1,9 @@
 import logging
+import threading
+import time
 from django.core.cache import cache
 from django.conf import settings
-from typing import Any, Optional, List, Dict
+from typing import Any, Iterable, Optional, List, Dict
 import hashlib
 import json
 from django.db import models
@@ -9,11 +11,78 @@ from django.db import models
 logger = logging.getLogger(__name__)
 
 class CacheService:
-    """Service für optimiertes Caching von Datenbankabfragen und API-Responses"""
+    """
+    Service für optimiertes Caching von Datenbankabfragen und API-Responses
+
+    Invalidierung erfolgt über Tags statt über das Durchsuchen von Keys: Jeder Tag
+    (z.B. "model:patient") besitzt einen Generationszähler im Cache. Getaggte Keys
+    enthalten die aktuellen Generationen ihrer Tags; das Erhöhen eines Zählers macht
+    alle zugehörigen Einträge in O(1) unerreichbar (sie laufen per Timeout aus).
+    Das funktioniert mit jedem Cache-Backend (locmem, redis, ...).
+
+    Die Zähler selbst laufen nach TAG_TIMEOUT aus. Ein neu angelegter Zähler ist
+    zeitbasiert und damit nie gleich einer früheren Generation; ein ausgelaufener
+    Zähler kostet also höchstens einen Cache-Miss.
+    """
     
     DEFAULT_TIMEOUT = 300  # 5 Minuten
     LONG_TIMEOUT = 1800    # 30 Minuten
     SHORT_TIMEOUT = 60     # 1 Minute
+
+    TAG_VERSION_PREFIX = 'cache_tag_version:'
+    TAG_TIMEOUT = 86400    # 1 Tag, deutlich länger als jeder getaggte Eintrag
+
+    # Models, deren Instanz-Tags (model_tag(name, pk)) von getaggten Einträgen gelesen
+    # werden; nur für diese erhöhen die Model-Signale auch die Generation der Instanz
+    INSTANCE_TAGGED_MODELS = {'userrole'}
+
+    @staticmethod
+    def model_tag(model_name: str, instance_id: Optional[int] = None) -> str:
+        """Tag für ein Model bzw. eine einzelne Instanz (z.B. "model:patient:5")"""
+        tag = f"model:{model_name.lower()}"
+        if instance_id is not None:
+            tag += f":{instance_id}"
+        return tag
+
+    @staticmethod
+    def _initial_tag_version() -> int:
+        # Zeitbasiert statt 1, damit ein verdrängter Zähler nie auf eine alte Generation zurückfällt
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def get_tag_versions(tags: Iterable[str]) -> Dict[str, int]:
+        """Liest die aktuellen Generationen mehrerer Tags mit einem Cache-Zugriff"""
+        tags = sorted(set(tags))
+        if not tags:
+            return {}
+
+        version_keys = {CacheService.TAG_VERSION_PREFIX + tag: tag for tag in tags}
+        found = cache.get_many(list(version_keys))
+        versions = {version_keys[key]: value for key, value in found.items()}
+
+        for version_key, tag in version_keys.items():
+            if tag not in versions:
+                cache.add(version_key, CacheService._initial_tag_version(), CacheService.TAG_TIMEOUT)
+                versions[tag] = cache.get(version_key)
+        return versions
+
+    @staticmethod
+    def invalidate_tag(tag: str) -> None:
+        """Erhöht die Generation eines Tags und invalidiert damit alle getaggten Einträge"""
+        version_key = CacheService.TAG_VERSION_PREFIX + tag
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # Zähler existiert (noch) nicht: neue Generation anlegen
+            cache.set(version_key, CacheService._initial_tag_version(), CacheService.TAG_TIMEOUT)
+        logger.debug(f"Cache-Tag '{tag}' invalidiert")
+
+    @staticmethod
+    def generate_tagged_cache_key(prefix: str, tags: Iterable[str], *args, **kwargs) -> str:
+        """Wie generate_cache_key, zusätzlich abhängig von den aktuellen Generationen der Tags"""
+        versions = CacheService.get_tag_versions(tags)
+        version_parts = [f"{tag}={version}" for tag, version in sorted(versions.items())]
+        return f"{prefix}:" + CacheService.generate_cache_key(prefix, *version_parts, *args, **kwargs)
     
     @staticmethod
     def generate_cache_key(prefix: str, *args, **kwargs) -> str:
@@ -42,10 +111,12 @@ class CacheService:
         cached_data = cache.get(key)
         if cached_data is not None:
             logger.debug(f"Cache hit für Key: {key}")
+            cache_monitor.record_hit(key)
             return cached_data
         
         # Cache miss - führe Callback aus
         logger.debug(f"Cache miss für Key: {key}")
+        cache_monitor.record_miss(key)
         try:
             data = callback(**kwargs)
             cache.set(key, data, timeout)
@@ -56,28 +127,25 @@ class CacheService:
     
     @staticmethod
     def invalidate_pattern(pattern: str) -> int:
-        """Invalidiert alle Cache-Einträge die einem Pattern entsprechen"""
-        if not hasattr(cache, '_cache'):
-            logger.warning("Cache-Backend unterstützt keine Pattern-Invalidierung")
-            return 0
-        
-        invalidated_count = 0
-        for key in list(cache._cache.keys()):
-            if pattern in key:
-                cache.delete(key)
-                invalidated_count += 1
-        
-        logger.info(f"{invalidated_count} Cache-Einträge mit Pattern '{pattern}' invalidiert")
-        return invalidated_count
+        """
+        Invalidiert alle Cache-Einträge eines Tags.
+
+        Früher wurden dazu die Keys des locmem-Backends durchsucht; das Pattern
+        wird jetzt als Tag behandelt und funktioniert so mit jedem Backend.
+        """
+        CacheService.invalidate_tag(pattern)
+        return 1
     
     @staticmethod
     def invalidate_model_cache(model_name: str, instance_id: Optional[int] = None) -> int:
         """Invalidiert Cache-Einträge für ein spezifisches Model"""
-        pattern = f"model:{model_name}"
-        if instance_id:
-            pattern += f":{instance_id}"
-        
-        return CacheService.invalidate_pattern(pattern)
+        CacheService.invalidate_tag(CacheService.model_tag(model_name, instance_id))
+        return 1
+
+    @staticmethod
+    def get_stats() -> Dict:
+        """Hit/Miss-Statistiken dieses Prozesses"""
+        return cache_monitor.get_stats()
     
     @staticmethod
     def get_user_cache_key(user_id: int, prefix: str) -> str:
@@ -99,12 +167,24 @@ class CacheService:
 # Spezialisierte Cache-Methoden für häufige Anwendungsfälle
 class ModelCacheService:
     """Spezialisierter Cache-Service für Model-Daten"""
+
+    # Models, deren Änderungen die jeweiligen Listen ungültig machen
+    PATIENT_LIST_MODELS = ['patient', 'patientinsurance', 'insuranceprovider', 'appointment', 'prescription', 'dataprotectionconsent']
+    APPOINTMENT_LIST_MODELS = [
+        'appointment', 'patient', 'practitioner', 'treatment', 'room',
+        'prescription', 'patientinsurance', 'insuranceprovider', 'billingitem'
+    ]
+
+    @staticmethod
+    def _model_tags(model_names: List[str]) -> List[str]:
+        return [CacheService.model_tag(name) for name in model_names]
     
     @staticmethod
     def get_patient_list(user_id: int, filters: Dict = None) -> List[Dict]:
         """Cached Patientenliste mit Filtern"""
-        cache_key = CacheService.generate_cache_key(
-            "patient_list", 
+        cache_key = CacheService.generate_tagged_cache_key(
+            "patient_list",
+            ModelCacheService._model_tags(ModelCacheService.PATIENT_LIST_MODELS),
             user_id=user_id, 
             filters=json.dumps(filters, sort_keys=True) if filters else "none"
         )
@@ -112,14 +192,9 @@ class ModelCacheService:
         def fetch_patients():
             from core.models import Patient
             from core.serializers import PatientSerializer
+            from core.services.performance_service import QueryOptimizer
             
-            queryset = Patient.objects.select_related(
-                'patient_insurance__insurance_provider'
-            ).prefetch_related(
-                'appointments__practitioner',
-                'appointments__treatment',
-                'prescriptions__treatment_1'
-            )
+            queryset = QueryOptimizer.optimize_patient_queryset(Patient.objects.all())
             
             # Filter anwenden
             if filters:
@@ -130,9 +205,9 @@ class ModelCacheService:
                     )
                 if filters.get('has_appointments') is not None:
                     if filters['has_appointments']:
-                        queryset = queryset.filter(appointments__isnull=False)
+                        queryset = queryset.filter(appointment__isnull=False).distinct()
                     else:
-                        queryset = queryset.filter(appointments__isnull=True)
+                        queryset = queryset.filter(appointment__isnull=True)
             
             serializer = PatientSerializer(queryset, many=True)
             return serializer.data
@@ -142,8 +217,9 @@ class ModelCacheService:
     @staticmethod
     def get_appointment_list(user_id: int, filters: Dict = None) -> List[Dict]:
         """Cached Terminliste mit Filtern"""
-        cache_key = CacheService.generate_cache_key(
-            "appointment_list", 
+        cache_key = CacheService.generate_tagged_cache_key(
+            "appointment_list",
+            ModelCacheService._model_tags(ModelCacheService.APPOINTMENT_LIST_MODELS),
             user_id=user_id, 
             filters=json.dumps(filters, sort_keys=True) if filters else "none"
         )
@@ -181,34 +257,51 @@ class ModelCacheService:
     def invalidate_patient_cache(patient_id: int = None) -> None:
         """Invalidiert Patienten-bezogene Cache-Einträge"""
         if patient_id:
-            CacheService.invalidate_pattern(f"patient:{patient_id}")
-        CacheService.invalidate_pattern("patient_list")
+            CacheService.invalidate_model_cache('patient', patient_id)
+        CacheService.invalidate_model_cache('patient')
     
     @staticmethod
     def invalidate_appointment_cache(appointment_id: int = None) -> None:
         """Invalidiert Termin-bezogene Cache-Einträge"""
         if appointment_id:
-            CacheService.invalidate_pattern(f"appointment:{appointment_id}")
-        CacheService.invalidate_pattern("appointment_list")
+            CacheService.invalidate_model_cache('appointment', appointment_id)
+        CacheService.invalidate_model_cache('appointment')
 
 # Performance-Monitoring
 class CachePerformanceMonitor:
-    """Überwacht Cache-Performance und generiert Statistiken"""
+    """Überwacht Cache-Performance und generiert Statistiken (pro Prozess, threadsicher)"""
     
     def __init__(self):
+        self._lock = threading.Lock()
         self.hit_count = 0
         self.miss_count = 0
         self.total_requests = 0
+        self.by_prefix = {}
+
+    @staticmethod
+    def _prefix(key: Optional[str]) -> str:
+        if not key or ':' not in key:
+            return 'other'
+        return key.split(':', 1)[0]
+
+    def _record(self, key: Optional[str], hit: bool):
+        prefix = self._prefix(key)
+        with self._lock:
+            self.total_requests += 1
+            if hit:
+                self.hit_count += 1
+            else:
+                self.miss_count += 1
+            counters = self.by_prefix.setdefault(prefix, {'hits': 0, 'misses': 0})
+            counters['hits' if hit else 'misses'] += 1
     
-    def record_hit(self):
+    def record_hit(self, key: Optional[str] = None):
         """Zeichnet einen Cache-Hit auf"""
-        self.hit_count += 1
-        self.total_requests += 1
+        self._record(key, True)
     
-    def record_miss(self):
+    def record_miss(self, key: Optional[str] = None):
         """Zeichnet einen Cache-Miss auf"""
-        self.miss_count += 1
-        self.total_requests += 1
+        self._record(key, False)
     
     def get_hit_rate(self) -> float:
         """Berechnet die Cache-Hit-Rate"""
@@ -218,19 +311,24 @@ class CachePerformanceMonitor:
     
     def get_stats(self) -> Dict:
         """Gibt Cache-Statistiken zurück"""
+        with self._lock:
+            by_prefix = {prefix: dict(counters) for prefix, counters in self.by_prefix.items()}
         return {
             'total_requests': self.total_requests,
             'hits': self.hit_count,
             'misses': self.miss_count,
             'hit_rate': self.get_hit_rate(),
+            'by_prefix': by_prefix,
             'cache_size': len(cache._cache) if hasattr(cache, '_cache') else 'unknown'
         }
     
     def reset_stats(self):
         """Setzt Statistiken zurück"""
-        self.hit_count = 0
-        self.miss_count = 0
-        self.total_requests = 0
+        with self._lock:
+            self.hit_count = 0
+            self.miss_count = 0
+            self.total_requests = 0
+            self.by_prefix = {}
 
 # Globale Instanz für Performance-Monitoring
 cache_monitor = CachePerformanceMonitor()
@@ -0,0 +1,169 @@
+"""
+Kompakter Kalender-Feed für Termine.
+
+Liefert die Termine eines Zeitfensters spaltenweise ({'id': [...], 'start': [...], ...})
+statt als Liste verschachtelter Objekte. Patienten, Behandlungen, Behandler und Räume
+erscheinen nur als IDs; ihre Anzeigenamen stehen einmalig in Lookup-Tabellen. Gelesen
+wird über eine einzige .values()-Projektion ohne Modellinstanzen und Serializer.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, Optional
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Spaltenreihenfolge des Feeds
+COLUMNS = [
+    'id', 'start', 'duration', 'status', 'patient', 'treatment',
+    'practitioner', 'room', 'prescription', 'series',
+]
+
+# Projektion: Spalte -> Feld der .values()-Abfrage
+FIELD_MAP = {
+    'id': 'id',
+    'start': 'appointment_date',
+    'duration': 'duration_minutes',
+    'status': 'status',
+    'patient': 'patient_id',
+    'treatment': 'treatment_id',
+    'practitioner': 'practitioner_id',
+    'room': 'room_id',
+    'prescription': 'prescription_id',
+    'series': 'series_identifier',
+}
+
+LOOKUP_FIELDS = [
+    'patient__first_name', 'patient__last_name',
+    'treatment__treatment_name', 'treatment__duration_minutes',
+    'practitioner__first_name', 'practitioner__last_name',
+    'room__name',
+]
+
+
+class CalendarFeedService:
+    """Erzeugt den spaltenweisen Kalender-Feed für ein Zeitfenster"""
+
+    DEFAULT_RANGE_DAYS = 7
+    MAX_RANGE_DAYS = 62
+
+    @staticmethod
+    def _parse_bound(value: str, name: str) -> datetime:
+        """Akzeptiert ISO-Datum (2025-01-06) oder ISO-Zeitpunkt (2025-01-06T00:00:00+01:00)"""
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                raise ValidationError(f"Ungültiges Datum für '{name}': {value}")
+            parsed = datetime.combine(parsed_date, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    @staticmethod
+    def _parse_ids(value: Optional[str], name: str):
+        if not value:
+            return None
+        try:
+            return [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise ValidationError(f"Ungültige ID-Liste für '{name}': {value}")
+
+    @classmethod
+    def parse_params(cls, params) -> Dict:
+        """
+        Liest start/end/practitioner/room/status aus den Query-Parametern.
+
+        Ohne start beginnt das Fenster am Montag der aktuellen Woche, ohne end umfasst
+        es DEFAULT_RANGE_DAYS Tage. Fenster über MAX_RANGE_DAYS werden abgelehnt.
+        """
+        if params.get('start'):
+            start = cls._parse_bound(params['start'], 'start')
+        else:
+            today = timezone.localdate()
+            start = timezone.make_aware(datetime.combine(today - timedelta(days=today.weekday()), time.min))
+
+        if params.get('end'):
+            end = cls._parse_bound(params['end'], 'end')
+        else:
+            end = start + timedelta(days=cls.DEFAULT_RANGE_DAYS)
+
+        if end <= start:
+            raise ValidationError("'end' muss nach 'start' liegen.")
+        if end - start > timedelta(days=cls.MAX_RANGE_DAYS):
+            raise ValidationError(f"Der Zeitraum darf höchstens {cls.MAX_RANGE_DAYS} Tage umfassen.")
+
+        statuses = [s for s in (params.get('status') or '').split(',') if s]
+        return {
+            'start': start,
+            'end': end,
+            'practitioner_ids': cls._parse_ids(params.get('practitioner'), 'practitioner'),
+            'room_ids': cls._parse_ids(params.get('room'), 'room'),
+            'statuses': statuses or None,
+        }
+
+    @staticmethod
+    def build_feed(queryset, start: datetime, end: datetime,
+                   practitioner_ids: Optional[Iterable[int]] = None,
+                   room_ids: Optional[Iterable[int]] = None,
+                   statuses: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Baut den Feed aus einem (bereits nach Berechtigungen gefilterten) Appointment-QuerySet.
+
+        Returns:
+            {'start', 'end', 'count', 'columns', 'appointments': {Spalte: [Werte]},
+             'patients', 'treatments', 'practitioners', 'rooms'}
+        """
+        queryset = queryset.filter(appointment_date__gte=start, appointment_date__lt=end)
+        if practitioner_ids is not None:
+            queryset = queryset.filter(practitioner_id__in=practitioner_ids)
+        if room_ids is not None:
+            queryset = queryset.filter(room_id__in=room_ids)
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+
+        rows = queryset.order_by('appointment_date', 'id').values(*FIELD_MAP.values(), *LOOKUP_FIELDS)
+
+        columns = {column: [] for column in COLUMNS}
+        patients, treatments, practitioners, rooms = {}, {}, {}, {}
+        current_tz = timezone.get_current_timezone()
+
+        for row in rows:
+            for column, field in FIELD_MAP.items():
+                value = row[field]
+                if column == 'start':
+                    value = timezone.localtime(value, current_tz).isoformat()
+                columns[column].append(value)
+
+            if row['patient_id'] is not None and row['patient_id'] not in patients:
+                patients[row['patient_id']] = f"{row['patient__first_name']} {row['patient__last_name']}"
+            if row['treatment_id'] is not None and row['treatment_id'] not in treatments:
+                treatments[row['treatment_id']] = {
+                    'name': row['treatment__treatment_name'],
+                    'duration': row['treatment__duration_minutes'],
+                }
+            if row['practitioner_id'] is not None and row['practitioner_id'] not in practitioners:
+                practitioners[row['practitioner_id']] = (
+                    f"{row['practitioner__first_name']} {row['practitioner__last_name']}"
+                )
+            if row['room_id'] is not None and row['room_id'] not in rooms:
+                rooms[row['room_id']] = row['room__name']
+
+        count = len(columns['id'])
+        logger.debug(f"Kalender-Feed {start} bis {end}: {count} Termine")
+
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'count': count,
+            'columns': COLUMNS,
+            'appointments': columns,
+            'patients': patients,
+            'treatments': treatments,
+            'practitioners': practitioners,
+            'rooms': rooms,
+        }
@@ -0,0 +1,208 @@
+"""
+Konfliktprüfung für Termine auf Basis sortierter Intervall-Listen.
+
+Statt pro Termin und Ressource eine eigene Überschneidungsabfrage abzusetzen, lädt der
+ConflictChecker alle nicht stornierten Termine der beteiligten Behandler und Räume für
+den gesamten Zeitraum eines Stapels mit einer einzigen Abfrage. Danach kostet jede
+Prüfung O(log n); ein Stapel von N vorgeschlagenen Terminen wird nach Beginn sortiert
+und in O(N log N) gegen den Bestand und gegeneinander geprüft.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from core.models import Appointment
+from core.services.appointment_workflow_service import AppointmentWorkflowService
+from core.services.availability_service import IntervalIndex
+
+logger = logging.getLogger(__name__)
+
+PRACTITIONER_CONFLICT = 'Der Behandler hat bereits einen Termin in diesem Zeitraum'
+ROOM_CONFLICT = 'Der Raum ist in diesem Zeitraum bereits belegt'
+
+
+def _pk(value):
+    """Akzeptiert Modellinstanz oder Primärschlüssel"""
+    return getattr(value, 'pk', value)
+
+
+class ConflictChecker:
+    """
+    Prüft Termine auf Überschneidungen bei Behandler und Raum.
+
+    Bestehende Termine werden beim Erzeugen geladen; über reserve() angenommene Termine
+    eines Stapels landen in eigenen Intervall-Listen, sodass spätere Vorschläge auch
+    gegen frühere Vorschläge desselben Stapels geprüft werden.
+    """
+
+    # Termine, die vor dem Fenster beginnen, können noch hineinragen
+    LOOKBACK = timedelta(days=1)
+
+    def __init__(self, start, end, practitioner_ids: Iterable = (), room_ids: Iterable = (),
+                 exclude_ids: Iterable = ()):
+        self.start = start
+        self.end = end
+        self.practitioner_ids = {pk for pk in map(_pk, practitioner_ids) if pk is not None}
+        self.room_ids = {pk for pk in map(_pk, room_ids) if pk is not None}
+        self.exclude_ids = {pk for pk in exclude_ids if pk is not None}
+
+        self.practitioner_bookings: Dict[int, IntervalIndex] = {pk: IntervalIndex() for pk in self.practitioner_ids}
+        self.room_bookings: Dict[int, IntervalIndex] = {pk: IntervalIndex() for pk in self.room_ids}
+        self.practitioner_reserved: Dict[int, IntervalIndex] = {pk: IntervalIndex() for pk in self.practitioner_ids}
+        self.room_reserved: Dict[int, IntervalIndex] = {pk: IntervalIndex() for pk in self.room_ids}
+
+        self._load()
+
+    @classmethod
+    def for_proposals(cls, proposals: List[Dict], exclude_ids: Iterable = ()) -> 'ConflictChecker':
+        """
+        Erzeugt einen Checker für eine Liste von Vorschlägen
+        ({'start', 'end', 'practitioner_id', 'room_id'}), der den gesamten Zeitraum abdeckt.
+        """
+        if not proposals:
+            return cls(None, None, exclude_ids=exclude_ids)
+        return cls(
+            min(p['start'] for p in proposals),
+            max(p['end'] for p in proposals),
+            practitioner_ids=[p.get('practitioner_id') for p in proposals],
+            room_ids=[p.get('room_id') for p in proposals],
+            exclude_ids=exclude_ids,
+        )
+
+    @classmethod
+    def for_appointments(cls, appointments: Iterable[Appointment]) -> 'ConflictChecker':
+        """Erzeugt einen Checker für (ggf. ungespeicherte) Termine; diese selbst werden ignoriert"""
+        appointments = list(appointments)
+        return cls.for_proposals(
+            [cls.proposal_from_appointment(a) for a in appointments],
+            exclude_ids=[a.pk for a in appointments],
+        )
+
+    @staticmethod
+    def proposal_from_appointment(appointment: Appointment) -> Dict:
+        start = appointment.appointment_date
+        return {
+            'start': start,
+            'end': start + timedelta(minutes=appointment.duration_minutes or 0),
+            'practitioner_id': appointment.practitioner_id,
+            'room_id': appointment.room_id,
+        }
+
+    def _load(self):
+        if self.start is None or not (self.practitioner_ids or self.room_ids):
+            return
+
+        queryset = Appointment.objects.filter(
+            appointment_date__gte=self.start - self.LOOKBACK,
+            appointment_date__lt=self.end,
+        ).filter(
+            Q(practitioner_id__in=self.practitioner_ids) | Q(room_id__in=self.room_ids)
+        ).exclude(
+            status='cancelled'
+        )
+        if self.exclude_ids:
+            queryset = queryset.exclude(id__in=self.exclude_ids)
+
+        bookings = AppointmentWorkflowService.annotate_end_time(queryset).filter(
+            end_time__gt=self.start
+        ).values_list('id', 'practitioner_id', 'room_id', 'appointment_date', 'end_time')
+
+        count = 0
+        for appointment_id, practitioner_id, room_id, start, end in bookings:
+            if practitioner_id in self.practitioner_bookings:
+                self.practitioner_bookings[practitioner_id].add(start, end, appointment_id)
+            if room_id in self.room_bookings:
+                self.room_bookings[room_id].add(start, end, appointment_id)
+            count += 1
+
+        logger.debug(f"Konfliktprüfung: {count} Termine zwischen {self.start} und {self.end} geladen")
+
+    @staticmethod
+    def _find(indexes, start, end):
+        for index in indexes:
+            if index is not None:
+                hit = index.find(start, end)
+                if hit:
+                    return hit[2]
+        return None
+
+    def _ensure_covered(self, start, end, practitioner_id, room_id):
+        if practitioner_id is not None and practitioner_id not in self.practitioner_ids \
+                or room_id is not None and room_id not in self.room_ids \
+                or self.start is None or start < self.start or end > self.end:
+            raise ValueError('Zeitraum oder Ressource liegt außerhalb der geladenen Daten des ConflictCheckers')
+
+    def find_conflict(self, start, end, practitioner_id=None, room_id=None) -> Optional[Dict]:
+        """
+        Liefert den ersten Konflikt für [start, end) als
+        {'resource', 'reason', 'appointment_id', 'proposal'} oder None.
+        """
+        practitioner_id, room_id = _pk(practitioner_id), _pk(room_id)
+        self._ensure_covered(start, end, practitioner_id, room_id)
+
+        if practitioner_id is not None:
+            payload = self._find(
+                (self.practitioner_bookings[practitioner_id], self.practitioner_reserved[practitioner_id]), start, end
+            )
+            if payload is not None:
+                return self._conflict('practitioner', PRACTITIONER_CONFLICT, payload)
+
+        if room_id is not None:
+            payload = self._find((self.room_bookings[room_id], self.room_reserved[room_id]), start, end)
+            if payload is not None:
+                return self._conflict('room', ROOM_CONFLICT, payload)
+
+        return None
+
+    @staticmethod
+    def _conflict(resource, reason, payload):
+        kind, value = payload if isinstance(payload, tuple) else ('appointment', payload)
+        return {
+            'resource': resource,
+            'reason': reason,
+            'appointment_id': value if kind == 'appointment' else None,
+            'proposal': value if kind == 'proposal' else None,
+        }
+
+    def reserve(self, start, end, practitioner_id=None, room_id=None, proposal=None):
+        """Vermerkt einen angenommenen Termin, damit folgende Prüfungen ihn berücksichtigen"""
+        practitioner_id, room_id = _pk(practitioner_id), _pk(room_id)
+        payload = ('proposal', proposal)
+        if practitioner_id is not None:
+            self.practitioner_reserved[practitioner_id].add(start, end, payload)
+        if room_id is not None:
+            self.room_reserved[room_id].add(start, end, payload)
+
+    def validate(self, start, end, practitioner_id=None, room_id=None):
+        """Wirft ValidationError bei einem Konflikt"""
+        conflict = self.find_conflict(start, end, practitioner_id, room_id)
+        if conflict:
+            raise ValidationError(conflict['reason'])
+
+    def check_batch(self, proposals: List[Dict]) -> List[Dict]:
+        """
+        Prüft eine Liste von Vorschlägen gegen den Bestand und gegeneinander.
+
+        Die Vorschläge werden nach Beginn sortiert abgearbeitet; konfliktfreie Vorschläge
+        werden reserviert. Zurückgegeben wird je Konflikt ein Dict mit 'index' (Position
+        in proposals), 'start' sowie den Angaben aus find_conflict().
+        """
+        conflicts = []
+        for index in sorted(range(len(proposals)), key=lambda i: proposals[i]['start']):
+            proposal = proposals[index]
+            conflict = self.find_conflict(
+                proposal['start'], proposal['end'], proposal.get('practitioner_id'), proposal.get('room_id')
+            )
+            if conflict:
+                conflicts.append({'index': index, 'start': proposal['start'], **conflict})
+                continue
+            self.reserve(
+                proposal['start'], proposal['end'], proposal.get('practitioner_id'), proposal.get('room_id'),
+                proposal=index,
+            )
+        conflicts.sort(key=lambda c: c['index'])
+        return conflicts
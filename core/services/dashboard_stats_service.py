@@ -0,0 +1,362 @@
+"""
+Materialisierte Dashboard-Statistiken.
+
+Die Kennzahlen des Dashboards liegen als Zähler in DashboardStatistic. Jedes beobachtete
+Model beschreibt über eine Beitragsfunktion, welche Zähler eine Instanz erhöht. Bei
+Speichern/Löschen wird die Differenz zwischen altem und neuem Beitrag per F()-Ausdruck
+auf die Zähler gebucht. Zeitabhängige Kennzahlen (z.B. kommende Termine, Umsatz im
+laufenden Monat) veralten mit der Zeit und werden vom Management-Command
+recompute_dashboard_stats regelmäßig vollständig neu berechnet.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TREATMENT_USAGE_PREFIX = 'treatment_usage:'
+INSURANCE_DISTRIBUTION_PREFIX = 'insurance_distribution:'
+
+
+def _month_bounds(now):
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    return month_start, last_month_start
+
+
+def _patient_contribution(values, now):
+    created_at = values['created_at']
+    return {
+        'patients.total': 1,
+        'patients.new_this_month': 1 if created_at and created_at >= now - timedelta(days=30) else 0,
+    }
+
+
+def _appointment_contribution(values, now):
+    appointment_date = values['appointment_date']
+    contribution = {
+        'appointments.total': 1,
+        'appointments.upcoming': 1 if appointment_date >= now else 0,
+        'appointments.this_week': 1 if now <= appointment_date <= now + timedelta(days=7) else 0,
+        'appointments.past': 1 if appointment_date < now else 0,
+        'appointments.past_no_show': 1 if appointment_date < now and values['status'] == 'no_show' else 0,
+    }
+    if values['treatment__treatment_name']:
+        contribution[TREATMENT_USAGE_PREFIX + values['treatment__treatment_name']] = 1
+    return contribution
+
+
+def _treatment_contribution(values, now):
+    return {'treatments.total': 1}
+
+
+def _prescription_contribution(values, now):
+    return {
+        'prescriptions.total': 1,
+        'prescriptions.pending': 1 if values['status'] == 'Open' else 0,
+    }
+
+
+def _insurance_group_contribution(values, now):
+    return {'insurance_groups.total': 1}
+
+
+def _patient_insurance_contribution(values, now):
+    name = values['insurance_provider__name']
+    return {INSURANCE_DISTRIBUTION_PREFIX + name: 1} if name else {}
+
+
+def _billing_item_contribution(values, now):
+    created_at = values['created_at']
+    amount = values['insurance_amount'] or Decimal('0.00')
+    month_start, last_month_start = _month_bounds(now)
+    return {
+        'finances.current_month': amount if created_at and created_at >= month_start else 0,
+        'finances.last_month': amount if created_at and last_month_start <= created_at <= month_start else 0,
+        'finances.outstanding': amount if not values['is_billed'] else 0,
+    }
+
+
+class DashboardStatsService:
+    """Pflegt und liest die materialisierten Dashboard-Kennzahlen"""
+
+    # Model-Name -> (benötigte Felder, Beitragsfunktion)
+    TRACKED_MODELS = {
+        'Patient': (['created_at'], _patient_contribution),
+        'Appointment': (['appointment_date', 'status', 'treatment__treatment_name'], _appointment_contribution),
+        'Treatment': ([], _treatment_contribution),
+        'Prescription': (['status'], _prescription_contribution),
+        'InsuranceProviderGroup': ([], _insurance_group_contribution),
+        'PatientInsurance': (['insurance_provider__name'], _patient_insurance_contribution),
+        'BillingItem': (['created_at', 'insurance_amount', 'is_billed'], _billing_item_contribution),
+    }
+
+    # ------------------------------------------------------------------
+    # Inkrementelle Fortschreibung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_tracked(model) -> bool:
+        return model._meta.app_label == 'core' and model.__name__ in DashboardStatsService.TRACKED_MODELS
+
+    @staticmethod
+    def _instance_values(instance, fields: List[str]) -> Dict:
+        """Liest die benötigten Felder (auch über Relationen) von einer Instanz"""
+        values = {}
+        for field in fields:
+            value = instance
+            for part in field.split('__'):
+                value = getattr(value, part, None) if value is not None else None
+            values[field] = value
+        return values
+
+    @staticmethod
+    def contribution(model, values: Optional[Dict], now=None) -> Dict[str, Decimal]:
+        """Beitrag einer Instanz (als Feldwerte) zu den Zählern; None = kein Beitrag"""
+        if values is None:
+            return {}
+        _, contribution_func = DashboardStatsService.TRACKED_MODELS[model.__name__]
+        return contribution_func(values, now or timezone.now())
+
+    @staticmethod
+    def load_stored_values(instance) -> Optional[Dict]:
+        """Lädt die gespeicherten Feldwerte einer Instanz (vor dem Speichern)"""
+        if instance._state.adding or instance.pk is None:
+            return None
+        fields, _ = DashboardStatsService.TRACKED_MODELS[type(instance).__name__]
+        return type(instance).objects.filter(pk=instance.pk).values(*fields).first() if fields else {}
+
+    @staticmethod
+    def record_change(instance, old_values: Optional[Dict], deleted: bool = False) -> None:
+        """Bucht die Differenz zwischen altem und neuem Beitrag einer Instanz"""
+        model = type(instance)
+        fields, _ = DashboardStatsService.TRACKED_MODELS[model.__name__]
+        now = timezone.now()
+
+        new_values = None if deleted else DashboardStatsService._instance_values(instance, fields)
+        if deleted:
+            old_values = DashboardStatsService._instance_values(instance, fields)
+
+        deltas = defaultdict(Decimal)
+        for name, value in DashboardStatsService.contribution(model, new_values, now).items():
+            deltas[name] += Decimal(value)
+        for name, value in DashboardStatsService.contribution(model, old_values, now).items():
+            deltas[name] -= Decimal(value)
+        DashboardStatsService.apply_deltas(deltas, now)
+
+    @staticmethod
+    def record_bulk_created(instances: Iterable) -> None:
+        """Bucht per bulk_create angelegte Instanzen (dort werden keine Signals ausgelöst)"""
+        now = timezone.now()
+        deltas = defaultdict(Decimal)
+        for instance in instances:
+            model = type(instance)
+            fields, _ = DashboardStatsService.TRACKED_MODELS[model.__name__]
+            values = DashboardStatsService._instance_values(instance, fields)
+            for name, value in DashboardStatsService.contribution(model, values, now).items():
+                deltas[name] += Decimal(value)
+        DashboardStatsService.apply_deltas(deltas, now)
+
+    @staticmethod
+    def record_bulk_updates(model, changes: Iterable) -> None:
+        """Bucht per QuerySet.update geänderte Zeilen als Paare (alte Werte, neue Werte)"""
+        now = timezone.now()
+        deltas = defaultdict(Decimal)
+        for old_values, new_values in changes:
+            for name, value in DashboardStatsService.contribution(model, new_values, now).items():
+                deltas[name] += Decimal(value)
+            for name, value in DashboardStatsService.contribution(model, old_values, now).items():
+                deltas[name] -= Decimal(value)
+        DashboardStatsService.apply_deltas(deltas, now)
+
+    @staticmethod
+    def apply_deltas(deltas: Dict[str, Decimal], now=None) -> None:
+        """Erhöht/verringert Zähler atomar; ohne vorhandenen Snapshot wird nichts gebucht"""
+        from core.models import DashboardStatistic
+
+        now = now or timezone.now()
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+            updated = DashboardStatistic.objects.filter(name=name).update(
+                value=F('value') + delta,
+                updated_at=now
+            )
+            if updated or not DashboardStatistic.objects.exists():
+                continue
+            # Neuer dynamischer Zähler (z.B. neue Behandlung in der Top-Liste)
+            stat, created = DashboardStatistic.objects.get_or_create(
+                name=name,
+                defaults={'value': delta}
+            )
+            if not created:
+                DashboardStatistic.objects.filter(pk=stat.pk).update(value=F('value') + delta, updated_at=now)
+
+    # ------------------------------------------------------------------
+    # Vollständige Neuberechnung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def compute_counters(now=None) -> Dict[str, Decimal]:
+        """Berechnet alle Zähler direkt aus der Datenbank"""
+        from core.models import (
+            Patient, Appointment, Treatment, Prescription, InsuranceProviderGroup,
+            PatientInsurance, BillingItem
+        )
+
+        now = now or timezone.now()
+        month_start, last_month_start = _month_bounds(now)
+
+        counters = {}
+        counters['patients.total'] = Patient.objects.count()
+        counters['patients.new_this_month'] = Patient.objects.filter(created_at__gte=now - timedelta(days=30)).count()
+
+        counters.update({
+            f'appointments.{name}': value or 0
+            for name, value in Appointment.objects.aggregate(
+                total=Count('id'),
+                upcoming=Count('id', filter=Q(appointment_date__gte=now)),
+                this_week=Count('id', filter=Q(appointment_date__range=(now, now + timedelta(days=7)))),
+                past=Count('id', filter=Q(appointment_date__lt=now)),
+                past_no_show=Count('id', filter=Q(appointment_date__lt=now, status='no_show')),
+            ).items()
+        })
+        for row in Appointment.objects.filter(treatment__isnull=False).values('treatment__treatment_name').annotate(count=Count('id')):
+            counters[TREATMENT_USAGE_PREFIX + row['treatment__treatment_name']] = row['count']
+
+        counters['treatments.total'] = Treatment.objects.count()
+        prescription_counts = Prescription.objects.aggregate(
+            total=Count('id'),
+            pending=Count('id', filter=Q(status='Open'))
+        )
+        counters['prescriptions.total'] = prescription_counts['total']
+        counters['prescriptions.pending'] = prescription_counts['pending']
+        counters['insurance_groups.total'] = InsuranceProviderGroup.objects.count()
+
+        for row in PatientInsurance.objects.filter(insurance_provider__isnull=False).values(
+            'insurance_provider__name'
+        ).annotate(count=Count('id')):
+            counters[INSURANCE_DISTRIBUTION_PREFIX + row['insurance_provider__name']] = row['count']
+
+        finances = BillingItem.objects.aggregate(
+            current_month=Sum('insurance_amount', filter=Q(created_at__gte=month_start)),
+            last_month=Sum('insurance_amount', filter=Q(created_at__range=(last_month_start, month_start))),
+            outstanding=Sum('insurance_amount', filter=Q(is_billed=False)),
+        )
+        for name, value in finances.items():
+            counters[f'finances.{name}'] = value or Decimal('0.00')
+
+        return counters
+
+    @staticmethod
+    def recompute() -> int:
+        """Berechnet alle Kennzahlen neu und schreibt sie als Snapshot; gibt die Anzahl Zähler zurück"""
+        from core.models import DashboardStatistic
+
+        now = timezone.now()
+        counters = DashboardStatsService.compute_counters(now)
+
+        with transaction.atomic():
+            existing = {stat.name: stat for stat in DashboardStatistic.objects.select_for_update()}
+            to_update = []
+            to_create = []
+            for name, value in counters.items():
+                stat = existing.pop(name, None)
+                if stat:
+                    stat.value = value
+                    stat.computed_at = now
+                    stat.updated_at = now
+                    to_update.append(stat)
+                else:
+                    to_create.append(DashboardStatistic(name=name, value=value, computed_at=now))
+
+            DashboardStatistic.objects.bulk_update(to_update, ['value', 'computed_at', 'updated_at'], batch_size=500)
+            DashboardStatistic.objects.bulk_create(to_create, batch_size=500)
+            if existing:
+                DashboardStatistic.objects.filter(pk__in=[stat.pk for stat in existing.values()]).delete()
+
+        logger.info(f"Dashboard-Statistiken neu berechnet: {len(counters)} Zähler")
+        return len(counters)
+
+    # ------------------------------------------------------------------
+    # Lesen
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def get_stats() -> Dict:
+        """Liefert die Dashboard-Statistiken aus dem Snapshot (eine Abfrage)"""
+        from core.models import DashboardStatistic
+
+        rows = list(DashboardStatistic.objects.values_list('name', 'value', 'computed_at', 'updated_at'))
+        if not rows:
+            DashboardStatsService.recompute()
+            rows = list(DashboardStatistic.objects.values_list('name', 'value', 'computed_at', 'updated_at'))
+
+        counters = {}
+        treatment_usage = {}
+        insurance_distribution = {}
+        computed_at = None
+        updated_at = None
+        for name, value, row_computed_at, row_updated_at in rows:
+            if name.startswith(TREATMENT_USAGE_PREFIX):
+                if value > 0:
+                    treatment_usage[name[len(TREATMENT_USAGE_PREFIX):]] = int(value)
+            elif name.startswith(INSURANCE_DISTRIBUTION_PREFIX):
+                if value > 0:
+                    insurance_distribution[name[len(INSURANCE_DISTRIBUTION_PREFIX):]] = int(value)
+            else:
+                counters[name] = value
+            if row_computed_at and (computed_at is None or row_computed_at < computed_at):
+                computed_at = row_computed_at
+            if row_updated_at and (updated_at is None or row_updated_at > updated_at):
+                updated_at = row_updated_at
+
+        def count(name):
+            return int(counters.get(name, 0))
+
+        past = count('appointments.past')
+        no_show_rate = round((count('appointments.past_no_show') / past) * 100, 2) if past else 0
+        most_common = dict(sorted(treatment_usage.items(), key=lambda item: -item[1])[:5])
+        now = timezone.now()
+
+        return {
+            'patients': {
+                'total': count('patients.total'),
+                'newThisMonth': count('patients.new_this_month'),
+            },
+            'appointments': {
+                'total': count('appointments.total'),
+                'upcoming': count('appointments.upcoming'),
+                'thisWeek': count('appointments.this_week'),
+                'noShowRate': no_show_rate,
+            },
+            'treatments': {
+                'total': count('treatments.total'),
+                'mostCommon': most_common,
+            },
+            'finances': {
+                'currentMonth': float(counters.get('finances.current_month', 0)),
+                'lastMonth': float(counters.get('finances.last_month', 0)),
+                'outstanding': float(counters.get('finances.outstanding', 0)),
+            },
+            'prescriptions': {
+                'total': count('prescriptions.total'),
+                'pending': count('prescriptions.pending'),
+            },
+            'insuranceGroups': {
+                'total': count('insurance_groups.total'),
+                'distribution': insurance_distribution,
+            },
+            'snapshot': {
+                'computedAt': computed_at.isoformat() if computed_at else None,
+                'ageSeconds': int((now - computed_at).total_seconds()) if computed_at else None,
+                'lastUpdatedAt': updated_at.isoformat() if updated_at else None,
+            },
+        }
@@ -0,0 +1,307 @@
+"""
+Ausgangspostfach (Transactional Outbox) und gebündelte E-Mail-Zustellung.
+
+Benachrichtigungen werden nicht mehr im Abfrage-Loop per send_mail verschickt, sondern
+als OutboundEmail gesammelt angelegt (enqueue, ein bulk_create). Da das in derselben
+Transaktion wie die auslösende Änderung geschieht, geht keine Nachricht verloren und es
+wird keine für eine zurückgerollte Änderung verschickt.
+
+Der Zustell-Worker (deliver_pending, Management-Command deliver_emails) beansprucht
+wartende Nachrichten stapelweise per bedingtem UPDATE mit einem Claim-Token, daher
+können mehrere Worker parallel laufen. Ein Stapel wird über eine einzige, offen
+gehaltene Verbindung des E-Mail-Backends versendet. Fehlgeschlagene Nachrichten werden
+mit exponentiell wachsendem Abstand erneut versucht, bis MAX_ATTEMPTS erreicht ist.
+Durchsatz und Fehler werden in den prozesslokalen Metriken (Präfix 'email_outbox:')
+erfasst. Alle Grenzwerte sind über settings.EMAIL_OUTBOX konfigurierbar.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, F
+from django.utils import timezone
+
+from core.models import OutboundEmail
+from core.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF_SECONDS': 60,
+    'SENDING_TIMEOUT_SECONDS': 600,
+    'RETENTION_DAYS': 30,
+}
+
+METRICS_PREFIX = 'email_outbox:'
+
+
+class EmailOutboxService:
+    """Anlegen, Zustellen und Aufräumen ausgehender E-Mails"""
+
+    @staticmethod
+    def get_settings():
+        return {**DEFAULT_SETTINGS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+    # ------------------------------------------------------------------
+    # Anlegen
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def build(recipient: str, subject: str, body: str, dedup_key: Optional[str] = None,
+              category: str = '') -> OutboundEmail:
+        """Ungespeicherte Nachricht für enqueue()"""
+        return OutboundEmail(
+            recipient=recipient,
+            subject=subject[:255],
+            body=body,
+            dedup_key=dedup_key,
+            category=category,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+        )
+
+    @staticmethod
+    def existing_keys(keys: Iterable[str]) -> set:
+        """Bereits im Ausgangspostfach vorhandene dedup_keys"""
+        keys = [key for key in set(keys) if key]
+        existing = set()
+        # In Portionen, damit die IN-Liste unter dem Parameterlimit von SQLite bleibt
+        for start in range(0, len(keys), 500):
+            existing.update(OutboundEmail.objects.filter(
+                dedup_key__in=keys[start:start + 500]
+            ).values_list('dedup_key', flat=True))
+        return existing
+
+    @staticmethod
+    def enqueue(messages: Iterable[OutboundEmail]) -> List[OutboundEmail]:
+        """
+        Legt die Nachrichten gesammelt an. Nachrichten ohne Empfänger und solche, deren
+        dedup_key bereits existiert (auch innerhalb des Aufrufs), werden übersprungen.
+
+        Returns:
+            Die tatsächlich neu angelegten Nachrichten
+        """
+        candidates = []
+        seen_keys = set()
+        for message in messages:
+            if not message.recipient:
+                continue
+            if message.dedup_key:
+                if message.dedup_key in seen_keys:
+                    continue
+                seen_keys.add(message.dedup_key)
+            candidates.append(message)
+
+        if seen_keys:
+            existing = EmailOutboxService.existing_keys(seen_keys)
+            candidates = [message for message in candidates if message.dedup_key not in existing]
+
+        # ignore_conflicts fängt gleichzeitig laufende Erzeuger mit demselben dedup_key ab
+        OutboundEmail.objects.bulk_create(candidates, batch_size=500, ignore_conflicts=True)
+        if candidates:
+            metrics.increment(f'{METRICS_PREFIX}enqueued', len(candidates))
+            logger.info(f"{len(candidates)} E-Mails in das Ausgangspostfach gestellt")
+        return candidates
+
+    # ------------------------------------------------------------------
+    # Zustellung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def claim_batch(batch_size: int) -> List[OutboundEmail]:
+        """Beansprucht bis zu batch_size fällige Nachrichten für diesen Worker"""
+        now = timezone.now()
+        candidates = list(
+            OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not candidates:
+            return []
+
+        token = uuid.uuid4()
+        OutboundEmail.objects.filter(pk__in=candidates, status='pending').update(
+            status='sending',
+            claim_token=token,
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+        )
+        return list(OutboundEmail.objects.filter(claim_token=token, status='sending').order_by('id'))
+
+    @classmethod
+    def _retry_or_fail(cls, messages: List[OutboundEmail], errors: Dict[int, str], config) -> Dict[str, int]:
+        """Stellt fehlgeschlagene Nachrichten mit Backoff erneut ein oder markiert sie als fehlgeschlagen"""
+        now = timezone.now()
+        # Gleiche Fehler mit gleichem Versuchszähler (z.B. Mailserver nicht erreichbar) in einem UPDATE
+        groups = defaultdict(list)
+        retried = failed = 0
+        for message in messages:
+            error = errors[message.pk][:2000]
+            if message.attempts < config['MAX_ATTEMPTS']:
+                delay = config['RETRY_BACKOFF_SECONDS'] * 2 ** (message.attempts - 1)
+                groups[('pending', error, now + timedelta(seconds=delay))].append(message.pk)
+                retried += 1
+            else:
+                groups[('failed', error, None)].append(message.pk)
+                logger.error(f"E-Mail {message.pk} an {message.recipient} endgültig fehlgeschlagen: {error}")
+                failed += 1
+
+        for (status, error, next_attempt_at), ids in groups.items():
+            values = {'status': status, 'claim_token': None, 'last_error': error}
+            if next_attempt_at is not None:
+                values['next_attempt_at'] = next_attempt_at
+            OutboundEmail.objects.filter(pk__in=ids).update(**values)
+        return {'retried': retried, 'failed': failed}
+
+    @classmethod
+    def send_batch(cls, messages: List[OutboundEmail], connection=None) -> Dict[str, int]:
+        """
+        Versendet beanspruchte Nachrichten über eine gemeinsame Verbindung.
+
+        Jede Nachricht wird einzeln an send_messages übergeben, damit ein Fehler genau
+        der betroffenen Nachricht zugeordnet wird; die Verbindung bleibt dabei offen.
+        """
+        config = cls.get_settings()
+        if not messages:
+            return {'sent': 0, 'retried': 0, 'failed': 0}
+
+        connection = connection or get_connection(fail_silently=False)
+        sent_ids = []
+        errors = {}
+        start = perf_counter()
+        try:
+            connection.open()
+        except Exception as e:
+            errors = {message.pk: f'Verbindung zum Mailserver fehlgeschlagen: {e}' for message in messages}
+        else:
+            try:
+                for message in messages:
+                    email = EmailMessage(
+                        subject=message.subject,
+                        body=message.body,
+                        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                        to=[message.recipient],
+                        connection=connection,
+                    )
+                    try:
+                        if connection.send_messages([email]):
+                            sent_ids.append(message.pk)
+                        else:
+                            errors[message.pk] = 'Nachricht wurde vom Backend nicht angenommen'
+                    except Exception as e:
+                        errors[message.pk] = str(e) or e.__class__.__name__
+            finally:
+                try:
+                    connection.close()
+                except Exception as e:
+                    logger.warning(f"Verbindung zum Mailserver konnte nicht geschlossen werden: {e}")
+        elapsed_ms = (perf_counter() - start) * 1000
+
+        if sent_ids:
+            OutboundEmail.objects.filter(pk__in=sent_ids).update(
+                status='sent', claim_token=None, last_error='', sent_at=timezone.now()
+            )
+        outcome = cls._retry_or_fail([message for message in messages if message.pk in errors], errors, config)
+        outcome['sent'] = len(sent_ids)
+
+        metrics.observe(f'{METRICS_PREFIX}batch', elapsed_ms)
+        for name in ('sent', 'retried', 'failed'):
+            if outcome[name]:
+                metrics.increment(f'{METRICS_PREFIX}{name}', outcome[name])
+        return outcome
+
+    @classmethod
+    def deliver_pending(cls, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict:
+        """
+        Stellt fällige Nachrichten stapelweise zu, bis keine mehr fällig sind.
+
+        Returns:
+            {'sent', 'retried', 'failed', 'batches', 'seconds', 'messages_per_second'}
+        """
+        config = cls.get_settings()
+        batch_size = batch_size or config['BATCH_SIZE']
+        cls.requeue_stale()
+
+        totals = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+        start = perf_counter()
+        connection = get_connection(fail_silently=False)
+        while max_batches is None or totals['batches'] < max_batches:
+            messages = cls.claim_batch(batch_size)
+            if not messages:
+                break
+            outcome = cls.send_batch(messages, connection)
+            for name, value in outcome.items():
+                totals[name] += value
+            totals['batches'] += 1
+
+        seconds = perf_counter() - start
+        totals['seconds'] = round(seconds, 3)
+        totals['messages_per_second'] = round(totals['sent'] / seconds, 1) if seconds and totals['sent'] else 0.0
+        if totals['batches']:
+            logger.info(
+                f"E-Mail-Zustellung: {totals['sent']} gesendet, {totals['retried']} erneut eingestellt, "
+                f"{totals['failed']} fehlgeschlagen in {totals['batches']} Stapeln "
+                f"({totals['messages_per_second']} Nachrichten/s)"
+            )
+        return totals
+
+    # ------------------------------------------------------------------
+    # Wartung
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def requeue_stale(cls) -> int:
+        """Gibt Nachrichten frei, deren Worker länger als SENDING_TIMEOUT_SECONDS nicht fertig wurde"""
+        cutoff = timezone.now() - timedelta(seconds=cls.get_settings()['SENDING_TIMEOUT_SECONDS'])
+        count = OutboundEmail.objects.filter(status='sending', claimed_at__lt=cutoff).update(
+            status='pending', claim_token=None
+        )
+        if count:
+            logger.warning(f"{count} hängende E-Mails erneut eingestellt")
+        return count
+
+    @staticmethod
+    def retry_failed() -> int:
+        """Stellt endgültig fehlgeschlagene Nachrichten erneut ein (z.B. nach einer Mailserver-Störung)"""
+        return OutboundEmail.objects.filter(status='failed').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+
+    @classmethod
+    def purge_sent(cls, days: Optional[int] = None) -> int:
+        """
+        Löscht gesendete Nachrichten, die älter als RETENTION_DAYS sind. Der dedup_key
+        entfällt damit ebenfalls; Erzeuger wählen ihre Schlüssel daher so, dass eine
+        Nachricht nach Ablauf der Frist nicht mehr erneut anfällt.
+        """
+        days = cls.get_settings()['RETENTION_DAYS'] if days is None else days
+        deleted, _ = OutboundEmail.objects.filter(
+            status='sent', sent_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        return deleted
+
+    @staticmethod
+    def get_statistics(all_processes: bool = False) -> Dict:
+        """
+        Anzahl der Nachrichten je Status, älteste wartende Nachricht und Zustell-Metriken
+        (mit all_processes auch die der Worker-Prozesse, siehe MetricsRegistry.collect)
+        """
+        counts = {
+            row['status']: row['count']
+            for row in OutboundEmail.objects.order_by().values('status').annotate(count=Count('id'))
+        }
+        oldest = OutboundEmail.objects.filter(status='pending').order_by('created_at').values_list(
+            'created_at', flat=True
+        ).first()
+        return {
+            'by_status': {status: counts.get(status, 0) for status, _ in OutboundEmail.STATUS_CHOICES},
+            'oldest_pending': oldest,
+            'metrics': metrics.collect(METRICS_PREFIX) if all_processes else metrics.snapshot(METRICS_PREFIX),
+        }
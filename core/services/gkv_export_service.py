@@ -1,15 +1,56 @@
+import csv
+import io
 from decimal import Decimal
 from datetime import datetime, date
+from xml.sax.saxutils import XMLGenerator
 from django.db import transaction
+from django.db.models import Prefetch
 from core.models import Appointment, BillingItem, Treatment, Patient, PatientInsurance
 from core.services.billing_service import BillingService
 
 
+class _LineBuffer(io.TextIOBase):
+    """Textpuffer für csv.writer/XMLGenerator, der den geschriebenen Text zum Abholen sammelt"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+        return len(value)
+
+    def drain(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+
 class GKVExportService:
     """
     Service für die Export-Funktionalität gemäß GKV-Anforderungen
+
+    Neben den listenbasierten Methoden gibt es einen Streaming-Pfad
+    (iter_gkv_export_items, iter_csv, iter_xml, stream_export, write_export_file),
+    dessen Speicherbedarf unabhängig von der Exportgröße konstant bleibt.
     """
-    
+
+    EXPORT_CHUNK_SIZE = 500
+
+    CSV_HEADER = [
+        'Termin-ID', 'Patient-ID', 'Patient-Name', 'Versicherungsnummer',
+        'Krankenkasse', 'Behandlung', 'LEGS-Code', 'Abrechnungscode',
+        'Tarifkennzeichen', 'VKZ', 'Telemedizin', 'Termindatum',
+        'Dauer (Min)', 'Behandler', 'Raum', 'Gesamtbetrag',
+        'Netto-Betrag', 'Zuzahlung', 'Verordnung-ID', 'Sitzungsnummer',
+        'Gesamtsitzungen', 'Serien-ID'
+    ]
+
+    CONTENT_TYPES = {
+        'csv': 'text/csv; charset=utf-8',
+        'xml': 'application/xml; charset=utf-8',
+    }
+
     def __init__(self):
         self.billing_service = BillingService()
     
@@ -17,29 +58,41 @@ class GKVExportService:
         """
         Generiert Export-Daten für GKV-Abrechnung
         """
+        return list(self.iter_gkv_export_items(billing_cycle, start_date, end_date))
+
+    def iter_gkv_export_items(self, billing_cycle=None, start_date=None, end_date=None, chunk_size=None):
+        """
+        Liefert die Export-Einträge einzeln aus einem Generator.
+
+        Die Termine werden blockweise per iterator() gelesen, Abrechnungspositionen
+        werden je Block vorab geladen (keine Abfrage pro Termin).
+        """
         if billing_cycle:
             appointments = self._get_appointments_for_billing_cycle(billing_cycle)
         else:
             appointments = self._get_appointments_for_date_range(start_date, end_date)
-        
-        export_data = []
-        
-        for appointment in appointments:
+
+        appointments = appointments.select_related(
+            'patient_insurance__insurance_provider', 'prescription'
+        ).prefetch_related(
+            Prefetch('billing_items', queryset=BillingItem.objects.only(
+                'id', 'appointment_id', 'insurance_amount', 'patient_copay'
+            ))
+        ).order_by('appointment_date', 'id')
+
+        for appointment in appointments.iterator(chunk_size=chunk_size or self.EXPORT_CHUNK_SIZE):
             if not self._is_gkv_eligible(appointment):
                 continue
-                
+
             export_item = self._create_gkv_export_item(appointment)
             if export_item:
-                export_data.append(export_item)
-        
-        return export_data
-    
+                yield export_item
+
     def _get_appointments_for_billing_cycle(self, billing_cycle):
         """Holt Termine für einen Abrechnungszyklus"""
         return Appointment.objects.filter(
-            billing_cycle=billing_cycle,
-            status='completed'
-        ).select_related('patient', 'treatment', 'practitioner', 'room')
+            billing_items__billing_cycle=billing_cycle
+        ).distinct().select_related('patient', 'treatment', 'practitioner', 'room')
     
     def _get_appointments_for_date_range(self, start_date, end_date):
         """Holt Termine für einen Datumsbereich"""
@@ -72,8 +125,8 @@ class GKVExportService:
         patient = appointment.patient
         patient_insurance = appointment.patient_insurance
         
-        # Hole BillingItems für diesen Termin
-        billing_items = BillingItem.objects.filter(appointment=appointment)
+        # Hole BillingItems für diesen Termin (im Streaming-Pfad vorab geladen)
+        billing_items = appointment.billing_items.all()
         
         # Berechne Gesamtbetrag
         total_amount = sum(item.get_total_amount() for item in billing_items)
@@ -105,100 +158,176 @@ class GKVExportService:
             'total_amount': total_amount,
             'net_amount': net_amount,
             'copayment_amount': copayment_amount,
-            'prescription_id': appointment.prescription.id if appointment.prescription else None,
-                    'session_number': getattr(appointment, 'session_number', 1),
-        'total_sessions': getattr(appointment, 'total_sessions', 1),
+            'prescription_id': appointment.prescription_id,
+            'session_number': getattr(appointment, 'session_number', 1),
+            'total_sessions': getattr(appointment, 'total_sessions', 1),
             'series_identifier': appointment.series_identifier,
         }
         
         return export_item
     
+    def _csv_row(self, item):
+        """Wandelt einen Export-Eintrag in eine CSV-Zeile um"""
+        return [
+            item['appointment_id'],
+            item['patient_id'],
+            item['patient_name'],
+            item['patient_insurance_number'],
+            item['insurance_provider'],
+            item['treatment_name'],
+            item['legs_code'],
+            item['accounting_code'],
+            item['tariff_indicator'],
+            item['prescription_type_indicator'],
+            'Ja' if item['is_telemedicine'] else 'Nein',
+            item['appointment_date'].strftime('%d.%m.%Y'),
+            item['duration_minutes'],
+            item['practitioner_name'],
+            item['room_name'],
+            f"{item['total_amount']:.2f}",
+            f"{item['net_amount']:.2f}",
+            f"{item['copayment_amount']:.2f}",
+            item['prescription_id'] or '',
+            item['session_number'] or '',
+            item['total_sessions'] or '',
+            item['series_identifier'] or ''
+        ]
+
+    def iter_csv(self, export_items):
+        """Erzeugt die CSV-Datei zeilenweise (Header zuerst, damit sofort Daten fließen)"""
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer, delimiter=';')
+
+        writer.writerow(self.CSV_HEADER)
+        yield buffer.drain()
+
+        for item in export_items:
+            writer.writerow(self._csv_row(item))
+            yield buffer.drain()
+
     def export_to_csv(self, export_data, filename=None):
         """Exportiert GKV-Daten als CSV"""
-        import csv
-        from io import StringIO
-        
         if not filename:
             filename = f"gkv_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        output = StringIO()
-        writer = csv.writer(output, delimiter=';')
-        
-        # Header
-        header = [
-            'Termin-ID', 'Patient-ID', 'Patient-Name', 'Versicherungsnummer',
-            'Krankenkasse', 'Behandlung', 'LEGS-Code', 'Abrechnungscode',
-            'Tarifkennzeichen', 'VKZ', 'Telemedizin', 'Termindatum',
-            'Dauer (Min)', 'Behandler', 'Raum', 'Gesamtbetrag',
-            'Netto-Betrag', 'Zuzahlung', 'Verordnung-ID', 'Sitzungsnummer',
-            'Gesamtsitzungen', 'Serien-ID'
-        ]
-        writer.writerow(header)
-        
-        # Daten
-        for item in export_data:
-            row = [
-                item['appointment_id'],
-                item['patient_id'],
-                item['patient_name'],
-                item['patient_insurance_number'],
-                item['insurance_provider'],
-                item['treatment_name'],
-                item['legs_code'],
-                item['accounting_code'],
-                item['tariff_indicator'],
-                item['prescription_type_indicator'],
-                'Ja' if item['is_telemedicine'] else 'Nein',
-                item['appointment_date'].strftime('%d.%m.%Y'),
-                item['duration_minutes'],
-                item['practitioner_name'],
-                item['room_name'],
-                f"{item['total_amount']:.2f}",
-                f"{item['net_amount']:.2f}",
-                f"{item['copayment_amount']:.2f}",
-                item['prescription_id'] or '',
-                item['session_number'] or '',
-                item['total_sessions'] or '',
-                item['series_identifier'] or ''
-            ]
-            writer.writerow(row)
-        
-        return output.getvalue(), filename
-    
+
+        return ''.join(self.iter_csv(export_data)), filename
+
+    def iter_xml(self, export_items, total_appointments=None):
+        """
+        Erzeugt die XML-Datei inkrementell mit korrektem Escaping.
+
+        Ist total_appointments vorab nicht bekannt (Streaming), wird die Anzahl
+        nach der Terminliste ausgegeben.
+        """
+        buffer = _LineBuffer()
+        xml = XMLGenerator(buffer, encoding='UTF-8', short_empty_elements=True)
+
+        def element(name, value, indent):
+            xml.ignorableWhitespace(' ' * indent)
+            xml.startElement(name, {})
+            xml.characters('' if value is None else str(value))
+            xml.endElement(name)
+            xml.ignorableWhitespace('\n')
+
+        xml.startDocument()
+        xml.startElement('gkv_export', {})
+        xml.ignorableWhitespace('\n')
+        element('export_date', datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 2)
+        if total_appointments is not None:
+            element('total_appointments', total_appointments, 2)
+        xml.ignorableWhitespace('  ')
+        xml.startElement('appointments', {})
+        xml.ignorableWhitespace('\n')
+        yield buffer.drain()
+
+        count = 0
+        for item in export_items:
+            xml.ignorableWhitespace('    ')
+            xml.startElement('appointment', {})
+            xml.ignorableWhitespace('\n')
+            element('id', item['appointment_id'], 6)
+            element('patient_name', item['patient_name'], 6)
+            element('insurance_number', item['patient_insurance_number'], 6)
+            element('treatment_name', item['treatment_name'], 6)
+            element('legs_code', item['legs_code'], 6)
+            element('appointment_date', item['appointment_date'].strftime("%Y-%m-%d"), 6)
+            element('net_amount', f"{item['net_amount']:.2f}", 6)
+            element('copayment_amount', f"{item['copayment_amount']:.2f}", 6)
+            xml.ignorableWhitespace('    ')
+            xml.endElement('appointment')
+            xml.ignorableWhitespace('\n')
+            count += 1
+            yield buffer.drain()
+
+        xml.ignorableWhitespace('  ')
+        xml.endElement('appointments')
+        xml.ignorableWhitespace('\n')
+        if total_appointments is None:
+            element('total_appointments', count, 2)
+        xml.endElement('gkv_export')
+        xml.endDocument()
+        yield buffer.drain()
+
     def export_to_xml(self, export_data, filename=None):
         """Exportiert GKV-Daten als XML (für elektronische Abrechnung)"""
         if not filename:
             filename = f"gkv_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xml"
-        
-        xml_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        xml_content += '<gkv_export>\n'
-        xml_content += f'  <export_date>{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</export_date>\n'
-        xml_content += f'  <total_appointments>{len(export_data)}</total_appointments>\n'
-        xml_content += '  <appointments>\n'
-        
-        for item in export_data:
-            xml_content += '    <appointment>\n'
-            xml_content += f'      <id>{item["appointment_id"]}</id>\n'
-            xml_content += f'      <patient_name>{item["patient_name"]}</patient_name>\n'
-            xml_content += f'      <insurance_number>{item["patient_insurance_number"]}</insurance_number>\n'
-            xml_content += f'      <treatment_name>{item["treatment_name"]}</treatment_name>\n'
-            xml_content += f'      <legs_code>{item["legs_code"]}</legs_code>\n'
-            xml_content += f'      <appointment_date>{item["appointment_date"].strftime("%Y-%m-%d")}</appointment_date>\n'
-            xml_content += f'      <net_amount>{item["net_amount"]:.2f}</net_amount>\n'
-            xml_content += f'      <copayment_amount>{item["copayment_amount"]:.2f}</copayment_amount>\n'
-            xml_content += '    </appointment>\n'
-        
-        xml_content += '  </appointments>\n'
-        xml_content += '</gkv_export>'
-        
-        return xml_content, filename
-    
+
+        return ''.join(self.iter_xml(export_data, total_appointments=len(export_data))), filename
+
+    def stream_export(self, export_format='csv', billing_cycle=None, start_date=None, end_date=None):
+        """
+        Liefert (Chunk-Generator, Dateiname, Content-Type) für einen Streaming-Export,
+        z.B. zur Verwendung mit StreamingHttpResponse.
+        """
+        if export_format not in self.CONTENT_TYPES:
+            raise ValueError(f"Unbekanntes Export-Format: {export_format}")
+
+        filename = f"gkv_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        export_items = self.iter_gkv_export_items(billing_cycle, start_date, end_date)
+        if export_format == 'csv':
+            chunks = self.iter_csv(export_items)
+        else:
+            chunks = self.iter_xml(export_items)
+        return chunks, filename, self.CONTENT_TYPES[export_format]
+
+    def write_export_file(self, file_path, export_format='csv', billing_cycle=None, start_date=None, end_date=None):
+        """
+        Schreibt einen Export direkt in eine Datei, ohne die Daten im Speicher zu halten.
+
+        Returns:
+            Dict mit 'total_items', 'total_amount' (Netto) und 'total_copayment'
+        """
+        stats = {'total_items': 0, 'total_amount': Decimal('0.00'), 'total_copayment': Decimal('0.00')}
+
+        def counted(items):
+            for item in items:
+                stats['total_items'] += 1
+                stats['total_amount'] += item['net_amount']
+                stats['total_copayment'] += item['copayment_amount']
+                yield item
+
+        export_items = counted(self.iter_gkv_export_items(billing_cycle, start_date, end_date))
+        if export_format == 'csv':
+            chunks = self.iter_csv(export_items)
+        else:
+            chunks = self.iter_xml(export_items)
+
+        with open(file_path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        return stats
+
     def validate_gkv_compliance(self, export_data):
         """Validiert GKV-Compliance der Export-Daten"""
         errors = []
         warnings = []
+        total_items = 0
         
         for item in export_data:
+            total_items += 1
+
             # Prüfe LEGS-Code
             if not item['legs_code']:
                 errors.append(f"Termin {item['appointment_id']}: Kein LEGS-Code")
@@ -223,5 +352,5 @@ class GKVExportService:
             'valid': len(errors) == 0,
             'errors': errors,
             'warnings': warnings,
-            'total_items': len(export_data)
+            'total_items': total_items
         } 
\ No newline at end of file
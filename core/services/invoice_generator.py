@@ -2,12 +2,9 @@ from datetime import datetime, date, timedelta
 from typing import List, Optional
 from decimal import Decimal
 
-from django.template.loader import render_to_string
 from django.conf import settings
-import pdfkit  # Für PDF-Generierung aus HTML
 
 from core.models import (
-    Practice,
     Patient,
     BillingItem,
     Prescription,
@@ -22,41 +19,16 @@ class InvoiceGenerator:
         billing_items: List[BillingItem],
         invoice_number: str
     ) -> bytes:
-        """Generiert eine PDF-Rechnung für Patientenzuzahlungen"""
-        practice = Practice.objects.first()
+        """Generiert eine PDF-Rechnung für Patientenzuzahlungen (über den PDF-Cache, siehe InvoicePdfService)"""
+        from core.services.invoice_pdf_service import InvoicePdfService
+
         invoice_date = date.today()
         due_date = invoice_date + timedelta(days=30)  # 30 Tage Zahlungsziel
         
-        # Berechnung der Gesamtsumme
-        total_amount = sum(item.patient_copay for item in billing_items)
-        
-        # Kontext für das Template
-        context = {
-            'practice': practice,
-            'patient': patient,
-            'billing_items': billing_items,
-            'invoice_number': invoice_number,
-            'invoice_date': invoice_date,
-            'total_amount': total_amount,
-            'due_date': due_date,
-        }
-        
-        # HTML generieren
-        html_content = render_to_string('invoice/patient_invoice.html', context)
-        
-        # PDF-Optionen
-        options = {
-            'page-size': 'A4',
-            'margin-top': '20mm',
-            'margin-right': '20mm',
-            'margin-bottom': '20mm',
-            'margin-left': '20mm',
-            'encoding': 'UTF-8',
-        }
-        
-        # PDF generieren
-        pdf = pdfkit.from_string(html_content, False, options=options)
-        return pdf
+        document = InvoicePdfService.build_item_document(
+            patient, billing_items, invoice_number, invoice_date, due_date
+        )
+        return InvoicePdfService.render_document(document)
 
     @staticmethod
     def generate_invoice_number(patient: Patient) -> str:
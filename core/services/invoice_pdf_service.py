@@ -0,0 +1,478 @@
+"""
+Rechnungs-PDFs mit inhaltsadressiertem Festplatten-Cache und parallelem Stapel-Rendering.
+
+Zu jeder Rechnung (Patienten-, Zuzahlungs- und Privatrechnung) wird ein JSON-kompatibles
+Dokument mit allen gedruckten Angaben aufgebaut (Praxis, Patient, Positionen, Beträge,
+Status). Der SHA-256 dieses Dokuments zusammen mit RENDERER_VERSION ist der
+Cache-Schlüssel: Solange sich an der Rechnung nichts ändert, wird das PDF nicht neu
+erzeugt; jede Änderung (auch an Praxis- oder Patientendaten) führt zu einem neuen
+Schlüssel. Für einen Stapel werden die Positionen aller Rechnungen mit wenigen
+Abfragen geladen.
+
+Fehlende PDFs werden mit reportlab im Prozess erzeugt (core/invoice_pdf_renderer.py),
+ab PARALLEL_THRESHOLD fehlenden PDFs in einem ProcessPoolExecutor. Für einen
+Abrechnungslauf liefert stream_zip ein ZIP-Archiv als Generator (für
+StreamingHttpResponse), merge_pdfs eine zusammengeführte PDF-Datei. Alle Grenzwerte
+sind über settings.INVOICE_PDF konfigurierbar.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from core.invoice_pdf_renderer import (
+    RENDERER_VERSION, render_invoice_to_file, render_invoices_to_files
+)
+from core.models import BillingItem, PatientCopayInvoice, PatientInvoice, Practice, PrivatePatientInvoice
+from core.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'CACHE_DIR': None,  # Standard: <tmp>/medical_invoice_pdf_cache
+    'CACHE_MAX_BYTES': 500 * 1024 * 1024,
+    'MAX_WORKERS': 4,
+    'PARALLEL_THRESHOLD': 20,
+    'CHUNK_SIZE': 10,
+}
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'medical_invoice_pdf_cache')
+DEFAULT_DUE_DAYS = 30
+METRICS_PREFIX = 'invoice_pdf:'
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Präfixe wie in invoice_overview / invoice_detail
+INVOICE_TYPES = {
+    'patient': PatientInvoice,
+    'copay': PatientCopayInvoice,
+    'private': PrivatePatientInvoice,
+}
+
+
+class _ZipStream:
+    """Schreibziel für zipfile, dessen Inhalt nach jedem Eintrag abgeholt wird"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class InvoicePdfService:
+    """Aufbau, Zwischenspeicherung und Bündelung von Rechnungs-PDFs"""
+
+    _lock = threading.Lock()
+    _executor = None
+
+    @staticmethod
+    def get_settings():
+        return {**DEFAULT_SETTINGS, **getattr(settings, 'INVOICE_PDF', {})}
+
+    @classmethod
+    def cache_dir(cls) -> str:
+        directory = cls.get_settings()['CACHE_DIR'] or DEFAULT_CACHE_DIR
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    # ------------------------------------------------------------------
+    # Auswahl
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def parse_invoice_id(invoice_id: str):
+        """'copay_12' -> PatientCopayInvoice 12; None bei unbekanntem Präfix oder fehlender Rechnung"""
+        prefix, _, pk = invoice_id.partition('_')
+        model = INVOICE_TYPES.get(prefix)
+        if model is None or not pk.isdigit():
+            return None
+        return model.objects.select_related('patient').filter(pk=pk).first()
+
+    @staticmethod
+    def invoices_for_run(billing_cycle_id: Optional[int] = None, start_date=None, end_date=None,
+                         types: Optional[List[str]] = None) -> List:
+        """
+        Rechnungen eines Abrechnungslaufs: alle Zuzahlungs- und Privatrechnungen eines
+        Abrechnungszyklus oder alle Rechnungen mit Rechnungsdatum im Zeitraum
+        (z.B. der monatliche Zuzahlungslauf), sortiert nach Rechnungsnummer.
+        """
+        types = types or list(INVOICE_TYPES)
+        invoices = []
+        for name in types:
+            queryset = INVOICE_TYPES[name].objects.select_related('patient')
+            if billing_cycle_id is not None:
+                if name == 'patient':
+                    continue
+                field = 'gkv_claim__billing_cycle_id' if name == 'copay' else 'billing_cycle_id'
+                queryset = queryset.filter(**{field: billing_cycle_id})
+            if start_date:
+                queryset = queryset.filter(invoice_date__gte=start_date)
+            if end_date:
+                queryset = queryset.filter(invoice_date__lte=end_date)
+            invoices.extend(queryset)
+        invoices.sort(key=lambda invoice: invoice.invoice_number)
+        return invoices
+
+    # ------------------------------------------------------------------
+    # Dokumente
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _practice_document() -> Dict:
+        practice = Practice.objects.order_by('id').first()
+        if practice is None:
+            return {}
+        return {
+            'name': practice.name,
+            'street_address': practice.street_address,
+            'postal_code': practice.postal_code,
+            'city': practice.city,
+            'phone': practice.phone,
+            'email': practice.email,
+            'tax_id': practice.tax_id,
+            'bank_details': practice.bank_details or {},
+        }
+
+    @staticmethod
+    def _patient_document(patient) -> Dict:
+        return {
+            'name': f'{patient.first_name} {patient.last_name}',
+            'street_address': patient.street_address,
+            'postal_code': patient.postal_code,
+            'city': patient.city,
+        }
+
+    @staticmethod
+    def _item_lines(items, amount) -> List[Dict]:
+        return [
+            {
+                'date': timezone.localtime(item.appointment.appointment_date).date().isoformat(),
+                'description': item.treatment.treatment_name,
+                'amount': str(amount(item)),
+            }
+            for item in sorted(items, key=lambda item: (item.appointment.appointment_date, item.id))
+        ]
+
+    @staticmethod
+    def _load_items(invoices) -> Dict[Tuple[str, int], List[BillingItem]]:
+        """Positionen aller Zuzahlungs- und Privatrechnungen mit einer Abfrage je Rechnungsart"""
+        cycles = defaultdict(set)
+        patients = defaultdict(set)
+        owners = defaultdict(list)
+        for invoice in invoices:
+            if isinstance(invoice, PatientCopayInvoice):
+                cycle_id = invoice.gkv_claim.billing_cycle_id if invoice.gkv_claim_id else None
+                kind = 'copay'
+            elif isinstance(invoice, PrivatePatientInvoice):
+                cycle_id = invoice.billing_cycle_id
+                kind = 'private'
+            else:
+                continue
+            if cycle_id is None:
+                continue
+            cycles[kind].add(cycle_id)
+            patients[kind].add(invoice.patient_id)
+            owners[(kind, cycle_id, invoice.patient_id)].append(invoice)
+
+        items = {}
+        extra = {'copay': {'patient_copay__gt': 0}, 'private': {'is_private_billing': True}}
+        for kind in cycles:
+            # Obermenge über beide IN-Listen; zugeordnet wird über (Zyklus, Patient)
+            queryset = BillingItem.objects.filter(
+                billing_cycle_id__in=cycles[kind], appointment__patient_id__in=patients[kind], **extra[kind]
+            ).select_related('appointment', 'treatment')
+            for item in queryset:
+                key = (kind, item.billing_cycle_id, item.appointment.patient_id)
+                for invoice in owners.get(key, []):
+                    items.setdefault((kind, invoice.pk), []).append(item)
+        return items
+
+    @classmethod
+    def build_documents(cls, invoices) -> List[Dict]:
+        """Druckdaten je Rechnung (Reihenfolge wie invoices)"""
+        practice = cls._practice_document()
+        if any(isinstance(invoice, PatientCopayInvoice) and invoice.gkv_claim_id for invoice in invoices):
+            # gkv_claim für den Abrechnungszyklus gesammelt nachladen
+            prefetch_related_objects(
+                [invoice for invoice in invoices if isinstance(invoice, PatientCopayInvoice)], 'gkv_claim'
+            )
+        items = cls._load_items(invoices)
+
+        documents = []
+        for invoice in invoices:
+            if isinstance(invoice, PatientCopayInvoice):
+                title = 'Rechnung über gesetzliche Zuzahlungen'
+                total = invoice.total_copay
+                lines = cls._item_lines(items.get(('copay', invoice.pk), []), lambda item: item.patient_copay)
+                due_date = invoice.due_date
+            elif isinstance(invoice, PrivatePatientInvoice):
+                title = 'Rechnung'
+                total = invoice.total_amount
+                lines = cls._item_lines(items.get(('private', invoice.pk), []), lambda item: item.get_total_amount())
+                due_date = invoice.due_date
+            else:
+                # Patientenrechnungen sind nicht mit einzelnen Positionen verknüpft
+                title = 'Rechnung'
+                total = invoice.amount
+                lines = [{
+                    'date': invoice.invoice_date.isoformat(),
+                    'description': 'Zuzahlungen und Eigenanteile laut Abrechnung',
+                    'amount': str(total),
+                }]
+                due_date = invoice.invoice_date + timedelta(days=DEFAULT_DUE_DAYS)
+
+            paid = total if invoice.status == 'paid' else Decimal('0.00')
+            documents.append({
+                'title': title,
+                'invoice_number': invoice.invoice_number,
+                'invoice_date': invoice.invoice_date.isoformat(),
+                'due_date': due_date.isoformat() if due_date and invoice.status != 'paid' else None,
+                'status': invoice.status,
+                'practice': practice,
+                'patient': cls._patient_document(invoice.patient),
+                'lines': lines,
+                'total': str(total),
+                'paid': str(paid),
+                'open': str(total - paid),
+            })
+        return documents
+
+    @classmethod
+    def build_item_document(cls, patient, billing_items, invoice_number: str, invoice_date, due_date) -> Dict:
+        """Druckdaten für eine noch nicht gespeicherte Zuzahlungsrechnung (InvoiceGenerator)"""
+        billing_items = list(billing_items)
+        total = sum((item.patient_copay for item in billing_items), Decimal('0.00'))
+        return {
+            'title': 'Rechnung über gesetzliche Zuzahlungen',
+            'invoice_number': invoice_number,
+            'invoice_date': invoice_date.isoformat(),
+            'due_date': due_date.isoformat(),
+            'status': 'created',
+            'practice': cls._practice_document(),
+            'patient': cls._patient_document(patient),
+            'lines': cls._item_lines(billing_items, lambda item: item.patient_copay),
+            'total': str(total),
+            'paid': '0.00',
+            'open': str(total),
+        }
+
+    @staticmethod
+    def document_key(document: Dict) -> str:
+        """SHA-256 über Dokument und Renderer-Version"""
+        payload = json.dumps(document, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(f'{RENDERER_VERSION}:{payload}'.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _get_executor(cls, config):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=min(config['MAX_WORKERS'], os.cpu_count() or 1),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls, wait=True):
+        """Beendet den Render-Pool (z.B. am Ende eines Management-Commands)"""
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    @classmethod
+    def _render_missing(cls, jobs: List[Tuple[Dict, str]], config) -> None:
+        # Mehr Prozesse als Kerne bringen nichts; bei einem Kern wird im Prozess gerendert
+        workers = min(config['MAX_WORKERS'], os.cpu_count() or 1)
+        if len(jobs) < config['PARALLEL_THRESHOLD'] or workers <= 1:
+            for document, path in jobs:
+                render_invoice_to_file(document, path)
+            return
+
+        chunk_size = max(1, config['CHUNK_SIZE'])
+        chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+        try:
+            for _ in cls._get_executor(config).map(render_invoices_to_files, chunks):
+                pass
+        except BrokenProcessPool as e:
+            logger.error(f"Render-Pool für Rechnungs-PDFs abgebrochen, rendere im Prozess: {str(e)}")
+            with cls._lock:
+                cls._executor = None
+            for document, path in jobs:
+                if not os.path.exists(path):
+                    render_invoice_to_file(document, path)
+
+    @classmethod
+    def render(cls, invoices) -> List[Tuple[object, str]]:
+        """
+        Liefert zu jeder Rechnung den Pfad des PDFs im Cache und erzeugt fehlende PDFs
+        (ab PARALLEL_THRESHOLD im Prozesspool).
+
+        Returns:
+            [(Rechnung, Pfad), ...] in der Reihenfolge von invoices
+        """
+        config = cls.get_settings()
+        directory = cls.cache_dir()
+        invoices = list(invoices)
+        start = perf_counter()
+
+        documents = cls.build_documents(invoices)
+        paths = [os.path.join(directory, f'{cls.document_key(document)}.pdf') for document in documents]
+
+        missing = {}
+        for document, path in zip(documents, paths):
+            if path in missing:
+                continue
+            try:
+                os.utime(path)  # Zugriff für die LRU-Verdrängung vermerken
+            except FileNotFoundError:
+                missing[path] = document
+
+        if missing:
+            cls._render_missing([(document, path) for path, document in missing.items()], config)
+            cls.evict(exclude=set(paths))
+
+        metrics.increment(f'{METRICS_PREFIX}cache_hits', len(paths) - len(missing))
+        metrics.increment(f'{METRICS_PREFIX}rendered', len(missing))
+        metrics.observe(f'{METRICS_PREFIX}batch', (perf_counter() - start) * 1000)
+        if missing:
+            logger.info(
+                f"Rechnungs-PDFs: {len(missing)} erzeugt, {len(paths) - len(missing)} aus dem Cache "
+                f"({(perf_counter() - start):.2f}s)"
+            )
+        return list(zip(invoices, paths))
+
+    @classmethod
+    def render_one(cls, invoice) -> str:
+        return cls.render([invoice])[0][1]
+
+    @classmethod
+    def render_document(cls, document: Dict) -> bytes:
+        """PDF zu einem bereits aufgebauten Dokument (über den Cache)"""
+        path = os.path.join(cls.cache_dir(), f'{cls.document_key(document)}.pdf')
+        if not os.path.exists(path):
+            render_invoice_to_file(document, path)
+            cls.evict(exclude={path})
+        with open(path, 'rb') as f:
+            return f.read()
+
+    # ------------------------------------------------------------------
+    # Download
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def filename(invoice) -> str:
+        number = re.sub(r'[^A-Za-z0-9._-]+', '_', invoice.invoice_number)
+        return f'Rechnung_{number}.pdf'
+
+    @classmethod
+    def stream_zip(cls, entries: List[Tuple[object, str]]) -> Iterator[bytes]:
+        """
+        ZIP-Archiv als Folge von Blöcken; es liegt nie vollständig im Speicher.
+        PDFs sind bereits komprimiert und werden daher nur gespeichert (ZIP_STORED).
+        """
+        stream = _ZipStream()
+        used = set()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for invoice, path in entries:
+                name = cls.filename(invoice)
+                if name in used:
+                    name = f'{name[:-4]}_{invoice.pk}.pdf'
+                used.add(name)
+                with open(path, 'rb') as source, archive.open(name, 'w', force_zip64=True) as target:
+                    for block in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+                        target.write(block)
+                        data = stream.drain()
+                        if data:
+                            yield data
+        # Restlicher Eintrag und zentrales Verzeichnis (beim Schließen geschrieben)
+        yield stream.drain()
+
+    @staticmethod
+    def merge_pdfs(entries: List[Tuple[object, str]]):
+        """Fügt die PDFs zu einer Datei zusammen; Rückgabe ist eine temporäre Datei (Position 0)"""
+        import fitz  # PyMuPDF
+
+        merged = fitz.open()
+        try:
+            for _, path in entries:
+                with fitz.open(path) as source:
+                    merged.insert_pdf(source)
+            handle = tempfile.TemporaryFile(suffix='.pdf')
+            handle.write(merged.tobytes(garbage=3, deflate=True))
+        finally:
+            merged.close()
+        handle.seek(0)
+        return handle
+
+    # ------------------------------------------------------------------
+    # Verdrängung
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def evict(cls, exclude: Optional[set] = None) -> int:
+        """Entfernt die am längsten nicht genutzten PDFs, bis CACHE_MAX_BYTES eingehalten wird"""
+        max_bytes = cls.get_settings()['CACHE_MAX_BYTES']
+        exclude = exclude or set()
+        entries = []
+        total = 0
+        try:
+            with os.scandir(cls.cache_dir()) as scan:
+                for entry in scan:
+                    if not entry.is_file() or not entry.name.endswith('.pdf'):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError as e:
+            logger.warning(f"Cache-Verzeichnis für Rechnungs-PDFs nicht lesbar: {str(e)}")
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path in exclude:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
@@ -0,0 +1,294 @@
+"""
+Prozesslokale Metriken (Zähler und Latenz-Histogramme) ohne Sperren im Messpfad.
+
+Jeder Thread schreibt in einen eigenen Shard (threading.local): Eine Messung ist ein
+Dictionary-Zugriff und ein paar Integer-Additionen, ohne Lock und ohne Cache-Round-Trip.
+Gelesen wird, indem die Shards aller Threads zusammengeführt werden; Shards beendeter
+Threads werden dabei in einen gemeinsamen Shard eingefaltet.
+
+Histogramme haben feste Buckets (Millisekunden); Perzentile werden beim Auslesen aus den
+Bucket-Zählern interpoliert. Damit lassen sich Histogramme mehrerer Prozesse durch
+einfaches Addieren zusammenführen: Ein Hintergrund-Thread schreibt den Stand des Prozesses
+alle PERFORMANCE_MONITORING['METRICS_FLUSH_SECONDS'] Sekunden in den gemeinsamen Cache,
+collect() liest die Stände aller Prozesse und fasst sie zusammen.
+"""
+
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Obere Bucket-Grenzen in Millisekunden (letzter Bucket: alles darüber)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+PROCESS_INDEX_KEY = 'metrics:processes'
+PROCESS_KEY_PREFIX = 'metrics:process'
+DEFAULT_FLUSH_SECONDS = 30
+
+
+class LatencyHistogram:
+    """Histogramm mit festen Buckets"""
+
+    __slots__ = ('counts', 'total', 'max')
+
+    def __init__(self, counts=None, total: float = 0.0, maximum: float = 0.0):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = total
+        self.max = maximum
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> 'LatencyHistogram':
+        return LatencyHistogram(self.counts, self.total, self.max)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """Linear innerhalb des Buckets interpoliert, höchstens das gemessene Maximum"""
+        count = self.count
+        if not count:
+            return None
+        rank = quantile * count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index >= len(LATENCY_BUCKETS_MS):
+                    return round(self.max, 2)
+                lower = LATENCY_BUCKETS_MS[index - 1] if index else 0
+                upper = LATENCY_BUCKETS_MS[index]
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return round(min(value, self.max), 2)
+            seen += bucket_count
+        return round(self.max, 2)
+
+    def to_raw(self) -> Dict:
+        """JSON-kompatible Rohdaten (für den Cache)"""
+        return {'counts': self.counts, 'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_raw(cls, data: Dict) -> 'LatencyHistogram':
+        return cls(data['counts'], data['total'], data['max'])
+
+    def summary(self) -> Dict:
+        count = self.count
+        return {
+            'count': count,
+            'avg_ms': round(self.total / count, 2) if count else None,
+            'max_ms': round(self.max, 2),
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+        }
+
+
+class _Shard:
+    """Messwerte eines Threads – wird nur von diesem Thread beschrieben"""
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+
+def _merge_raw(target: Dict, raw: Dict) -> None:
+    for name, value in raw.get('counters', {}).items():
+        target['counters'][name] = target['counters'].get(name, 0) + value
+    for name, data in raw.get('histograms', {}).items():
+        histogram = LatencyHistogram.from_raw(data)
+        existing = target['histograms'].get(name)
+        if existing is None:
+            target['histograms'][name] = histogram
+        else:
+            existing.merge(histogram)
+
+
+class MetricsRegistry:
+    """Zähler und Histogramme eines Prozesses"""
+
+    def __init__(self):
+        self._shards_lock = threading.Lock()
+        self._init_state()
+
+    def _init_state(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._flusher = None
+        self._stop = threading.Event()
+        self.process_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    # ------------------------------------------------------------------
+    # Messen (ohne Lock)
+    # ------------------------------------------------------------------
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._ensure_flusher()
+            return shard
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        counters = self._shard().counters
+        counters[name] = counters.get(name, 0) + amount
+
+    def observe(self, name: str, value_ms: float) -> None:
+        histograms = self._shard().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = LatencyHistogram()
+        histogram.observe(value_ms)
+
+    # ------------------------------------------------------------------
+    # Lesen
+    # ------------------------------------------------------------------
+
+    def _collect_local(self) -> Dict:
+        """Führt alle Shards zusammen; Shards beendeter Threads werden eingefaltet"""
+        merged = {'counters': {}, 'histograms': {}}
+        with self._shards_lock:
+            # _retired wird nur unter diesem Lock beschrieben
+            retired = {'counters': self._retired.counters, 'histograms': self._retired.histograms}
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    _merge_raw(retired, self._shard_raw(shard))
+            self._shards = alive
+            _merge_raw(merged, self._shard_raw(self._retired))
+
+        for shard in alive:
+            _merge_raw(merged, self._shard_raw(shard))
+        return merged
+
+    @staticmethod
+    def _shard_raw(shard: _Shard) -> Dict:
+        # list(dict.items()) ist unter dem GIL atomar; der Besitzer-Thread darf weiter schreiben
+        return {
+            'counters': dict(list(shard.counters.items())),
+            'histograms': {name: histogram.copy().to_raw() for name, histogram in list(shard.histograms.items())},
+        }
+
+    @staticmethod
+    def _summarize(merged: Dict, prefix: str = '') -> Dict:
+        return {
+            'counters': {
+                name: value for name, value in sorted(merged['counters'].items()) if name.startswith(prefix)
+            },
+            'histograms': {
+                name: histogram.summary()
+                for name, histogram in sorted(merged['histograms'].items()) if name.startswith(prefix)
+            },
+        }
+
+    def snapshot(self, prefix: str = '') -> Dict:
+        """Zusammenfassung dieses Prozesses: {'counters': {...}, 'histograms': {Name: p50/p95/p99...}}"""
+        return self._summarize(self._collect_local(), prefix)
+
+    def collect(self, prefix: str = '') -> Dict:
+        """Zusammenfassung über alle Prozesse, die in den Cache geschrieben haben (inkl. diesem)"""
+        index = cache.get(PROCESS_INDEX_KEY) or {}
+        keys = [self._process_key(process_id) for process_id in index if process_id != self.process_id]
+        merged = self._collect_local()
+        for raw in cache.get_many(keys).values():
+            _merge_raw(merged, raw)
+        summary = self._summarize(merged, prefix)
+        summary['processes'] = len(keys) + 1
+        return summary
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.counters = {}
+                shard.histograms = {}
+            self._retired = _Shard(None)
+
+    # ------------------------------------------------------------------
+    # Übertragung in den gemeinsamen Cache
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def flush_interval() -> int:
+        config = getattr(settings, 'PERFORMANCE_MONITORING', {})
+        return int(config.get('METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS))
+
+    @staticmethod
+    def _process_key(process_id: str) -> str:
+        return f'{PROCESS_KEY_PREFIX}:{process_id}'
+
+    def flush(self) -> None:
+        """Schreibt den Stand dieses Prozesses in den Cache und meldet ihn im Prozess-Index an"""
+        interval = self.flush_interval() or DEFAULT_FLUSH_SECONDS
+        ttl = interval * 3
+        merged = self._collect_local()
+        raw = {
+            'counters': merged['counters'],
+            'histograms': {name: histogram.to_raw() for name, histogram in merged['histograms'].items()},
+        }
+        cache.set(self._process_key(self.process_id), raw, ttl)
+
+        # Der Index wird pro Prozess nur einmal je Intervall geschrieben; geht eine Anmeldung
+        # durch gleichzeitiges Schreiben verloren, holt der nächste Flush sie nach.
+        now = time.time()
+        index = cache.get(PROCESS_INDEX_KEY) or {}
+        index = {process_id: seen for process_id, seen in index.items() if now - seen < ttl}
+        index[self.process_id] = now
+        cache.set(PROCESS_INDEX_KEY, index, ttl)
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None or self.flush_interval() <= 0:
+            return
+        with self._shards_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        interval = self.flush_interval()
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Metriken konnten nicht in den Cache geschrieben werden: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _after_fork(self) -> None:
+        # Im Kindprozess (z.B. gunicorn --preload) existiert der Flush-Thread nicht mehr
+        self._shards_lock = threading.Lock()
+        self._init_state()
+
+
+# Globale Instanz
+metrics = MetricsRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._after_fork)
@@ -1,66 +1,110 @@
 import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 from core.models import Appointment, Prescription, Patient, User, UserActivityLog
+from core.services.email_outbox_service import EmailOutboxService
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    """Service für automatische Benachrichtigungen und Erinnerungen"""
-    
+    """
+    Service für automatische Benachrichtigungen und Erinnerungen.
+
+    Die Prüfungen versenden keine E-Mails selbst, sondern stellen sie gesammelt in das
+    Ausgangspostfach (EmailOutboxService); zugestellt wird gebündelt durch deliver_emails
+    bzw. am Ende von send_notifications. Über den dedup_key wird jede Benachrichtigung
+    nur einmal angelegt, auch wenn die Prüfung mehrfach läuft.
+    """
+
     @staticmethod
-    def send_appointment_reminders():
-        """Sendet automatische Termin-Erinnerungen"""
+    def _enqueue(notifications, module, object_type, dry_run=False):
+        """
+        Stellt die Benachrichtigungen in das Ausgangspostfach und protokolliert die neu
+        angelegten gesammelt.
+
+        Args:
+            notifications: Liste von (OutboundEmail, Objekt, Benutzer-ID oder None, Beschreibung)
+        Returns:
+            Anzahl der neu angelegten Benachrichtigungen
+        """
+        if dry_run:
+            keys = [message.dedup_key for message, _, _, _ in notifications if message.recipient]
+            existing = EmailOutboxService.existing_keys(keys)
+            return sum(1 for key in keys if key not in existing)
+
+        with transaction.atomic():
+            created = {
+                message.dedup_key
+                for message in EmailOutboxService.enqueue(message for message, _, _, _ in notifications)
+            }
+            UserActivityLog.objects.bulk_create([
+                UserActivityLog(
+                    user_id=user_id,
+                    action='notification_sent',
+                    module=module,
+                    object_type=object_type,
+                    object_id=str(obj.id),
+                    description=description
+                )
+                for message, obj, user_id, description in notifications
+                if user_id and message.dedup_key in created
+            ])
+        return len(created)
+
+    @staticmethod
+    def send_appointment_reminders(dry_run=False):
+        """Stellt Termin-Erinnerungen für die nächsten 24 Stunden in das Ausgangspostfach"""
         try:
             # Termine in den nächsten 24 Stunden
-            tomorrow = timezone.now() + timedelta(days=1)
+            now = timezone.now()
             upcoming_appointments = Appointment.objects.filter(
-                appointment_date__gte=timezone.now(),
-                appointment_date__lte=tomorrow,
-                status='planned'
+                appointment_date__gte=now,
+                appointment_date__lte=now + timedelta(days=1),
+                status='planned',
+                patient__receive_notifications=True
             ).select_related('patient', 'practitioner', 'treatment')
-            
-            for appointment in upcoming_appointments:
-                NotificationService._send_appointment_reminder(appointment)
-                
-            logger.info(f"Termin-Erinnerungen gesendet: {upcoming_appointments.count()}")
-            
+
+            notifications = [
+                NotificationService._appointment_reminder(appointment, now)
+                for appointment in upcoming_appointments
+            ]
+            count = NotificationService._enqueue(notifications, 'appointments', 'Appointment', dry_run)
+            logger.info(f"Termin-Erinnerungen eingestellt: {count}")
+            return count
+
         except Exception as e:
             logger.error(f"Fehler beim Senden von Termin-Erinnerungen: {e}")
-    
+            return 0
+
     @staticmethod
-    def _send_appointment_reminder(appointment):
-        """Sendet eine einzelne Termin-Erinnerung"""
-        try:
-            # Prüfe ob Patient Benachrichtigungen erhalten möchte
-            if not appointment.patient.receive_notifications:
-                return
-                
-            # Berechne Zeit bis zum Termin
-            time_until = appointment.appointment_date - timezone.now()
-            hours_until = time_until.total_seconds() / 3600
-            
-            # Bestimme Priorität basierend auf Zeit
-            if hours_until <= 2:
-                priority = "HOCH"
-                subject = f"⚠️ Dringende Termin-Erinnerung: {appointment.treatment.treatment_name}"
-            elif hours_until <= 6:
-                priority = "MITTEL"
-                subject = f"📅 Termin-Erinnerung: {appointment.treatment.treatment_name}"
-            else:
-                priority = "NIEDRIG"
-                subject = f"📋 Termin-Erinnerung: {appointment.treatment.treatment_name}"
-            
-            # E-Mail-Inhalt
-            message = f"""
+    def _appointment_reminder(appointment, now):
+        """Termin-Erinnerung; ein verschobener Termin erhält eine neue Erinnerung"""
+        # Berechne Zeit bis zum Termin
+        time_until = appointment.appointment_date - now
+        hours_until = time_until.total_seconds() / 3600
+
+        # Bestimme Priorität basierend auf Zeit
+        if hours_until <= 2:
+            priority = "HOCH"
+            subject = f"⚠️ Dringende Termin-Erinnerung: {appointment.treatment.treatment_name}"
+        elif hours_until <= 6:
+            priority = "MITTEL"
+            subject = f"📅 Termin-Erinnerung: {appointment.treatment.treatment_name}"
+        else:
+            priority = "NIEDRIG"
+            subject = f"📋 Termin-Erinnerung: {appointment.treatment.treatment_name}"
+
+        local_date = timezone.localtime(appointment.appointment_date)
+
+        # E-Mail-Inhalt
+        message = f"""
 Hallo {appointment.patient.first_name} {appointment.patient.last_name},
 
 dies ist eine Erinnerung für Ihren Termin:
 
-📅 Datum: {appointment.appointment_date.strftime('%d.%m.%Y')}
-🕐 Uhrzeit: {appointment.appointment_date.strftime('%H:%M')}
+📅 Datum: {local_date.strftime('%d.%m.%Y')}
+🕐 Uhrzeit: {local_date.strftime('%H:%M')}
 👨‍⚕️ Behandler: {appointment.practitioner.get_full_name()}
 🏥 Behandlung: {appointment.treatment.treatment_name}
 ⏱️ Dauer: {appointment.duration_minutes} Minuten
@@ -72,60 +116,54 @@ Bei Fragen kontaktieren Sie uns gerne.
 Mit freundlichen Grüßen
 Ihr Praxisteam
             """
-            
-            # Sende E-Mail (falls konfiguriert)
-            if hasattr(settings, 'EMAIL_HOST') and settings.EMAIL_HOST:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[appointment.patient.email],
-                    fail_silently=True
-                )
-            
-            # Logge die Benachrichtigung
-            UserActivityLog.objects.create(
-                user=appointment.practitioner,
-                action='notification_sent',
-                module='appointments',
-                object_type='Appointment',
-                object_id=str(appointment.id),
-                description=f"Termin-Erinnerung gesendet (Priorität: {priority})"
-            )
-            
-        except Exception as e:
-            logger.error(f"Fehler beim Senden der Termin-Erinnerung für Termin {appointment.id}: {e}")
-    
+
+        email = EmailOutboxService.build(
+            recipient=appointment.patient.email,
+            subject=subject,
+            body=message,
+            dedup_key=f"appointment_reminder:{appointment.id}:{appointment.appointment_date:%Y%m%d%H%M}",
+            category='appointment_reminder',
+        )
+        return (
+            email, appointment, appointment.practitioner.user_id,
+            f"Termin-Erinnerung gesendet (Priorität: {priority})"
+        )
+
     @staticmethod
-    def check_prescription_expiry():
-        """Prüft ablaufende Verordnungen und sendet Benachrichtigungen"""
+    def check_prescription_expiry(dry_run=False):
+        """Prüft ablaufende Verordnungen und stellt Benachrichtigungen in das Ausgangspostfach"""
         try:
-            # Verordnungen die in den nächsten 30 Tagen ablaufen
-            thirty_days_from_now = timezone.now().date() + timedelta(days=30)
+            # Verordnungen die in den nächsten 30 Tagen ablaufen; bereits abgelaufene nicht mehr
+            today = timezone.now().date()
+            thirty_days_from_now = today + timedelta(days=30)
             expiring_prescriptions = Prescription.objects.filter(
                 prescription_date__lte=thirty_days_from_now - timedelta(days=335),  # 1 Jahr - 30 Tage
+                prescription_date__gt=today - timedelta(days=365),
                 status='In_Progress'
-            ).select_related('patient', 'doctor')
-            
-            for prescription in expiring_prescriptions:
-                NotificationService._send_prescription_expiry_notification(prescription)
-                
-            logger.info(f"Verordnungsablauf-Benachrichtigungen gesendet: {expiring_prescriptions.count()}")
-            
+            ).select_related('patient', 'doctor', 'treatment_1', 'treatment_2', 'treatment_3')
+
+            notifications = [
+                NotificationService._prescription_expiry_notification(prescription, today)
+                for prescription in expiring_prescriptions
+            ]
+            count = NotificationService._enqueue(notifications, 'prescriptions', 'Prescription', dry_run)
+            logger.info(f"Verordnungsablauf-Benachrichtigungen eingestellt: {count}")
+            return count
+
         except Exception as e:
             logger.error(f"Fehler beim Prüfen ablaufender Verordnungen: {e}")
-    
+            return 0
+
     @staticmethod
-    def _send_prescription_expiry_notification(prescription):
-        """Sendet Benachrichtigung für ablaufende Verordnung"""
-        try:
-            # Berechne verbleibende Tage
-            expiry_date = prescription.prescription_date + timedelta(days=365)
-            days_remaining = (expiry_date - timezone.now().date()).days
-            
-            subject = f"⚠️ Verordnung läuft ab: {prescription.get_primary_treatment_name()}"
-            
-            message = f"""
+    def _prescription_expiry_notification(prescription, today):
+        """Benachrichtigung für ablaufende Verordnung (einmal je Verordnung)"""
+        # Berechne verbleibende Tage
+        expiry_date = prescription.prescription_date + timedelta(days=365)
+        days_remaining = (expiry_date - today).days
+
+        subject = f"⚠️ Verordnung läuft ab: {prescription.get_primary_treatment_name()}"
+
+        message = f"""
 Hallo {prescription.patient.first_name} {prescription.patient.last_name},
 
 Ihre Verordnung für {prescription.get_primary_treatment_name()} läuft in {days_remaining} Tagen ab.
@@ -141,58 +179,53 @@ Bitte kontaktieren Sie Ihren Arzt für eine Verlängerung der Verordnung.
 Mit freundlichen Grüßen
 Ihr Praxisteam
             """
-            
-            # Sende E-Mail
-            if hasattr(settings, 'EMAIL_HOST') and settings.EMAIL_HOST:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[prescription.patient.email],
-                    fail_silently=True
-                )
-            
-            # Logge die Benachrichtigung
-            UserActivityLog.objects.create(
-                user=prescription.doctor,
-                action='notification_sent',
-                module='prescriptions',
-                object_type='Prescription',
-                object_id=str(prescription.id),
-                description=f"Verordnungsablauf-Benachrichtigung gesendet ({days_remaining} Tage verbleibend)"
-            )
-            
-        except Exception as e:
-            logger.error(f"Fehler beim Senden der Verordnungsablauf-Benachrichtigung für Verordnung {prescription.id}: {e}")
-    
+
+        email = EmailOutboxService.build(
+            recipient=prescription.patient.email,
+            subject=subject,
+            body=message,
+            dedup_key=f"prescription_expiry:{prescription.id}",
+            category='prescription_expiry',
+        )
+        # Ärzte haben kein Benutzerkonto, daher ohne Protokolleintrag
+        return (
+            email, prescription, None,
+            f"Verordnungsablauf-Benachrichtigung gesendet ({days_remaining} Tage verbleibend)"
+        )
+
     @staticmethod
-    def check_no_show_followup():
-        """Prüft No-Shows und sendet Nachverfolgungs-Benachrichtigungen"""
+    def check_no_show_followup(dry_run=False):
+        """Prüft No-Shows und stellt Nachverfolgungs-Benachrichtigungen in das Ausgangspostfach"""
         try:
-            # Termine die als "no_show" markiert sind und noch nicht nachverfolgt wurden
+            # Termine der letzten 7 Tage, die als "no_show" markiert sind; bereits
+            # nachverfolgte fallen über den dedup_key heraus
             no_show_appointments = Appointment.objects.filter(
                 status='no_show',
-                appointment_date__gte=timezone.now() - timedelta(days=7)  # Letzte 7 Tage
-            ).select_related('patient', 'practitioner')
-            
-            for appointment in no_show_appointments:
-                NotificationService._send_no_show_followup(appointment)
-                
-            logger.info(f"No-Show Nachverfolgungen gesendet: {no_show_appointments.count()}")
-            
+                appointment_date__gte=timezone.now() - timedelta(days=7)
+            ).select_related('patient', 'practitioner', 'treatment')
+
+            notifications = [
+                NotificationService._no_show_followup(appointment)
+                for appointment in no_show_appointments
+            ]
+            count = NotificationService._enqueue(notifications, 'appointments', 'Appointment', dry_run)
+            logger.info(f"No-Show Nachverfolgungen eingestellt: {count}")
+            return count
+
         except Exception as e:
             logger.error(f"Fehler beim Prüfen von No-Shows: {e}")
-    
+            return 0
+
     @staticmethod
-    def _send_no_show_followup(appointment):
-        """Sendet Nachverfolgung für No-Show"""
-        try:
-            subject = f"❓ Rückfrage zu Ihrem verpassten Termin"
-            
-            message = f"""
+    def _no_show_followup(appointment):
+        """Nachverfolgung für No-Show (einmal je Termin)"""
+        subject = f"❓ Rückfrage zu Ihrem verpassten Termin"
+        local_date = timezone.localtime(appointment.appointment_date)
+
+        message = f"""
 Hallo {appointment.patient.first_name} {appointment.patient.last_name},
 
-wir haben Sie zu Ihrem Termin am {appointment.appointment_date.strftime('%d.%m.%Y um %H:%M')} nicht gesehen.
+wir haben Sie zu Ihrem Termin am {local_date.strftime('%d.%m.%Y um %H:%M')} nicht gesehen.
 
 📋 Termindetails:
 - Behandlung: {appointment.treatment.treatment_name}
@@ -205,37 +238,34 @@ Falls es einen technischen Fehler gab, entschuldigen wir uns und bitten um Rück
 Mit freundlichen Grüßen
 Ihr Praxisteam
             """
-            
-            # Sende E-Mail
-            if hasattr(settings, 'EMAIL_HOST') and settings.EMAIL_HOST:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[appointment.patient.email],
-                    fail_silently=True
-                )
-            
-            # Logge die Nachverfolgung
-            UserActivityLog.objects.create(
-                user=appointment.practitioner,
-                action='notification_sent',
-                module='appointments',
-                object_type='Appointment',
-                object_id=str(appointment.id),
-                description="No-Show Nachverfolgung gesendet"
-            )
-            
-        except Exception as e:
-            logger.error(f"Fehler beim Senden der No-Show Nachverfolgung für Termin {appointment.id}: {e}")
-    
+
+        email = EmailOutboxService.build(
+            recipient=appointment.patient.email,
+            subject=subject,
+            body=message,
+            dedup_key=f"no_show_followup:{appointment.id}",
+            category='no_show_followup',
+        )
+        return email, appointment, appointment.practitioner.user_id, "No-Show Nachverfolgung gesendet"
+
     @staticmethod
-    def run_all_notifications():
-        """Führt alle automatischen Benachrichtigungen aus"""
+    def run_all_notifications(dry_run=False):
+        """
+        Führt alle automatischen Benachrichtigungen aus und stellt die eingestellten
+        E-Mails anschließend gebündelt zu.
+
+        Returns:
+            Anzahl der eingestellten Benachrichtigungen je Art und Zustellstatistik
+        """
         logger.info("Starte automatische Benachrichtigungen...")
-        
-        NotificationService.send_appointment_reminders()
-        NotificationService.check_prescription_expiry()
-        NotificationService.check_no_show_followup()
-        
-        logger.info("Automatische Benachrichtigungen abgeschlossen") 
\ No newline at end of file
+
+        result = {
+            'appointment_reminders': NotificationService.send_appointment_reminders(dry_run),
+            'prescription_expiry': NotificationService.check_prescription_expiry(dry_run),
+            'no_show_followup': NotificationService.check_no_show_followup(dry_run),
+        }
+        if not dry_run:
+            result['delivery'] = EmailOutboxService.deliver_pending()
+
+        logger.info("Automatische Benachrichtigungen abgeschlossen")
+        return result
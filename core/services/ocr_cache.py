@@ -0,0 +1,152 @@
+"""
+Inhaltsadressierter Festplatten-Cache für die OCR-Pipeline.
+
+Schlüssel ist der SHA-256 des Dateiinhalts (ergänzt um Seite bzw. Pipeline-Version),
+daher liefert ein erneuter Upload derselben Datei – z.B. nach einem fehlgeschlagenen
+Matching in create_prescription_from_ocr – das Ergebnis sofort. Abgelegt werden
+erkannter Text (.txt) und vorverarbeitete Bildvarianten (.npz).
+
+Die Größe ist über OCR_JOBS['CACHE_MAX_BYTES'] begrenzt; verdrängt wird nach
+LRU-Prinzip anhand der Änderungszeit, die bei jedem Treffer aktualisiert wird.
+Schreibzugriffe erfolgen atomar (temporäre Datei + os.replace), sodass mehrere
+OCR-Prozesse denselben Cache nutzen können.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'medical_ocr_cache')
+DEFAULT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class OCRCache:
+    """Content-Hash-basierter LRU-Cache für OCR-Text und vorverarbeitete Bilder"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        config = getattr(settings, 'OCR_JOBS', {})
+        self.directory = directory or config.get('CACHE_DIR') or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else config.get('CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES)
+        self.enabled = self.max_bytes > 0
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """SHA-256 des Dateiinhalts"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f'{key}{extension}')
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Zugriff für die LRU-Verdrängung vermerken
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"OCR-Cache-Eintrag nicht lesbar ({path}): {str(e)}")
+            return None
+
+    def _write(self, path: str, write):
+        """Schreibt atomar über eine temporäre Datei; write erhält das geöffnete Dateiobjekt"""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"OCR-Cache-Eintrag konnte nicht geschrieben werden ({path}): {str(e)}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+        self.evict()
+
+    # ------------------------------------------------------------------
+    # Text
+    # ------------------------------------------------------------------
+
+    def get_text(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        data = self._read(self._path(key, '.txt'))
+        return data.decode('utf-8') if data is not None else None
+
+    def set_text(self, key: str, text: str):
+        if self.enabled:
+            data = text.encode('utf-8')
+            self._write(self._path(key, '.txt'), lambda f: f.write(data))
+
+    # ------------------------------------------------------------------
+    # Vorverarbeitete Bilder
+    # ------------------------------------------------------------------
+
+    def get_images(self, key: str) -> Optional[List[np.ndarray]]:
+        if not self.enabled:
+            return None
+        path = self._path(key, '.npz')
+        try:
+            os.utime(path)  # Zugriff für die LRU-Verdrängung vermerken
+            with np.load(path) as archive:
+                return [archive[name] for name in archive.files]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"OCR-Cache-Bild beschädigt ({path}): {str(e)}")
+            return None
+
+    def set_images(self, key: str, images: List[np.ndarray]):
+        if self.enabled:
+            arrays = {f'variant_{i}': image for i, image in enumerate(images)}
+            self._write(self._path(key, '.npz'), lambda f: np.savez_compressed(f, **arrays))
+
+    # ------------------------------------------------------------------
+    # Verdrängung
+    # ------------------------------------------------------------------
+
+    def evict(self) -> int:
+        """Entfernt die am längsten nicht genutzten Einträge, bis max_bytes eingehalten wird"""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if not entry.is_file() or entry.name.endswith('.tmp'):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError as e:
+            logger.warning(f"OCR-Cache-Verzeichnis nicht lesbar: {str(e)}")
+            return 0
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        logger.debug(f"OCR-Cache: {removed} Einträge verdrängt")
+        return removed
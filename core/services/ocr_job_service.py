@@ -0,0 +1,437 @@
+"""
+Asynchrone OCR-Aufträge mit datenbankgestützter Warteschlange.
+
+Ein Upload wird im Default-Storage abgelegt und als OCRJob (Status 'queued') angelegt.
+Die eigentliche Verarbeitung läuft in einem ProcessPoolExecutor (core/ocr_worker.py).
+Im Modus 'inline' startet der Webprozess wartende Aufträge selbst, im Modus 'worker'
+übernimmt das ausschließlich das Management-Command process_ocr_jobs.
+
+Aufträge werden per bedingtem UPDATE (queued -> processing) mit einem claim_token
+beansprucht, daher können mehrere Prozesse dieselbe Tabelle abarbeiten, ohne einen
+Auftrag doppelt zu verarbeiten. Solange ein Auftrag läuft, erneuert der beanspruchende
+Prozess heartbeat_at; nur Aufträge ohne Lebenszeichen seit JOB_TIMEOUT_SECONDS werden
+erneut eingestellt. Ergebnisse werden nur mit passendem claim_token geschrieben, ein
+inzwischen neu vergebener Auftrag wird also nicht überschrieben.
+Alle Grenzwerte sind über settings.OCR_JOBS konfigurierbar.
+"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import OCRJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'DISPATCH': 'inline',
+    'MAX_WORKERS': 2,
+    'CONFIG_WORKERS': 4,
+    'MAX_FILE_SIZE': 10 * 1024 * 1024,
+    'MAX_PENDING_JOBS_PER_USER': 5,
+    'MAX_ATTEMPTS': 2,
+    'JOB_TIMEOUT_SECONDS': 300,
+    'HEARTBEAT_SECONDS': 30,
+    'RESULT_TTL_HOURS': 24,
+}
+
+UPLOAD_DIRECTORY = 'prescriptions/ocr_uploads'
+ALLOWED_CONTENT_TYPES = ['image/jpeg', 'image/png', 'image/jpg', 'application/pdf']
+PENDING_STATUSES = ('queued', 'processing')
+PURGE_BATCH_SIZE = 500
+
+
+class OCRJobService:
+    """Annahme, Verteilung und Ergebnisablage von OCR-Aufträgen"""
+
+    _lock = threading.Lock()
+    _executor = None
+    _in_flight = 0
+    _claims = {}  # job_id -> claim_token der in diesem Prozess laufenden Aufträge
+    _heartbeat = None
+
+    @staticmethod
+    def get_settings():
+        return {**DEFAULT_SETTINGS, **getattr(settings, 'OCR_JOBS', {})}
+
+    # ------------------------------------------------------------------
+    # Annahme
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def submit(cls, uploaded_file, user=None) -> OCRJob:
+        """
+        Prüft und speichert einen Upload und legt den OCR-Auftrag an.
+
+        Raises:
+            ValidationError: Bei unzulässigem Dateityp, zu großer Datei oder
+                zu vielen offenen Aufträgen des Benutzers
+        """
+        config = cls.get_settings()
+
+        if uploaded_file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise ValidationError('Nicht unterstützter Dateityp. Erlaubt: JPG, PNG, PDF')
+
+        if uploaded_file.size > config['MAX_FILE_SIZE']:
+            max_mb = config['MAX_FILE_SIZE'] // (1024 * 1024)
+            raise ValidationError(f'Datei zu groß. Maximale Größe: {max_mb}MB')
+
+        if user is not None and not user.is_authenticated:
+            user = None
+
+        if user is not None:
+            pending = OCRJob.objects.filter(created_by=user, status__in=PENDING_STATUSES).count()
+            if pending >= config['MAX_PENDING_JOBS_PER_USER']:
+                raise ValidationError(
+                    'Zu viele offene OCR-Aufträge. Bitte warten Sie, bis laufende Aufträge abgeschlossen sind.'
+                )
+
+        saved_path = default_storage.save(f'{UPLOAD_DIRECTORY}/{uploaded_file.name}', uploaded_file)
+        job = OCRJob.objects.create(
+            file=saved_path,
+            original_name=uploaded_file.name,
+            content_type=uploaded_file.content_type,
+            file_size=uploaded_file.size,
+            created_by=user
+        )
+        logger.info(f"OCR-Auftrag {job.id} angelegt ({uploaded_file.name}, {uploaded_file.size} Bytes)")
+
+        if config['DISPATCH'] == 'inline':
+            transaction.on_commit(cls.dispatch_pending)
+
+        return job
+
+    @staticmethod
+    def get_job_for_user(job_id, user):
+        """Liefert den Auftrag, sofern er dem Benutzer gehört (Admins sehen alle), sonst None"""
+        queryset = OCRJob.objects.all()
+        if not (user.is_superuser or getattr(user, 'is_admin', False)):
+            queryset = queryset.filter(created_by=user)
+        return queryset.filter(pk=job_id).first()
+
+    @staticmethod
+    def to_response(job: OCRJob) -> dict:
+        """Antwortformat für das Polling; bei Abschluss identisch zur früheren synchronen Antwort"""
+        data = {
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'original_name': job.original_name,
+            'attempts': job.attempts,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+
+        if job.status == 'queued':
+            data['queue_position'] = OCRJob.objects.filter(
+                status='queued', created_at__lte=job.created_at
+            ).count()
+        elif job.status == 'completed':
+            extracted_data = job.result or {}
+            data.update({
+                'extracted_data': extracted_data,
+                'validation': job.validation or {'errors': [], 'warnings': []},
+                'uploaded_file': job.file,
+                'confidence_score': extracted_data.get('confidence_score', 0.0),
+            })
+        elif job.status == 'failed':
+            data['error'] = job.error_message or 'OCR-Verarbeitung fehlgeschlagen'
+
+        return data
+
+    # ------------------------------------------------------------------
+    # Verteilung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def claim(job_id):
+        """Beansprucht einen wartenden Auftrag atomar; liefert den claim_token oder None, wenn ein anderer Prozess schneller war"""
+        token = uuid.uuid4()
+        now = timezone.now()
+        claimed = OCRJob.objects.filter(pk=job_id, status='queued').update(
+            status='processing',
+            attempts=F('attempts') + 1,
+            claim_token=token,
+            started_at=now,
+            heartbeat_at=now
+        ) == 1
+        return token if claimed else None
+
+    @staticmethod
+    def _claimed(job_id, token):
+        """Auftrag, solange er noch mit diesem claim_token in Bearbeitung ist"""
+        return OCRJob.objects.filter(pk=job_id, status='processing', claim_token=token)
+
+    @classmethod
+    def dispatch_pending(cls) -> int:
+        """Startet wartende Aufträge, solange im Prozesspool freie Plätze sind"""
+        config = cls.get_settings()
+        cls.requeue_stale()
+
+        with cls._lock:
+            free_slots = config['MAX_WORKERS'] - cls._in_flight
+        if free_slots <= 0:
+            return 0
+
+        candidates = list(
+            OCRJob.objects.filter(status='queued')
+            .order_by('created_at')
+            .values_list('id', flat=True)[:free_slots]
+        )
+
+        started = 0
+        for job_id in candidates:
+            token = cls.claim(job_id)
+            if token and cls._start(job_id, token, config):
+                started += 1
+        return started
+
+    @classmethod
+    def in_flight(cls) -> int:
+        with cls._lock:
+            return cls._in_flight
+
+    @classmethod
+    def _ensure_heartbeat(cls, config):
+        with cls._lock:
+            if cls._heartbeat is not None and cls._heartbeat.is_alive():
+                return
+            cls._heartbeat = threading.Thread(
+                target=cls._heartbeat_loop, args=(config['HEARTBEAT_SECONDS'],),
+                name='ocr-job-heartbeat', daemon=True
+            )
+            cls._heartbeat.start()
+
+    @classmethod
+    def _heartbeat_loop(cls, interval):
+        """Erneuert heartbeat_at der laufenden Aufträge, bis keiner mehr läuft"""
+        while True:
+            time.sleep(interval)
+            with cls._lock:
+                tokens = list(cls._claims.values())
+                if not tokens:
+                    cls._heartbeat = None
+                    return
+            try:
+                OCRJob.objects.filter(status='processing', claim_token__in=tokens).update(
+                    heartbeat_at=timezone.now()
+                )
+            except Exception as e:
+                logger.error(f"Lebenszeichen für OCR-Aufträge konnte nicht geschrieben werden: {str(e)}")
+            finally:
+                connection.close()
+
+    @classmethod
+    def _get_executor(cls, config):
+        from core.ocr_worker import init_ocr_worker
+
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=config['MAX_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_ocr_worker
+                )
+            return cls._executor
+
+    @classmethod
+    def _reset_executor(cls):
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def shutdown(cls, wait=True):
+        """Beendet den Prozesspool (z.B. am Ende des Worker-Commands)"""
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    @staticmethod
+    def _local_path(storage_path):
+        """Lokaler Dateipfad für den Worker; bei entfernten Storages wird eine temporäre Kopie angelegt"""
+        try:
+            return default_storage.path(storage_path), False
+        except NotImplementedError:
+            suffix = os.path.splitext(storage_path)[1]
+            with default_storage.open(storage_path, 'rb') as source, \
+                    tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as target:
+                shutil.copyfileobj(source, target)
+            return target.name, True
+
+    @classmethod
+    def _start(cls, job_id, token, config) -> bool:
+        from core.ocr_worker import run_ocr_job
+
+        storage_path = OCRJob.objects.filter(pk=job_id).values_list('file', flat=True).first()
+        try:
+            local_path, is_temp = cls._local_path(storage_path)
+        except Exception as e:
+            cls._mark_failed(job_id, token, f'Datei konnte nicht gelesen werden: {str(e)}')
+            return False
+
+        with cls._lock:
+            cls._in_flight += 1
+            cls._claims[job_id] = token
+        try:
+            future = cls._get_executor(config).submit(run_ocr_job, local_path, config['CONFIG_WORKERS'])
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.error(f"OCR-Prozesspool nicht verfügbar: {str(e)}")
+            cls._reset_executor()
+            with cls._lock:
+                cls._in_flight -= 1
+                cls._claims.pop(job_id, None)
+            cls._claimed(job_id, token).update(
+                status='queued', claim_token=None, started_at=None, heartbeat_at=None
+            )
+            if is_temp:
+                os.unlink(local_path)
+            return False
+
+        cls._ensure_heartbeat(config)
+        future.add_done_callback(partial(cls._on_done, job_id, token, local_path if is_temp else None))
+        logger.debug(f"OCR-Auftrag {job_id} gestartet")
+        return True
+
+    @classmethod
+    def _on_done(cls, job_id, token, temp_path, future):
+        """Callback des Prozesspools: Ergebnis ablegen und nächsten Auftrag starten"""
+        try:
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                cls._reset_executor()
+                cls._handle_failure(job_id, token, f'OCR-Prozess abgebrochen: {str(e)}')
+            except Exception as e:
+                cls._handle_failure(job_id, token, str(e))
+            else:
+                cls._mark_completed(job_id, token, result)
+        except Exception as e:
+            logger.error(f"Ergebnis für OCR-Auftrag {job_id} konnte nicht gespeichert werden: {str(e)}")
+        finally:
+            with cls._lock:
+                cls._in_flight -= 1
+                cls._claims.pop(job_id, None)
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        try:
+            cls.dispatch_pending()
+        except Exception as e:
+            logger.error(f"Fehler beim Starten wartender OCR-Aufträge: {str(e)}")
+        finally:
+            # Callback läuft im Verwaltungsthread des Pools; dessen Verbindung nicht offen halten
+            if not connection.in_atomic_block:
+                connection.close()
+
+    # ------------------------------------------------------------------
+    # Ergebnisse und Wartung
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _mark_completed(cls, job_id, token, result):
+        extracted_data = result.get('extracted_data') or {}
+        updated = cls._claimed(job_id, token).update(
+            status='completed',
+            result=extracted_data,
+            validation=result.get('validation'),
+            error_message=extracted_data.get('error_message') or '',
+            claim_token=None,
+            finished_at=timezone.now()
+        )
+        if updated:
+            logger.info(f"OCR-Auftrag {job_id} abgeschlossen")
+        else:
+            logger.warning(f"Ergebnis für OCR-Auftrag {job_id} verworfen: Auftrag wurde inzwischen neu vergeben")
+
+    @classmethod
+    def _mark_failed(cls, job_id, token, message):
+        cls._claimed(job_id, token).update(
+            status='failed',
+            error_message=message,
+            claim_token=None,
+            finished_at=timezone.now()
+        )
+        logger.error(f"OCR-Auftrag {job_id} fehlgeschlagen: {message}")
+
+    @classmethod
+    def _handle_failure(cls, job_id, token, message):
+        """Stellt den Auftrag erneut ein, solange MAX_ATTEMPTS nicht erreicht ist"""
+        attempts = OCRJob.objects.filter(pk=job_id).values_list('attempts', flat=True).first() or 0
+        if attempts < cls.get_settings()['MAX_ATTEMPTS']:
+            if cls._claimed(job_id, token).update(
+                status='queued', claim_token=None, started_at=None, heartbeat_at=None, error_message=message
+            ):
+                logger.warning(f"OCR-Auftrag {job_id} erneut eingestellt (Versuch {attempts}): {message}")
+        else:
+            cls._mark_failed(job_id, token, message)
+
+    @classmethod
+    def requeue_stale(cls) -> int:
+        """
+        Setzt Aufträge zurück, von deren Prozess seit JOB_TIMEOUT_SECONDS kein Lebenszeichen
+        kam (z.B. nach einem Neustart des verarbeitenden Prozesses). Noch laufende Aufträge
+        erneuern heartbeat_at alle HEARTBEAT_SECONDS und bleiben daher beansprucht.
+        """
+        config = cls.get_settings()
+        now = timezone.now()
+        stale = OCRJob.objects.filter(
+            status='processing',
+            heartbeat_at__lt=now - timedelta(seconds=config['JOB_TIMEOUT_SECONDS'])
+        )
+        failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+            status='failed',
+            error_message='Zeitüberschreitung bei der OCR-Verarbeitung',
+            claim_token=None,
+            finished_at=now
+        )
+        requeued = stale.update(status='queued', claim_token=None, started_at=None, heartbeat_at=None)
+        if failed or requeued:
+            logger.warning(f"OCR-Aufträge mit Zeitüberschreitung: {requeued} erneut eingestellt, {failed} fehlgeschlagen")
+        return requeued
+
+    @classmethod
+    def purge_expired(cls) -> int:
+        """
+        Löscht abgeschlossene/fehlgeschlagene Aufträge, die älter als RESULT_TTL_HOURS sind,
+        samt der hochgeladenen Datei im Storage
+        """
+        cutoff = timezone.now() - timedelta(hours=cls.get_settings()['RESULT_TTL_HOURS'])
+        expired = OCRJob.objects.filter(
+            status__in=('completed', 'failed'),
+            finished_at__lt=cutoff
+        )
+        removed = []
+        for job_id, storage_path in expired.values_list('id', 'file').iterator():
+            if storage_path:
+                try:
+                    default_storage.delete(storage_path)
+                except Exception as e:
+                    # Auftrag behalten, damit der nächste Lauf die Datei erneut löscht
+                    logger.error(f"Datei von OCR-Auftrag {job_id} konnte nicht gelöscht werden: {str(e)}")
+                    continue
+            removed.append(job_id)
+
+        deleted = 0
+        for start in range(0, len(removed), PURGE_BATCH_SIZE):
+            deleted += OCRJob.objects.filter(pk__in=removed[start:start + PURGE_BATCH_SIZE]).delete()[0]
+        return deleted
@@ -7,16 +7,54 @@ import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import io
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import fitz  # PyMuPDF für PDF-Verarbeitung
+from django.conf import settings
+from core.services.ocr_cache import OCRCache
 
 logger = logging.getLogger(__name__)
 
+# Seiten mit weniger Zeichen in der Textebene gelten als gescannt und werden per OCR gelesen
+MIN_TEXT_LAYER_CHARS = 20
+
+_page_executor = None
+_page_executor_lock = threading.Lock()
+
+
+def get_page_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Prozessweiter Pool für die seitenweise OCR von PDFs (Worker siehe core/ocr_worker.py)"""
+    global _page_executor
+    from core.ocr_worker import init_ocr_worker
+
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_ocr_worker
+            )
+        return _page_executor
+
+
+def shutdown_page_executor(wait: bool = True):
+    """Beendet den Seiten-Prozesspool; wait=False verwirft auch noch wartende Seiten"""
+    global _page_executor
+    with _page_executor_lock:
+        executor, _page_executor = _page_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
 class OCRService:
     """
     OCR-Service für die automatische Erkennung von Rezeptdaten
     """
     
-    def __init__(self):
+    def __init__(self, config_workers: Optional[int] = None, page_workers: Optional[int] = None,
+                 cache: Optional[OCRCache] = None):
         # Tesseract-Konfiguration für deutsche Sprache mit mehreren PSM-Modi
         self.configs = [
             '--oem 3 --psm 6 -l deu',  # Einheitlicher Textblock
@@ -25,6 +63,17 @@ class OCRService:
             '--oem 1 --psm 3 -l deu',  # Legacy mit Auto-Segmentierung
         ]
         self.config = self.configs[0]  # Standard-Konfiguration
+        ocr_settings = getattr(settings, 'OCR_JOBS', {})
+        # Anzahl parallel laufender Tesseract-Aufrufe (1 = nacheinander wie bisher)
+        self.config_workers = config_workers or ocr_settings.get('CONFIG_WORKERS') or len(self.configs)
+        # Anzahl Prozesse für gescannte PDF-Seiten und Auflösung der Rasterung
+        self.page_workers = page_workers or ocr_settings.get('PAGE_WORKERS', 2)
+        self.pdf_dpi = ocr_settings.get('PDF_RENDER_DPI', 300)
+        self.cache = cache if cache is not None else OCRCache()
+        # Bestandteil aller Cache-Schlüssel: geänderte Konfigurationen machen alte Einträge ungültig
+        self.pipeline_version = hashlib.sha1(
+            ('|'.join(self.configs) + f'|{self.pdf_dpi}').encode('utf-8')
+        ).hexdigest()[:8]
         
         # Regex-Patterns für Muster 13 Heilmittelverordnung
         self.patterns = {
@@ -111,85 +160,216 @@ class OCRService:
         Extrahiert Text aus einem Bild
         """
         try:
-            # Bild laden und vorverarbeiten
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Konnte Bild nicht laden: {image_path}")
-            
-            # Graustufen konvertieren
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Rauschen reduzieren
-            denoised = cv2.medianBlur(gray, 3)
-            
-            # Kontrast verbessern
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(denoised)
-            
-            # Zusätzliche Vorverarbeitung für bessere OCR
-            # Schwellenwert anwenden
-            _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Morphologische Operationen für Rauschen entfernen
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-            cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-            
-            # Skalierung für bessere OCR
-            height, width = cleaned.shape
-            if width < 1000:  # Wenn Bild zu klein ist
-                scale_factor = 2.0
-                cleaned = cv2.resize(cleaned, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
-            
-            # OCR durchführen mit mehreren Konfigurationen und Bildvarianten
-            text = ""
-            image_variants = [enhanced, cleaned, thresh]
-            
-            for variant_idx, img_variant in enumerate(image_variants):
-                if text.strip():  # Wenn bereits Text gefunden wurde
-                    break
-                    
-                for i, config in enumerate(self.configs):
-                    try:
-                        logger.debug(f"Versuche OCR mit Bildvariante {variant_idx+1}, Konfiguration {i+1}: {config}")
-                        text = pytesseract.image_to_string(img_variant, config=config)
-                        if text.strip():  # Wenn Text gefunden wurde
-                            logger.debug(f"OCR erfolgreich mit Bildvariante {variant_idx+1}, Konfiguration {i+1}")
-                            break
-                    except Exception as ocr_error:
-                        logger.debug(f"OCR Bildvariante {variant_idx+1}, Konfiguration {i+1} fehlgeschlagen: {str(ocr_error)}")
-                        continue
-            
-            # Fallback: Einfachste Konfiguration
-            if not text.strip():
-                try:
-                    logger.info("Versuche Fallback-OCR...")
-                    text = pytesseract.image_to_string(enhanced, config='--oem 1 --psm 6 -l deu')
-                except Exception as fallback_error:
-                    logger.error(f"Fallback-OCR fehlgeschlagen: {str(fallback_error)}")
-                    text = ""
-            
-            return text
+            def load_image():
+                image = cv2.imread(image_path)
+                if image is None:
+                    raise ValueError(f"Konnte Bild nicht laden: {image_path}")
+                return image
+            
+            cache_key = f"{self.cache.file_digest(image_path)}-{self.pipeline_version}"
+            return self._ocr_image(load_image, cache_key)
         except Exception as e:
             logger.error(f"Fehler bei OCR-Text-Extraktion: {str(e)}")
             raise
     
+    def _ocr_image(self, load_image, cache_key: str) -> str:
+        """
+        OCR eines Bildes mit Cache für Text und vorverarbeitete Varianten.
+        load_image wird nur aufgerufen, wenn nichts im Cache liegt.
+        """
+        text = self.cache.get_text(cache_key)
+        if text is not None:
+            logger.debug(f"OCR-Text aus Cache: {cache_key}")
+            return text
+        
+        image_variants = self.cache.get_images(cache_key)
+        if image_variants is None:
+            image_variants = self._preprocess(load_image())
+            self.cache.set_images(cache_key, image_variants)
+        
+        text = self._ocr_variants(image_variants)
+        if text.strip():  # Leere Ergebnisse nicht cachen, damit ein erneuter Versuch neu rechnet
+            self.cache.set_text(cache_key, text)
+        return text
+    
+    def _preprocess(self, image) -> List[np.ndarray]:
+        """
+        Erzeugt die Bildvarianten [enhanced, cleaned, thresh] für die OCR
+        """
+        # Graustufen konvertieren (gerasterte PDF-Seiten sind bereits grau)
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Rauschen reduzieren
+        denoised = cv2.medianBlur(gray, 3)
+        
+        # Kontrast verbessern
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        enhanced = clahe.apply(denoised)
+        
+        # Zusätzliche Vorverarbeitung für bessere OCR
+        # Schwellenwert anwenden
+        _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        # Morphologische Operationen für Rauschen entfernen
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        
+        # Skalierung für bessere OCR
+        height, width = cleaned.shape
+        if width < 1000:  # Wenn Bild zu klein ist
+            scale_factor = 2.0
+            cleaned = cv2.resize(cleaned, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
+        
+        return [enhanced, cleaned, thresh]
+    
+    def _ocr_variants(self, image_variants: List[np.ndarray]) -> str:
+        """
+        OCR über mehrere Bildvarianten; die erste Variante mit Text gewinnt
+        """
+        text = ""
+        for variant_idx, img_variant in enumerate(image_variants):
+            text = self._ocr_with_configs(img_variant, variant_idx)
+            if text.strip():  # Wenn bereits Text gefunden wurde
+                break
+        
+        # Fallback: Einfachste Konfiguration
+        if not text.strip():
+            try:
+                logger.info("Versuche Fallback-OCR...")
+                text = pytesseract.image_to_string(image_variants[0], config='--oem 1 --psm 6 -l deu')
+            except Exception as fallback_error:
+                logger.error(f"Fallback-OCR fehlgeschlagen: {str(fallback_error)}")
+                text = ""
+        
+        return text
+    
+    def _ocr_with_configs(self, img_variant, variant_idx: int) -> str:
+        """
+        Führt die Tesseract-Konfigurationen für eine Bildvariante parallel aus.
+
+        Tesseract läuft als eigener Prozess, daher genügen Threads für echte Parallelität.
+        Ergebnis ist wie bei der sequentiellen Variante der Text der ersten Konfiguration
+        (in der Reihenfolge von self.configs), die überhaupt Text liefert.
+        """
+        def run(index_config):
+            i, config = index_config
+            try:
+                logger.debug(f"Versuche OCR mit Bildvariante {variant_idx+1}, Konfiguration {i+1}: {config}")
+                return pytesseract.image_to_string(img_variant, config=config)
+            except Exception as ocr_error:
+                logger.debug(f"OCR Bildvariante {variant_idx+1}, Konfiguration {i+1} fehlgeschlagen: {str(ocr_error)}")
+                return ""
+        
+        workers = max(1, min(self.config_workers, len(self.configs)))
+        if workers == 1:
+            results = map(run, enumerate(self.configs))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(run, enumerate(self.configs)))
+        
+        for i, text in enumerate(results):
+            if text.strip():  # Wenn Text gefunden wurde
+                logger.debug(f"OCR erfolgreich mit Bildvariante {variant_idx+1}, Konfiguration {i+1}")
+                return text
+        return ""
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
-        Extrahiert Text aus einer PDF
+        Extrahiert Text aus einer PDF.
+        
+        Seiten ohne (ausreichende) Textebene werden gerastert und durch die Bild-OCR
+        geschickt, bei mehreren Seiten parallel im Seiten-Prozesspool.
         """
         try:
-            doc = fitz.open(pdf_path)
-            text = ""
+            digest = self.cache.file_digest(pdf_path)
+            document_key = f"{digest}-{self.pipeline_version}"
+            cached_text = self.cache.get_text(document_key)
+            if cached_text is not None:
+                logger.debug(f"PDF-Text aus Cache: {document_key}")
+                return cached_text
             
-            for page in doc:
-                text += page.get_text()
+            doc = fitz.open(pdf_path)
+            try:
+                page_texts = [page.get_text() for page in doc]
+            finally:
+                doc.close()
             
-            doc.close()
+            scanned_pages = [
+                page_number for page_number, page_text in enumerate(page_texts)
+                if len(page_text.strip()) < MIN_TEXT_LAYER_CHARS
+            ]
+            if scanned_pages:
+                logger.info(f"PDF enthält {len(scanned_pages)} gescannte Seite(n) - OCR per Rasterisierung")
+                for page_number, page_text in self._ocr_pdf_pages(pdf_path, scanned_pages, digest).items():
+                    if page_text.strip():
+                        page_texts[page_number] = page_text
+            
+            text = "".join(page_texts)
+            if text.strip():
+                self.cache.set_text(document_key, text)
             return text
         except Exception as e:
             logger.error(f"Fehler bei PDF-Text-Extraktion: {str(e)}")
             raise
     
+    def _page_cache_key(self, digest: str, page_number: int) -> str:
+        return f"{digest}-p{page_number}-{self.pipeline_version}"
+    
+    def ocr_pdf_page(self, pdf_path: str, page_number: int, digest: str) -> str:
+        """
+        Rastert eine PDF-Seite (Graustufen, PDF_RENDER_DPI) und führt die Bild-OCR aus
+        """
+        def load_image():
+            doc = fitz.open(pdf_path)
+            try:
+                pixmap = doc[page_number].get_pixmap(dpi=self.pdf_dpi, colorspace=fitz.csGRAY, alpha=False)
+            finally:
+                doc.close()
+            return np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width)
+        
+        return self._ocr_image(load_image, self._page_cache_key(digest, page_number))
+    
+    def _ocr_pdf_pages(self, pdf_path: str, page_numbers: List[int], digest: str) -> Dict[int, str]:
+        """
+        OCR für mehrere PDF-Seiten; bereits gecachte Seiten werden übersprungen,
+        die übrigen parallel im Seiten-Prozesspool verarbeitet
+        """
+        from core.ocr_worker import run_pdf_page_ocr
+        
+        results = {}
+        pending = []
+        for page_number in page_numbers:
+            cached_text = self.cache.get_text(self._page_cache_key(digest, page_number))
+            if cached_text is not None:
+                results[page_number] = cached_text
+            else:
+                pending.append(page_number)
+        
+        if len(pending) > 1 and self.page_workers > 1:
+            try:
+                executor = get_page_executor(self.page_workers)
+                futures = {
+                    executor.submit(run_pdf_page_ocr, pdf_path, page_number, digest, self.config_workers): page_number
+                    for page_number in pending
+                }
+                for future in as_completed(futures):
+                    page_number = futures[future]
+                    try:
+                        results[page_number] = future.result()
+                    except Exception as page_error:
+                        logger.error(f"OCR für PDF-Seite {page_number + 1} fehlgeschlagen: {str(page_error)}")
+                        results[page_number] = ""
+                return results
+            except Exception as pool_error:
+                # z.B. BrokenProcessPool: Pool verwerfen und seriell weiterarbeiten
+                logger.error(f"Seiten-Prozesspool nicht verfügbar, verarbeite seriell: {str(pool_error)}")
+                shutdown_page_executor(wait=False)
+                pending = [page_number for page_number in pending if page_number not in results]
+        
+        for page_number in pending:
+            results[page_number] = self.ocr_pdf_page(pdf_path, page_number, digest)
+        return results
+    
     def parse_prescription_data(self, text: str) -> Dict[str, Any]:
         """
         Parst extrahierten Text und erkennt Rezeptdaten
@@ -517,3 +697,4 @@ class OCRService:
             'errors': errors,
             'warnings': warnings
         }
+
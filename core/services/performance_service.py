@@ -8,53 +8,57 @@ from typing import Dict, Any, Optional, Callable
 import psutil
 import os
 
+from core.services.cache_service import CacheService
+from core.services.metrics_service import metrics
+
 logger = logging.getLogger(__name__)
 
+
+class _QueryCounter:
+    """execute_wrapper, der nur Abfragen zählt"""
+
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
 class PerformanceService:
     """Service für umfassende Performance-Optimierungen und Monitoring"""
     
     @staticmethod
     def monitor_performance(func: Callable) -> Callable:
-        """Decorator für Performance-Monitoring von Funktionen"""
+        """
+        Decorator für Performance-Monitoring von Funktionen.
+
+        Dauer und Abfrageanzahl landen in der prozesslokalen Metrik-Registry (ohne Lock und
+        ohne Cache-Zugriff); Abfragen werden über execute_wrapper gezählt, auch ohne DEBUG.
+        """
+        name = func.__qualname__
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            start_queries = len(connection.queries)
+            counter = _QueryCounter()
+            start_time = time.perf_counter()
             
             try:
-                result = func(*args, **kwargs)
-                return result
+                with connection.execute_wrapper(counter):
+                    return func(*args, **kwargs)
             finally:
-                end_time = time.time()
-                end_queries = len(connection.queries)
-                
-                duration = end_time - start_time
-                query_count = end_queries - start_queries
+                duration = time.perf_counter() - start_time
+                metrics.observe(f'function:{name}', duration * 1000)
+                metrics.increment(f'function_queries:{name}', counter.count)
                 
                 # Log Performance-Metriken
                 if duration > 1.0:  # Langsame Funktionen
                     logger.warning(
-                        f"Slow function detected: {func.__name__} took {duration:.2f}s "
-                        f"and executed {query_count} queries"
+                        f"Slow function detected: {name} took {duration:.2f}s "
+                        f"and executed {counter.count} queries"
                     )
-                
-                # Cache Performance-Metriken
-                cache_key = f"perf:{func.__name__}"
-                cached_metrics = cache.get(cache_key, {
-                    'call_count': 0,
-                    'total_duration': 0,
-                    'total_queries': 0,
-                    'avg_duration': 0,
-                    'avg_queries': 0
-                })
-                
-                cached_metrics['call_count'] += 1
-                cached_metrics['total_duration'] += duration
-                cached_metrics['total_queries'] += query_count
-                cached_metrics['avg_duration'] = cached_metrics['total_duration'] / cached_metrics['call_count']
-                cached_metrics['avg_queries'] = cached_metrics['total_queries'] / cached_metrics['call_count']
-                
-                cache.set(cache_key, cached_metrics, 3600)  # 1 Stunde
         
         return wrapper
     
@@ -119,7 +123,8 @@ class PerformanceService:
             return {
                 'cache_working': cache_hit,
                 'cache_backend': settings.CACHES['default']['BACKEND'],
-                'cache_timeout': settings.CACHES['default'].get('TIMEOUT', 300)
+                'cache_timeout': settings.CACHES['default'].get('TIMEOUT', 300),
+                'hit_stats': CacheService.get_stats()
             }
         except Exception as e:
             logger.error(f"Error getting cache metrics: {e}")
@@ -155,6 +160,7 @@ class PerformanceService:
     def clear_performance_cache():
         """Löscht alle Performance-Cache-Einträge"""
         try:
+            metrics.reset()
             # Finde alle Performance-Cache-Keys
             if hasattr(cache, '_cache'):
                 # LocMemCache Backend
@@ -180,6 +186,34 @@ class PerformanceService:
         except Exception as e:
             logger.error(f"Error clearing performance cache: {e}")
     
+    @staticmethod
+    def _read_metrics(prefix: str, all_processes: bool) -> Dict[str, Any]:
+        if all_processes:
+            return metrics.collect(prefix)
+        return metrics.snapshot(prefix)
+
+    @staticmethod
+    def get_request_metrics(all_processes: bool = False) -> Dict[str, Any]:
+        """Latenz-Histogramme je Route aus der RequestPerformanceMiddleware"""
+        return {
+            'latency': PerformanceService._read_metrics('request:', all_processes)['histograms'],
+            'database': PerformanceService._read_metrics('request_db:', all_processes)['histograms'],
+        }
+
+    @staticmethod
+    def get_function_metrics(all_processes: bool = False) -> Dict[str, Any]:
+        """Aufrufe, Latenz-Perzentile und Abfragen je mit monitor_performance markierter Funktion"""
+        data = PerformanceService._read_metrics('function', all_processes)
+        functions = {}
+        for key, histogram in data['histograms'].items():
+            name = key.split(':', 1)[1]
+            query_total = data['counters'].get(f'function_queries:{name}', 0)
+            functions[name] = {
+                **histogram,
+                'avg_queries': round(query_total / histogram['count'], 2) if histogram['count'] else 0,
+            }
+        return functions
+    
     @staticmethod
     def get_performance_summary() -> Dict[str, Any]:
         """Gibt eine Zusammenfassung aller Performance-Metriken zurück"""
@@ -187,6 +221,8 @@ class PerformanceService:
             'system': PerformanceService.get_system_metrics(),
             'database': PerformanceService.get_database_metrics(),
             'cache': PerformanceService.get_cache_metrics(),
+            'requests': PerformanceService.get_request_metrics(all_processes=True),
+            'functions': PerformanceService.get_function_metrics(all_processes=True),
             'timestamp': time.time()
         }
 
@@ -209,13 +245,16 @@ class QueryOptimizer:
     
     @staticmethod
     def optimize_patient_queryset(queryset):
-        """Optimiert Patient-QuerySets"""
-        return queryset.select_related(
-            'patient_insurance__insurance_provider'
-        ).prefetch_related(
-            'appointments__practitioner',
-            'appointments__treatment',
-            'prescriptions__treatment_1'
+        """
+        Optimiert Patient-QuerySets für den PatientSerializer: Versicherungen (mit Kasse) und
+        Datenschutzeinwilligungen werden mit je einer Abfrage für die ganze Liste vorgeladen.
+        """
+        from django.db.models import Prefetch
+        from core.models import DataProtectionConsent, PatientInsurance
+
+        return queryset.prefetch_related(
+            Prefetch('insurances', queryset=PatientInsurance.objects.select_related('insurance_provider')),
+            Prefetch('data_consents', queryset=DataProtectionConsent.objects.order_by('-consent_date', '-id')),
         )
     
     @staticmethod
@@ -0,0 +1,209 @@
+"""
+Vorberechnete Berechtigungsmatrix pro Benutzer.
+
+Statt für jede Prüfung von User.has_module_permission eine ModulePermission-Abfrage
+abzusetzen, werden die aktiven Modul-Berechtigungen und die Rollen-Berechtigungen eines
+Benutzers mit einer Abfrage geladen und als Matrix im Cache abgelegt. Prüfungen sind
+danach reine Dictionary-Zugriffe.
+
+Der Cache-Key enthält eine Versionsmarke (CacheService-Tags): Sie wird beim Erteilen,
+Entziehen oder Ändern einer ModulePermission sowie beim Speichern der Rolle erhöht;
+ein Rollenwechsel des Benutzers führt über die role_id im Key zu einem neuen Eintrag.
+Läuft eine Berechtigung ab, endet die Gültigkeit der Matrix zu diesem Zeitpunkt.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.services.cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_LEVELS = {
+    'none': 0,
+    'read': 1,
+    'create': 2,
+    'update': 3,
+    'delete': 4,
+    'full': 5,
+}
+
+# Höchstes zuerst – Reihenfolge für get_effective_permissions
+LEVEL_ORDER = ['full', 'delete', 'update', 'create', 'read']
+
+
+class PermissionMatrix:
+    """Aufgelöste Berechtigungen eines Benutzers (ohne Admin-Override)"""
+
+    __slots__ = ('explicit', 'role_permissions', 'valid_until')
+
+    def __init__(self, explicit: Dict[str, str], role_permissions: Dict, valid_until: Optional[datetime]):
+        self.explicit = explicit
+        self.role_permissions = role_permissions
+        self.valid_until = valid_until
+
+    def is_current(self, now=None) -> bool:
+        return self.valid_until is None or (now or timezone.now()) < self.valid_until
+
+    def has_permission(self, user, module_name: str, required_permission: str = 'read') -> bool:
+        """Entspricht der bisherigen Auswertungsreihenfolge von User.has_module_permission"""
+        permission = self.explicit.get(module_name)
+        if permission is not None:
+            return PERMISSION_LEVELS.get(permission, 0) >= PERMISSION_LEVELS.get(required_permission, 0)
+
+        # Fallback: alte Berechtigungsfelder am Benutzer
+        legacy_field = f'can_access_{module_name}'
+        if hasattr(user, legacy_field):
+            return bool(getattr(user, legacy_field, False))
+
+        # Fallback: Rollen-Berechtigungen
+        if self.role_permissions:
+            return bool(self.role_permissions.get(module_name, False))
+
+        return False
+
+    def permission_level(self, module_name: str) -> str:
+        return self.explicit.get(module_name, 'none')
+
+    def to_cache(self) -> Dict:
+        """JSON-kompatible Darstellung (der Redis-Cache serialisiert als JSON)"""
+        return {
+            'explicit': self.explicit,
+            'role_permissions': self.role_permissions,
+            'valid_until': self.valid_until.isoformat() if self.valid_until else None,
+        }
+
+    @classmethod
+    def from_cache(cls, data: Dict) -> 'PermissionMatrix':
+        valid_until = parse_datetime(data['valid_until']) if data.get('valid_until') else None
+        return cls(data['explicit'], data['role_permissions'], valid_until)
+
+
+class PermissionMatrixService:
+    """Baut, cached und invalidiert Berechtigungsmatrizen"""
+
+    CACHE_PREFIX = 'permission_matrix'
+    INSTANCE_ATTRIBUTE = '_permission_matrix'
+
+    @staticmethod
+    def user_tag(user_id: int) -> str:
+        return f'permissions:user:{user_id}'
+
+    @staticmethod
+    def _tags(user) -> list:
+        tags = [PermissionMatrixService.user_tag(user.pk)]
+        if user.role_id:
+            tags.append(CacheService.model_tag('userrole', user.role_id))
+        return tags
+
+    @staticmethod
+    def _cache_key(user) -> str:
+        return CacheService.generate_tagged_cache_key(
+            PermissionMatrixService.CACHE_PREFIX, PermissionMatrixService._tags(user), user.pk, user.role_id
+        )
+
+    @staticmethod
+    def _rows_for(user):
+        """
+        Liefert (Rollen-Berechtigungen, [(Modul, Berechtigung, Ablauf), ...]).
+
+        Sind Rolle und module_permissions bereits geladen (select_related/prefetch_related,
+        z.B. in der Benutzerliste), entsteht keine Abfrage; sonst genau eine über einen Join.
+        """
+        prefetched = getattr(user, '_prefetched_objects_cache', {}).get('module_permissions')
+        role_cached = not user.role_id or user._meta.get_field('role').is_cached(user)
+        if prefetched is not None and role_cached:
+            role_permissions = user.role.permissions if user.role_id else {}
+            rows = [(p.module, p.permission, p.expires_at) for p in prefetched if p.is_active]
+            return role_permissions or {}, rows
+
+        from core.models import User
+
+        role_permissions = {}
+        rows = []
+        for role_perms, module, permission, expires_at, is_active in User.objects.filter(pk=user.pk).values_list(
+            'role__permissions',
+            'module_permissions__module',
+            'module_permissions__permission',
+            'module_permissions__expires_at',
+            'module_permissions__is_active',
+        ):
+            role_permissions = role_perms or {}
+            if module is not None and is_active:
+                rows.append((module, permission, expires_at))
+        return role_permissions, rows
+
+    @staticmethod
+    def build(user) -> PermissionMatrix:
+        """Löst die Berechtigungen eines Benutzers auf"""
+        now = timezone.now()
+        role_permissions, rows = PermissionMatrixService._rows_for(user)
+
+        explicit = {}
+        valid_until = None
+        for module, permission, expires_at in rows:
+            if expires_at is not None:
+                if expires_at <= now:
+                    continue  # abgelaufen: Fallback auf Legacy-Felder bzw. Rolle
+                valid_until = expires_at if valid_until is None else min(valid_until, expires_at)
+            explicit[module] = permission
+
+        return PermissionMatrix(explicit, role_permissions, valid_until)
+
+    @staticmethod
+    def get(user) -> PermissionMatrix:
+        """
+        Matrix des Benutzers: zuerst am Objekt (pro Request), dann aus dem Cache,
+        sonst neu aufgebaut und mit Laufzeit bis zum nächsten Ablaufzeitpunkt abgelegt.
+        """
+        now = timezone.now()
+        matrix = getattr(user, PermissionMatrixService.INSTANCE_ATTRIBUTE, None)
+        if matrix is not None and matrix.is_current(now):
+            return matrix
+
+        key = PermissionMatrixService._cache_key(user)
+        cached = cache.get(key)
+        matrix = PermissionMatrix.from_cache(cached) if cached else None
+        if matrix is None or not matrix.is_current(now):
+            matrix = PermissionMatrixService.build(user)
+            timeout = CacheService.LONG_TIMEOUT
+            if matrix.valid_until is not None:
+                timeout = max(1, min(timeout, int((matrix.valid_until - now).total_seconds()) + 1))
+            cache.set(key, matrix.to_cache(), timeout)
+
+        setattr(user, PermissionMatrixService.INSTANCE_ATTRIBUTE, matrix)
+        return matrix
+
+    @staticmethod
+    def invalidate(user_id: int, user=None) -> None:
+        """Erhöht die Versionsmarke des Benutzers (und verwirft die Matrix am Objekt)"""
+        CacheService.invalidate_tag(PermissionMatrixService.user_tag(user_id))
+        if user is not None:
+            user.__dict__.pop(PermissionMatrixService.INSTANCE_ATTRIBUTE, None)
+            # Vorgeladene Berechtigungen wären jetzt veraltet
+            getattr(user, '_prefetched_objects_cache', {}).pop('module_permissions', None)
+
+    @staticmethod
+    def effective_permissions(user, module_choices: Iterable) -> Dict:
+        """Höchstes Berechtigungslevel je Modul (Format von User.get_effective_permissions)"""
+        is_admin = user.is_superuser or user.is_admin
+        matrix = None if is_admin else PermissionMatrixService.get(user)
+
+        permissions = {}
+        for module_code, module_name in module_choices:
+            permission_level = 'full' if is_admin else 'none'
+            if not is_admin:
+                for level in LEVEL_ORDER:
+                    if matrix.has_permission(user, module_code, level):
+                        permission_level = level
+                        break
+            permissions[module_code] = {
+                'permission': permission_level,
+                'name': module_name
+            }
+        return permissions
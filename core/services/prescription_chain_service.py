@@ -0,0 +1,227 @@
+"""
+Denormalisierte Verordnungsketten (Erstverordnung + Folgeverordnungen).
+
+Jede Verordnung kennt ihre Erstverordnung (chain_root, bei der Erstverordnung sie selbst),
+ihre Position in der Kette sowie die Summen der Kette (verordnete und abgeschlossene
+Sitzungen, letzte Position). Damit sind get_root_prescription, die Sitzungssummen und
+can_create_follow_up reine Feldzugriffe statt rekursiver Abfragen über die Kette.
+
+Gepflegt wird die Kette in Prescription.save (innerhalb derselben Transaktion), sobald
+eine Verordnung neu angelegt wird oder sich Ursprung, Sitzungsanzahl oder abgeschlossene
+Sitzungen ändern. Vor dem Neuberechnen der Summen wird die Erstverordnung gesperrt
+(lock_chains), damit gleichzeitig gespeicherte Folgeverordnungen einer Kette nacheinander
+rechnen und keine die Zeile der anderen übersieht. Der Management-Command rebuild_prescription_chains baut alle Ketten
+neu auf (Erstbefüllung, Reparatur nach queryset.update).
+"""
+
+import logging
+from collections import defaultdict
+from typing import List, Optional
+
+from django.db import transaction
+from django.db.models import Max, Sum
+
+logger = logging.getLogger(__name__)
+
+# Schutz vor zirkulären Verweisen (entspricht der alten Rekursionsgrenze)
+MAX_CHAIN_DEPTH = 10
+
+
+class PrescriptionChainService:
+    """Pflegt chain_root, chain_position und die Kettensummen von Verordnungen"""
+
+    @staticmethod
+    def _walk_to_root_id(prescription) -> int:
+        """Ermittelt die Erstverordnung über original_prescription (nur für nicht gepflegte Ketten)"""
+        from core.models import Prescription
+
+        current_id = prescription.pk
+        parent_id = prescription.original_prescription_id
+        for _ in range(MAX_CHAIN_DEPTH + 1):
+            if parent_id is None:
+                return current_id
+            current_id = parent_id
+            parent_id = Prescription.objects.filter(pk=parent_id).values_list(
+                'original_prescription_id', flat=True
+            ).first()
+        raise ValueError(
+            "Maximale Rekursionstiefe für Folgeverordnungen erreicht. "
+            "Möglicherweise gibt es zirkuläre Referenzen."
+        )
+
+    @staticmethod
+    def resolve_root_id(prescription) -> int:
+        """Erstverordnung einer gespeicherten Verordnung (eine Abfrage auf den Ursprung)"""
+        from core.models import Prescription
+
+        if prescription.original_prescription_id is None:
+            return prescription.pk
+
+        root_id = Prescription.objects.filter(pk=prescription.original_prescription_id).values_list(
+            'chain_root_id', flat=True
+        ).first()
+        return root_id or PrescriptionChainService._walk_to_root_id(prescription)
+
+    @staticmethod
+    def lock_chains(*root_ids) -> None:
+        """
+        Sperrt die Erstverordnungen der Ketten bis zum Ende der Transaktion (in ID-Reihenfolge,
+        damit sich zwei Kettenwechsel nicht gegenseitig blockieren)
+        """
+        from core.models import Prescription
+
+        ids = sorted({root_id for root_id in root_ids if root_id is not None})
+        if ids:
+            list(Prescription.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk'))
+
+    @staticmethod
+    def next_follow_up_number(root_id: int) -> int:
+        from core.models import Prescription
+
+        return (Prescription.objects.filter(original_prescription_id=root_id).aggregate(
+            max_num=Max('follow_up_number')
+        )['max_num'] or 0) + 1
+
+    @staticmethod
+    def refresh_totals(root_id: int) -> dict:
+        """Berechnet die Summen einer Kette unter Sperre der Erstverordnung neu und schreibt sie an alle Glieder"""
+        from core.models import Prescription
+
+        with transaction.atomic():
+            PrescriptionChainService.lock_chains(root_id)
+            members = Prescription.objects.filter(chain_root_id=root_id)
+            totals = members.aggregate(
+                total=Sum('number_of_sessions'),
+                completed=Sum('sessions_completed'),
+                last_position=Max('chain_position'),
+            )
+            values = {
+                'chain_total_sessions': totals['total'] or 0,
+                'chain_completed_sessions': totals['completed'] or 0,
+                'chain_last_position': totals['last_position'] or 0,
+            }
+            members.update(**values)
+        return values
+
+    @staticmethod
+    def _descendant_ids(prescription_id: int, root_id: int) -> List[int]:
+        """Folgeverordnungen, die (auch mittelbar) auf die Verordnung verweisen, innerhalb ihrer bisherigen Kette"""
+        from core.models import Prescription
+
+        children = defaultdict(list)
+        for pk, parent_id in Prescription.objects.filter(chain_root_id=root_id).values_list(
+            'id', 'original_prescription_id'
+        ):
+            children[parent_id].append(pk)
+
+        descendants = []
+        seen = {prescription_id}
+        pending = list(children.get(prescription_id, []))
+        while pending:
+            pk = pending.pop()
+            if pk in seen:
+                continue  # zirkulärer Verweis
+            seen.add(pk)
+            descendants.append(pk)
+            pending.extend(children.get(pk, []))
+        return descendants
+
+    @staticmethod
+    def sync(prescription) -> Optional[int]:
+        """
+        Ordnet eine gespeicherte Verordnung ihrer Kette zu und aktualisiert die Kettensummen.
+
+        Wechselt die Verordnung die Kette (neue original_prescription), wandern ihre
+        Folgeverordnungen mit, und die Summen der bisherigen Kette werden ebenfalls neu
+        berechnet. Wird aus Prescription.save innerhalb einer Transaktion aufgerufen; die
+        Werte werden auch am übergebenen Objekt gesetzt.
+
+        Returns:
+            Erstverordnung der bisherigen Kette, falls die Verordnung die Kette gewechselt hat
+        """
+        from core.models import Prescription
+
+        root_id = PrescriptionChainService.resolve_root_id(prescription)
+        position = 0 if root_id == prescription.pk else max(prescription.follow_up_number, 1)
+        previous_root_id, previous_position = Prescription.objects.filter(pk=prescription.pk).values_list(
+            'chain_root_id', 'chain_position'
+        ).first()
+        moved_from = previous_root_id if previous_root_id not in (None, root_id) else None
+        PrescriptionChainService.lock_chains(root_id, moved_from)
+
+        if moved_from is not None:
+            descendants = PrescriptionChainService._descendant_ids(prescription.pk, moved_from)
+            if descendants:
+                Prescription.objects.filter(pk__in=descendants).update(chain_root_id=root_id)
+
+        if (previous_root_id, previous_position) != (root_id, position):
+            Prescription.objects.filter(pk=prescription.pk).update(chain_root_id=root_id, chain_position=position)
+        prescription.chain_root_id = root_id
+        prescription.chain_position = position
+
+        for field, value in PrescriptionChainService.refresh_totals(root_id).items():
+            setattr(prescription, field, value)
+        if moved_from is not None:
+            PrescriptionChainService.refresh_totals(moved_from)
+        return moved_from
+
+    @staticmethod
+    def rebuild(batch_size: int = 500) -> int:
+        """
+        Baut Zuordnung und Summen aller Ketten aus original_prescription neu auf.
+
+        Liest alle Verordnungen mit einer Abfrage, rechnet die Ketten im Speicher und schreibt
+        nur geänderte Zeilen per bulk_update zurück.
+
+        Returns:
+            Anzahl der aktualisierten Verordnungen
+        """
+        from core.models import Prescription
+
+        fields = ['chain_root', 'chain_position', 'chain_total_sessions',
+                  'chain_completed_sessions', 'chain_last_position']
+        prescriptions = {
+            p.pk: p for p in Prescription.objects.only(
+                'id', 'original_prescription_id', 'follow_up_number', 'number_of_sessions',
+                'sessions_completed', *fields
+            )
+        }
+
+        def find_root(pk):
+            for _ in range(MAX_CHAIN_DEPTH + 1):
+                parent_id = prescriptions[pk].original_prescription_id
+                if parent_id is None or parent_id not in prescriptions:
+                    return pk
+                pk = parent_id
+            return None
+
+        chains = {}
+        for pk, prescription in prescriptions.items():
+            root_id = find_root(pk)
+            if root_id is None:
+                logger.warning(f"Verordnung {pk}: zirkuläre Folgeverordnungskette, übersprungen")
+                continue
+            chains.setdefault(root_id, []).append(prescription)
+
+        changed = []
+        for root_id, members in chains.items():
+            positions = {
+                p.pk: 0 if p.pk == root_id else max(p.follow_up_number, 1) for p in members
+            }
+            values = {
+                'chain_total_sessions': sum(p.number_of_sessions for p in members),
+                'chain_completed_sessions': sum(p.sessions_completed for p in members),
+                'chain_last_position': max(positions.values()),
+            }
+            for p in members:
+                expected = dict(values, chain_root_id=root_id, chain_position=positions[p.pk])
+                if any(getattr(p, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(p, field, value)
+                    changed.append(p)
+
+        with transaction.atomic():
+            Prescription.objects.bulk_update(changed, fields, batch_size=batch_size)
+
+        logger.info(f"Verordnungsketten neu aufgebaut: {len(chains)} Ketten, {len(changed)} Verordnungen aktualisiert")
+        return len(changed)
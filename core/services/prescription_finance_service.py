@@ -0,0 +1,284 @@
+"""
+Materialisierte Finanzübersicht je Verordnung.
+
+PrescriptionFinancialSummary hält pro Verordnung:
+- billed_amount: Summe der BillingItems (Kassenanteil + Zuzahlung)
+- expected_amount: Wert der abrechnungsbereiten, noch nicht abgerechneten Termine aller
+  abrechenbaren Verordnungen der Kette (bisher Prescription.get_total_amount)
+- paid_amount: Summe der Zahlungszuordnungen (bisher Prescription.get_paid_amount)
+- outstanding_amount: expected_amount - paid_amount
+
+Die Übersicht wird per Signal fortgeschrieben: Zahlungszuordnungen ändern nur paid/outstanding
+der betroffenen Verordnung, Termine und BillingItems lösen eine Neuberechnung der Kette aus.
+Die Abrechenbarkeit hängt vom Tagesdatum ab (Gültigkeit der Krankenkasse); der
+Management-Command reconcile_prescription_finances gleicht deshalb regelmäßig ab.
+"""
+
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+AMOUNT_FIELDS = ('billed_amount', 'expected_amount', 'paid_amount', 'outstanding_amount')
+
+
+class PrescriptionFinanceService:
+    """Berechnet, pflegt und prüft PrescriptionFinancialSummary"""
+
+    # ------------------------------------------------------------------
+    # Berechnung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _chain_members(prescription_ids: Iterable[int]) -> Dict[int, int]:
+        """Verordnung -> Erstverordnung für alle Glieder der betroffenen Ketten"""
+        from core.models import Prescription
+
+        ids = {pk for pk in prescription_ids if pk is not None}
+        if not ids:
+            return {}
+        root_ids = {
+            root_id or pk
+            for pk, root_id in Prescription.objects.filter(pk__in=ids).values_list('id', 'chain_root_id')
+        }
+        members = dict(
+            Prescription.objects.filter(chain_root_id__in=root_ids).values_list('id', 'chain_root_id')
+        )
+        # Noch nicht zugeordnete Verordnungen bilden eine eigene Kette
+        for pk in ids:
+            members.setdefault(pk, pk)
+        return members
+
+    @staticmethod
+    def _expected_by_chain(root_ids: Iterable[int], today) -> Dict[int, Decimal]:
+        """Wert der abrechnungsbereiten, nicht abgerechneten Termine abrechenbarer Verordnungen je Kette"""
+        from core.models import Appointment
+
+        root_ids = list(root_ids)
+        appointments = Appointment.objects.filter(
+            Q(prescription__chain_root_id__in=root_ids) | Q(prescription_id__in=root_ids),
+            status='ready_to_bill',
+            billing_items__isnull=True
+        ).select_related(
+            'treatment',
+            'prescription__treatment_1',
+            'prescription__patient_insurance__insurance_provider'
+        )
+
+        totals = defaultdict(lambda: ZERO)
+        billable = {}
+        for appointment in appointments:
+            prescription = appointment.prescription
+            if prescription.pk not in billable:
+                billable[prescription.pk] = (
+                    prescription.status in ['In_Progress', 'Extended']
+                    and prescription.patient_insurance.is_valid(today)
+                    and prescription.treatment_1 is not None
+                    and not prescription.treatment_1.is_self_pay
+                )
+            if not billable[prescription.pk]:
+                continue
+            amount = appointment.calculate_billing_amount()
+            totals[prescription.chain_root_id or prescription.pk] += amount['insurance_amount'] + amount['patient_copay']
+        return totals
+
+    @staticmethod
+    def _sum_by_prescription(model, prescription_ids, expression) -> Dict[int, Decimal]:
+        return {
+            row['prescription_id']: row['total'] or ZERO
+            for row in model.objects.filter(prescription_id__in=prescription_ids)
+            .values('prescription_id').annotate(total=Sum(expression))
+        }
+
+    @staticmethod
+    def compute(prescription_ids: Iterable[int]) -> Dict[int, Dict[str, Decimal]]:
+        """
+        Berechnet die Übersicht für die angegebenen Verordnungen und alle Glieder ihrer Ketten.
+
+        Returns:
+            {prescription_id: {'billed_amount', 'expected_amount', 'paid_amount', 'outstanding_amount'}}
+        """
+        from core.models import BillingItem, PaymentAllocation
+
+        members = PrescriptionFinanceService._chain_members(prescription_ids)
+        if not members:
+            return {}
+
+        ids = list(members)
+        expected = PrescriptionFinanceService._expected_by_chain(set(members.values()), timezone.now().date())
+        billed = PrescriptionFinanceService._sum_by_prescription(
+            BillingItem, ids, F('insurance_amount') + F('patient_copay')
+        )
+        paid = PrescriptionFinanceService._sum_by_prescription(PaymentAllocation, ids, 'amount')
+
+        summaries = {}
+        for pk, root_id in members.items():
+            expected_amount = expected.get(root_id, ZERO)
+            paid_amount = paid.get(pk, ZERO)
+            summaries[pk] = {
+                'billed_amount': billed.get(pk, ZERO),
+                'expected_amount': expected_amount,
+                'paid_amount': paid_amount,
+                'outstanding_amount': expected_amount - paid_amount,
+            }
+        return summaries
+
+    # ------------------------------------------------------------------
+    # Fortschreibung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _store(summaries: Dict[int, Dict[str, Decimal]]) -> None:
+        from core.models import PrescriptionFinancialSummary
+
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {
+                summary.prescription_id: summary
+                for summary in PrescriptionFinancialSummary.objects.select_for_update().filter(
+                    prescription_id__in=list(summaries)
+                )
+            }
+            to_update, to_create = [], []
+            for pk, values in summaries.items():
+                summary = existing.get(pk)
+                if summary is None:
+                    to_create.append(PrescriptionFinancialSummary(prescription_id=pk, computed_at=now, **values))
+                    continue
+                for field, value in values.items():
+                    setattr(summary, field, value)
+                summary.computed_at = now
+                summary.updated_at = now
+                to_update.append(summary)
+
+            if to_update:
+                PrescriptionFinancialSummary.objects.bulk_update(
+                    to_update, [*AMOUNT_FIELDS, 'computed_at', 'updated_at']
+                )
+            if to_create:
+                PrescriptionFinancialSummary.objects.bulk_create(to_create, ignore_conflicts=True)
+
+    @staticmethod
+    def refresh(prescription_ids: Iterable[int]) -> None:
+        """Berechnet und speichert die Übersicht der betroffenen Verordnungsketten"""
+        summaries = PrescriptionFinanceService.compute(prescription_ids)
+        if summaries:
+            PrescriptionFinanceService._store(summaries)
+            logger.debug(f"Finanzübersicht für {len(summaries)} Verordnungen aktualisiert")
+
+    @staticmethod
+    def guarded(refresh, description: str, *args) -> None:
+        """
+        Führt eine Aktualisierung aus Signals bzw. save() in einem Savepoint aus: Ein
+        Datenbankfehler wird protokolliert (reconcile_prescription_finances gleicht später ab),
+        ohne die Transaktion des Aufrufers unbrauchbar zu machen.
+        """
+        try:
+            with transaction.atomic():
+                refresh(*args)
+        except DatabaseError as e:
+            logger.warning(f"Finanzübersicht für {description} konnte nicht aktualisiert werden: {e}")
+
+    @staticmethod
+    def refresh_paid(prescription_id: Optional[int]) -> None:
+        """Nach Änderung einer Zahlungszuordnung: nur paid/outstanding der Verordnung nachführen"""
+        from core.models import PaymentAllocation, PrescriptionFinancialSummary
+
+        if prescription_id is None:
+            return
+        paid = PaymentAllocation.objects.filter(prescription_id=prescription_id).aggregate(
+            total=Sum('amount')
+        )['total'] or ZERO
+        updated = PrescriptionFinancialSummary.objects.filter(prescription_id=prescription_id).update(
+            paid_amount=paid,
+            outstanding_amount=F('expected_amount') - paid,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            PrescriptionFinanceService.refresh([prescription_id])
+
+    @staticmethod
+    def get_summary(prescription):
+        """Übersicht einer Verordnung; fehlt sie, wird sie berechnet"""
+        from core.models import PrescriptionFinancialSummary
+
+        try:
+            return prescription.financial_summary
+        except PrescriptionFinancialSummary.DoesNotExist:
+            pass
+
+        if prescription.pk is None:
+            return PrescriptionFinancialSummary(prescription=prescription)
+
+        PrescriptionFinanceService.refresh([prescription.pk])
+        summary = PrescriptionFinancialSummary.objects.get(prescription_id=prescription.pk)
+        prescription.financial_summary = summary
+        return summary
+
+    # ------------------------------------------------------------------
+    # Auswertung und Abgleich
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def outstanding(prescriptions=None):
+        """Verordnungen mit offenem Betrag, größter zuerst (indizierte Abfrage auf outstanding_amount)"""
+        from core.models import PrescriptionFinancialSummary
+
+        queryset = PrescriptionFinancialSummary.objects.filter(outstanding_amount__gt=0)
+        if prescriptions is not None:
+            queryset = queryset.filter(prescription__in=prescriptions)
+        return queryset.order_by('-outstanding_amount', 'prescription_id')
+
+    @staticmethod
+    def reconcile(fix: bool = False, batch_size: int = 500) -> List[Dict]:
+        """
+        Vergleicht alle gespeicherten Übersichten mit der Neuberechnung.
+
+        Args:
+            fix: Abweichungen und fehlende Übersichten direkt korrigieren
+
+        Returns:
+            Liste der Abweichungen ({'prescription_id', 'field', 'stored', 'expected'}),
+            fehlende Übersichten mit field='missing'
+        """
+        from core.models import Prescription, PrescriptionFinancialSummary
+
+        differences = []
+        root_ids = list(
+            Prescription.objects.filter(chain_root_id=F('id')).values_list('id', flat=True)
+        ) + list(
+            Prescription.objects.filter(chain_root__isnull=True).values_list('id', flat=True)
+        )
+
+        for offset in range(0, len(root_ids), batch_size):
+            computed = PrescriptionFinanceService.compute(root_ids[offset:offset + batch_size])
+            stored = {
+                summary.prescription_id: summary
+                for summary in PrescriptionFinancialSummary.objects.filter(prescription_id__in=list(computed))
+            }
+            stale = {}
+            for pk, values in computed.items():
+                summary = stored.get(pk)
+                if summary is None:
+                    differences.append({'prescription_id': pk, 'field': 'missing', 'stored': None, 'expected': None})
+                    stale[pk] = values
+                    continue
+                for field, value in values.items():
+                    if getattr(summary, field) != value:
+                        differences.append({
+                            'prescription_id': pk, 'field': field,
+                            'stored': getattr(summary, field), 'expected': value,
+                        })
+                        stale[pk] = values
+            if fix and stale:
+                PrescriptionFinanceService._store(stale)
+
+        logger.info(f"Abgleich Finanzübersicht: {len(differences)} Abweichungen{' korrigiert' if fix else ''}")
+        return differences
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 from core.models import Prescription, Appointment, Patient, Practitioner, Treatment, Room
+from core.services.conflict_service import ConflictChecker
 
 logger = logging.getLogger(__name__)
 
@@ -73,29 +74,18 @@ class PrescriptionSeriesService:
         )
         
         appointments = []
+        checker = PrescriptionSeriesService._conflict_checker(
+            appointment_dates, duration_minutes, practitioner, room
+        )
         
         with transaction.atomic():
             for i, appointment_date in enumerate(appointment_dates):
-                # Prüfe ob der Behandler verfügbar ist
-                if not PrescriptionSeriesService._is_practitioner_available(
-                    practitioner, appointment_date, duration_minutes
-                ):
-                    logger.warning(
-                        f"Behandler {practitioner} ist am {appointment_date} nicht verfügbar. "
-                        f"Termin wird übersprungen."
-                    )
+                appointment_room = PrescriptionSeriesService._reserve_slot(
+                    checker, practitioner, room, appointment_date, duration_minutes
+                )
+                if appointment_room is False:
                     continue
                 
-                # Prüfe ob der Raum verfügbar ist (falls angegeben)
-                if room and not PrescriptionSeriesService._is_room_available(
-                    room, appointment_date, duration_minutes
-                ):
-                    logger.warning(
-                        f"Raum {room.name} ist am {appointment_date} nicht verfügbar. "
-                        f"Termin wird ohne Raum erstellt."
-                    )
-                    room = None
-                
                 # Erstelle Termin
                 appointment = Appointment.objects.create(
                     patient=prescription.patient,
@@ -106,7 +96,7 @@ class PrescriptionSeriesService:
                     patient_insurance=prescription.patient_insurance,
                     duration_minutes=duration_minutes,
                     notes=notes,
-                    room=room,
+                    room=appointment_room,
                     series_identifier=series_identifier,
                     is_recurring=True,
                     **kwargs
@@ -185,27 +175,18 @@ class PrescriptionSeriesService:
         new_appointments = []
         series_identifier = last_appointment.series_identifier
         
+        checker = PrescriptionSeriesService._conflict_checker(
+            new_appointment_dates, duration_minutes, practitioner, room
+        )
+        
         with transaction.atomic():
             for appointment_date in new_appointment_dates:
-                # Prüfe Verfügbarkeit
-                if not PrescriptionSeriesService._is_practitioner_available(
-                    practitioner, appointment_date, duration_minutes
-                ):
-                    logger.warning(
-                        f"Behandler {practitioner} ist am {appointment_date} nicht verfügbar. "
-                        f"Termin wird übersprungen."
-                    )
+                appointment_room = PrescriptionSeriesService._reserve_slot(
+                    checker, practitioner, room, appointment_date, duration_minutes
+                )
+                if appointment_room is False:
                     continue
                 
-                if room and not PrescriptionSeriesService._is_room_available(
-                    room, appointment_date, duration_minutes
-                ):
-                    logger.warning(
-                        f"Raum {room.name} ist am {appointment_date} nicht verfügbar. "
-                        f"Termin wird ohne Raum erstellt."
-                    )
-                    room = None
-                
                 # Erstelle Termin
                 appointment = Appointment.objects.create(
                     patient=prescription.patient,
@@ -216,7 +197,7 @@ class PrescriptionSeriesService:
                     patient_insurance=prescription.patient_insurance,
                     duration_minutes=duration_minutes,
                     notes=notes,
-                    room=room,
+                    room=appointment_room,
                     series_identifier=series_identifier,
                     is_recurring=True,
                     **kwargs
@@ -359,29 +340,54 @@ class PrescriptionSeriesService:
             return start_date + timedelta(days=sessions - 1)
     
     @staticmethod
-    def _is_practitioner_available(practitioner: Practitioner, date: datetime, duration: int) -> bool:
-        """Prüft ob ein Behandler verfügbar ist"""
-        # Vereinfachte Prüfung - hier könnte komplexere Logik implementiert werden
-        conflicting_appointments = Appointment.objects.filter(
-            practitioner=practitioner,
-            appointment_date__lt=date + timedelta(minutes=duration),
-            appointment_date__gt=date - timedelta(minutes=duration)
+    def _conflict_checker(
+        dates: List[datetime],
+        duration: int,
+        practitioner: Practitioner,
+        room: Optional[Room]
+    ) -> ConflictChecker:
+        """Lädt die Belegung von Behandler und Raum für alle Termine der Serie mit einer Abfrage"""
+        if not dates:
+            return ConflictChecker(None, None)
+        return ConflictChecker(
+            min(dates),
+            max(dates) + timedelta(minutes=duration),
+            practitioner_ids=[practitioner],
+            room_ids=[room] if room and room.is_active else [],
         )
-        return not conflicting_appointments.exists()
     
     @staticmethod
-    def _is_room_available(room: Room, date: datetime, duration: int) -> bool:
-        """Prüft ob ein Raum verfügbar ist"""
-        if not room.is_active:
+    def _reserve_slot(
+        checker: ConflictChecker,
+        practitioner: Practitioner,
+        room: Optional[Room],
+        date: datetime,
+        duration: int
+    ):
+        """
+        Prüft einen Serientermin und reserviert ihn im Checker.
+        
+        Returns:
+            False wenn der Behandler belegt ist (Termin wird übersprungen),
+            sonst den zu verwendenden Raum (None falls belegt oder nicht angegeben)
+        """
+        end = date + timedelta(minutes=duration)
+        if checker.find_conflict(date, end, practitioner_id=practitioner.pk):
+            logger.warning(
+                f"Behandler {practitioner} ist am {date} nicht verfügbar. "
+                f"Termin wird übersprungen."
+            )
             return False
         
-        # Vereinfachte Prüfung
-        conflicting_appointments = Appointment.objects.filter(
-            room=room,
-            appointment_date__lt=date + timedelta(minutes=duration),
-            appointment_date__gt=date - timedelta(minutes=duration)
-        )
-        return not conflicting_appointments.exists()
+        if room and (not room.is_active or checker.find_conflict(date, end, room_id=room.pk)):
+            logger.warning(
+                f"Raum {room.name} ist am {date} nicht verfügbar. "
+                f"Termin wird ohne Raum erstellt."
+            )
+            room = None
+        
+        checker.reserve(date, end, practitioner.pk, room.pk if room else None)
+        return room
     
     @staticmethod
     def get_series_info(series_identifier: str) -> Dict:
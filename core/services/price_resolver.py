@@ -0,0 +1,241 @@
+"""
+Datumsindizierter Preis-Resolver.
+
+Lädt alle Preisperioden (Surcharge und TreatmentPrice) einmalig in eine prozessweite
+Struktur, die nach (Behandlung, Kassengruppe) bzw. Behandlung gruppiert und nach
+Gültigkeitsbeginn sortiert ist. Preisabfragen erfolgen per Bisektion ohne Datenbankzugriff.
+
+Die Tabellen werden beim Speichern/Löschen von Preisen über Signals nach dem Commit
+invalidiert (siehe core/signals.py). Damit auch andere Worker-Prozesse neu laden, wird
+zusätzlich eine Versionsmarke im gemeinsamen Cache gesetzt, die höchstens alle
+VERSION_CHECK_SECONDS Sekunden abgefragt wird. Bis zum Commit nutzt nur die ändernde
+Verbindung eigene, nicht veröffentlichte Tabellen – ein Rollback hinterlässt so keine Preise.
+
+Surcharge- und Behandlungspreis-Tabellen werden gemeinsam als ein unveränderlicher
+Schnappschuss (Tupel) veröffentlicht und von den Abfragen in eine lokale Variable gelesen,
+damit ein gleichzeitiges invalidate() in einem anderen Thread keinen halben Stand sichtbar macht.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+SurchargePeriod = namedtuple(
+    'SurchargePeriod',
+    ['valid_from', 'valid_until', 'insurance_payment', 'patient_payment', 'id']
+)
+TreatmentPricePeriod = namedtuple(
+    'TreatmentPricePeriod',
+    ['valid_from', 'valid_until', 'gkv_price', 'copayment_amount', 'private_price', 'self_pay_price', 'id']
+)
+
+
+class _PeriodTable:
+    """Nach valid_from sortierte Preisperioden eines Schlüssels"""
+
+    __slots__ = ('starts', 'periods')
+
+    def __init__(self, periods):
+        self.periods = sorted(periods, key=lambda p: (p.valid_from, p.id))
+        self.starts = [p.valid_from for p in self.periods]
+
+    def find(self, check_date):
+        """Jüngste Periode mit valid_from <= check_date <= valid_until (None = unbegrenzt)"""
+        index = bisect_right(self.starts, check_date)
+        while index > 0:
+            index -= 1
+            period = self.periods[index]
+            if period.valid_until is None or period.valid_until >= check_date:
+                return period
+        return None
+
+
+class PriceResolver:
+    """Prozessweiter, datumsindizierter Cache für Surcharge- und TreatmentPrice-Abfragen"""
+
+    VERSION_CACHE_KEY = 'price_resolver_version'
+    VERSION_CHECK_SECONDS = 5
+    # Attribut der Datenbankverbindung mit den Preisänderungen der offenen Transaktion
+    # ('markers': Position und Callback in run_on_commit) und den dafür geladenen Tabellen
+    PENDING_ATTRIBUTE = '_price_resolver_pending'
+
+    _lock = threading.Lock()
+    # (Surcharge-Tabellen, Behandlungspreis-Tabellen) oder None
+    _tables: Optional[Tuple[Dict, Dict]] = None
+    _version = None
+    _last_version_check = 0.0
+
+    # ------------------------------------------------------------------
+    # Laden und Invalidieren
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _load(cls) -> Tuple[Dict, Dict]:
+        from core.models import Surcharge, TreatmentPrice
+
+        surcharges = defaultdict(list)
+        for row in Surcharge.objects.values_list(
+            'treatment_id', 'insurance_provider_group_id', 'valid_from', 'valid_until',
+            'insurance_payment', 'patient_payment', 'id'
+        ):
+            surcharges[(row[0], row[1])].append(SurchargePeriod(*row[2:]))
+
+        treatment_prices = defaultdict(list)
+        for row in TreatmentPrice.objects.filter(is_active=True).values_list(
+            'treatment_id', 'price_list__valid_from', 'price_list__valid_until',
+            'gkv_price', 'copayment_amount', 'private_price', 'self_pay_price', 'id'
+        ):
+            treatment_prices[row[0]].append(TreatmentPricePeriod(*row[1:]))
+
+        tables = (
+            {key: _PeriodTable(periods) for key, periods in surcharges.items()},
+            {key: _PeriodTable(periods) for key, periods in treatment_prices.items()},
+        )
+        logger.debug(
+            f"PriceResolver geladen: {len(tables[0])} Surcharge-Schlüssel, {len(tables[1])} Behandlungspreise"
+        )
+        return tables
+
+    @staticmethod
+    def _marker_alive(connection, index: int, callback) -> bool:
+        # Commit und Rollback (auch auf einen Savepoint) entfernen den on_commit-Callback
+        callbacks = connection.run_on_commit
+        return index < len(callbacks) and callbacks[index][1] is callback
+
+    @classmethod
+    def _pending_tables(cls) -> Optional[Tuple[Dict, Dict]]:
+        """Eigene Tabellen der Verbindung, solange deren Transaktion geänderte Preise enthält"""
+        connection = connections[DEFAULT_DB_ALIAS]
+        pending = getattr(connection, cls.PENDING_ATTRIBUTE, None)
+        if pending is None:
+            return None
+        markers = pending['markers']
+        while markers and not cls._marker_alive(connection, *markers[-1]):
+            markers.pop()
+            pending['tables'] = None
+        if not markers:
+            setattr(connection, cls.PENDING_ATTRIBUTE, None)
+            return None
+        if pending['tables'] is None:
+            pending['tables'] = cls._load()
+        return pending['tables']
+
+    @classmethod
+    def _ensure_loaded(cls) -> Tuple[Dict, Dict]:
+        pending = cls._pending_tables()
+        if pending is not None:
+            return pending
+
+        tables = cls._tables
+        now = time.monotonic()
+        if tables is not None and now - cls._last_version_check < cls.VERSION_CHECK_SECONDS:
+            return tables
+
+        with cls._lock:
+            shared_version = cache.get(cls.VERSION_CACHE_KEY)
+            cls._last_version_check = now
+            if cls._tables is not None and shared_version == cls._version:
+                return cls._tables
+            if shared_version is None:
+                shared_version = uuid.uuid4().hex
+                cache.set(cls.VERSION_CACHE_KEY, shared_version, None)
+            cls._tables = cls._load()
+            cls._version = shared_version
+            return cls._tables
+
+    @classmethod
+    def invalidate(cls):
+        """Verwirft die Preistabellen in diesem und (über die Cache-Version) allen anderen Prozessen"""
+        with cls._lock:
+            cls._tables = None
+            cls._version = None
+            cache.set(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    @classmethod
+    def invalidate_on_commit(cls, using: Optional[str] = None):
+        """
+        Für Preisänderungen: invalidiert erst nach dem Commit. Bis dahin liest nur die
+        ändernde Verbindung ihre eigenen, frisch geladenen Tabellen.
+        """
+        connection = connections[using or DEFAULT_DB_ALIAS]
+        if not connection.in_atomic_block:
+            cls.invalidate()
+            return
+
+        def callback():
+            cls.invalidate()
+
+        transaction.on_commit(callback, using=using)
+        pending = getattr(connection, cls.PENDING_ATTRIBUTE, None) or {'markers': [], 'tables': None}
+        pending['markers'].append((len(connection.run_on_commit) - 1, callback))
+        pending['tables'] = None
+        setattr(connection, cls.PENDING_ATTRIBUTE, pending)
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _pk(obj):
+        return obj if obj is None or isinstance(obj, int) else obj.pk
+
+    @classmethod
+    def get_surcharge(cls, treatment, insurance_provider_group, check_date: date) -> Optional[SurchargePeriod]:
+        """Gültige Surcharge-Periode für Behandlung und Kassengruppe zu einem Datum"""
+        surcharges, _ = cls._ensure_loaded()
+        table = surcharges.get((cls._pk(treatment), cls._pk(insurance_provider_group)))
+        return table.find(check_date) if table else None
+
+    @classmethod
+    def get_treatment_price(cls, treatment, check_date: date) -> Optional[TreatmentPricePeriod]:
+        """Gültiger (aktiver) TreatmentPrice einer Behandlung zu einem Datum"""
+        _, treatment_prices = cls._ensure_loaded()
+        table = treatment_prices.get(cls._pk(treatment))
+        return table.find(check_date) if table else None
+
+    @classmethod
+    def resolve_billing_amount(cls, treatment, check_date: date, insurance_provider_group=None,
+                               with_prescription: bool = False) -> Dict[str, Decimal]:
+        """
+        Ermittelt Kassen- und Patientenanteil nach denselben Regeln wie Appointment.get_billing_amount:
+
+        1. Mit Verordnung: Surcharge der Kassengruppe, sonst GKV-Preis/Zuzahlung aus TreatmentPrice
+        2. Selbstzahler-Preis aus TreatmentPrice
+        3. Fallback: Treatment.self_pay_price
+        """
+        treatment_price = cls.get_treatment_price(treatment, check_date)
+
+        if with_prescription:
+            surcharge = cls.get_surcharge(treatment, insurance_provider_group, check_date)
+            if surcharge:
+                return {
+                    'insurance_amount': surcharge.insurance_payment,
+                    'patient_copay': surcharge.patient_payment
+                }
+            if treatment_price:
+                return {
+                    'insurance_amount': treatment_price.gkv_price or Decimal('0.00'),
+                    'patient_copay': treatment_price.copayment_amount or Decimal('0.00')
+                }
+
+        if treatment_price and treatment_price.self_pay_price:
+            return {
+                'insurance_amount': Decimal('0.00'),
+                'patient_copay': treatment_price.self_pay_price
+            }
+
+        return {
+            'insurance_amount': Decimal('0.00'),
+            'patient_copay': getattr(treatment, 'self_pay_price', None) or Decimal('0.00')
+        }
@@ -9,6 +9,7 @@ from typing import Optional, Dict, List
 from django.db.models import Q
 
 from core.models import Treatment, Surcharge, InsuranceProviderGroup, InsuranceProvider
+from core.services.price_resolver import PriceResolver
 
 
 class PriceService:
@@ -34,16 +35,8 @@ class PriceService:
         if check_date is None:
             check_date = date.today()
             
-        try:
-            surcharge = Surcharge.objects.get(
-                treatment=treatment,
-                insurance_provider_group=insurance_provider_group,
-                valid_from__lte=check_date,
-                valid_until__gte=check_date
-            )
-            return surcharge.insurance_payment
-        except Surcharge.DoesNotExist:
-            return None
+        surcharge = PriceResolver.get_surcharge(treatment, insurance_provider_group, check_date)
+        return surcharge.insurance_payment if surcharge else None
     
     @staticmethod
     def get_valid_patient_copay_for_date(
@@ -65,16 +58,8 @@ class PriceService:
         if check_date is None:
             check_date = date.today()
             
-        try:
-            surcharge = Surcharge.objects.get(
-                treatment=treatment,
-                insurance_provider_group=insurance_provider_group,
-                valid_from__lte=check_date,
-                valid_until__gte=check_date
-            )
-            return surcharge.patient_payment
-        except Surcharge.DoesNotExist:
-            return None
+        surcharge = PriceResolver.get_surcharge(treatment, insurance_provider_group, check_date)
+        return surcharge.patient_payment if surcharge else None
     
     @staticmethod
     def get_price_history(
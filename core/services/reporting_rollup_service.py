@@ -0,0 +1,459 @@
+"""
+Tages-Rollups für Berichte und Finanzauswertungen.
+
+Drei Faktentabellen verdichten die Rohdaten auf einen Tag (Ortszeit):
+- DailyAppointmentRollup: Termine je Tag × Behandler × Behandlung × Versicherungsgruppe × Status
+- DailyBillingRollup: BillingItems je Tag × Behandler × Behandlung × Versicherungsgruppe ×
+  Abrechnungsart × abgerechnet
+- DailyInvoiceRollup: Patientenrechnungen je Tag × Status
+
+Fortgeschrieben wird tageweise: Ändert sich ein Termin, eine Abrechnungsposition oder eine
+Rechnung, werden nach dem Commit die betroffenen Tage (alter und neuer Tag) aus den
+Rohdaten neu verdichtet. Das ist eine indizierte Aggregation über einen Tag und bleibt
+damit auch bei großen Datenmengen billig. Je Rollup und Tag gibt es eine Sperrzeile
+(ReportingRollupDay); gleichzeitige Aktualisierungen desselben Tages laufen dadurch
+nacheinander, und die Unique-Constraints der Rollups lassen keine doppelten Zeilen zu. Massenoperationen ohne Signals (bulk_create,
+QuerySet.update) rufen refresh_days direkt auf.
+
+Abhängigkeiten über Relationen (z.B. ein nachträglich geänderter Behandler eines bereits
+abgerechneten Termins) werden nicht verfolgt; der Management-Command
+rebuild_reporting_rollups baut die Tabellen deshalb nächtlich neu auf.
+
+Die Auswertungen (ReportingService, finance_views) lesen nur noch aus den Rollups, sodass
+auch mehrjährige Vergleiche einige hundert bis tausend Zeilen statt Millionen lesen.
+"""
+
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+TRUNCATE = {'week': TruncWeek, 'month': TruncMonth, 'year': TruncYear}
+
+
+def _local_day(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _day_bounds(start_day, end_day):
+    """Tage (einschließlich end_day) -> halboffenes Intervall aus Zeitpunkten in Ortszeit"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _runs(days: Iterable) -> List[tuple]:
+    """Fasst Tage zu zusammenhängenden Bereichen (start, end) zusammen"""
+    runs = []
+    for day in sorted(set(days)):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def _in_period(queryset, start_day, end_day):
+    """Rollup-Zeilen ab start_day bis end_day (einschließlich; None = ohne Ende)"""
+    queryset = queryset.filter(day__gte=start_day)
+    return queryset.filter(day__lte=end_day) if end_day is not None else queryset
+
+
+def _appointment_rows(start_day, end_day):
+    from core.models import Appointment, DailyAppointmentRollup
+
+    start, end = _day_bounds(start_day, end_day)
+    rows = Appointment.objects.filter(
+        appointment_date__gte=start, appointment_date__lt=end
+    ).annotate(
+        day=TruncDate('appointment_date'),
+        group=Coalesce(
+            'patient_insurance__insurance_provider__group_id',
+            'prescription__patient_insurance__insurance_provider__group_id'
+        ),
+    ).values('day', 'practitioner_id', 'treatment_id', 'group', 'status').annotate(
+        count=Count('id'),
+        duration=Sum('duration_minutes'),
+    ).order_by()
+
+    return [
+        DailyAppointmentRollup(
+            day=row['day'],
+            practitioner_id=row['practitioner_id'],
+            treatment_id=row['treatment_id'],
+            insurance_group_id=row['group'],
+            status=row['status'],
+            appointment_count=row['count'],
+            duration_minutes=row['duration'] or 0,
+        )
+        for row in rows
+    ]
+
+
+def _billing_rows(start_day, end_day):
+    from core.models import BillingItem, DailyBillingRollup
+
+    start, end = _day_bounds(start_day, end_day)
+    rows = BillingItem.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).annotate(
+        day=TruncDate('created_at'),
+        group=Coalesce(
+            'appointment__patient_insurance__insurance_provider__group_id',
+            'prescription__patient_insurance__insurance_provider__group_id'
+        ),
+        billing_type=Case(
+            When(is_gkv_billing=True, then=Value('gkv')),
+            When(is_private_billing=True, then=Value('private')),
+            When(is_self_pay_billing=True, then=Value('self_pay')),
+            default=Value('other'),
+        ),
+    ).values(
+        'day', 'appointment__practitioner_id', 'treatment_id', 'group', 'billing_type', 'is_billed'
+    ).annotate(
+        count=Count('id'),
+        insurance=Sum('insurance_amount'),
+        copay=Sum('patient_copay'),
+    ).order_by()
+
+    return [
+        DailyBillingRollup(
+            day=row['day'],
+            practitioner_id=row['appointment__practitioner_id'],
+            treatment_id=row['treatment_id'],
+            insurance_group_id=row['group'],
+            billing_type=row['billing_type'],
+            is_billed=row['is_billed'],
+            item_count=row['count'],
+            insurance_amount=row['insurance'] or ZERO,
+            patient_copay=row['copay'] or ZERO,
+        )
+        for row in rows
+    ]
+
+
+def _invoice_rows(start_day, end_day):
+    from core.models import DailyInvoiceRollup, PatientInvoice
+
+    start, end = _day_bounds(start_day, end_day)
+    rows = PatientInvoice.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).annotate(
+        day=TruncDate('created_at'),
+    ).values('day', 'status').annotate(
+        count=Count('id'),
+        total=Sum('amount'),
+    ).order_by()
+
+    return [
+        DailyInvoiceRollup(
+            day=row['day'],
+            status=row['status'],
+            invoice_count=row['count'],
+            amount=row['total'] or ZERO,
+        )
+        for row in rows
+    ]
+
+
+class ReportingRollupService:
+    """Pflegt die Tages-Rollups und liefert die Auswertungen daraus"""
+
+    # Rollup -> (Rollup-Model, Quell-Model, Datumsfeld der Quelle, Verdichtung)
+    ROLLUPS = {
+        'appointments': ('DailyAppointmentRollup', 'Appointment', 'appointment_date', _appointment_rows),
+        'billing': ('DailyBillingRollup', 'BillingItem', 'created_at', _billing_rows),
+        'invoices': ('DailyInvoiceRollup', 'PatientInvoice', 'created_at', _invoice_rows),
+    }
+
+    # ------------------------------------------------------------------
+    # Fortschreibung
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _models(kind: str):
+        rollup_name, source_name, date_field, build = ReportingRollupService.ROLLUPS[kind]
+        return apps.get_model('core', rollup_name), apps.get_model('core', source_name), date_field, build
+
+    @staticmethod
+    def rollup_for(model) -> Optional[str]:
+        """Rollup, in das ein Quell-Model eingeht (None, falls keins)"""
+        if model._meta.app_label != 'core':
+            return None
+        for kind, (_, source_name, _, _) in ReportingRollupService.ROLLUPS.items():
+            if model.__name__ == source_name:
+                return kind
+        return None
+
+    @staticmethod
+    def _lock_days(kind: str, start_day, end_day):
+        """Legt fehlende Sperrzeilen des Zeitraums an und sperrt alle bis zum Ende der Transaktion"""
+        from core.models import ReportingRollupDay
+
+        days = [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+        ReportingRollupDay.objects.bulk_create(
+            [ReportingRollupDay(kind=kind, day=day) for day in days], ignore_conflicts=True
+        )
+        markers = ReportingRollupDay.objects.filter(kind=kind, day__gte=start_day, day__lte=end_day)
+        list(markers.select_for_update().order_by('day').values_list('id'))
+        return markers
+
+    @staticmethod
+    def refresh_range(kind: str, start_day, end_day) -> int:
+        """Verdichtet die Tage start_day bis end_day (einschließlich) neu; gibt die Anzahl Zeilen zurück"""
+        rollup_model, _, _, build = ReportingRollupService._models(kind)
+        with transaction.atomic():
+            markers = ReportingRollupService._lock_days(kind, start_day, end_day)
+            rows = build(start_day, end_day)
+            rollup_model.objects.filter(day__gte=start_day, day__lte=end_day).delete()
+            rollup_model.objects.bulk_create(rows, batch_size=1000)
+            markers.update(refreshed_at=timezone.now())
+        return len(rows)
+
+    @staticmethod
+    def refresh_days(kind: str, days: Iterable) -> None:
+        """Verdichtet die angegebenen Tage neu (zusammenhängende Tage in einem Schritt)"""
+        for start_day, end_day in _runs(_local_day(day) for day in days if day is not None):
+            ReportingRollupService.refresh_range(kind, start_day, end_day)
+
+    @staticmethod
+    def stored_day(instance):
+        """Tag der gespeicherten Instanz vor dem Speichern (None bei neuen Instanzen)"""
+        kind = ReportingRollupService.rollup_for(type(instance))
+        if kind is None or instance._state.adding or instance.pk is None:
+            return None
+        _, source_model, date_field, _ = ReportingRollupService._models(kind)
+        if source_model._meta.get_field(date_field).auto_now_add:
+            # Unveränderlich, der Tag ist derselbe wie nach dem Speichern
+            return None
+        value = source_model.objects.filter(pk=instance.pk).values_list(date_field, flat=True).first()
+        return _local_day(value)
+
+    @staticmethod
+    def schedule_refresh(instance, old_day=None) -> None:
+        """Verdichtet nach dem Commit den alten und den neuen Tag einer geänderten Instanz neu"""
+        kind = ReportingRollupService.rollup_for(type(instance))
+        if kind is None:
+            return
+        _, _, date_field, _ = ReportingRollupService._models(kind)
+        days = {old_day, _local_day(getattr(instance, date_field, None))} - {None}
+        if not days:
+            return
+
+        def refresh():
+            try:
+                ReportingRollupService.refresh_days(kind, days)
+            except Exception as e:
+                logger.warning(f"Tages-Rollup '{kind}' für {sorted(days)} konnte nicht aktualisiert werden: {e}")
+
+        transaction.on_commit(refresh)
+
+    @staticmethod
+    def rebuild(kinds: Optional[Iterable[str]] = None, start_day=None, end_day=None,
+                chunk_days: int = 31) -> Dict[str, int]:
+        """
+        Baut die Rollups aus den Rohdaten neu auf, blockweise über chunk_days Tage
+        (je Block eine Transaktion).
+
+        Ohne Zeitraum wird der gesamte Datenbestand verdichtet und Rollup-Zeilen außerhalb
+        davon werden gelöscht.
+
+        Returns:
+            {Rollup: Anzahl Zeilen}
+        """
+        results = {}
+        for kind in kinds or ReportingRollupService.ROLLUPS:
+            rollup_model, source_model, date_field, _ = ReportingRollupService._models(kind)
+            first, last = start_day, end_day
+            if first is None or last is None:
+                bounds = source_model.objects.aggregate(first=Min(date_field), last=Max(date_field))
+                first = first or _local_day(bounds['first'])
+                last = last or _local_day(bounds['last'])
+                if start_day is None and end_day is None:
+                    stale = rollup_model.objects.all()
+                    if first is not None:
+                        stale = stale.exclude(day__gte=first, day__lte=last)
+                    stale.delete()
+            if first is None or last is None:
+                results[kind] = 0
+                continue
+
+            total = 0
+            chunk_start = first
+            while chunk_start <= last:
+                chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), last)
+                total += ReportingRollupService.refresh_range(kind, chunk_start, chunk_end)
+                chunk_start = chunk_end + timedelta(days=1)
+            results[kind] = total
+            logger.info(f"Tages-Rollup '{kind}' neu aufgebaut: {total} Zeilen ({first} bis {last})")
+        return results
+
+    # ------------------------------------------------------------------
+    # Auswertungen
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def invoice_totals(start_day, end_day) -> Dict[str, Dict]:
+        """Rechnungen im Zeitraum je Status: {Status: {'count', 'amount'}}"""
+        from core.models import DailyInvoiceRollup
+
+        return {
+            row['status']: {'count': row['total_count'] or 0, 'amount': row['total_amount'] or ZERO}
+            for row in _in_period(DailyInvoiceRollup.objects.all(), start_day, end_day)
+            .values('status').annotate(total_count=Sum('invoice_count'), total_amount=Sum('amount')).order_by()
+        }
+
+    @staticmethod
+    def billing_totals(start_day, end_day) -> Dict:
+        """Summen der Abrechnungspositionen im Zeitraum (Kassenanteil nach Abrechnungsart, Zuzahlungen)"""
+        from core.models import DailyBillingRollup
+
+        totals = _in_period(DailyBillingRollup.objects.all(), start_day, end_day).aggregate(
+            total_items=Sum('item_count'),
+            total_insurance=Sum('insurance_amount'),
+            total_copay=Sum('patient_copay'),
+            gkv_amount=Sum('insurance_amount', filter=Q(billing_type='gkv')),
+            private_amount=Sum('insurance_amount', filter=Q(billing_type='private')),
+            outstanding_amount=Sum('insurance_amount', filter=Q(is_billed=False)),
+        )
+        return {
+            'item_count': totals['total_items'] or 0,
+            'insurance_amount': totals['total_insurance'] or ZERO,
+            'patient_copay': totals['total_copay'] or ZERO,
+            'gkv_amount': totals['gkv_amount'] or ZERO,
+            'private_amount': totals['private_amount'] or ZERO,
+            'outstanding_amount': totals['outstanding_amount'] or ZERO,
+        }
+
+    @staticmethod
+    def revenue_series(start_day, end_day, granularity: str = 'month') -> List[Dict]:
+        """
+        Umsatzverlauf je Tag/Woche/Monat/Jahr.
+
+        Returns:
+            [{'period', 'revenue' (bezahlte Rechnungen), 'open_invoices' (erstellte Rechnungen),
+              'invoice_count', 'insurance_amount', 'gkv_revenue', 'private_revenue',
+              'copay_revenue', 'item_count'}], nach Periode sortiert
+        """
+        from core.models import DailyBillingRollup, DailyInvoiceRollup
+
+        def grouped(queryset):
+            if granularity == 'day':
+                return queryset.annotate(period=F('day'))
+            return queryset.annotate(period=TRUNCATE[granularity]('day'))
+
+        series = {}
+
+        def entry(period):
+            if period not in series:
+                series[period] = {
+                    'period': period, 'revenue': ZERO, 'open_invoices': ZERO, 'invoice_count': 0,
+                    'insurance_amount': ZERO, 'gkv_revenue': ZERO, 'private_revenue': ZERO,
+                    'copay_revenue': ZERO, 'item_count': 0,
+                }
+            return series[period]
+
+        invoices = grouped(_in_period(DailyInvoiceRollup.objects.all(), start_day, end_day))
+        for row in invoices.values('period').annotate(
+            revenue=Sum('amount', filter=Q(status='paid')),
+            open_invoices=Sum('amount', filter=Q(status='created')),
+            total_count=Sum('invoice_count'),
+        ).order_by():
+            values = entry(row['period'])
+            values['revenue'] = row['revenue'] or ZERO
+            values['open_invoices'] = row['open_invoices'] or ZERO
+            values['invoice_count'] = row['total_count'] or 0
+
+        billing = grouped(_in_period(DailyBillingRollup.objects.all(), start_day, end_day))
+        for row in billing.values('period').annotate(
+            total_insurance=Sum('insurance_amount'),
+            gkv_revenue=Sum('insurance_amount', filter=Q(billing_type='gkv')),
+            private_revenue=Sum('insurance_amount', filter=Q(billing_type='private')),
+            copay_revenue=Sum('patient_copay'),
+            total_items=Sum('item_count'),
+        ).order_by():
+            values = entry(row['period'])
+            values['insurance_amount'] = row['total_insurance'] or ZERO
+            for name in ('gkv_revenue', 'private_revenue', 'copay_revenue'):
+                values[name] = row[name] or ZERO
+            values['item_count'] = row['total_items'] or 0
+
+        return [series[period] for period in sorted(series)]
+
+    @staticmethod
+    def billing_breakdown(fields: List[str], start_day, end_day, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Abrechnungspositionen gruppiert nach Dimensionen des Rollups (z.B. 'treatment__treatment_name',
+        'insurance_group__name'), nach Kassenanteil absteigend.
+        """
+        from core.models import DailyBillingRollup
+
+        rows = _in_period(DailyBillingRollup.objects.all(), start_day, end_day).values(*fields).annotate(
+            total_insurance=Sum('insurance_amount'),
+            total_copay=Sum('patient_copay'),
+            total_items=Sum('item_count'),
+        ).order_by('-total_insurance')
+
+        result = []
+        for row in rows[:limit] if limit else rows:
+            row['insurance_amount'] = row.pop('total_insurance') or ZERO
+            row['patient_copay'] = row.pop('total_copay') or ZERO
+            row['item_count'] = row.pop('total_items') or 0
+            result.append(row)
+        return result
+
+    @staticmethod
+    def appointment_breakdown(fields: List[str], start_day, end_day) -> List[Dict]:
+        """
+        Termine gruppiert nach Dimensionen des Rollups (z.B. 'treatment__treatment_name') mit
+        Anzahl je Status und mittlerer Dauer, nach Anzahl absteigend.
+        """
+        from core.models import DailyAppointmentRollup
+
+        rows = _in_period(DailyAppointmentRollup.objects.all(), start_day, end_day).values(*fields).annotate(
+            total_appointments=Sum('appointment_count'),
+            completed_appointments=Coalesce(Sum('appointment_count', filter=Q(status='completed')), 0),
+            cancelled_appointments=Coalesce(Sum('appointment_count', filter=Q(status='cancelled')), 0),
+            no_show_appointments=Coalesce(Sum('appointment_count', filter=Q(status='no_show')), 0),
+            total_duration=Sum('duration_minutes'),
+        ).order_by('-total_appointments')
+
+        result = []
+        for row in rows:
+            total = row.pop('total_duration') or 0
+            row['avg_duration'] = total / row['total_appointments'] if row['total_appointments'] else None
+            result.append(row)
+        return result
+
+    @staticmethod
+    def self_pay_revenue(start_day, end_day) -> Dict:
+        """Abgeschlossene Selbstzahler-Termine im Zeitraum zum aktuellen Selbstzahlerpreis"""
+        from core.models import DailyAppointmentRollup
+
+        totals = _in_period(DailyAppointmentRollup.objects.all(), start_day, end_day).filter(
+            status='completed', treatment__is_self_pay=True
+        ).aggregate(
+            total_revenue=Sum(
+                F('appointment_count') * F('treatment__self_pay_price'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            ),
+            total_appointments=Sum('appointment_count'),
+        )
+        return {
+            'total_revenue': totals['total_revenue'],
+            'total_appointments': totals['total_appointments'] or 0,
+        }
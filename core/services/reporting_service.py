@@ -2,11 +2,11 @@ import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Sum, Count, Avg, Q, F
-from django.db.models.functions import TruncMonth, TruncWeek, TruncDay
 from core.models import (
     Appointment, Patient, Prescription, Treatment, BillingCycle, 
     BillingItem, Practitioner, Room, Waitlist, UserActivityLog
 )
+from core.services.reporting_rollup_service import ReportingRollupService
 
 logger = logging.getLogger(__name__)
 
@@ -21,51 +21,46 @@ class ReportingService:
             
             if period == 'week':
                 start_date = now - timedelta(days=7)
-                group_by = TruncWeek
+                granularity = 'week'
             elif period == 'month':
                 start_date = now - timedelta(days=30)
-                group_by = TruncMonth
+                granularity = 'month'
             elif period == 'quarter':
                 start_date = now - timedelta(days=90)
-                group_by = TruncMonth
+                granularity = 'month'
             elif period == 'year':
                 start_date = now - timedelta(days=365)
-                group_by = TruncMonth
+                granularity = 'month'
             else:
                 start_date = now - timedelta(days=30)
-                group_by = TruncMonth
-            
-            # Abrechnungsstatistiken
-            billing_stats = BillingItem.objects.filter(
-                created_at__gte=start_date
-            ).aggregate(
-                total_insurance_amount=Sum('insurance_amount'),
-                total_patient_copay=Sum('patient_copay'),
-                total_items=Count('id'),
-                avg_insurance_amount=Avg('insurance_amount'),
-                avg_patient_copay=Avg('patient_copay')
-            )
+                granularity = 'month'
+            start_day = timezone.localtime(start_date).date()
+            
+            # Abrechnungsstatistiken (aus den Tages-Rollups)
+            totals = ReportingRollupService.billing_totals(start_day, None)
+            item_count = totals['item_count']
+            billing_stats = {
+                'total_insurance_amount': totals['insurance_amount'],
+                'total_patient_copay': totals['patient_copay'],
+                'total_items': item_count,
+                'avg_insurance_amount': totals['insurance_amount'] / item_count if item_count else None,
+                'avg_patient_copay': totals['patient_copay'] / item_count if item_count else None,
+            }
             
             # Termin-basierte Einnahmen (Selbstzahler)
-            appointment_revenue = Appointment.objects.filter(
-                appointment_date__gte=start_date,
-                treatment__is_self_pay=True,
-                status='completed'
-            ).aggregate(
-                total_revenue=Sum('treatment__self_pay_price'),
-                total_appointments=Count('id')
-            )
+            appointment_revenue = ReportingRollupService.self_pay_revenue(start_day, None)
             
             # Monatliche Entwicklung
-            monthly_trend = BillingItem.objects.filter(
-                created_at__gte=start_date
-            ).annotate(
-                month=group_by('created_at')
-            ).values('month').annotate(
-                insurance_amount=Sum('insurance_amount'),
-                patient_copay=Sum('patient_copay'),
-                total_items=Count('id')
-            ).order_by('month')
+            monthly_trend = [
+                {
+                    'month': row['period'],
+                    'insurance_amount': row['insurance_amount'],
+                    'patient_copay': row['copay_revenue'],
+                    'total_items': row['item_count'],
+                }
+                for row in ReportingRollupService.revenue_series(start_day, None, granularity)
+                if row['item_count']
+            ]
             
             return {
                 'period': period,
@@ -73,7 +68,7 @@ class ReportingService:
                 'end_date': now,
                 'billing_stats': billing_stats,
                 'appointment_revenue': appointment_revenue,
-                'monthly_trend': list(monthly_trend),
+                'monthly_trend': monthly_trend,
                 'total_revenue': (
                     (billing_stats['total_insurance_amount'] or 0) +
                     (billing_stats['total_patient_copay'] or 0) +
@@ -92,16 +87,12 @@ class ReportingService:
             now = timezone.now()
             start_date = now - timedelta(days=30 if period == 'month' else 90)
             
-            # Behandlungsstatistiken
-            treatment_stats = Appointment.objects.filter(
-                appointment_date__gte=start_date
-            ).values('treatment__treatment_name').annotate(
-                total_appointments=Count('id'),
-                completed_appointments=Count('id', filter=Q(status='completed')),
-                cancelled_appointments=Count('id', filter=Q(status='cancelled')),
-                no_show_appointments=Count('id', filter=Q(status='no_show')),
-                avg_duration=Avg('duration_minutes')
-            ).order_by('-total_appointments')
+            start_day = timezone.localtime(start_date).date()
+            
+            # Behandlungsstatistiken (aus den Tages-Rollups, inkl. geplanter Termine)
+            treatment_stats = ReportingRollupService.appointment_breakdown(
+                ['treatment__treatment_name'], start_day, None
+            )
             
             # Erfolgsquoten berechnen
             for stat in treatment_stats:
@@ -112,13 +103,9 @@ class ReportingService:
                 stat['no_show_rate'] = round((stat['no_show_appointments'] / total * 100), 2) if total > 0 else 0
             
             # Behandler-Performance
-            practitioner_stats = Appointment.objects.filter(
-                appointment_date__gte=start_date
-            ).values('practitioner__first_name', 'practitioner__last_name').annotate(
-                total_appointments=Count('id'),
-                completed_appointments=Count('id', filter=Q(status='completed')),
-                avg_duration=Avg('duration_minutes')
-            ).order_by('-total_appointments')
+            practitioner_stats = ReportingRollupService.appointment_breakdown(
+                ['practitioner__first_name', 'practitioner__last_name'], start_day, None
+            )
             
             # Erfolgsquoten für Behandler
             for stat in practitioner_stats:
@@ -129,8 +116,8 @@ class ReportingService:
             
             return {
                 'period': period,
-                'treatment_stats': list(treatment_stats),
-                'practitioner_stats': list(practitioner_stats),
+                'treatment_stats': treatment_stats,
+                'practitioner_stats': practitioner_stats,
                 'total_appointments': sum(stat['total_appointments'] for stat in treatment_stats),
                 'overall_success_rate': round(
                     sum(stat['completed_appointments'] for stat in treatment_stats) / 
@@ -2,11 +2,12 @@ import logging
 import re
 import hashlib
 import secrets
+import time
 from typing import Dict, List, Optional, Any
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ValidationError
-from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timezone as dt_timezone
 import json
 
 logger = logging.getLogger(__name__)
@@ -22,7 +23,7 @@ class SecurityService:
             'lockout_minutes': 30
         },
         'api_requests': {
-            'max_requests': 100,
+            'max_requests': 600,
             'window_minutes': 1
         },
         'password_reset': {
@@ -272,14 +273,90 @@ class SecurityService:
         return result
 
 class RateLimiter:
-    """Rate Limiting für API-Endpunkte"""
-    
-    def __init__(self):
-        self.attempts = {}
-    
+    """
+    Rate Limiting für API-Endpunkte über den Django-Cache.
+
+    Zählt Versuche in zwei festen Zeitfenstern (aktuelles und vorheriges) und gewichtet das
+    vorherige anteilig (gleitendes Fenster). Jeder Versuch ist ein atomares cache.incr, jede
+    Prüfung ein get_many – O(1) pro Anfrage und über alle Worker-Prozesse hinweg konsistent,
+    da alle denselben Cache (Redis, locmem, Datei) nutzen. Die Zähler laufen per TTL ab.
+    """
+
+    KEY_PREFIX = 'ratelimit'
+
+    def __init__(self, cache_alias: str = 'default'):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _config(limit_type: str) -> Optional[Dict[str, int]]:
+        # settings.RATE_LIMITS überschreibt einzelne Werte; max_requests/max_attempts 0 schaltet das Limit ab
+        config = {
+            **SecurityService.RATE_LIMIT_CONFIG.get(limit_type, {}),
+            **getattr(settings, 'RATE_LIMITS', {}).get(limit_type, {}),
+        }
+        if not config.get('max_attempts', config.get('max_requests')):
+            return None
+        return {
+            'max_attempts': config.get('max_attempts', config.get('max_requests')),
+            'window_seconds': config['window_minutes'] * 60,
+            'lockout_seconds': config.get('lockout_minutes', 0) * 60,
+        }
+
+    def _key(self, identifier: str, limit_type: str, suffix) -> str:
+        # Identifier (z.B. IP + Benutzername) nur gehasht im Cache-Key
+        digest = hashlib.sha256(str(identifier).encode('utf-8')).hexdigest()[:32]
+        return f"{self.KEY_PREFIX}:{limit_type}:{digest}:{suffix}"
+
+    def _window_keys(self, identifier: str, limit_type: str, window_seconds: int, now: float):
+        index = int(now // window_seconds)
+        elapsed = (now - index * window_seconds) / window_seconds
+        return (
+            self._key(identifier, limit_type, index),
+            self._key(identifier, limit_type, index - 1),
+            elapsed,
+            (index + 1) * window_seconds,
+        )
+
+    def _increment(self, key: str, timeout: int) -> int:
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Zwischen add und incr abgelaufen
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def _status(self, config, estimate: float, reset_at: float, lockout_until: Optional[float]) -> Dict[str, Any]:
+        if lockout_until:
+            minutes = config['lockout_seconds'] // 60
+            return {
+                'allowed': False,
+                'remaining': 0,
+                'lockout_until': datetime.fromtimestamp(lockout_until, tz=dt_timezone.utc),
+                'message': f"Zu viele Versuche. Bitte warten Sie {minutes} Minuten."
+            }
+
+        max_attempts = config['max_attempts']
+        if estimate > max_attempts:
+            return {
+                'allowed': False,
+                'remaining': 0,
+                'reset_time': datetime.fromtimestamp(reset_at, tz=dt_timezone.utc),
+                'message': "Zu viele Anfragen. Bitte versuchen Sie es später erneut."
+            }
+        return {
+            'allowed': True,
+            'remaining': max(0, int(max_attempts - estimate)),
+            'reset_time': datetime.fromtimestamp(reset_at, tz=dt_timezone.utc)
+        }
+
     def check_rate_limit(self, identifier: str, limit_type: str) -> Dict[str, Any]:
         """
-        Prüft Rate Limits
+        Prüft Rate Limits, ohne einen Versuch zu zählen
         
         Args:
             identifier: Eindeutiger Identifier (z.B. IP, User-ID)
@@ -288,61 +365,79 @@ class RateLimiter:
         Returns:
             Rate Limit Status
         """
-        config = SecurityService.RATE_LIMIT_CONFIG.get(limit_type, {})
+        config = self._config(limit_type)
         if not config:
             return {'allowed': True, 'remaining': 999}
-        
-        now = timezone.now()
-        key = f"{identifier}:{limit_type}"
-        
-        # Alte Einträge entfernen
-        if key in self.attempts:
-            window_start = now - timedelta(minutes=config['window_minutes'])
-            self.attempts[key] = [attempt for attempt in self.attempts[key] if attempt > window_start]
-        else:
-            self.attempts[key] = []
-        
-        # Limit prüfen
-        current_attempts = len(self.attempts[key])
-        max_attempts = config['max_attempts']
-        
-        if current_attempts >= max_attempts:
-            # Lockout prüfen
-            if 'lockout_minutes' in config:
-                oldest_attempt = min(self.attempts[key])
-                lockout_until = oldest_attempt + timedelta(minutes=config['lockout_minutes'])
-                
-                if now < lockout_until:
-                    return {
-                        'allowed': False,
-                        'remaining': 0,
-                        'lockout_until': lockout_until,
-                        'message': f"Zu viele Versuche. Bitte warten Sie {config['lockout_minutes']} Minuten."
-                    }
-                else:
-                    # Lockout vorbei, Reset
-                    self.attempts[key] = []
-                    current_attempts = 0
-        
-        return {
-            'allowed': True,
-            'remaining': max_attempts - current_attempts,
-            'reset_time': now + timedelta(minutes=config['window_minutes'])
-        }
+
+        current_key, previous_key, elapsed, reset_at = self._window_keys(
+            identifier, limit_type, config['window_seconds'], time.time()
+        )
+        lockout_key = self._key(identifier, limit_type, 'lockout')
+        values = self.cache.get_many([current_key, previous_key, lockout_key])
+
+        # Der nächste Versuch darf das Limit gerade noch erreichen
+        estimate = values.get(current_key, 0) + values.get(previous_key, 0) * (1 - elapsed) + 1
+        return self._status(config, estimate, reset_at, values.get(lockout_key))
+
+    def hit(self, identifier: str, limit_type: str) -> Dict[str, Any]:
+        """
+        Zählt einen Versuch und prüft im selben Schritt das Limit (für Throttles).
+        Abgelehnte Versuche werden nicht gezählt.
+        """
+        config = self._config(limit_type)
+        if not config:
+            return {'allowed': True, 'remaining': 999}
+
+        lockout_key = self._key(identifier, limit_type, 'lockout')
+        lockout_until = self.cache.get(lockout_key)
+        current_key, previous_key, elapsed, reset_at = self._window_keys(
+            identifier, limit_type, config['window_seconds'], time.time()
+        )
+        if lockout_until:
+            return self._status(config, 0, reset_at, lockout_until)
+
+        current = self._increment(current_key, config['window_seconds'] * 2)
+        estimate = current + self.cache.get(previous_key, 0) * (1 - elapsed)
+        status = self._status(config, estimate, reset_at, None)
+        if not status['allowed']:
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            status = self._lock_out(identifier, limit_type, config) or status
+        return status
+
+    def _lock_out(self, identifier: str, limit_type: str, config) -> Optional[Dict[str, Any]]:
+        """Sperrt den Identifier für lockout_minutes, sofern konfiguriert"""
+        if not config['lockout_seconds']:
+            return None
+        lockout_key = self._key(identifier, limit_type, 'lockout')
+        self.cache.add(lockout_key, time.time() + config['lockout_seconds'], config['lockout_seconds'])
+        logger.warning(f"Rate Limit '{limit_type}' überschritten, Sperre für {config['lockout_seconds'] // 60} Minuten")
+        return self._status(config, 0, 0, self.cache.get(lockout_key))
     
     def record_attempt(self, identifier: str, limit_type: str) -> None:
         """Zeichnet einen Versuch auf"""
-        key = f"{identifier}:{limit_type}"
-        if key not in self.attempts:
-            self.attempts[key] = []
-        
-        self.attempts[key].append(timezone.now())
+        config = self._config(limit_type)
+        if not config:
+            return
+
+        current_key, previous_key, elapsed, _ = self._window_keys(
+            identifier, limit_type, config['window_seconds'], time.time()
+        )
+        current = self._increment(current_key, config['window_seconds'] * 2)
+        if current + self.cache.get(previous_key, 0) * (1 - elapsed) >= config['max_attempts']:
+            self._lock_out(identifier, limit_type, config)
     
     def reset_attempts(self, identifier: str, limit_type: str) -> None:
         """Setzt Versuche zurück"""
-        key = f"{identifier}:{limit_type}"
-        if key in self.attempts:
-            del self.attempts[key]
+        config = self._config(limit_type)
+        if not config:
+            return
+        current_key, previous_key, _, _ = self._window_keys(
+            identifier, limit_type, config['window_seconds'], time.time()
+        )
+        self.cache.delete_many([current_key, previous_key, self._key(identifier, limit_type, 'lockout')])
 
 # Globale Rate Limiter Instanz
 rate_limiter = RateLimiter()
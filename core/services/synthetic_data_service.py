@@ -0,0 +1,533 @@
+"""
+Generator für synthetische Praxisdaten in realistischer Größenordnung.
+
+Erzeugt reproduzierbar (fester Seed) eine komplette Praxis: Krankenkassen mit
+Preisperioden, Ärzte, Therapeuten mit Arbeitszeiten, Räume, Patienten mit Versicherung,
+Verordnungsketten mit Folgeverordnungen, Termine, Abrechnungszyklen mit Positionen und
+Zuzahlungsrechnungen. Alle Massendaten werden patientenblockweise per bulk_create
+geschrieben; abgeleitete Daten (Kettenfelder, Finanzübersicht, Dashboard-Snapshot,
+Tages-Rollups) werden direkt mitgeführt bzw. am Ende neu berechnet, da bulk_create keine
+Signals auslöst.
+
+Gedacht für Entwicklungs- und Benchmark-Datenbanken (siehe run_benchmarks), nicht für
+Produktivsysteme.
+"""
+
+import logging
+import random
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import (
+    Appointment, BillingCycle, BillingItem, Bundesland, Category, Doctor, ICDCode,
+    InsuranceProvider, InsuranceProviderGroup, Patient, PatientInsurance, PatientInvoice,
+    Practice, Practitioner, Prescription, PriceList, Room, Surcharge, Treatment,
+    TreatmentPrice, TreatmentType, WorkingHour
+)
+
+logger = logging.getLogger(__name__)
+
+# Vordefinierte Größen (Patienten, Termine)
+SCALES = {
+    'small': {'patients': 500, 'appointments': 20_000},
+    'medium': {'patients': 5_000, 'appointments': 200_000},
+    'large': {'patients': 50_000, 'appointments': 2_000_000},
+}
+
+# Name, Dauer, Positionsnummer, AC, TK, GKV-Preis (aktuelles Jahr), Privatpreis, Selbstzahler, Gewicht
+TREATMENT_CATALOG = [
+    ('Krankengymnastik', 20, 'X0501', '201', '11', '28.35', '36.00', False, 40),
+    ('Manuelle Therapie', 20, 'X1201', '201', '12', '33.65', '42.00', False, 20),
+    ('Manuelle Lymphdrainage 45 Min.', 45, 'X0205', '201', '13', '53.50', '62.00', False, 10),
+    ('Klassische Massagetherapie', 20, 'X0106', '201', '14', '19.90', '28.00', False, 8),
+    ('KG-ZNS nach Bobath', 30, 'X0708', '201', '15', '46.35', '55.00', False, 8),
+    ('Wärmetherapie mittels Heißer Rolle', 10, 'X1530', '201', '16', '11.10', '15.00', False, 6),
+    ('Elektrotherapie', 10, 'X1620', '201', '17', '7.45', '12.00', False, 4),
+    ('Osteopathie', 60, None, None, None, None, '95.00', True, 4),
+]
+
+ICD_CODES = [
+    ('M54.5', 'Kreuzschmerz'),
+    ('M54.2', 'Zervikalneuralgie'),
+    ('M25.56', 'Gelenkschmerz Unterschenkel'),
+    ('M75.1', 'Läsionen der Rotatorenmanschette'),
+    ('M17.1', 'Sonstige primäre Gonarthrose'),
+    ('M16.1', 'Sonstige primäre Koxarthrose'),
+    ('S83.2', 'Meniskusriss, akut'),
+    ('I89.0', 'Lymphödem'),
+    ('G81.9', 'Hemiparese und Hemiplegie'),
+    ('M51.2', 'Sonstige näher bezeichnete Bandscheibenverlagerung'),
+]
+
+GKV_PROVIDERS = ['AOK', 'Barmer', 'Techniker Krankenkasse', 'DAK-Gesundheit', 'IKK classic',
+                 'KKH', 'hkk', 'BKK Mobil Oil', 'HEK', 'Knappschaft']
+PRIVATE_PROVIDERS = ['Allianz PKV', 'Debeka', 'DKV', 'Signal Iduna', 'HUK-Coburg']
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannah', 'Jonas', 'Karl',
+               'Lena', 'Maria', 'Noah', 'Olga', 'Paul', 'Rita', 'Sophie', 'Tim', 'Ute', 'Walter']
+LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker',
+              'Schulz', 'Hoffmann', 'Koch', 'Richter', 'Klein', 'Wolf', 'Neumann', 'Schwarz']
+CITIES = [('Lemgo', '32657'), ('Detmold', '32756'), ('Bielefeld', '33602'), ('Lage', '32791'),
+          ('Bad Salzuflen', '32105'), ('Blomberg', '32825')]
+STREETS = ['Hauptstraße', 'Bahnhofstraße', 'Lindenweg', 'Kirchplatz', 'Am Markt', 'Gartenstraße']
+
+WORKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+PRICE_INCREASE_PER_YEAR = Decimal('1.04')
+COPAY_RATE = Decimal('0.10')
+BILLING_LAG_DAYS = 45  # jüngere vergangene Termine sind noch nicht abgerechnet
+CENT = Decimal('0.01')
+
+# Therapeuten, Ärzte je Patient
+PATIENTS_PER_PRACTITIONER = 800
+PATIENTS_PER_DOCTOR = 250
+
+
+def _quarter_start(value: date) -> date:
+    return date(value.year, 3 * ((value.month - 1) // 3) + 1, 1)
+
+
+def _quarter_end(value: date) -> date:
+    start = _quarter_start(value)
+    next_start = date(start.year + (start.month + 3 > 12), (start.month + 2) % 12 + 1, 1)
+    return next_start - timedelta(days=1)
+
+
+class SyntheticPracticeGenerator:
+    """Erzeugt eine synthetische Praxis mit der gewünschten Anzahl Patienten und Termine"""
+
+    def __init__(self, patients: int, appointments: int, seed: int = 42, batch_size: int = 1000,
+                 history_days: int = 730, future_days: int = 60,
+                 progress_callback: Optional[Callable[[str], None]] = None):
+        self.patients = patients
+        self.appointments = appointments
+        self.seed = seed
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.progress = progress_callback or (lambda message: None)
+
+        self.today = timezone.localdate()
+        self.history_start = self.today - timedelta(days=history_days)
+        self.horizon = self.today + timedelta(days=future_days)
+        self.now = timezone.now()
+        self.counts = defaultdict(int)
+
+    # ------------------------------------------------------------------
+    # Ablauf
+    # ------------------------------------------------------------------
+
+    def generate(self) -> Dict[str, int]:
+        """Erzeugt alle Daten; gibt die Anzahl der angelegten Datensätze je Modell zurück"""
+        from core.services.dashboard_stats_service import DashboardStatsService
+        from core.services.price_resolver import PriceResolver
+        from core.services.reporting_rollup_service import ReportingRollupService
+
+        self._create_reference_data()
+        PriceResolver.invalidate()
+
+        appointments_per_patient = self.appointments / max(self.patients, 1)
+        chunk_size = max(1, self.batch_size)
+        for offset in range(0, self.patients, chunk_size):
+            size = min(chunk_size, self.patients - offset)
+            with transaction.atomic():
+                self._create_patient_block(offset, size, appointments_per_patient)
+            self.progress(
+                f"{offset + size}/{self.patients} Patienten, {self.counts['appointments']} Termine"
+            )
+
+        DashboardStatsService.recompute()
+        ReportingRollupService.rebuild()
+        logger.info(f"Synthetische Praxisdaten erzeugt (Seed {self.seed}): {dict(self.counts)}")
+        return dict(self.counts)
+
+    # ------------------------------------------------------------------
+    # Stammdaten
+    # ------------------------------------------------------------------
+
+    def _create_reference_data(self) -> None:
+        bundesland, _ = Bundesland.objects.get_or_create(
+            abbreviation='NW', defaults={'name': 'Nordrhein-Westfalen'}
+        )
+        if not Practice.objects.exists():
+            Practice.objects.create(
+                name='Physiotherapie am Markt', bundesland=bundesland, street_address='Am Markt 1',
+                postal_code='32657', city='Lemgo', phone='05261 12345', email='praxis@example.com',
+                institution_code='123456789', tax_id='313/5753/1234'
+            )
+
+        self._create_treatments()
+        self._create_insurance_providers()
+        self._create_price_periods()
+
+        self.icd_codes = []
+        for code, title in ICD_CODES:
+            icd, _ = ICDCode.objects.get_or_create(code=code, defaults={'title': title})
+            self.icd_codes.append(icd)
+
+        doctor_count = max(5, self.patients // PATIENTS_PER_DOCTOR)
+        Doctor.objects.bulk_create([
+            Doctor(
+                first_name=self.rng.choice(FIRST_NAMES), last_name=f'{self.rng.choice(LAST_NAMES)}',
+                license_number=f'SYN-LANR-{index:06d}', email=f'arzt{index}@example.com',
+                phone_number='05261 98765'
+            )
+            for index in range(doctor_count)
+        ], ignore_conflicts=True)
+        self.doctor_ids = list(
+            Doctor.objects.filter(license_number__startswith='SYN-LANR-').values_list('id', flat=True)[:doctor_count]
+        )
+
+        practitioner_count = max(3, self.patients // PATIENTS_PER_PRACTITIONER)
+        self.practitioner_ids = []
+        for index in range(practitioner_count):
+            practitioner, _ = Practitioner.objects.get_or_create(
+                email=f'therapeut{index}@synthetic.example.com',
+                defaults={'first_name': FIRST_NAMES[index % len(FIRST_NAMES)],
+                          'last_name': f'Therapeut {index + 1}'}
+            )
+            self.practitioner_ids.append(practitioner.id)
+        WorkingHour.objects.bulk_create([
+            WorkingHour(practitioner_id=practitioner_id, day_of_week=day, start_time=time(8),
+                        end_time=time(18), valid_from=date(2000, 1, 1))
+            for practitioner_id in self.practitioner_ids for day in WORKDAYS
+        ], ignore_conflicts=True)
+
+        self.room_ids = []
+        for index in range(max(2, practitioner_count)):
+            room, _ = Room.objects.get_or_create(name=f'Behandlungsraum {index + 1}')
+            self.room_ids.append(room.id)
+
+    def _create_treatments(self) -> None:
+        category, _ = Category.objects.get_or_create(name='Physiotherapie')
+        self.treatments = []
+        self.treatment_weights = []
+        for name, duration, position, ac, tk, gkv, private, self_pay, weight in TREATMENT_CATALOG:
+            treatment, _ = Treatment.objects.get_or_create(
+                treatment_name=name,
+                defaults={
+                    'description': name, 'duration_minutes': duration, 'category': category,
+                    'position_number': position, 'accounting_code': ac, 'tariff_indicator': tk,
+                    'legs_code': f'{ac}.{tk}' if ac else None, 'is_self_pay': self_pay,
+                    'self_pay_price': Decimal(private) if self_pay else None,
+                }
+            )
+            treatment.catalog_gkv_price = Decimal(gkv) if gkv else None
+            treatment.catalog_private_price = Decimal(private)
+            self.treatments.append(treatment)
+            self.treatment_weights.append(weight)
+
+    def _create_insurance_providers(self) -> None:
+        self.gkv_group, _ = InsuranceProviderGroup.objects.get_or_create(name='Gesetzliche Krankenkassen')
+        self.private_group, _ = InsuranceProviderGroup.objects.get_or_create(name='Private Krankenversicherungen')
+
+        self.gkv_providers = []
+        self.private_providers = []
+        for index, name in enumerate(GKV_PROVIDERS):
+            provider, _ = InsuranceProvider.objects.get_or_create(
+                provider_id=f'SYN-GKV-{index:03d}', defaults={'name': name, 'group': self.gkv_group}
+            )
+            self.gkv_providers.append(provider)
+        for index, name in enumerate(PRIVATE_PROVIDERS):
+            provider, _ = InsuranceProvider.objects.get_or_create(
+                provider_id=f'SYN-PKV-{index:03d}', defaults={'name': name, 'group': self.private_group}
+            )
+            self.private_providers.append(provider)
+
+        # Abrechnungszyklen je Kasse und Quartal
+        self.billing_cycles = {}
+        quarter = _quarter_start(self.history_start)
+        while quarter <= self.today:
+            for provider in self.gkv_providers + self.private_providers:
+                cycle, _ = BillingCycle.objects.get_or_create(
+                    insurance_provider=provider, start_date=quarter,
+                    defaults={'end_date': _quarter_end(quarter), 'status': 'completed'}
+                )
+                self.billing_cycles[(provider.id, quarter)] = cycle.id
+            quarter = _quarter_end(quarter) + timedelta(days=1)
+
+    def _year_factor(self, year: int) -> Decimal:
+        return PRICE_INCREASE_PER_YEAR ** (year - self.today.year)
+
+    def _price(self, base: Decimal, year: int) -> Decimal:
+        return (base * self._year_factor(year)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def _create_price_periods(self) -> None:
+        """Jährliche Preisperioden: Surcharge je Kassengruppe und TreatmentPrice je Preisliste"""
+        treatment_type = (
+            TreatmentType.objects.filter(type_code='mixed').first()
+            or TreatmentType.objects.create(type_code='mixed', name='Gemischt')
+        )
+        years = range(self.history_start.year, self.horizon.year + 1)
+
+        existing = set(Surcharge.objects.filter(
+            treatment__in=self.treatments
+        ).values_list('treatment_id', 'insurance_provider_group_id', 'valid_from'))
+        surcharges = []
+        for treatment in self.treatments:
+            if treatment.catalog_gkv_price is None:
+                continue
+            for year in years:
+                valid_from = date(year, 1, 1)
+                gkv_price = self._price(treatment.catalog_gkv_price, year)
+                private_price = self._price(treatment.catalog_private_price, year)
+                for group, insurance, copay in (
+                    (self.gkv_group, gkv_price - (gkv_price * COPAY_RATE).quantize(CENT), (gkv_price * COPAY_RATE).quantize(CENT)),
+                    (self.private_group, private_price, Decimal('0.00')),
+                ):
+                    if (treatment.id, group.id, valid_from) in existing:
+                        continue
+                    surcharges.append(Surcharge(
+                        treatment=treatment, insurance_provider_group=group, insurance_payment=insurance,
+                        patient_payment=copay, valid_from=valid_from, valid_until=date(year, 12, 31)
+                    ))
+        Surcharge.objects.bulk_create(surcharges, batch_size=self.batch_size)
+        self.counts['surcharges'] += len(surcharges)
+
+        prices = []
+        for year in years:
+            price_list, created = PriceList.objects.get_or_create(
+                name=f'Preisliste {year}', treatment_type=treatment_type,
+                defaults={'valid_from': date(year, 1, 1), 'valid_until': date(year, 12, 31)}
+            )
+            if not created:
+                continue
+            for treatment in self.treatments:
+                gkv_price = self._price(treatment.catalog_gkv_price, year) if treatment.catalog_gkv_price else None
+                private_price = self._price(treatment.catalog_private_price, year)
+                prices.append(TreatmentPrice(
+                    treatment=treatment, price_list=price_list, gkv_price=gkv_price,
+                    copayment_amount=(gkv_price * COPAY_RATE).quantize(CENT) if gkv_price else None,
+                    private_price=private_price, self_pay_price=private_price
+                ))
+        TreatmentPrice.objects.bulk_create(prices, batch_size=self.batch_size)
+        self.counts['treatment_prices'] += len(prices)
+
+    # ------------------------------------------------------------------
+    # Patientenblöcke
+    # ------------------------------------------------------------------
+
+    def _create_patient_block(self, offset: int, size: int, appointments_per_patient: float) -> None:
+        rng = self.rng
+        patients = []
+        for index in range(offset, offset + size):
+            city, postal_code = rng.choice(CITIES)
+            patients.append(Patient(
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                dob=date(rng.randint(1935, 2015), rng.randint(1, 12), rng.randint(1, 28)),
+                gender=rng.choice(['Male', 'Female']), email=f'patient{self.seed}-{index}@example.com',
+                phone_number=f'+49521{index:07d}', street_address=f'{rng.choice(STREETS)} {rng.randint(1, 120)}',
+                city=city, postal_code=postal_code, country='Deutschland'
+            ))
+        Patient.objects.bulk_create(patients, batch_size=self.batch_size)
+        self.counts['patients'] += len(patients)
+
+        insurances = []
+        for patient in patients:
+            is_private = rng.random() < 0.12
+            provider = rng.choice(self.private_providers if is_private else self.gkv_providers)
+            insurances.append(PatientInsurance(
+                patient=patient, insurance_provider=provider, is_private=is_private,
+                insurance_number=f'{"P" if is_private else "A"}{patient.id:09d}',
+                valid_from=self.history_start - timedelta(days=rng.randint(30, 3650))
+            ))
+        PatientInsurance.objects.bulk_create(insurances, batch_size=self.batch_size)
+        self.counts['patient_insurances'] += len(insurances)
+
+        chains = []
+        for patient, insurance in zip(patients, insurances):
+            quota = max(1, round(rng.gauss(appointments_per_patient, appointments_per_patient * 0.3)))
+            chains.extend(self._plan_chains(patient, insurance, quota))
+
+        prescriptions = self._create_prescriptions(chains)
+        appointments = self._create_appointments(chains)
+        self._create_billing(appointments)
+        self._create_invoices(appointments)
+
+        from core.services.prescription_finance_service import PrescriptionFinanceService
+        PrescriptionFinanceService.refresh([p.id for p in prescriptions])
+
+    def _plan_chains(self, patient, insurance, quota: int) -> List[List[Dict]]:
+        """Verordnungsketten (Erst- plus 0-2 Folgeverordnungen) mit geplanten Terminen"""
+        rng = self.rng
+        chains = []
+        planned = 0
+        span_days = max(1, (self.horizon - self.history_start).days - 21)
+        while planned < quota:
+            treatment = rng.choices(self.treatments, weights=self.treatment_weights)[0]
+            practitioner_id = rng.choice(self.practitioner_ids)
+            start = self.history_start + timedelta(days=rng.randrange(span_days))
+            chain = []
+            for _ in range(rng.choice([1, 1, 2, 2, 3])):
+                if planned >= quota or start > self.horizon:
+                    break
+                sessions = rng.choice([6, 6, 8, 10, 10, 12])
+                frequency = rng.choice(['weekly_1', 'weekly_2', 'weekly_2'])
+                step_days = (7,) if frequency == 'weekly_1' else (3, 4)
+                hour = rng.randint(8, 17)
+                minute = rng.choice([0, 30])
+
+                appointments = []
+                day = start
+                for session in range(sessions):
+                    if day > self.horizon or planned >= quota:
+                        break
+                    if day.weekday() >= 5:
+                        day += timedelta(days=7 - day.weekday())
+                    appointments.append(self._plan_appointment(day, hour, minute))
+                    planned += 1
+                    day += timedelta(days=step_days[session % len(step_days)])
+
+                chain.append({
+                    'patient': patient, 'insurance': insurance, 'treatment': treatment,
+                    'practitioner_id': practitioner_id, 'sessions': sessions, 'frequency': frequency,
+                    'date': start - timedelta(days=rng.randint(1, 14)), 'appointments': appointments,
+                })
+                start = day + timedelta(days=rng.randint(3, 21))
+            if chain:
+                chains.append(chain)
+        return chains
+
+    def _plan_appointment(self, day: date, hour: int, minute: int):
+        moment = timezone.make_aware(datetime.combine(day, time(hour, minute)))
+        if moment > self.now:
+            return moment, 'planned'
+        roll = self.rng.random()
+        if roll < 0.05:
+            return moment, 'cancelled'
+        if roll < 0.08:
+            return moment, 'no_show'
+        if (self.today - day).days > BILLING_LAG_DAYS:
+            return moment, 'billed'
+        return moment, 'ready_to_bill' if roll < 0.75 else 'completed'
+
+    def _create_prescriptions(self, chains: List[List[Dict]]) -> List[Prescription]:
+        """Legt die Verordnungen ebenenweise an (Erstverordnungen zuerst) inkl. Kettenfelder"""
+        created = []
+        depth = max((len(chain) for chain in chains), default=0)
+        for level in range(depth):
+            level_objects = []
+            for chain in chains:
+                if level >= len(chain):
+                    continue
+                plan = chain[level]
+                done = sum(1 for _, status in plan['appointments']
+                           if status in ('completed', 'ready_to_bill', 'billed'))
+                is_last = level == len(chain) - 1
+                if not is_last:
+                    status = 'Extended'
+                elif done >= plan['sessions']:
+                    status = 'Completed'
+                else:
+                    status = 'In_Progress' if done else 'Open'
+                icd = self.rng.choice(self.icd_codes)
+                plan['object'] = Prescription(
+                    patient=plan['patient'], patient_insurance=plan['insurance'],
+                    doctor_id=self.rng.choice(self.doctor_ids), diagnosis_code=icd, diagnosis_text=icd.title,
+                    treatment_1=plan['treatment'], number_of_sessions=plan['sessions'], sessions_completed=done,
+                    therapy_frequency_type=plan['frequency'], prescription_date=plan['date'], status=status,
+                    original_prescription=chain[level - 1]['object'] if level else None,
+                    is_follow_up=level > 0, follow_up_number=level,
+                    chain_root=chain[0]['object'] if level else None, chain_position=level,
+                    chain_last_position=len(chain) - 1,
+                )
+                plan['done'] = done
+                level_objects.append(plan['object'])
+            Prescription.objects.bulk_create(level_objects, batch_size=self.batch_size)
+            created.extend(level_objects)
+
+        # Kettensummen und Verweis der Erstverordnung auf sich selbst
+        for chain in chains:
+            total = sum(plan['sessions'] for plan in chain)
+            completed = sum(plan['done'] for plan in chain)
+            for plan in chain:
+                plan['object'].chain_total_sessions = total
+                plan['object'].chain_completed_sessions = completed
+        Prescription.objects.bulk_update(
+            created, ['chain_total_sessions', 'chain_completed_sessions'], batch_size=self.batch_size
+        )
+        Prescription.objects.filter(
+            pk__in=[chain[0]['object'].pk for chain in chains]
+        ).update(chain_root_id=F('id'))
+
+        self.counts['prescriptions'] += len(created)
+        return created
+
+    def _create_appointments(self, chains: List[List[Dict]]) -> List[Appointment]:
+        appointments = []
+        for chain in chains:
+            for plan in chain:
+                prescription = plan['object']
+                room_id = self.rng.choice(self.room_ids)
+                for moment, status in plan['appointments']:
+                    appointments.append(Appointment(
+                        patient=plan['patient'], practitioner_id=plan['practitioner_id'],
+                        appointment_date=moment, status=status, treatment=plan['treatment'],
+                        prescription=prescription, patient_insurance=plan['insurance'],
+                        duration_minutes=plan['treatment'].duration_minutes, room_id=room_id,
+                        series_identifier=f'syn-{prescription.pk}', is_recurring=True
+                    ))
+        Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
+        self.counts['appointments'] += len(appointments)
+        return appointments
+
+    def _billing_amounts(self, appointment: Appointment):
+        """(Kassenanteil, Zuzahlung, Abrechnungsart) nach Preisperiode des Termindatums"""
+        treatment = appointment.treatment
+        year = appointment.appointment_date.year
+        if treatment.is_self_pay:
+            return Decimal('0.00'), self._price(treatment.catalog_private_price, year), 'is_self_pay_billing'
+        if appointment.patient_insurance.is_private:
+            return self._price(treatment.catalog_private_price, year), Decimal('0.00'), 'is_private_billing'
+        price = self._price(treatment.catalog_gkv_price, year)
+        copay = (price * COPAY_RATE).quantize(CENT)
+        return price - copay, copay, 'is_gkv_billing'
+
+    def _create_billing(self, appointments: List[Appointment]) -> None:
+        items = []
+        for appointment in appointments:
+            if appointment.status != 'billed':
+                continue
+            insurance_amount, copay, billing_flag = self._billing_amounts(appointment)
+            day = timezone.localtime(appointment.appointment_date).date()
+            cycle_id = self.billing_cycles[(appointment.patient_insurance.insurance_provider_id, _quarter_start(day))]
+            treatment = appointment.treatment
+            items.append(BillingItem(
+                billing_cycle_id=cycle_id, prescription=appointment.prescription, appointment=appointment,
+                treatment=treatment, insurance_amount=insurance_amount, patient_copay=copay,
+                legs_code=treatment.legs_code, is_billed=True,
+                insurance_claim_created=billing_flag == 'is_gkv_billing', **{billing_flag: True}
+            ))
+        BillingItem.objects.bulk_create(items, batch_size=self.batch_size)
+        self.counts['billing_items'] += len(items)
+        self._billing_items = items
+
+    def _create_invoices(self, appointments: List[Appointment]) -> None:
+        """Eine Patientenrechnung (Zuzahlung bzw. Privat-/Selbstzahlerbetrag) je Patient und Quartal"""
+        totals = defaultdict(Decimal)
+        for item in self._billing_items:
+            amount = item.patient_copay if not item.is_private_billing else item.insurance_amount
+            if amount:
+                day = timezone.localtime(item.appointment.appointment_date).date()
+                totals[(item.appointment.patient_id, _quarter_start(day))] += amount
+
+        invoices = []
+        for (patient_id, quarter), amount in totals.items():
+            invoice_date = min(_quarter_end(quarter) + timedelta(days=5), self.today)
+            paid = (self.today - invoice_date).days > 30 and self.rng.random() < 0.9
+            invoices.append(PatientInvoice(
+                patient_id=patient_id, invoice_number=f'SYN{self.seed}-{patient_id}-{quarter:%Y%m}',
+                invoice_date=invoice_date, amount=amount, status='paid' if paid else 'created',
+                payment_date=invoice_date + timedelta(days=self.rng.randint(5, 25)) if paid else None
+            ))
+        PatientInvoice.objects.bulk_create(invoices, batch_size=self.batch_size)
+
+        # created_at (auto_now_add) auf das Rechnungsdatum zurückdatieren – die Finanzübersicht filtert danach
+        for invoice in invoices:
+            invoice.created_at = timezone.make_aware(datetime.combine(invoice.invoice_date, time(12)))
+        PatientInvoice.objects.bulk_update(invoices, ['created_at'], batch_size=self.batch_size)
+        self.counts['patient_invoices'] += len(invoices)
@@ -0,0 +1,99 @@
+"""
+Sichtbarkeitsbereich von Therapeuten.
+
+Therapeuten sehen nur ihre eigenen Termine und Wartelisten-Einträge sowie Patienten und
+Verordnungen, zu denen sie Termine haben. Der zugehörige Behandler wird über die direkte
+Verknüpfung Practitioner.user (eindeutig und indiziert) bestimmt – einmal pro Request,
+danach hängt der Scope am Benutzerobjekt. Patienten und Verordnungen werden per
+EXISTS-Semi-Join über die Termine eingeschränkt statt über id__in-Listen.
+"""
+
+import logging
+from typing import Optional
+
+from django.db.models import Exists, OuterRef
+
+from core.models import Appointment, Practitioner
+
+logger = logging.getLogger(__name__)
+
+
+class TherapistScope:
+    """Filtert QuerySets auf den Sichtbarkeitsbereich eines Benutzers"""
+
+    __slots__ = ('restricted', 'practitioner_id')
+
+    def __init__(self, restricted: bool, practitioner_id: Optional[int] = None):
+        self.restricted = restricted
+        self.practitioner_id = practitioner_id
+
+    @property
+    def is_empty(self) -> bool:
+        """Therapeut ohne verknüpften Behandler: sieht nichts"""
+        return self.restricted and self.practitioner_id is None
+
+    def filter_appointments(self, queryset):
+        if not self.restricted:
+            return queryset
+        if self.is_empty:
+            return queryset.none()
+        return queryset.filter(practitioner_id=self.practitioner_id)
+
+    def filter_waitlist(self, queryset):
+        return self.filter_appointments(queryset)
+
+    def filter_patients(self, queryset):
+        if not self.restricted:
+            return queryset
+        if self.is_empty:
+            return queryset.none()
+        return queryset.filter(Exists(Appointment.objects.filter(
+            patient_id=OuterRef('pk'),
+            practitioner_id=self.practitioner_id,
+        )))
+
+    def filter_prescriptions(self, queryset):
+        if not self.restricted:
+            return queryset
+        if self.is_empty:
+            return queryset.none()
+        return queryset.filter(Exists(Appointment.objects.filter(
+            prescription_id=OuterRef('pk'),
+            practitioner_id=self.practitioner_id,
+        )))
+
+
+UNRESTRICTED = TherapistScope(restricted=False)
+
+
+class TherapistScopeService:
+    """Ermittelt den Sichtbarkeitsbereich eines Benutzers"""
+
+    INSTANCE_ATTRIBUTE = '_therapist_scope'
+
+    @staticmethod
+    def for_user(user) -> TherapistScope:
+        """
+        Admins, Superuser und Verwaltung sehen alles; Therapeuten nur ihren Bereich.
+
+        Das Ergebnis wird am Benutzerobjekt abgelegt, sodass mehrere Prüfungen innerhalb
+        eines Requests höchstens eine Abfrage auslösen.
+        """
+        scope = getattr(user, TherapistScopeService.INSTANCE_ATTRIBUTE, None)
+        if scope is not None:
+            return scope
+
+        if user.is_superuser or user.is_admin or not user.is_therapist:
+            scope = UNRESTRICTED
+        else:
+            practitioner_id = Practitioner.objects.filter(user_id=user.pk).values_list('id', flat=True).first()
+            if practitioner_id is None:
+                logger.warning(f"Therapeut {user.username} ist mit keinem Behandler verknüpft")
+            scope = TherapistScope(restricted=True, practitioner_id=practitioner_id)
+
+        setattr(user, TherapistScopeService.INSTANCE_ATTRIBUTE, scope)
+        return scope
+
+    @staticmethod
+    def for_request(request) -> TherapistScope:
+        return TherapistScopeService.for_user(request.user)
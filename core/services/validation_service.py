@@ -8,6 +8,7 @@ from core.models import (
     Prescription, Appointment, BillingItem, PatientInsurance,
     Treatment, Surcharge, InsuranceProvider
 )
+from core.services.price_resolver import PriceResolver
 
 logger = logging.getLogger(__name__)
 
@@ -125,23 +126,20 @@ class ValidationService:
         
         # Prüfe Surcharge (außer bei Selbstzahler)
         if billing_item.prescription and not billing_item.appointment.is_self_pay():
-            try:
-                surcharge = Surcharge.objects.get(
-                    treatment=billing_item.treatment,
-                    insurance_provider_group=billing_item.prescription.patient_insurance.insurance_provider.group,
-                    valid_from__lte=billing_item.appointment.appointment_date.date(),
-                    valid_until__gte=billing_item.appointment.appointment_date.date()
-                )
-                
+            surcharge = PriceResolver.get_surcharge(
+                billing_item.treatment,
+                billing_item.prescription.patient_insurance.insurance_provider.group_id,
+                billing_item.appointment.appointment_date.date()
+            )
+            if surcharge is None:
+                errors.append("Keine gültige Surcharge für diesen Termin gefunden")
+            else:
                 # Prüfe ob die Beträge mit der Surcharge übereinstimmen
                 if surcharge.insurance_payment != billing_item.insurance_amount:
                     errors.append(f"KK-Betrag stimmt nicht mit Surcharge überein: {surcharge.insurance_payment} vs {billing_item.insurance_amount}")
-                
+
                 if surcharge.patient_payment != billing_item.patient_copay:
                     errors.append(f"Zuzahlung stimmt nicht mit Surcharge überein: {surcharge.patient_payment} vs {billing_item.patient_copay}")
-                    
-            except Surcharge.DoesNotExist:
-                errors.append("Keine gültige Surcharge für diesen Termin gefunden")
         
         return errors
     
@@ -1,14 +1,142 @@
 import logging
+from bisect import bisect_left
+from collections import defaultdict
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db.models import Q
-from core.models import Waitlist, Appointment, UserActivityLog
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from core.models import Waitlist, WaitlistOffer, Appointment, UserActivityLog
+from core.services.email_outbox_service import EmailOutboxService
 from core.services.notification_service import NotificationService
-from django.core.mail import send_mail
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# Reihenfolge der Prioritäten (das CharField sortiert sonst alphabetisch)
+PRIORITY_RANK = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+DEFAULT_SLOT_DURATION = 30
+
+
+class _SlotList:
+    """
+    Freie Termine eines Schlüssels (Behandler, Behandlung, Dauer), nach Beginn sortiert.
+
+    Vergebene Termine werden über Nachfolger-Zeiger mit Pfadkompression übersprungen
+    (Union-Find), sodass jede Suche amortisiert nahezu konstant kostet.
+    """
+
+    __slots__ = ('starts', 'appointments', '_next')
+
+    def __init__(self, appointments):
+        self.appointments = appointments
+        self.starts = [appointment.appointment_date for appointment in appointments]
+        self._next = list(range(len(appointments) + 1))
+
+    def _find(self, index):
+        root = index
+        while self._next[root] != root:
+            root = self._next[root]
+        while self._next[index] != root:
+            self._next[index], index = root, self._next[index]
+        return root
+
+    def take_first(self, earliest, latest, excluded=()):
+        """Vergibt den frühesten freien Termin in [earliest, latest] (ohne excluded-IDs)"""
+        index = self._find(bisect_left(self.starts, earliest))
+        while index < len(self.appointments) and self.starts[index] <= latest:
+            appointment = self.appointments[index]
+            if appointment.id not in excluded:
+                self._next[index] = index + 1
+                return appointment
+            index = self._find(index + 1)
+        return None
+
+
+class WaitlistMatcher:
+    """
+    Ordnet freie (stornierte) Termine wartenden Wartelisten-Einträgen zu.
+
+    Lädt alle wartenden Einträge und alle noch nicht vergebenen stornierten Termine im
+    gemeinsamen Zeitfenster mit je einer Abfrage, indiziert die Termine nach (Behandler,
+    Behandlung, Dauer) und vergibt sie in einem Durchlauf in echter Prioritätsreihenfolge
+    (dringend vor hoch vor mittel vor niedrig, dann nach Eintragungsdatum). Jeder Termin
+    wird höchstens einmal angeboten, jeder Eintrag erhält höchstens ein Angebot.
+    """
+
+    def __init__(self, now=None):
+        self.now = now or timezone.now()
+
+    @staticmethod
+    def slot_key(entry):
+        duration = DEFAULT_SLOT_DURATION
+        if entry.original_appointment_id and entry.original_appointment:
+            duration = entry.original_appointment.duration_minutes
+        return entry.practitioner_id, entry.treatment_id, duration
+
+    def load_entries(self, lock=False):
+        """Wartende, nicht abgelaufene Einträge in Prioritätsreihenfolge"""
+        queryset = Waitlist.objects.filter(
+            status='waiting',
+            available_until__gt=self.now
+        ).select_related('patient', 'original_appointment')
+        if lock:
+            queryset = queryset.select_for_update(of=('self',))
+        entries = list(queryset)
+        entries.sort(key=lambda entry: (PRIORITY_RANK.get(entry.priority, len(PRIORITY_RANK)), entry.created_at, entry.id))
+        return entries
+
+    def load_slots(self, entries):
+        """Stornierte Termine im Fenster der Einträge ohne offenes oder angenommenes Angebot, indiziert"""
+        if not entries:
+            return {}
+        keys = {self.slot_key(entry) for entry in entries}
+        open_offers = WaitlistOffer.objects.filter(appointment=OuterRef('pk'), declined_at__isnull=True)
+        appointments = Appointment.objects.filter(
+            status='cancelled',
+            appointment_date__gte=min(entry.available_from for entry in entries),
+            appointment_date__lte=max(entry.available_until for entry in entries),
+            practitioner_id__in={key[0] for key in keys},
+            treatment_id__in={key[1] for key in keys},
+            duration_minutes__in={key[2] for key in keys},
+        ).exclude(
+            Exists(open_offers)
+        ).select_related('practitioner', 'treatment').order_by('appointment_date', 'id')
+
+        grouped = defaultdict(list)
+        for appointment in appointments:
+            key = (appointment.practitioner_id, appointment.treatment_id, appointment.duration_minutes)
+            if key in keys:
+                grouped[key].append(appointment)
+        return {key: _SlotList(slot_appointments) for key, slot_appointments in grouped.items()}
+
+    def match(self, entries=None):
+        """
+        Ordnet Einträge und Termine zu, ohne zu speichern.
+
+        Returns:
+            Liste von (Wartelisten-Eintrag, Termin) in Vergabereihenfolge
+        """
+        entries = self.load_entries() if entries is None else entries
+        slots = self.load_slots(entries)
+        if not slots:
+            return []
+
+        # Bereits angebotene (auch abgelehnte) Paare nicht erneut anbieten
+        previous = defaultdict(set)
+        for waitlist_id, appointment_id in WaitlistOffer.objects.filter(
+            waitlist_id__in=[entry.id for entry in entries]
+        ).values_list('waitlist_id', 'appointment_id'):
+            previous[waitlist_id].add(appointment_id)
+
+        matches = []
+        for entry in entries:
+            slot_list = slots.get(self.slot_key(entry))
+            if slot_list is None:
+                continue
+            appointment = slot_list.take_first(entry.available_from, entry.available_until, previous[entry.id])
+            if appointment is not None:
+                matches.append((entry, appointment))
+        return matches
+
 class WaitlistService:
     """Service für Wartelisten-Management und automatische Terminvergabe"""
     
@@ -57,6 +185,41 @@ class WaitlistService:
             logger.error(f"Fehler beim Hinzufügen zur Warteliste: {e}")
             raise
     
+    @staticmethod
+    def add_to_waitlist_bulk(appointments, notes=None):
+        """
+        Mengenvariante von add_to_waitlist für viele abgesagte Termine.
+
+        Erwartet Termine mit vorab geladener Verordnung und Behandlung und legt
+        alle Wartelisten-Einträge mit einem bulk_create an.
+        """
+        available_from = timezone.now()
+        available_until = available_from + timedelta(days=30)
+
+        entries = []
+        for appointment in appointments:
+            priority = 'medium'
+            if appointment.prescription and appointment.prescription.is_urgent:
+                priority = 'urgent'
+            elif appointment.treatment.is_self_pay:
+                priority = 'high'
+
+            entries.append(Waitlist(
+                patient_id=appointment.patient_id,
+                treatment_id=appointment.treatment_id,
+                practitioner_id=appointment.practitioner_id,
+                prescription_id=appointment.prescription_id,
+                available_from=available_from,
+                available_until=available_until,
+                priority=priority,
+                original_appointment_id=appointment.id,
+                notes=notes or f"Terminabsage: {appointment.appointment_date.strftime('%d.%m.%Y %H:%M')}"
+            ))
+
+        Waitlist.objects.bulk_create(entries)
+        logger.info(f"{len(entries)} Patienten zur Warteliste hinzugefügt")
+        return entries
+    
     @staticmethod
     def find_matching_appointments(waitlist_entry):
         """Findet passende freie Termine für einen Wartelisten-Eintrag"""
@@ -78,66 +241,90 @@ class WaitlistService:
             return []
     
     @staticmethod
-    def offer_appointments_to_waitlist():
-        """Bietet freie Termine Wartelisten-Patienten an"""
+    def offer_appointments_to_waitlist(dry_run=False):
+        """
+        Bietet freie Termine Wartelisten-Patienten an (siehe WaitlistMatcher).
+
+        Angebote, Statusänderungen, Protokolleinträge und die E-Mails (Ausgangspostfach,
+        siehe EmailOutboxService) werden gesammelt in einer Transaktion geschrieben. Das
+        Angebot gilt nur 24 Stunden, daher wird das Ausgangspostfach direkt nach dem Commit
+        zugestellt statt erst beim nächsten Lauf von deliver_emails.
+
+        Returns:
+            Anzahl der angebotenen Termine
+        """
         try:
-            # Hole alle wartenden Einträge, sortiert nach Priorität
-            waiting_entries = Waitlist.objects.filter(
-                status='waiting',
-                available_until__gt=timezone.now()
-            ).order_by('-priority', 'created_at')
-            
-            offered_count = 0
-            
-            for entry in waiting_entries:
-                # Finde passende Termine
-                matching_appointments = WaitlistService.find_matching_appointments(entry)
-                
-                for appointment in matching_appointments:
-                    # Prüfe ob der Termin noch verfügbar ist
-                    if not WaitlistService._is_appointment_available(appointment):
-                        continue
-                    
-                    # Biete den Termin an
-                    offer = entry.offer_appointment(appointment)
-                    
-                    # Sende Benachrichtigung an den Patienten
-                    WaitlistService._send_appointment_offer_notification(entry, appointment)
-                    
-                    offered_count += 1
+            matcher = WaitlistMatcher()
+            if dry_run:
+                return len(matcher.match())
+
+            with transaction.atomic():
+                matches = matcher.match(matcher.load_entries(lock=True))
+                if not matches:
+                    logger.info("Termine an Warteliste angeboten: 0")
+                    return 0
+
+                now = matcher.now
+                WaitlistOffer.objects.bulk_create([
+                    WaitlistOffer(waitlist=entry, appointment=appointment, offered_at=now)
+                    for entry, appointment in matches
+                ])
+                Waitlist.objects.filter(id__in=[entry.id for entry, _ in matches]).update(
+                    status='offered', updated_at=now
+                )
+                UserActivityLog.objects.bulk_create([
+                    UserActivityLog(
+                        user_id=appointment.practitioner.user_id,
+                        action='notification_sent',
+                        module='waitlist',
+                        object_type='Waitlist',
+                        object_id=str(entry.id),
+                        description=f"Termin-Angebot gesendet für {appointment.appointment_date}"
+                    )
+                    for entry, appointment in matches
+                    if appointment.practitioner.user_id
+                ])
+
+                for entry, appointment in matches:
+                    entry.status = 'offered'
                     logger.info(f"Termin {appointment.id} an {entry.patient} angeboten")
-                    break  # Nur einen Termin pro Wartelisten-Eintrag anbieten
-            
-            logger.info(f"Termine an Warteliste angeboten: {offered_count}")
-            return offered_count
+                EmailOutboxService.enqueue(
+                    WaitlistService._offer_email(entry, appointment) for entry, appointment in matches
+                )
+                transaction.on_commit(WaitlistService._deliver_offers)
+
+            logger.info(f"Termine an Warteliste angeboten: {len(matches)}")
+            return len(matches)
             
         except Exception as e:
             logger.error(f"Fehler beim Anbieten von Terminen: {e}")
             return 0
     
     @staticmethod
-    def _is_appointment_available(appointment):
-        """Prüft ob ein Termin noch verfügbar ist"""
-        # Prüfe ob bereits ein Wartelisten-Angebot für diesen Termin existiert
-        existing_offers = appointment.waitlist_offers.filter(
-            Q(accepted_at__isnull=True) & Q(declined_at__isnull=True)
-        )
-        
-        return not existing_offers.exists()
-    
-    @staticmethod
-    def _send_appointment_offer_notification(waitlist_entry, appointment):
-        """Sendet Benachrichtigung über angebotenen Termin"""
+    def _deliver_offers():
+        """Stellt die Angebots-E-Mails nach dem Commit zu; Fehler bleiben für deliver_emails liegen"""
         try:
-            subject = f"🎯 Neuer Termin verfügbar: {appointment.treatment.treatment_name}"
-            
-            message = f"""
+            result = EmailOutboxService.deliver_pending()
+            logger.info(
+                f"Angebots-E-Mails zugestellt: {result['sent']} gesendet, "
+                f"{result['retried']} erneut eingestellt, {result['failed']} fehlgeschlagen"
+            )
+        except Exception as e:
+            logger.error(f"Fehler beim Zustellen der Angebots-E-Mails: {e}")
+
+    @staticmethod
+    def _offer_message(waitlist_entry, appointment):
+        """Betreff und Text der Benachrichtigung über einen angebotenen Termin"""
+        subject = f"🎯 Neuer Termin verfügbar: {appointment.treatment.treatment_name}"
+        local_date = timezone.localtime(appointment.appointment_date)
+        
+        message = f"""
 Hallo {waitlist_entry.patient.first_name} {waitlist_entry.patient.last_name},
 
 ein neuer Termin ist für Sie verfügbar:
 
-📅 Datum: {appointment.appointment_date.strftime('%d.%m.%Y')}
-🕐 Uhrzeit: {appointment.appointment_date.strftime('%H:%M')}
+📅 Datum: {local_date.strftime('%d.%m.%Y')}
+🕐 Uhrzeit: {local_date.strftime('%H:%M')}
 👨‍⚕️ Behandler: {appointment.practitioner.get_full_name()}
 🏥 Behandlung: {appointment.treatment.treatment_name}
 ⏱️ Dauer: {appointment.duration_minutes} Minuten
@@ -147,29 +334,19 @@ Bitte bestätigen Sie diesen Termin innerhalb der nächsten 24 Stunden.
 Mit freundlichen Grüßen
 Ihr Praxisteam
             """
-            
-            # Sende E-Mail (falls konfiguriert)
-            if hasattr(settings, 'EMAIL_HOST') and settings.EMAIL_HOST:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[waitlist_entry.patient.email],
-                    fail_silently=True
-                )
-            
-            # Logge die Benachrichtigung
-            UserActivityLog.objects.create(
-                user=appointment.practitioner,
-                action='notification_sent',
-                module='waitlist',
-                object_type='Waitlist',
-                object_id=str(waitlist_entry.id),
-                description=f"Termin-Angebot gesendet für {appointment.appointment_date}"
-            )
-            
-        except Exception as e:
-            logger.error(f"Fehler beim Senden der Termin-Angebot-Benachrichtigung: {e}")
+        return subject, message
+    
+    @staticmethod
+    def _offer_email(waitlist_entry, appointment):
+        """Nachricht für das Ausgangspostfach zu einem angebotenen Termin"""
+        subject, message = WaitlistService._offer_message(waitlist_entry, appointment)
+        return EmailOutboxService.build(
+            recipient=waitlist_entry.patient.email,
+            subject=subject,
+            body=message,
+            dedup_key=f'waitlist_offer:{waitlist_entry.id}:{appointment.id}',
+            category='waitlist_offer',
+        )
     
     @staticmethod
     def cleanup_expired_entries():
@@ -1,6 +1,20 @@
-from django.db.models.signals import post_save, post_delete
+import logging
+
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import WorkingHour, Practitioner
+from .models import (
+    WorkingHour, Practitioner, Surcharge, TreatmentPrice, PriceList, ModulePermission, Prescription,
+    Appointment, BillingItem, PaymentAllocation,
+)
+from .services.price_resolver import PriceResolver
+from .services.cache_service import CacheService
+from .services.permission_service import PermissionMatrixService
+from .services.prescription_chain_service import PrescriptionChainService
+from .services.prescription_finance_service import PrescriptionFinanceService
+from .services.dashboard_stats_service import DashboardStatsService
+from .services.reporting_rollup_service import ReportingRollupService
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=WorkingHour)
 def update_practitioner_working_hours(sender, instance, created, **kwargs):
@@ -18,4 +32,217 @@ def handle_working_hour_delete(sender, instance, **kwargs):
     Aktualisiert die working_hours des zugehörigen Practitioners.
     """
     print(f"WorkingHour Signal: deleted for {instance.practitioner}")
-    instance.practitioner.save()  # Dies triggert die Aktualisierung der Arbeitszeiten 
\ No newline at end of file
+    instance.practitioner.save()  # Dies triggert die Aktualisierung der Arbeitszeiten 
+
+@receiver(post_save, sender=Surcharge)
+@receiver(post_delete, sender=Surcharge)
+@receiver(post_save, sender=TreatmentPrice)
+@receiver(post_delete, sender=TreatmentPrice)
+@receiver(post_save, sender=PriceList)
+@receiver(post_delete, sender=PriceList)
+def invalidate_price_resolver(sender, instance, **kwargs):
+    """
+    Signal, das ausgelöst wird, wenn sich Preise oder Preislisten ändern.
+    Verwirft die Preistabellen des PriceResolver nach dem Commit, damit Abrechnungen die neuen
+    Preise verwenden; bis dahin sieht nur die eigene Transaktion die geänderten Preise.
+    """
+    PriceResolver.invalidate_on_commit(kwargs.get('using'))
+
+
+@receiver(post_save, sender=ModulePermission)
+@receiver(post_delete, sender=ModulePermission)
+def invalidate_permission_matrix(sender, instance, **kwargs):
+    """
+    Signal, das ausgelöst wird, wenn eine Modul-Berechtigung gespeichert oder gelöscht wird
+    (auch über Admin oder API). Erhöht die Versionsmarke der Berechtigungsmatrix des Benutzers.
+    """
+    PermissionMatrixService.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Prescription)
+def refresh_prescription_chain(sender, instance, **kwargs):
+    """
+    Signal, das ausgelöst wird, wenn eine Folgeverordnung gelöscht wird.
+    Aktualisiert die Sitzungssummen der verbleibenden Kette (unter Sperre der Erstverordnung,
+    siehe PrescriptionChainService.refresh_totals).
+    """
+    if instance.chain_root_id and instance.chain_root_id != instance.pk:
+        PrescriptionChainService.refresh_totals(instance.chain_root_id)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_billing_state(sender, instance, **kwargs):
+    """
+    Signal, das vor dem Speichern eines Termins ausgelöst wird.
+    Merkt sich Status und Verordnung, damit die Finanzübersicht nur bei Bedarf neu berechnet wird.
+    Appointment.save liest den gespeicherten Termin ohnehin und legt den Stand bereits ab;
+    nur bei anderen Aufrufern (z.B. save_base) wird er hier gelesen.
+    """
+    if kwargs.get('raw') or instance.pk is None:
+        instance._stored_billing_state = None
+        return
+    if '_stored_billing_state' in instance.__dict__:
+        return
+    instance._stored_billing_state = Appointment.objects.filter(pk=instance.pk).values_list(
+        'status', 'prescription_id'
+    ).first()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def update_prescription_finances_for_appointment(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Speichern oder Löschen eines Termins ausgelöst wird.
+    Abrechnungsbereite Termine bestimmen den erwarteten Betrag der Verordnungskette.
+    """
+    if kwargs.get('raw'):
+        return
+    old_status, old_prescription_id = instance.__dict__.pop('_stored_billing_state', None) or (None, None)
+    if 'ready_to_bill' not in (old_status, instance.status):
+        return
+    PrescriptionFinanceService.guarded(
+        PrescriptionFinanceService.refresh, f"Termin {instance.pk}",
+        {old_prescription_id, instance.prescription_id}
+    )
+
+
+@receiver(post_save, sender=BillingItem)
+@receiver(post_delete, sender=BillingItem)
+def update_prescription_finances_for_billing_item(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Speichern oder Löschen einer Abrechnungsposition ausgelöst wird.
+    Aktualisiert abgerechneten und erwarteten Betrag der Verordnungskette.
+    """
+    if kwargs.get('raw'):
+        return
+
+    def refresh():
+        prescription_ids = {instance.prescription_id}
+        prescription_ids.update(
+            Appointment.objects.filter(pk=instance.appointment_id).values_list('prescription_id', flat=True)
+        )
+        PrescriptionFinanceService.refresh(prescription_ids)
+
+    PrescriptionFinanceService.guarded(refresh, f"Abrechnungsposition {instance.pk}")
+
+
+@receiver(post_save, sender=PaymentAllocation)
+@receiver(post_delete, sender=PaymentAllocation)
+def update_prescription_finances_for_allocation(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Speichern oder Löschen einer Zahlungszuordnung ausgelöst wird.
+    Führt bezahlten und offenen Betrag der Verordnung nach.
+    """
+    if kwargs.get('raw'):
+        return
+    PrescriptionFinanceService.guarded(
+        PrescriptionFinanceService.refresh_paid, f"Zahlungszuordnung {instance.pk}", instance.prescription_id
+    )
+
+
+@receiver(post_save, sender=Prescription)
+def update_prescription_finances_for_prescription(sender, instance, created, **kwargs):
+    """
+    Signal, das nach dem Speichern einer Verordnung ausgelöst wird.
+    Der Status bestimmt die Abrechenbarkeit und damit den erwarteten Betrag der Kette.
+    Neue und umgehängte Folgeverordnungen führt Prescription.save nach der Kettenzuordnung nach.
+    """
+    if kwargs.get('raw'):
+        return
+    relevant = not created and getattr(instance, '_stored_status', None) != instance.status
+    instance._stored_status = instance.status
+    if not relevant:
+        return
+    PrescriptionFinanceService.guarded(
+        PrescriptionFinanceService.refresh, f"Verordnung {instance.pk}", [instance.pk]
+    )
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_model_cache_generation(sender, instance, **kwargs):
+    """
+    Signal, das bei jeder Änderung eines core-Models ausgelöst wird.
+    Erhöht die Cache-Generation des Models, wodurch getaggte Cache-Einträge (siehe
+    CacheService) ohne Durchsuchen von Keys ungültig werden. Die Generation der Instanz
+    nur für Models, deren Instanz-Tags auch gelesen werden (INSTANCE_TAGGED_MODELS).
+    """
+    if sender._meta.app_label != 'core' or kwargs.get('raw'):
+        return
+    model_name = sender._meta.model_name
+    CacheService.invalidate_model_cache(model_name)
+    if instance.pk is not None and model_name in CacheService.INSTANCE_TAGGED_MODELS:
+        CacheService.invalidate_model_cache(model_name, instance.pk)
+
+
+@receiver(pre_save)
+def remember_dashboard_stats_values(sender, instance, **kwargs):
+    """
+    Signal, das vor dem Speichern eines für das Dashboard gezählten Models ausgelöst wird.
+    Merkt sich die gespeicherten Werte, damit nach dem Speichern nur die Differenz gebucht wird.
+    """
+    if kwargs.get('raw') or not DashboardStatsService.is_tracked(sender):
+        return
+    try:
+        instance._dashboard_stats_old_values = DashboardStatsService.load_stored_values(instance)
+    except Exception as e:
+        logger.warning(f"Dashboard-Statistik: Alte Werte für {sender.__name__} nicht lesbar: {e}")
+        instance._dashboard_stats_old_values = None
+
+
+@receiver(post_save)
+def update_dashboard_stats_on_save(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Speichern eines für das Dashboard gezählten Models ausgelöst wird.
+    Schreibt die materialisierten Dashboard-Kennzahlen inkrementell fort.
+    """
+    if kwargs.get('raw') or not DashboardStatsService.is_tracked(sender):
+        return
+    try:
+        DashboardStatsService.record_change(instance, getattr(instance, '_dashboard_stats_old_values', None))
+    except Exception as e:
+        logger.warning(f"Dashboard-Statistik konnte für {sender.__name__} nicht aktualisiert werden: {e}")
+
+
+@receiver(post_delete)
+def update_dashboard_stats_on_delete(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Löschen eines für das Dashboard gezählten Models ausgelöst wird.
+    Nimmt den Beitrag der Instanz aus den Dashboard-Kennzahlen heraus.
+    """
+    if not DashboardStatsService.is_tracked(sender):
+        return
+    try:
+        DashboardStatsService.record_change(instance, None, deleted=True)
+    except Exception as e:
+        logger.warning(f"Dashboard-Statistik konnte für {sender.__name__} nicht aktualisiert werden: {e}")
+
+
+@receiver(pre_save)
+def remember_reporting_rollup_day(sender, instance, **kwargs):
+    """
+    Signal, das vor dem Speichern eines Termins, einer Abrechnungsposition oder Rechnung ausgelöst wird.
+    Merkt sich den bisherigen Tag, damit bei einer Verschiebung auch dieser neu verdichtet wird.
+    """
+    if kwargs.get('raw') or ReportingRollupService.rollup_for(sender) is None:
+        return
+    try:
+        instance._reporting_rollup_old_day = ReportingRollupService.stored_day(instance)
+    except Exception as e:
+        logger.warning(f"Tages-Rollup: Bisheriger Tag für {sender.__name__} nicht lesbar: {e}")
+        instance._reporting_rollup_old_day = None
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_reporting_rollups(sender, instance, **kwargs):
+    """
+    Signal, das nach dem Speichern oder Löschen eines Termins, einer Abrechnungsposition oder Rechnung ausgelöst wird.
+    Verdichtet die betroffenen Tage der Tages-Rollups nach dem Commit neu.
+    """
+    if kwargs.get('raw') or ReportingRollupService.rollup_for(sender) is None:
+        return
+    try:
+        ReportingRollupService.schedule_refresh(instance, getattr(instance, '_reporting_rollup_old_day', None))
+    except Exception as e:
+        logger.warning(f"Tages-Rollup konnte für {sender.__name__} nicht aktualisiert werden: {e}")
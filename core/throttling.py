@@ -0,0 +1,70 @@
+"""
+Throttles für die REST-API auf Basis von SecurityService.RateLimiter.
+
+Die Zähler liegen im gemeinsamen Django-Cache statt im Speicher eines Worker-Prozesses;
+die Limits (Anzahl, Fenster, Sperrdauer) kommen aus SecurityService.RATE_LIMIT_CONFIG.
+"""
+
+import math
+import time
+
+from rest_framework.throttling import BaseThrottle
+
+from core.services.security_service import rate_limiter
+
+
+class SlidingWindowRateThrottle(BaseThrottle):
+    """Gleitendes Fenster je Benutzer (angemeldet) bzw. Client-IP (anonym)"""
+
+    limit_type = 'api_requests'
+
+    def get_identifier(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        identifier = self.get_identifier(request, view)
+        if identifier is None:
+            return True
+        self.status = rate_limiter.hit(identifier, self.limit_type)
+        return self.status['allowed']
+
+    def wait(self):
+        status = getattr(self, 'status', None) or {}
+        until = status.get('lockout_until') or status.get('reset_time')
+        if until is None:
+            return None
+        return max(0, math.ceil(until.timestamp() - time.time()))
+
+
+class ApiRateThrottle(SlidingWindowRateThrottle):
+    """Allgemeines API-Limit (api_requests)"""
+
+    limit_type = 'api_requests'
+
+
+class LoginRateThrottle(SlidingWindowRateThrottle):
+    """
+    Sperrt Anmeldungen (login_attempts) je Client-IP und Benutzername, damit sich
+    mehrere Mitarbeiter hinter derselben Praxis-IP nicht gegenseitig sperren.
+
+    Die Throttle zählt selbst nicht: Fehlgeschlagene Anmeldungen zeichnet LoginView auf,
+    eine erfolgreiche setzt den Zähler zurück.
+    """
+
+    limit_type = 'login_attempts'
+
+    def get_identifier(self, request, view):
+        if request.method != 'POST':
+            return None
+        username = str(request.data.get('username', '')).strip().lower()
+        return f'login:{self.get_ident(request)}:{username}'
+
+    def allow_request(self, request, view):
+        identifier = self.get_identifier(request, view)
+        if identifier is None:
+            return True
+        self.status = rate_limiter.check_rate_limit(identifier, self.limit_type)
+        return self.status['allowed']
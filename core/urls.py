@@ -16,10 +16,11 @@ from core.views.user_views import UserViewSet, UserRoleViewSet
 from core.views.billing_views import (
     BulkBillingView, invoice_overview, mark_invoice_as_paid_api, invoice_detail,
     pending_copay_appointments, create_copay_invoices, create_copay_invoices_from_billing_items,
-    create_copay_invoice_for_appointment, create_private_invoice_for_appointment
+    create_copay_invoice_for_appointment, create_private_invoice_for_appointment, gkv_export_download,
+    invoice_pdf, invoice_pdf_bulk
 )
 from core.views.finance_views import finance_overview, finance_historical, finance_comparison
-from core.views.views import process_prescription_ocr, create_prescription_from_ocr, settings_view
+from core.views.views import process_prescription_ocr, ocr_job_status, create_prescription_from_ocr, settings_view
 
 router = DefaultRouter()
 router.register(r'patients', PatientViewSet)
@@ -62,9 +63,12 @@ urlpatterns = [
     
     # Billing endpoints
     path('billing-cycles/bulk/', BulkBillingView.as_view(), name='bulk-billing'),
+    path('billing/gkv-export/', gkv_export_download, name='gkv-export-download'),
     path('invoices/overview/', invoice_overview, name='invoice-overview'),
     path('invoices/mark-paid/', mark_invoice_as_paid_api, name='mark-invoice-paid'),
+    path('invoices/pdf/bulk/', invoice_pdf_bulk, name='invoice-pdf-bulk'),
     path('invoices/<str:invoice_id>/detail/', invoice_detail, name='invoice-detail'),
+    path('invoices/<str:invoice_id>/pdf/', invoice_pdf, name='invoice-pdf'),
     path('copay-invoices/pending/', pending_copay_appointments, name='pending-copay-appointments'),
     path('copay-invoices/create/', create_copay_invoices, name='create-copay-invoices'),
     path('copay-invoices/create-from-billing-items/', create_copay_invoices_from_billing_items, name='create-copay-invoices-from-billing-items'),
@@ -88,6 +92,7 @@ urlpatterns = [
     
     # OCR endpoints
     path('prescriptions/ocr/process/', process_prescription_ocr, name='process-prescription-ocr'),
+    path('prescriptions/ocr/jobs/<uuid:job_id>/', ocr_job_status, name='ocr-job-status'),
     path('prescriptions/ocr/create/', create_prescription_from_ocr, name='create-prescription-from-ocr'),
     
     # Settings endpoints
@@ -138,34 +138,18 @@ def validate_working_hours(start_time, end_time, day_of_week):
 
 def validate_room_availability(room, start_time, end_time, appointment_id=None):
     """Validiert die Verfügbarkeit eines Raums"""
-    from core.models import Appointment
+    from core.services.conflict_service import ConflictChecker
     
-    conflicting_appointments = Appointment.objects.filter(
-        room=room,
-        appointment_date__lt=end_time,
-        appointment_date__gte=start_time
-    )
-    
-    if appointment_id:
-        conflicting_appointments = conflicting_appointments.exclude(id=appointment_id)
-    
-    if conflicting_appointments.exists():
+    checker = ConflictChecker(start_time, end_time, room_ids=[room], exclude_ids=[appointment_id])
+    if checker.find_conflict(start_time, end_time, room_id=room):
         raise ValidationError('Raum ist zu diesem Zeitpunkt bereits belegt.')
 
 def validate_practitioner_availability(practitioner, start_time, end_time, appointment_id=None):
     """Validiert die Verfügbarkeit eines Behandlers"""
-    from core.models import Appointment
-    
-    conflicting_appointments = Appointment.objects.filter(
-        practitioner=practitioner,
-        appointment_date__lt=end_time,
-        appointment_date__gte=start_time
-    )
-    
-    if appointment_id:
-        conflicting_appointments = conflicting_appointments.exclude(id=appointment_id)
+    from core.services.conflict_service import ConflictChecker
     
-    if conflicting_appointments.exists():
+    checker = ConflictChecker(start_time, end_time, practitioner_ids=[practitioner], exclude_ids=[appointment_id])
+    if checker.find_conflict(start_time, end_time, practitioner_id=practitioner):
         raise ValidationError('Behandler ist zu diesem Zeitpunkt bereits belegt.')
 
 def validate_patient_insurance_overlap(patient, valid_from, valid_to, insurance_id=None):
@@ -2,7 +2,7 @@ from datetime import date
 from django.views.generic import ListView, DetailView, CreateView
 from django.views.generic.edit import FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
 from rest_framework.views import APIView
@@ -18,12 +18,14 @@ from decimal import Decimal
 
 from core.models import (
     PatientInvoice, Patient, BillingItem, PatientCopayInvoice, 
-    PrivatePatientInvoice, GKVInsuranceClaim, Payment, Appointment
+    PrivatePatientInvoice, GKVInsuranceClaim, Payment, Appointment, BillingCycle
 )
 from core.services.invoice_generator import InvoiceGenerator
+from core.services.invoice_pdf_service import INVOICE_TYPES, InvoicePdfService
 from core.services.copay_invoice_service import CopayInvoiceService
 from core.forms import PatientInvoiceForm  # Müssen wir noch erstellen
 from core.services.bulk_billing_service import BulkBillingService
+from core.services.gkv_export_service import GKVExportService
 
 def parse_german_date(date_string):
     """Parst deutsche Datumsformate (DD.MM.YYYY)"""
@@ -90,20 +92,17 @@ class CreatePatientInvoiceView(LoginRequiredMixin, FormView):
         return super().form_valid(form)
 
 def download_invoice_pdf(request, pk):
-    invoice = get_object_or_404(PatientInvoice, pk=pk)
-    
-    # Generiere PDF
-    pdf_content = InvoiceGenerator.generate_patient_invoice(
-        patient=invoice.patient,
-        billing_items=invoice.billing_items.all(),
-        invoice_number=invoice.invoice_number
-    )
+    invoice = get_object_or_404(PatientInvoice.objects.select_related('patient'), pk=pk)
     
-    # Erstelle Response
-    response = HttpResponse(pdf_content, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Rechnung_{invoice.invoice_number}.pdf"'
+    # PDF aus dem Cache (wird nur bei geänderten Rechnungsdaten neu erzeugt)
+    path = InvoicePdfService.render_one(invoice)
     
-    return response
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=InvoicePdfService.filename(invoice),
+        content_type='application/pdf'
+    )
 
 def mark_invoice_as_paid(request, pk):
     if request.method != 'POST':
@@ -741,6 +740,128 @@ def create_copay_invoices_from_billing_items(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def gkv_export_download(request):
+    """Streamt den GKV-Export (CSV oder XML) für einen Abrechnungszyklus oder Zeitraum"""
+    export_format = request.GET.get('export_format', 'csv')
+    if export_format not in GKVExportService.CONTENT_TYPES:
+        return Response(
+            {'error': 'Ungültiges Export-Format'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    billing_cycle = None
+    start_date = None
+    end_date = None
+    billing_cycle_id = request.GET.get('billing_cycle_id')
+    if billing_cycle_id:
+        billing_cycle = get_object_or_404(BillingCycle, id=billing_cycle_id)
+    else:
+        start_date = parse_german_date(request.GET.get('start_date'))
+        end_date = parse_german_date(request.GET.get('end_date'))
+        if not all([start_date, end_date]):
+            return Response(
+                {'error': 'Bitte Abrechnungszyklus oder gültiges Start- und Enddatum angeben'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    chunks, filename, content_type = GKVExportService().stream_export(
+        export_format,
+        billing_cycle=billing_cycle,
+        start_date=start_date,
+        end_date=end_date
+    )
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def invoice_pdf(request, invoice_id):
+    """PDF einer Rechnung (patient_<id>, copay_<id> oder private_<id>)"""
+    invoice = InvoicePdfService.parse_invoice_id(invoice_id)
+    if invoice is None:
+        return Response(
+            {'error': 'Rechnung nicht gefunden'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    path = InvoicePdfService.render_one(invoice)
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=InvoicePdfService.filename(invoice),
+        content_type='application/pdf'
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def invoice_pdf_bulk(request):
+    """
+    Alle Rechnungs-PDFs eines Abrechnungslaufs (Abrechnungszyklus oder Zeitraum) als
+    gestreamtes ZIP-Archiv (export_format=zip) oder als eine zusammengeführte PDF-Datei
+    (export_format=pdf). Optional auf Rechnungsarten beschränkbar (types=copay,private).
+    """
+    export_format = request.GET.get('export_format', 'zip')
+    if export_format not in ('zip', 'pdf'):
+        return Response(
+            {'error': 'Ungültiges Export-Format'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    types = [name for name in request.GET.get('types', '').split(',') if name]
+    if any(name not in INVOICE_TYPES for name in types):
+        return Response(
+            {'error': 'Ungültige Rechnungsart'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    billing_cycle = None
+    start_date = None
+    end_date = None
+    billing_cycle_id = request.GET.get('billing_cycle_id')
+    if billing_cycle_id:
+        billing_cycle = get_object_or_404(BillingCycle, id=billing_cycle_id)
+    else:
+        start_date = parse_german_date(request.GET.get('start_date'))
+        end_date = parse_german_date(request.GET.get('end_date'))
+        if not all([start_date, end_date]):
+            return Response(
+                {'error': 'Bitte Abrechnungszyklus oder gültiges Start- und Enddatum angeben'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    invoices = InvoicePdfService.invoices_for_run(
+        billing_cycle_id=billing_cycle.id if billing_cycle else None,
+        start_date=start_date,
+        end_date=end_date,
+        types=types or None
+    )
+    if not invoices:
+        return Response(
+            {'error': 'Keine Rechnungen gefunden'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    entries = InvoicePdfService.render(invoices)
+    if billing_cycle:
+        basename = f'Rechnungen_Abrechnung_{billing_cycle.id}'
+    else:
+        basename = f'Rechnungen_{start_date:%Y%m%d}-{end_date:%Y%m%d}'
+
+    if export_format == 'pdf':
+        return FileResponse(
+            InvoicePdfService.merge_pdfs(entries),
+            as_attachment=True,
+            filename=f'{basename}.pdf',
+            content_type='application/pdf'
+        )
+
+    response = StreamingHttpResponse(InvoicePdfService.stream_zip(entries), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{basename}.zip"'
+    return response
+
 class BulkBillingView(APIView):
     def post(self, request):
         """Erstellt Abrechnungszyklen für alle Krankenkassen im Zeitraum"""
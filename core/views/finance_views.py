@@ -2,10 +2,10 @@ import logging
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Sum, Count, F, Avg, Q
-from django.db.models.functions import TruncMonth, TruncWeek, TruncDay, TruncYear
-from datetime import datetime, timedelta
-from core.models import Appointment, PatientInvoice, Treatment, Patient, BillingItem, BillingCycle
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from core.models import BillingItem
+from core.services.reporting_rollup_service import ReportingRollupService
 from django.utils import timezone
 import calendar
 
@@ -40,137 +40,57 @@ def finance_overview(request):
             end_date = today
         
         logger.debug(f"Berechne Finanzdaten für Zeitraum: {period} ({start_date} - {end_date})")
-        
-        # Gesamtumsatz (alle bezahlten Rechnungen im Zeitraum)
-        total_revenue = PatientInvoice.objects.filter(
-            status='paid',
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-
-        # Offene Rechnungen
-        open_invoices = PatientInvoice.objects.filter(
-            status='created',
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-
-        # Bezahlte Rechnungen
-        paid_invoices = PatientInvoice.objects.filter(
-            status='paid',
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-
-        # GKV-Umsatz (aus BillingItems)
-        gkv_revenue = BillingItem.objects.filter(
-            is_gkv_billing=True,
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('insurance_amount')
-        )['total'] or 0
 
-        # Private Patienten Umsatz
-        private_revenue = BillingItem.objects.filter(
-            is_private_billing=True,
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('insurance_amount')
-        )['total'] or 0
+        # Summen aus den Tages-Rollups statt Aggregationen über alle Rechnungen/Positionen
+        start_day = timezone.localtime(start_date).date()
+        end_day = timezone.localtime(end_date).date()
+        invoices = ReportingRollupService.invoice_totals(start_day, end_day)
+        billing = ReportingRollupService.billing_totals(start_day, end_day)
 
-        # Zuzahlungen
-        copay_revenue = BillingItem.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('patient_copay')
-        )['total'] or 0
+        def invoice_amount(*statuses):
+            return sum((invoices[status]['amount'] for status in statuses if status in invoices), Decimal('0.00'))
 
+        # Gesamtumsatz (alle bezahlten Rechnungen im Zeitraum)
+        total_revenue = invoice_amount('paid')
+        # Offene Rechnungen
+        open_invoices = invoice_amount('created')
+        # Bezahlte Rechnungen
+        paid_invoices = total_revenue
+        # GKV-Umsatz, private Patienten und Zuzahlungen (aus BillingItems)
+        gkv_revenue = billing['gkv_amount']
+        private_revenue = billing['private_amount']
+        copay_revenue = billing['patient_copay']
         # Ausstehende Beträge
-        outstanding_amount = PatientInvoice.objects.filter(
-            status__in=['created', 'sent'],
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-
+        outstanding_amount = invoice_amount('created', 'sent')
         # Durchschnittliche Rechnung
-        average_invoice_amount = PatientInvoice.objects.filter(
-            status='paid',
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        ).aggregate(
-            avg=Avg('amount')
-        )['avg'] or 0
+        paid_count = invoices.get('paid', {}).get('count', 0)
+        average_invoice_amount = total_revenue / paid_count if paid_count else 0
 
         logger.debug("Berechne Monatsumsätze...")
-        # Umsatz nach Monaten (für den ausgewählten Zeitraum)
-        if period == 'year':
-            revenue_by_month = PatientInvoice.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date,
-                status='paid'
-            ).annotate(
-                month=TruncMonth('created_at')
-            ).values('month').annotate(
-                revenue=Sum('amount'),
-                open_invoices=Sum('amount', filter=Q(status='created'))
-            ).order_by('month')
-        else:
-            # Für Monat/Quartal: Tagesweise Aufschlüsselung
-            revenue_by_month = PatientInvoice.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date,
-                status='paid'
-            ).annotate(
-                day=TruncDay('created_at')
-            ).values('day').annotate(
-                revenue=Sum('amount'),
-                open_invoices=Sum('amount', filter=Q(status='created'))
-            ).order_by('day')
-
-        logger.debug("Berechne Versicherungsumsätze...")
-        # Umsatz nach Versicherungen - vereinfacht
-        try:
-            revenue_by_insurance = BillingItem.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            ).values(
-                'appointment__patient__patientinsurance__insurance_provider__name'
-            ).annotate(
-                value=Sum('insurance_amount')
-            ).filter(
-                appointment__patient__patientinsurance__insurance_provider__name__isnull=False
-            ).order_by('-value')[:10]
-        except Exception as e:
-            logger.warning(f"Fehler bei Versicherungsumsätzen: {e}")
-            revenue_by_insurance = []
+        # Umsatz nach Monaten (Jahr) bzw. tageweise Aufschlüsselung (Monat/Quartal)
+        granularity = 'month' if period == 'year' else 'day'
+        revenue_by_month = [
+            {
+                granularity: row['period'],
+                'revenue': row['revenue'],
+                'open_invoices': row['open_invoices'],
+                'gkv_revenue': row['gkv_revenue'],
+                'private_revenue': row['private_revenue'],
+            }
+            for row in ReportingRollupService.revenue_series(start_day, end_day, granularity)
+        ]
 
-        logger.debug("Berechne Behandlungsumsätze...")
-        # Umsatz nach Behandlungen - vereinfacht
-        try:
-            revenue_by_treatment = BillingItem.objects.filter(
-                created_at__gte=start_date,
-                created_at__lte=end_date
-            ).values(
-                'appointment__treatment__treatment_name'
-            ).annotate(
-                value=Sum('insurance_amount')
-            ).filter(
-                appointment__treatment__treatment_name__isnull=False
-            ).order_by('-value')[:10]
-        except Exception as e:
-            logger.warning(f"Fehler bei Behandlungsumsätzen: {e}")
-            revenue_by_treatment = []
+        logger.debug("Berechne Versicherungs- und Behandlungsumsätze...")
+        revenue_by_insurance = [
+            {'name': row['insurance_group__name'], 'value': row['insurance_amount']}
+            for row in ReportingRollupService.billing_breakdown(['insurance_group__name'], start_day, end_day)
+            if row['insurance_group__name']
+        ][:10]
+        revenue_by_treatment = [
+            {'name': row['treatment__treatment_name'], 'value': row['insurance_amount']}
+            for row in ReportingRollupService.billing_breakdown(['treatment__treatment_name'], start_day, end_day)
+            if row['treatment__treatment_name']
+        ][:10]
 
         # Letzte Transaktionen - vereinfacht
         try:
@@ -217,20 +137,15 @@ def finance_overview(request):
         monthly_comparison = []
         if period == 'month':
             # Vergleich mit Vormonat
-            prev_month_start = timezone.make_aware(datetime(year, month - 1 if month > 1 else 12, 1))
-            prev_month_end = timezone.make_aware(datetime(year, month - 1 if month > 1 else 12, calendar.monthrange(year, month - 1 if month > 1 else 12)[1], 23, 59, 59))
-            
-            prev_month_revenue = PatientInvoice.objects.filter(
-                status='paid',
-                created_at__gte=prev_month_start,
-                created_at__lte=prev_month_end
-            ).aggregate(
-                total=Sum('amount')
-            )['total'] or 0
-            
+            prev_year, prev_month = (year, month - 1) if month > 1 else (year - 1, 12)
+            prev_month_revenue = ReportingRollupService.invoice_totals(
+                date(prev_year, prev_month, 1),
+                date(prev_year, prev_month, calendar.monthrange(prev_year, prev_month)[1])
+            ).get('paid', {}).get('amount', 0)
+
             monthly_comparison = [
                 {
-                    'period': f"{calendar.month_name[month - 1 if month > 1 else 12]} {year if month > 1 else year - 1}",
+                    'period': f"{calendar.month_name[prev_month]} {prev_year}",
                     'revenue': prev_month_revenue
                 },
                 {
@@ -248,9 +163,9 @@ def finance_overview(request):
             'copayRevenue': float(copay_revenue),
             'outstandingAmount': float(outstanding_amount),
             'averageInvoiceAmount': float(average_invoice_amount),
-            'revenueByMonth': list(revenue_by_month) if revenue_by_month else [],
-            'revenueByInsurance': list(revenue_by_insurance) if revenue_by_insurance else [],
-            'revenueByTreatment': list(revenue_by_treatment) if revenue_by_treatment else [],
+            'revenueByMonth': revenue_by_month,
+            'revenueByInsurance': revenue_by_insurance,
+            'revenueByTreatment': revenue_by_treatment,
             'latestTransactions': formatted_transactions,
             'monthlyComparison': monthly_comparison,
             'period': period,
@@ -271,50 +186,40 @@ def finance_historical(request):
         current_year = timezone.now().year
         years = range(current_year - 4, current_year + 1)
         
+        # Ein Durchlauf über die Monatssummen der Tages-Rollups statt 65 Einzelabfragen
+        monthly = {
+            (row['period'].year, row['period'].month): row
+            for row in ReportingRollupService.revenue_series(
+                date(years[0], 1, 1), date(years[-1], 12, 31), 'month'
+            )
+        }
+
         yearly_comparison = []
         monthly_trends = []
-        
+
         for year in years:
-            # Jahresumsatz
-            year_start = timezone.make_aware(datetime(year, 1, 1))
-            year_end = timezone.make_aware(datetime(year, 12, 31, 23, 59, 59))
-            
-            year_revenue = PatientInvoice.objects.filter(
-                status='paid',
-                created_at__gte=year_start,
-                created_at__lte=year_end
-            ).aggregate(
-                total=Sum('amount')
-            )['total'] or 0
-            
-            yearly_comparison.append({
-                'year': year,
-                'totalRevenue': year_revenue,
-                'averageRevenue': year_revenue / 12  # Durchschnitt pro Monat
-            })
-            
             # Monatliche Aufschlüsselung für Trends
+            year_revenue = 0
             for month in range(1, 13):
-                month_start = timezone.make_aware(datetime(year, month, 1))
-                month_end = timezone.make_aware(datetime(year, month, calendar.monthrange(year, month)[1], 23, 59, 59))
-                
-                month_data = PatientInvoice.objects.filter(
-                    status='paid',
-                    created_at__gte=month_start,
-                    created_at__lte=month_end
-                ).aggregate(
-                    revenue=Sum('amount')
-                )
-                
+                month_data = monthly.get((year, month), {})
+                revenue = month_data.get('revenue', 0)
+                year_revenue += revenue
+
                 monthly_trends.append({
                     'year': year,
                     'month': month,
                     'monthName': calendar.month_name[month],
-                    'revenue': month_data['revenue'] or 0,
-                    'gkvRevenue': 0,  # Wird später aus BillingItems berechnet
-                    'privateRevenue': 0  # Wird später aus BillingItems berechnet
+                    'revenue': revenue,
+                    'gkvRevenue': month_data.get('gkv_revenue', 0),
+                    'privateRevenue': month_data.get('private_revenue', 0)
                 })
-        
+
+            yearly_comparison.append({
+                'year': year,
+                'totalRevenue': year_revenue,
+                'averageRevenue': year_revenue / 12  # Durchschnitt pro Monat
+            })
+
         # Top-Performance-Monate
         top_months = sorted(monthly_trends, key=lambda x: x['revenue'], reverse=True)[:12]
         
@@ -372,37 +277,20 @@ def finance_comparison(request):
             start2 = timezone.make_aware(datetime(year2, 1, 1))
             end2 = timezone.make_aware(datetime(year2, 12, 31, 23, 59, 59))
         
-        # Daten für beide Zeiträume laden
+        # Daten für beide Zeiträume aus den Tages-Rollups laden
         def get_period_data(start, end):
+            start_day = timezone.localtime(start).date()
+            end_day = timezone.localtime(end).date()
+            invoices = ReportingRollupService.invoice_totals(start_day, end_day)
+            billing = ReportingRollupService.billing_totals(start_day, end_day)
+            paid = invoices.get('paid', {'count': 0, 'amount': 0})
             return {
-                'totalRevenue': PatientInvoice.objects.filter(
-                    status='paid',
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).aggregate(total=Sum('amount'))['total'] or 0,
-                'gkvRevenue': BillingItem.objects.filter(
-                    is_gkv_billing=True,
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).aggregate(total=Sum('insurance_amount'))['total'] or 0,
-                'privateRevenue': BillingItem.objects.filter(
-                    is_private_billing=True,
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).aggregate(total=Sum('insurance_amount'))['total'] or 0,
-                'copayRevenue': BillingItem.objects.filter(
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).aggregate(total=Sum('patient_copay'))['total'] or 0,
-                'invoiceCount': PatientInvoice.objects.filter(
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).count(),
-                'averageInvoice': PatientInvoice.objects.filter(
-                    status='paid',
-                    created_at__gte=start,
-                    created_at__lte=end
-                ).aggregate(avg=Avg('amount'))['avg'] or 0
+                'totalRevenue': paid['amount'],
+                'gkvRevenue': billing['gkv_amount'],
+                'privateRevenue': billing['private_amount'],
+                'copayRevenue': billing['patient_copay'],
+                'invoiceCount': sum(values['count'] for values in invoices.values()),
+                'averageInvoice': paid['amount'] / paid['count'] if paid['count'] else 0
             }
         
         period1_data = get_period_data(start1, end1)
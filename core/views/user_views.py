@@ -2,12 +2,34 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.views import TokenObtainPairView
 from ..models import User
 from ..serializers import UserSerializer
 from django.utils import timezone
 from datetime import datetime, timedelta
 from ..serializers import ModulePermissionSerializer, UserRoleSerializer
 from ..models import UserRole, ModulePermission, UserActivityLog
+from ..services.security_service import rate_limiter
+from ..throttling import LoginRateThrottle
+
+class LoginView(TokenObtainPairView):
+    """
+    Token-Anmeldung (/api/token/) mit Sperre nach wiederholten Fehlversuchen.
+    Gezählt werden nur abgelehnte Anmeldungen; eine erfolgreiche setzt den Zähler zurück.
+    """
+    throttle_classes = [LoginRateThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Hier statt in post(): Abgelehnte Anmeldungen kommen als Exception und erst dispatch macht die 401 daraus
+        response = super().finalize_response(request, response, *args, **kwargs)
+        identifier = LoginRateThrottle().get_identifier(request, self)
+        if identifier is None:
+            return response
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            rate_limiter.record_attempt(identifier, LoginRateThrottle.limit_type)
+        elif response.status_code == status.HTTP_200_OK:
+            rate_limiter.reset_attempts(identifier, LoginRateThrottle.limit_type)
+        return response
 
 class UserRoleViewSet(viewsets.ModelViewSet):
     queryset = UserRole.objects.all()
@@ -15,7 +37,8 @@ class UserRoleViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    # Rolle und Modul-Berechtigungen vorladen: Die Berechtigungsmatrix entsteht dann ohne weitere Abfragen
+    queryset = User.objects.select_related('role').prefetch_related('module_permissions__granted_by')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
 
@@ -343,9 +366,22 @@ class UserViewSet(viewsets.ModelViewSet):
             ).count()
         }
         
+        # Laufzeit-Metriken aller Prozesse (siehe core/services/metrics_service.py)
+        from core.services.performance_service import PerformanceService
+        performance_status = {
+            'requests': PerformanceService.get_request_metrics(all_processes=True)['latency'],
+            'functions': PerformanceService.get_function_metrics(all_processes=True),
+        }
+        
+        # E-Mail-Ausgangspostfach (siehe core/services/email_outbox_service.py)
+        from core.services.email_outbox_service import EmailOutboxService
+        email_outbox_status = EmailOutboxService.get_statistics(all_processes=True)
+        
         return Response({
             'database': db_status,
             'cache': cache_status,
             'permission_system': permission_system_status,
+            'performance': performance_status,
+            'email_outbox': email_outbox_status,
             'timestamp': timezone.now()
         }) 
\ No newline at end of file
@@ -9,6 +9,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 import logging
 import traceback
 from django.utils import timezone
+from django.urls import reverse
 from django.db.models import Count, Sum, Avg
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
@@ -20,7 +21,7 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.utils.decorators import method_decorator
 from django.utils.dateparse import parse_date
-from django.db import models
+from django.db import models, transaction
 from core.models import (
     Prescription,
     Appointment,
@@ -44,14 +45,19 @@ from core.services.propose_and_create_appointments import is_practitioner_availa
 
 from core.services.appointment_series import create_appointment_series, AppointmentSeriesService
 from core.services.prescription_series_service import PrescriptionSeriesService
+from core.services.availability_service import AvailabilityEngine
+from core.services.calendar_feed_service import CalendarFeedService
+from core.services.conflict_service import ConflictChecker
+from core.services.dashboard_stats_service import DashboardStatsService
 try:
     from core.services.ocr_service import OCRService
 except ImportError:
     OCRService = None
+from core.services.ocr_job_service import OCRJobService
 from core.services.performance_service import PerformanceService, QueryOptimizer, CacheOptimizer
-from django.core.files.storage import default_storage
+from core.services.prescription_finance_service import PrescriptionFinanceService
+from core.services.therapist_scope_service import TherapistScopeService
 from django.core.files.base import ContentFile
-import os
 import tempfile
 from ..models import (
     Bundesland,
@@ -153,37 +159,17 @@ class PatientViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         """Filtert Patienten nach Benutzerberechtigungen mit optimierten Queries"""
         user = self.request.user
         
-        # Basis-Query mit prefetch_related für optimierte Performance
-        base_queryset = Patient.objects.prefetch_related(
-            'insurances__insurance_provider'
-        )
+        # Versicherungen und Einwilligungen vorladen: konstante Anzahl Abfragen für die ganze Liste
+        base_queryset = QueryOptimizer.optimize_patient_queryset(Patient.objects.all())
         
-        # Wenn der Benutzer ein Admin/Superuser ist, zeige alle Patienten
-        if user.is_superuser or user.is_admin:
-            return base_queryset
-            
-        # Wenn der Benutzer ein Therapeut ist, zeige nur seine Patienten
-        if user.is_therapist:
-            # Finde den Practitioner, der diesem User entspricht
-            practitioner = Practitioner.objects.filter(
-                first_name=user.first_name,
-                last_name=user.last_name
-            ).first()
-            if practitioner:
-                # Finde alle Patienten, die Termine bei diesem Practitioner haben
-                appointments = Appointment.objects.filter(practitioner=practitioner)
-                patient_ids = appointments.values_list('patient_id', flat=True).distinct()
-                return base_queryset.filter(id__in=patient_ids)
-            else:
-                return Patient.objects.none()
-                
-        # Für normale Benutzer (Verwaltung) zeige alle Patienten
-        return base_queryset
+        # Admins und Verwaltung sehen alle Patienten, Therapeuten nur Patienten mit eigenen Terminen
+        return TherapistScopeService.for_user(user).filter_patients(base_queryset)
 
     @action(detail=True, methods=['get'])
     def appointments(self, request, pk=None):
@@ -261,6 +247,35 @@ class PractitionerViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Optional: Überschreiben für zusätzliche Filterung"""
         return Practitioner.objects.filter(is_active=True).order_by('first_name', 'last_name')
+
+    @action(detail=True, methods=['patch'])
+    def link_user(self, request, pk=None):
+        """Verknüpft den Behandler mit einem Benutzerkonto (user: ID oder null) – nur Admin"""
+        if not request.user.is_admin and not request.user.is_superuser:
+            return Response(
+                {'error': 'Admin-Berechtigung erforderlich'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if 'user' not in request.data:
+            return Response({'error': 'Feld "user" fehlt'}, status=status.HTTP_400_BAD_REQUEST)
+
+        practitioner = self.get_object()
+        user_id = request.data['user']
+        if user_id in (None, ''):
+            practitioner.user = None
+        else:
+            user = User.objects.filter(pk=user_id).first()
+            if user is None:
+                return Response({'error': 'Benutzer nicht gefunden'}, status=status.HTTP_400_BAD_REQUEST)
+            linked = Practitioner.objects.filter(user=user).exclude(pk=practitioner.pk).first()
+            if linked is not None:
+                return Response(
+                    {'error': f'Benutzer ist bereits mit Behandler {linked} verknüpft'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            practitioner.user = user
+        practitioner.save(update_fields=['user', 'updated_at'])
+        return Response(self.get_serializer(practitioner).data)
     
     @action(detail=True, methods=['get'])
     def working_hours(self, request, pk=None):
@@ -298,6 +313,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('appointment_date', 'id')
 
     def get_queryset(self):
         """Filtert Termine nach Benutzerberechtigungen mit optimierten Queries"""
@@ -307,23 +323,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         # Verwende QueryOptimizer für optimierte Queries
         queryset = QueryOptimizer.optimize_appointment_queryset(queryset)
 
-        # Wenn der Benutzer ein Admin/Superuser ist, zeige alle Termine
-        if user.is_superuser or user.is_admin:
-            return queryset
-            
-        # Wenn der Benutzer ein Therapeut ist, zeige nur seine eigenen Termine
-        if user.is_therapist:
-            # Hier müssen wir den Practitioner finden, der diesem User entspricht
-            # Da wir keine direkte Verknüpfung haben, suchen wir nach Namen
-            practitioner = Practitioner.objects.filter(
-                first_name=user.first_name,
-                last_name=user.last_name
-            ).first()
-            if practitioner:
-                return queryset.filter(practitioner=practitioner)
-            
-        # Für normale Benutzer (Verwaltung) zeige alle Termine
-        return queryset
+        # Admins und Verwaltung sehen alle Termine, Therapeuten nur ihre eigenen
+        return TherapistScopeService.for_user(user).filter_appointments(queryset)
 
     def list(self, request, *args, **kwargs):
         """Erweiterte Liste mit Filterung nach series_identifier"""
@@ -352,7 +353,12 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         # Sortierung nach Datum
         queryset = queryset.order_by('appointment_date')
         
+        # Keyset-Paginierung (nur wenn ?cursor= oder ?page_size= angegeben)
+        page = self.paginate_queryset(queryset)
+        
         try:
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
         except Exception as e:
@@ -364,6 +370,24 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Kompakter Kalender-Feed für ein Zeitfenster.
+        
+        Query-Parameter: start, end (ISO-Datum oder -Zeitpunkt), practitioner, room,
+        status (jeweils kommagetrennt). Die Termine werden spaltenweise geliefert,
+        Namen stehen in Lookup-Tabellen (siehe CalendarFeedService).
+        """
+        try:
+            params = CalendarFeedService.parse_params(request.query_params)
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Berechtigungsfilter übernehmen, Joins/Prefetches des Optimizers entfallen
+        queryset = self.get_queryset().select_related(None).prefetch_related(None)
+        return Response(CalendarFeedService.build_feed(queryset, **params))
+
     @action(detail=False, methods=['post'])
     def create_series(self, request):
         try:
@@ -585,6 +609,7 @@ class BillingCycleViewSet(viewsets.ModelViewSet):
     queryset = BillingCycle.objects.all()
     serializer_class = BillingCycleSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-start_date', '-id')
 
     @action(detail=False, methods=['post'], url_path='bulk')
     def bulk_create(self, request):
@@ -744,6 +769,7 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
     queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
         """
@@ -751,26 +777,8 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         
-        # Wenn der Benutzer ein Admin/Superuser ist, zeige alle Verordnungen
-        if user.is_superuser or user.is_admin:
-            queryset = Prescription.objects.all()
-        # Wenn der Benutzer ein Therapeut ist, zeige nur Verordnungen seiner Patienten
-        elif user.is_therapist:
-            # Finde den Practitioner, der diesem User entspricht
-            practitioner = Practitioner.objects.filter(
-                first_name=user.first_name,
-                last_name=user.last_name
-            ).first()
-            if practitioner:
-                # Finde alle Termine dieses Practitioners und deren Verordnungen
-                appointments = Appointment.objects.filter(practitioner=practitioner)
-                prescription_ids = appointments.values_list('prescription_id', flat=True).distinct()
-                queryset = Prescription.objects.filter(id__in=prescription_ids)
-            else:
-                queryset = Prescription.objects.none()
-        # Für normale Benutzer (Verwaltung) zeige alle Verordnungen
-        else:
-            queryset = Prescription.objects.all()
+        # Admins und Verwaltung sehen alle Verordnungen, Therapeuten nur solche mit eigenen Terminen
+        queryset = TherapistScopeService.for_user(user).filter_prescriptions(Prescription.objects.all())
         
         # Verwende QueryOptimizer für optimierte Queries
         queryset = QueryOptimizer.optimize_prescription_queryset(queryset)
@@ -870,6 +878,41 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def outstanding(self, request):
+        """Verordnungen mit offenem Betrag aus der materialisierten Finanzübersicht"""
+        prescriptions = TherapistScopeService.for_user(request.user).filter_prescriptions(Prescription.objects.all())
+        summaries = PrescriptionFinanceService.outstanding(prescriptions).values(
+            'prescription_id',
+            'prescription__patient_id',
+            'prescription__patient__first_name',
+            'prescription__patient__last_name',
+            'billed_amount',
+            'expected_amount',
+            'paid_amount',
+            'outstanding_amount',
+            'computed_at',
+        )
+
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+        except ValueError:
+            return Response({'error': "Ungültiger Wert für 'limit'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response([
+            {
+                'prescription': row['prescription_id'],
+                'patient': row['prescription__patient_id'],
+                'patient_name': f"{row['prescription__patient__first_name']} {row['prescription__patient__last_name']}",
+                'billed_amount': row['billed_amount'],
+                'expected_amount': row['expected_amount'],
+                'paid_amount': row['paid_amount'],
+                'outstanding_amount': row['outstanding_amount'],
+                'computed_at': row['computed_at'],
+            }
+            for row in summaries[:max(limit, 1)]
+        ])
+
 class WorkingHourViewSet(viewsets.ModelViewSet):
     queryset = WorkingHour.objects.all()
     serializer_class = WorkingHourSerializer
@@ -1013,115 +1056,23 @@ class GenerateAppointmentsPreviewView(TemplateView):
             return self.get(request, prescription_id, *args, **kwargs)
 
 class DashboardStatsView(APIView):
+    """
+    Dashboard-Kennzahlen aus dem materialisierten Snapshot (DashboardStatistic).
+
+    Die Zähler werden per Signal fortgeschrieben und vom Command
+    recompute_dashboard_stats neu berechnet; 'snapshot' enthält das Alter der Daten.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         try:
-            now = timezone.now()
-            month_ago = now - timedelta(days=30)
-            
-            # Patienten-Statistiken
-            patient_stats = {
-                'total': Patient.objects.count(),
-                'newThisMonth': Patient.objects.filter(created_at__gte=month_ago).count(),
-            }
-
-            # Termin-Statistiken
-            appointment_stats = {
-                'total': Appointment.objects.count(),
-                'upcoming': Appointment.objects.filter(appointment_date__gte=now).count(),
-                'thisWeek': Appointment.objects.filter(
-                    appointment_date__range=(now, now + timedelta(days=7))
-                ).count(),
-                'noShowRate': self._calculate_no_show_rate()
-            }
-
-            # Behandlungs-Statistiken
-            treatment_stats = {
-                'total': Treatment.objects.count(),
-                'mostCommon': self._get_most_common_treatments()
-            }
-
-            # Finanz-Statistiken
-            finance_stats = self._get_finance_stats()
-
-            # Rezept-Statistiken
-            prescription_stats = {
-                'total': Prescription.objects.count(),
-                'pending': Prescription.objects.filter(status='open').count()
-            }
-
-            # Versicherungsgruppen-Statistiken
-            insurance_stats = {
-                'total': InsuranceProviderGroup.objects.count(),
-                'distribution': self._get_insurance_distribution()
-            }
-
-            return Response({
-                'patients': patient_stats,
-                'appointments': appointment_stats,
-                'treatments': treatment_stats,
-                'finances': finance_stats,
-                'prescriptions': prescription_stats,
-                'insuranceGroups': insurance_stats
-            })
+            return Response(DashboardStatsService.get_stats())
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def _calculate_no_show_rate(self):
-        total = Appointment.objects.filter(appointment_date__lt=timezone.now()).count()
-        if total == 0:
-            return 0
-        no_shows = Appointment.objects.filter(
-            appointment_date__lt=timezone.now(),
-            status='no_show'
-        ).count()
-        return round((no_shows / total) * 100, 2)
-
-    def _get_most_common_treatments(self):
-        treatments = Appointment.objects.values('treatment__treatment_name')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:5]
-        return {item['treatment__treatment_name']: item['count'] for item in treatments if item['treatment__treatment_name']}
-
-    def _get_insurance_distribution(self):
-        distribution = (
-            Patient.objects.values('insurances__insurance_provider__name')
-            .annotate(count=Count('id'))
-            .filter(insurances__insurance_provider__name__isnull=False)
-        )
-        return {
-            item['insurances__insurance_provider__name']: item['count'] 
-            for item in distribution
-        }
-
-    def _get_finance_stats(self):
-        now = timezone.now()
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        last_month_start = (month_start - timedelta(days=1)).replace(day=1)
-        
-        # Verwende BillingItems für Finanzstatistiken
-        current_month_revenue = BillingItem.objects.filter(
-            created_at__gte=month_start
-        ).aggregate(total=Sum('insurance_amount'))['total'] or 0
-        
-        last_month_revenue = BillingItem.objects.filter(
-            created_at__range=(last_month_start, month_start)
-        ).aggregate(total=Sum('insurance_amount'))['total'] or 0
-        
-        outstanding_amount = BillingItem.objects.filter(
-            is_billed=False
-        ).aggregate(total=Sum('insurance_amount'))['total'] or 0
-        
-        return {
-            'currentMonth': float(current_month_revenue),
-            'lastMonth': float(last_month_revenue),
-            'outstanding': float(outstanding_amount)
-        }
-
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -1202,8 +1153,17 @@ class AppointmentSeriesViewSet(viewsets.ViewSet):
             current_datetime = start_datetime
 
             # Hole alle verfügbaren Räume und Behandler für alternative Vorschläge
-            available_rooms = Room.objects.filter(is_active=True)
-            available_practitioners = Practitioner.objects.filter(is_active=True)
+            available_rooms = list(Room.objects.filter(is_active=True))
+            available_practitioners = list(Practitioner.objects.filter(is_active=True))
+
+            # Belegungen, Abwesenheiten, Feiertage und Öffnungszeiten einmalig laden
+            engine = AvailabilityEngine(
+                start_datetime,
+                practitioners=[practitioner] + available_practitioners,
+                rooms=([room] if room else []) + available_rooms,
+            )
+            practitioner_names = {p.id: p.get_full_name() for p in available_practitioners}
+            room_names = {r.id: r.name for r in available_rooms}
 
             for i in range(number_of_appointments):
                 # Nächsten verfügbaren Termin finden
@@ -1211,34 +1171,26 @@ class AppointmentSeriesViewSet(viewsets.ViewSet):
                     current_datetime,
                     practitioner,
                     room,
-                    treatment.duration_minutes
+                    treatment.duration_minutes,
+                    engine=engine
                 )
 
                 # Alternative Slots finden falls der Hauptslot nicht verfügbar ist
                 alternative_slots = []
                 if not next_available:
-                    # Prüfe andere Räume und Behandler für den gleichen Tag
-                    day_start = current_datetime.replace(hour=7, minute=0)
-                    day_end = current_datetime.replace(hour=19, minute=0)
-                    current_time = day_start
-
-                    while current_time <= day_end:
-                        for alt_room in available_rooms:
-                            for alt_practitioner in available_practitioners:
-                                if self.is_slot_available(
-                                    current_time,
-                                    alt_practitioner,
-                                    alt_room,
-                                    treatment.duration_minutes
-                                ):
-                                    alternative_slots.append({
-                                        'datetime': current_time,
-                                        'practitioner': alt_practitioner.id,
-                                        'practitioner_name': alt_practitioner.get_full_name(),
-                                        'room': alt_room.id,
-                                        'room_name': alt_room.name
-                                    })
-                        current_time += timedelta(minutes=15)  # 15-Minuten-Intervalle
+                    # Prüfe andere Räume und Behandler für den gleichen Tag (15-Minuten-Intervalle)
+                    for slot_datetime, alt_practitioner_id, alt_room_id in engine.find_alternative_slots(
+                        current_datetime,
+                        treatment.duration_minutes,
+                        limit=5  # Limitiere auf 5 Alternativen
+                    ):
+                        alternative_slots.append({
+                            'datetime': slot_datetime,
+                            'practitioner': alt_practitioner_id,
+                            'practitioner_name': practitioner_names.get(alt_practitioner_id, ''),
+                            'room': alt_room_id,
+                            'room_name': room_names.get(alt_room_id, '')
+                        })
 
                 proposed_appointments.append({
                     'proposed_datetime': next_available or current_datetime,
@@ -1248,8 +1200,8 @@ class AppointmentSeriesViewSet(viewsets.ViewSet):
                     'room_name': room.name if room else '',
                     'duration_minutes': treatment.duration_minutes,
                     'is_available': bool(next_available),
-                    'conflicts': self.get_conflicts(current_datetime, practitioner, room),
-                    'alternative_slots': alternative_slots[:5],  # Limitiere auf 5 Alternativen
+                    'conflicts': self.get_conflicts(current_datetime, practitioner, room, engine=engine),
+                    'alternative_slots': alternative_slots,
                     'can_be_modified': True  # Erlaubt Änderungen im Frontend
                 })
                 current_datetime = (next_available or current_datetime) + timedelta(days=interval_days)
@@ -1267,170 +1219,95 @@ class AppointmentSeriesViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    def find_next_available_slot(self, start_datetime, practitioner, room, duration_minutes):
-        """Findet den nächsten verfügbaren Zeitslot"""
-        practice = Practice.objects.first()
-        current_datetime = start_datetime
-        max_days_to_check = 30  # Maximale Anzahl der zu prüfenden Tage
-        days_checked = 0
-        
-        while days_checked < max_days_to_check:
-            # Prüfe ob der Tag grundsätzlich verfügbar ist
-            day_name = current_datetime.strftime('%A').lower()
-            day_settings = practice.opening_hours.get(day_name, {})
-            
-            if day_settings.get('open'):
-                # Hole Start- und Endzeit für den Tag
-                hours = day_settings.get('hours', '07:00-19:00')
-                start_time, end_time = hours.split('-')
-                start_time = datetime.strptime(start_time, '%H:%M').time()
-                end_time = datetime.strptime(end_time, '%H:%M').time()
-                
-                # Setze Startzeit für den ersten Check
-                if current_datetime.time() < start_time:
-                    current_datetime = current_datetime.replace(
-                        hour=start_time.hour,
-                        minute=start_time.minute
-                    )
-                
-                # Prüfe Zeitslots für diesen Tag
-                while current_datetime.time() <= end_time:
-                    # Prüfe ob der Slot verfügbar ist
-                    if self.is_slot_available(
-                        current_datetime,
-                        practitioner,
-                        room,
-                        duration_minutes
-                    ):
-                        return current_datetime
-                    
-                    # Nächster 15-Minuten-Slot
-                    current_datetime += timedelta(minutes=15)
-                    
-                    # Wenn wir über die Endzeit hinaus sind, breche die innere Schleife ab
-                    if current_datetime.time() > end_time:
-                        break
-            
-            # Nächster Tag
-            current_datetime = (current_datetime + timedelta(days=1)).replace(
-                hour=7,  # Setze auf Praxisöffnung zurück
-                minute=0
-            )
-            days_checked += 1
-        
-        return None
+    def _get_engine(self, start_datetime, practitioner, room, engine=None):
+        """Verwendet die übergebene AvailabilityEngine oder erstellt eine für den Einzelaufruf"""
+        if engine is not None:
+            return engine
+        return AvailabilityEngine(start_datetime, practitioners=[practitioner], rooms=[room] if room else [])
 
-    def is_slot_available(self, datetime_to_check, practitioner, room, duration_minutes):
+    def find_next_available_slot(self, start_datetime, practitioner, room, duration_minutes, engine=None):
+        """Findet den nächsten verfügbaren Zeitslot (maximal 30 Tage im Voraus)"""
+        engine = self._get_engine(start_datetime, practitioner, room, engine)
+        return engine.find_next_available_slot(start_datetime, practitioner, room, duration_minutes)
+
+    def is_slot_available(self, datetime_to_check, practitioner, room, duration_minutes, engine=None):
         """Prüft ob ein Zeitslot verfügbar ist"""
-        end_datetime = datetime_to_check + timedelta(minutes=duration_minutes)
-        
-        # Prüfe Praxisöffnungszeiten
-        practice = Practice.objects.first()
-        if not practice.is_open_at(datetime_to_check) or not practice.is_open_at(end_datetime):
-            return False
-            
-        # Prüfe Raumverfügbarkeit
-        if room and not room.is_home_visit:
-            day_name = datetime_to_check.strftime('%A').lower()
-            room_settings = room.opening_hours.get(day_name, {})
-            if not room_settings.get('open'):
-                return False
-                
-            hours = room_settings.get('hours', '')
-            if not hours:
-                return False
-                
-            room_start, room_end = hours.split('-')
-            if (datetime_to_check.strftime('%H:%M') < room_start or 
-                end_datetime.strftime('%H:%M') > room_end):
-                return False
-        
-        # Prüfe Behandler-Abwesenheiten
-        absences = Absence.objects.filter(
-            practitioner=practitioner,
-            start_date__lte=datetime_to_check.date(),
-            end_date__gte=datetime_to_check.date()
-        )
-        for absence in absences:
-            if absence.is_full_day:
-                return False
-            if absence.start_time and absence.end_time:
-                if (datetime_to_check.time() >= absence.start_time and 
-                    end_datetime.time() <= absence.end_time):
-                    return False
-        
-        # Prüfe Terminkonflikte
-        existing_appointments = Appointment.objects.filter(
-            practitioner=practitioner,
-            appointment_date__range=(
-                datetime_to_check,
-                end_datetime - timedelta(minutes=1)
-            )
-        )
-        if existing_appointments.exists():
-            return False
-        
-        return True
+        engine = self._get_engine(datetime_to_check, practitioner, room, engine)
+        return engine.is_slot_available(datetime_to_check, practitioner, room, duration_minutes)
 
-    def get_conflicts(self, datetime_to_check, practitioner, room):
+    def get_conflicts(self, datetime_to_check, practitioner, room, engine=None):
         """Gibt alle Konflikte für einen Zeitslot zurück"""
-        conflicts = []
-        end_datetime = datetime_to_check + timedelta(minutes=30)  # Standard-Dauer
-        
-        # Prüfe Praxisöffnungszeiten
-        practice = Practice.objects.first()
-        if not practice.is_open_at(datetime_to_check):
-            conflicts.append("Außerhalb der Praxisöffnungszeiten")
-        
-        # Prüfe Raumverfügbarkeit
-        if room and not room.is_home_visit:
-            day_name = datetime_to_check.strftime('%A').lower()
-            room_settings = room.opening_hours.get(day_name, {})
-            if not room_settings.get('open'):
-                conflicts.append(f"Raum {room.name} ist an diesem Tag nicht verfügbar")
-            else:
-                hours = room_settings.get('hours', '')
-                if hours:
-                    room_start, room_end = hours.split('-')
-                    if (datetime_to_check.strftime('%H:%M') < room_start or 
-                        end_datetime.strftime('%H:%M') > room_end):
-                        conflicts.append(f"Außerhalb der Raumöffnungszeiten ({room.name})")
-        
-        return conflicts
+        engine = self._get_engine(datetime_to_check, practitioner, room, engine)
+        return engine.get_conflicts(datetime_to_check, room)
 
     @action(detail=False, methods=['post'])
     def confirm(self, request):
         """Bestätigt und erstellt die vorgeschlagenen Termine"""
         try:
             prescription = Prescription.objects.get(pk=request.data.get('prescription_id'))
-            appointments_data = request.data.get('appointments', [])
+            appointments_data = [
+                appointment_data for appointment_data in request.data.get('appointments', [])
+                if appointment_data.get('is_available')
+            ]
             
-            created_appointments = []
+            # Behandlungen mit einer Abfrage laden
+            treatment_ids = {
+                appointment_data.get('treatment') or prescription.treatment_1_id
+                for appointment_data in appointments_data
+            }
+            treatments = Treatment.objects.in_bulk([pk for pk in treatment_ids if pk])
             
+            proposals = []
             for appointment_data in appointments_data:
-                if appointment_data.get('is_available'):
-                    # Datetime-String in datetime-Objekt umwandeln
-                    appointment_datetime = make_aware(
-                        datetime.strptime(
-                            appointment_data['proposed_datetime'],
-                            '%Y-%m-%dT%H:%M:%SZ'
-                        )
+                # Datetime-String in datetime-Objekt umwandeln
+                appointment_datetime = make_aware(
+                    datetime.strptime(
+                        appointment_data['proposed_datetime'],
+                        '%Y-%m-%dT%H:%M:%SZ'
                     )
-                    
-                    # Behandlung aus appointment_data holen und prüfen
-                    try:
-                        treatment = Treatment.objects.get(id=appointment_data['treatment'])
-                    except Treatment.DoesNotExist:
-                        return Response({'error': 'Behandlung nicht gefunden'}, status=400)
-                    
+                )
+                
+                # Behandlung aus appointment_data holen und prüfen
+                treatment = treatments.get(int(appointment_data.get('treatment') or prescription.treatment_1_id or 0))
+                if treatment is None:
+                    return Response({'error': 'Behandlung nicht gefunden'}, status=400)
+                
+                duration_minutes = int(appointment_data.get('duration_minutes') or treatment.duration_minutes)
+                proposals.append({
+                    'start': appointment_datetime,
+                    'end': appointment_datetime + timedelta(minutes=duration_minutes),
+                    'practitioner_id': int(appointment_data['practitioner']),
+                    'room_id': int(appointment_data['room']) if appointment_data.get('room') else None,
+                    'treatment': treatment,
+                    'duration_minutes': duration_minutes,
+                })
+            
+            # Gesamte Serie mit einer Abfrage gegen Bestand und untereinander prüfen
+            conflicts = ConflictChecker.for_proposals(proposals).check_batch(proposals)
+            if conflicts:
+                return Response({
+                    'error': 'Terminkonflikte gefunden',
+                    'conflicts': [{
+                        'index': conflict['index'],
+                        'proposed_datetime': conflict['start'].isoformat(),
+                        'resource': conflict['resource'],
+                        'reason': conflict['reason'],
+                        'conflicting_appointment_id': conflict['appointment_id'],
+                        'conflicting_index': conflict['proposal'],
+                    } for conflict in conflicts]
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            created_appointments = []
+            with transaction.atomic():
+                for proposal in proposals:
                     appointment = Appointment.objects.create(
                         prescription=prescription,
                         patient=prescription.patient,
-                        treatment=treatment,
-                        practitioner_id=appointment_data['practitioner'],
-                        room_id=appointment_data.get('room'),
-                        appointment_date=appointment_datetime,
-                        duration_minutes=appointment_data['duration_minutes'],
+                        treatment=proposal['treatment'],
+                        practitioner_id=proposal['practitioner_id'],
+                        room_id=proposal['room_id'],
+                        appointment_date=proposal['start'],
+                        duration_minutes=proposal['duration_minutes'],
                         status='planned',
                         is_recurring=True
                     )
@@ -1631,6 +1508,7 @@ class WaitlistViewSet(viewsets.ModelViewSet):
     queryset = Waitlist.objects.all()
     serializer_class = WaitlistSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('created_at', 'id')
 
     def get_queryset(self):
         """Filtert Wartelisten-Einträge nach Benutzerberechtigungen"""
@@ -1639,21 +1517,8 @@ class WaitlistViewSet(viewsets.ModelViewSet):
             'patient', 'practitioner', 'treatment', 'prescription'
         )
 
-        # Wenn der Benutzer ein Admin/Superuser ist, zeige alle Einträge
-        if user.is_superuser or user.is_admin:
-            return queryset
-            
-        # Wenn der Benutzer ein Therapeut ist, zeige nur seine eigenen Einträge
-        if user.is_therapist:
-            practitioner = Practitioner.objects.filter(
-                first_name=user.first_name,
-                last_name=user.last_name
-            ).first()
-            if practitioner:
-                return queryset.filter(practitioner=practitioner)
-            
-        # Für normale Benutzer (Verwaltung) zeige alle Einträge
-        return queryset
+        # Admins und Verwaltung sehen alle Einträge, Therapeuten nur ihre eigenen
+        return TherapistScopeService.for_user(user).filter_waitlist(queryset)
 
     def list(self, request, *args, **kwargs):
         """Erweiterte Liste mit Filterung"""
@@ -1672,6 +1537,9 @@ class WaitlistViewSet(viewsets.ModelViewSet):
         # Sortierung nach Priorität und Erstellungsdatum
         queryset = queryset.order_by('-priority', 'created_at')
         
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -1679,6 +1547,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-payment_date', '-id')
     
     def get_queryset(self):
         queryset = Payment.objects.select_related(
@@ -1812,7 +1681,10 @@ class PaymentViewSet(viewsets.ModelViewSet):
 @permission_classes([IsAuthenticated])
 def process_prescription_ocr(request):
     """
-    Verarbeitet ein Rezept-Bild/PDF mit OCR und extrahiert die Daten
+    Nimmt ein Rezept-Bild/PDF entgegen und legt einen asynchronen OCR-Auftrag an.
+
+    Die Verarbeitung läuft im OCR-Prozesspool (siehe OCRJobService); das Ergebnis wird
+    über ocr_job_status abgefragt.
     """
     try:
         if 'file' not in request.FILES:
@@ -1821,65 +1693,17 @@ def process_prescription_ocr(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        uploaded_file = request.FILES['file']
-        
-        # Dateityp validieren
-        allowed_types = ['image/jpeg', 'image/png', 'image/jpg', 'application/pdf']
-        if uploaded_file.content_type not in allowed_types:
-            return Response(
-                {'error': 'Nicht unterstützter Dateityp. Erlaubt: JPG, PNG, PDF'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Dateigröße prüfen (max 10MB)
-        if uploaded_file.size > 10 * 1024 * 1024:
+        try:
+            job = OCRJobService.submit(request.FILES['file'], user=request.user)
+        except ValidationError as e:
             return Response(
-                {'error': 'Datei zu groß. Maximale Größe: 10MB'},
+                {'error': e.messages[0]},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Temporäre Datei erstellen im aktuellen Verzeichnis
-        import uuid
-        temp_file_path = os.path.join(os.getcwd(), f"ocr_upload_{uuid.uuid4().hex}_{uploaded_file.name}")
-        
-        try:
-            with open(temp_file_path, 'wb') as temp_file:
-                for chunk in uploaded_file.chunks():
-                    temp_file.write(chunk)
-            
-            # Berechtigungen setzen
-            os.chmod(temp_file_path, 0o644)
-            logger.info(f"Temporäre Datei erstellt: {temp_file_path}")
-        except Exception as e:
-            logger.error(f"Fehler beim Erstellen der temporären Datei: {str(e)}")
-            raise
-        
-        try:
-            # OCR verarbeiten
-            ocr_service = OCRService()
-            extracted_data = ocr_service.process_prescription_file(temp_file_path)
-            
-            # Daten validieren
-            validation = ocr_service.validate_extracted_data(extracted_data)
-            
-            # Datei speichern
-            file_path = f'prescriptions/ocr_uploads/{uploaded_file.name}'
-            saved_path = default_storage.save(file_path, uploaded_file)
-            
-            # Antwort vorbereiten
-            response_data = {
-                'extracted_data': extracted_data,
-                'validation': validation,
-                'uploaded_file': saved_path,
-                'confidence_score': extracted_data.get('confidence_score', 0.0)
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-            
-        finally:
-            # Temporäre Datei löschen
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+        response_data = OCRJobService.to_response(job)
+        response_data['status_url'] = reverse('ocr-job-status', args=[job.id])
+        return Response(response_data, status=status.HTTP_202_ACCEPTED)
                 
     except Exception as e:
         logger.error(f"Fehler bei OCR-Verarbeitung: {str(e)}")
@@ -1888,6 +1712,20 @@ def process_prescription_ocr(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def ocr_job_status(request, job_id):
+    """
+    Liefert Status und (nach Abschluss) Ergebnis eines OCR-Auftrags
+    """
+    job = OCRJobService.get_job_for_user(job_id, request.user)
+    if job is None:
+        return Response(
+            {'error': 'OCR-Auftrag nicht gefunden'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(OCRJobService.to_response(job))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_prescription_from_ocr(request):
@@ -2373,6 +2211,7 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-timestamp', '-id')
     filterset_fields = ['model_name', 'action', 'user', 'timestamp']
     ordering = ['-timestamp']
     
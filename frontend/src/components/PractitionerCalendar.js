@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useCallback } from 'react';
 import BaseCalendar from './BaseCalendar';
 import api from '../api/axios';
+import calendarFeedService, { getCalendarRange } from '../services/calendarFeedService';
 import { useNavigate } from 'react-router-dom';
 
 const PractitionerCalendar = ({ 
@@ -21,11 +22,12 @@ const PractitionerCalendar = ({
     const [absences, setAbsences] = useState([]);
     const navigate = useNavigate();
 
-    // Events neu laden
+    // Events neu laden (nur das sichtbare Zeitfenster über den kompakten Kalender-Feed)
     const fetchEvents = () => {
-        const token = localStorage.getItem('token');
-        const headers = token ? { Authorization: `Bearer ${token}` } : {};
-        api.get('/appointments/', { headers }).then(res => setEvents(res.data));
+        calendarFeedService
+            .getAppointments({ ...getCalendarRange(view, date), practitioner: selectedResources })
+            .then(setEvents)
+            .catch(() => setEvents([]));
     };
 
     // Arbeitszeiten neu laden
@@ -101,7 +103,7 @@ const PractitionerCalendar = ({
 
     useEffect(() => {
         fetchEvents();
-    }, [resources]);
+    }, [resources, view, date, selectedResources]);
 
     useEffect(() => {
         // Lade Abwesenheiten für die Kalenderansicht (aber nicht für die Abrechnung)
@@ -26,6 +26,8 @@ import {
 } from '@mui/icons-material';
 import api from '../api/axios';
 
+const OCR_POLL_INTERVAL_MS = 1000;
+
 const PrescriptionOCR = ({ onPrescriptionCreated }) => {
   const [file, setFile] = useState(null);
   const [preview, setPreview] = useState(null);
@@ -121,9 +123,21 @@ const PrescriptionOCR = ({ onPrescriptionCreated }) => {
         },
       });
 
-      setOcrData(response.data.extracted_data);
-      setValidation(response.data.validation);
-      setEditingData(response.data.extracted_data);
+      // OCR läuft asynchron: Auftragsstatus abfragen, bis das Ergebnis vorliegt
+      let job = response.data;
+      while (job.status === 'queued' || job.status === 'processing') {
+        await new Promise((resolve) => setTimeout(resolve, OCR_POLL_INTERVAL_MS));
+        const statusResponse = await api.get(`/prescriptions/ocr/jobs/${job.job_id}/`);
+        job = statusResponse.data;
+      }
+
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'OCR-Verarbeitung fehlgeschlagen');
+      }
+
+      setOcrData(job.extracted_data);
+      setValidation(job.validation);
+      setEditingData(job.extracted_data);
       
     } catch (error) {
       console.error('OCR Fehler:', error);
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import BaseCalendar from './BaseCalendar';
 import api from '../api/axios';
+import calendarFeedService, { getCalendarRange } from '../services/calendarFeedService';
 import { useNavigate } from 'react-router-dom';
 
 const RoomsCalendar = ({ 
@@ -20,11 +21,12 @@ const RoomsCalendar = ({
     const [events, setEvents] = useState([]);
     const navigate = useNavigate();
 
-    // Events neu laden
+    // Events neu laden (nur das sichtbare Zeitfenster über den kompakten Kalender-Feed)
     const fetchEvents = () => {
-        const token = localStorage.getItem('token');
-        const headers = token ? { Authorization: `Bearer ${token}` } : {};
-        api.get('/appointments/', { headers }).then(res => setEvents(res.data));
+        calendarFeedService
+            .getAppointments({ ...getCalendarRange(view, date), room: selectedResources })
+            .then(setEvents)
+            .catch(() => setEvents([]));
     };
 
     useEffect(() => {
@@ -46,9 +48,11 @@ const RoomsCalendar = ({
                 })));
             });
         }
+    }, [resources]);
 
+    useEffect(() => {
         fetchEvents();
-    }, [resources]);
+    }, [resources, view, date, selectedResources]);
 
     // Filtere die Räume basierend auf selectedResources
     const filteredRooms = rooms.filter(room => {
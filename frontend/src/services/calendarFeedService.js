@@ -0,0 +1,75 @@
+import api from '../api/axios';
+
+const CALENDAR_FEED_ENDPOINT = '/appointments/calendar/';
+
+// Zeitfenster passend zur Kalenderansicht (Monatsansicht inkl. angrenzender Wochen)
+export const getCalendarRange = (view, date) => {
+    const current = new Date(date || new Date());
+    let start;
+    let end;
+
+    if (view === 'dayGridMonth') {
+        start = new Date(current.getFullYear(), current.getMonth(), 1);
+        start.setDate(start.getDate() - 7);
+        end = new Date(current.getFullYear(), current.getMonth() + 1, 1);
+        end.setDate(end.getDate() + 7);
+    } else {
+        // Tages- und Wochenansicht: ganze Woche ab Montag laden
+        start = new Date(current.getFullYear(), current.getMonth(), current.getDate());
+        start.setDate(start.getDate() - ((start.getDay() + 6) % 7));
+        end = new Date(start);
+        end.setDate(end.getDate() + 7);
+    }
+
+    return { start: start.toISOString(), end: end.toISOString() };
+};
+
+// Wandelt den spaltenweisen Feed in die bisher genutzte Termin-Struktur um
+const expandFeed = (feed) => {
+    const columns = feed.appointments;
+    const appointments = [];
+
+    for (let i = 0; i < feed.count; i += 1) {
+        const treatment = feed.treatments[columns.treatment[i]];
+        appointments.push({
+            id: columns.id[i],
+            appointment_date: columns.start[i],
+            duration_minutes: columns.duration[i],
+            status: columns.status[i],
+            patient: columns.patient[i],
+            patient_name: feed.patients[columns.patient[i]] || 'Unbekannt',
+            treatment: columns.treatment[i],
+            treatment_name: treatment ? treatment.name : null,
+            practitioner: columns.practitioner[i],
+            practitioner_name: feed.practitioners[columns.practitioner[i]] || 'Unbekannt',
+            room: columns.room[i],
+            room_name: feed.rooms[columns.room[i]] || null,
+            prescription: columns.prescription[i],
+            series_identifier: columns.series[i]
+        });
+    }
+
+    return appointments;
+};
+
+const calendarFeedService = {
+    // Lädt die Termine eines Zeitfensters; filters: { practitioner, room, status } (Arrays oder kommagetrennt)
+    getAppointments: async ({ start, end, ...filters }) => {
+        const params = { start, end };
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value && value.length) {
+                params[key] = Array.isArray(value) ? value.join(',') : value;
+            }
+        });
+
+        try {
+            const response = await api.get(CALENDAR_FEED_ENDPOINT, { params });
+            return expandFeed(response.data);
+        } catch (error) {
+            console.error('Fehler beim Laden des Kalender-Feeds:', error.response || error);
+            throw error;
+        }
+    }
+};
+
+export default calendarFeedService;
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestPerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,6 +66,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Keyset-Paginierung (opt-in über ?cursor= bzw. ?page_size=, siehe core/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    # Rate Limiting über den gemeinsamen Cache (Limits in SecurityService.RATE_LIMIT_CONFIG bzw. RATE_LIMITS)
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.ApiRateThrottle',
+    ),
+}
+
+# Überschreibt einzelne Werte aus SecurityService.RATE_LIMIT_CONFIG; max_requests 0 schaltet das API-Limit ab.
+# Kalender und Dashboard lösen je Seitenaufruf mehrere Anfragen aus, daher großzügig je Benutzer und Minute.
+RATE_LIMITS = {
+    'api_requests': {
+        'max_requests': int(os.environ.get('API_RATE_LIMIT_PER_MINUTE', '600')),
+        'window_minutes': 1,
+    },
 }
 
 # CORS-Konfiguration
@@ -251,6 +267,53 @@ else:
         }
     }
 
+# Request-Profiling (siehe core/middleware.py)
+PERFORMANCE_MONITORING = {
+    'ENABLED': True,
+    # Anteil der Anfragen mit Abfrage-Profiling und Latenz-Histogramm (0.0 = nur Zeitmessung)
+    'SAMPLE_RATE': float(os.environ.get('PERFORMANCE_SAMPLE_RATE', '1.0' if DEBUG else '0.0')),
+    'SERVER_TIMING': os.environ.get('PERFORMANCE_SERVER_TIMING', str(DEBUG)).lower() == 'true',
+    'N_PLUS_ONE_THRESHOLD': 10,
+    # Intervall, in dem jeder Prozess seine Metriken in den gemeinsamen Cache schreibt (0 = aus)
+    'METRICS_FLUSH_SECONDS': 30,
+}
+
+# OCR-Auftragswarteschlange (siehe core/services/ocr_job_service.py)
+OCR_JOBS = {
+    # 'inline': Prozesspool im Webprozess, 'worker': nur über `manage.py process_ocr_jobs`
+    'DISPATCH': os.environ.get('OCR_JOB_DISPATCH', 'inline'),
+    'MAX_WORKERS': int(os.environ.get('OCR_MAX_WORKERS', '2')),  # parallele Aufträge (Prozesse)
+    'CONFIG_WORKERS': 4,  # parallele Tesseract-Konfigurationen je Auftrag
+    'PAGE_WORKERS': 2,  # Prozesse für gescannte PDF-Seiten je Auftrag
+    'PDF_RENDER_DPI': 300,
+    'CACHE_DIR': os.environ.get('OCR_CACHE_DIR'),  # Standard: <tmp>/medical_ocr_cache
+    'CACHE_MAX_BYTES': 200 * 1024 * 1024,  # LRU-Verdrängung ab dieser Größe, 0 = Cache aus
+    'MAX_FILE_SIZE': 10 * 1024 * 1024,
+    'MAX_PENDING_JOBS_PER_USER': 5,
+    'MAX_ATTEMPTS': 2,
+    'JOB_TIMEOUT_SECONDS': 300,  # ohne Lebenszeichen des Prozesses gilt ein Auftrag als abgebrochen
+    'HEARTBEAT_SECONDS': 30,
+    'RESULT_TTL_HOURS': 24,
+}
+
+# E-Mail-Ausgangspostfach (siehe core/services/email_outbox_service.py)
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '100')),  # Nachrichten je SMTP-Verbindung
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF_SECONDS': 60,  # verdoppelt sich mit jedem weiteren Versuch
+    'SENDING_TIMEOUT_SECONDS': 600,  # danach gilt ein beanspruchter Stapel als hängengeblieben
+    'RETENTION_DAYS': 30,  # gesendete Nachrichten werden danach von deliver_emails --purge gelöscht
+}
+
+# Rechnungs-PDFs (siehe core/services/invoice_pdf_service.py)
+INVOICE_PDF = {
+    'CACHE_DIR': os.environ.get('INVOICE_PDF_CACHE_DIR'),  # Standard: <tmp>/medical_invoice_pdf_cache
+    'CACHE_MAX_BYTES': 500 * 1024 * 1024,  # LRU-Verdrängung ab dieser Größe
+    'MAX_WORKERS': int(os.environ.get('INVOICE_PDF_MAX_WORKERS', '4')),  # Prozesse für Stapel-Rendering
+    'PARALLEL_THRESHOLD': 20,  # ab so vielen fehlenden PDFs wird im Prozesspool gerendert
+    'CHUNK_SIZE': 10,  # Rechnungen je Pool-Auftrag
+}
+
 # Logging Konfiguration
 LOGGING = {
     'version': 1,
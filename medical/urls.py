@@ -1,18 +1,18 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
     TokenRefreshView,
     TokenVerifyView,
 )
 from django.conf import settings
 from django.conf.urls.static import static
 from core.views.finance_views import finance_overview
+from core.views.user_views import LoginView
 
 urlpatterns = [
     path('admin/', admin.site.urls),  # Admin panel
     path('api/', include('core.urls')),  # API URLs aktiviert
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', LoginView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('api/finance/overview/', finance_overview, name='finance-overview'),